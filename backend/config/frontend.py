@@ -0,0 +1,45 @@
+"""
+Frontend en el mismo origen (SERVE_FRONTEND=True)
+==================================================
+Django sirve el build de Vite (``dist/``) con WhiteNoise, así el SPA y la
+API comparten dominio y el checkout no paga un preflight CORS por request.
+
+- /assets/*-<hash>.*: Cache-Control immutable por un año (Vite pone el
+  hash del contenido en el nombre).
+- index.html y demás archivos sin hash: ``no-cache`` (se revalidan), para
+  que un deploy nuevo se vea al instante.
+- Versiones .br / .gz precomprimidas: ``python manage.py compress_frontend``
+  las genera al lado de cada archivo y WhiteNoise elige según Accept-Encoding.
+- Cualquier otra ruta que no sea /api/ devuelve index.html (rutas del SPA
+  como /pago-exitoso que vuelven desde Mercado Pago).
+==================================================
+"""
+
+import re
+
+# Nombres que genera Vite: assets/index-B3x9kd2a.js, assets/logo-Cq1_zW8-.svg
+HASHED_ASSET_RE = re.compile(r'^/assets/.+-[A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$')
+
+
+def is_hashed_asset(path, url):
+    """WHITENOISE_IMMUTABLE_FILE_TEST: assets con hash de Vite."""
+    return bool(HASHED_ASSET_RE.match(url))
+
+
+def add_headers(headers, path, url):
+    """WHITENOISE_ADD_HEADERS_FUNCTION: lo que no tiene hash se revalida siempre."""
+    if not is_hashed_asset(path, url):
+        headers['Cache-Control'] = 'no-cache'
+
+
+def spa_index(request):
+    """Fallback del SPA: index.html para rutas del frontend."""
+    from django.conf import settings
+    from django.http import FileResponse, Http404
+
+    index = settings.FRONTEND_DIST_DIR / 'index.html'
+    if request.method not in ('GET', 'HEAD') or not index.is_file():
+        raise Http404("Frontend no disponible")
+    response = FileResponse(open(index, 'rb'), content_type='text/html; charset=utf-8')
+    response['Cache-Control'] = 'no-cache'
+    return response
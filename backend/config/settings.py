@@ -35,9 +35,19 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    # 503 a requests nuevos mientras el worker se apaga (payments/shutdown.py)
+    'payments.shutdown.DrainMiddleware',
+    # Tienda del request (X-Tenant / Origin / Host) para todo lo que sigue (payments/tenants.py)
+    'payments.tenants.TenantMiddleware',
+    # Cache en memoria, ETag/304 y gzip/brotli para /api/payments/ (payments/http_cache.py)
+    'payments.http_cache.ApiCacheMiddleware',
+    # Solo activo con REQUEST_PROFILING_ENABLED=True (payments/profiling.py)
+    'payments.profiling.RequestProfilingMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Solo activo con TRAFFIC_CAPTURE_ENABLED=True (graba /webhook/ y /validate/)
+    'payments.traffic.TrafficCaptureMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -57,13 +67,15 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'config.wsgi.application'
 
-# Base de datos SQLite para Orders (Railway tiene almacenamiento efímero, pero funciona para logs)
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
-}
+# Base de datos para Orders
+# - Sin DATABASE_URL: SQLite afinado (WAL, busy timeout, mmap). Railway tiene
+#   almacenamiento efímero: con REPLICA_DIR el WAL se replica en caliente y
+#   la base se restaura al arrancar (payments/replication.py)
+# - Con DATABASE_URL=postgres://...: Postgres con pool de conexiones
+# Ver config/database.py
+from .database import build_databases
+
+DATABASES = build_databases(BASE_DIR)
 
 # Internationalization
 LANGUAGE_CODE = 'es-ar'
@@ -71,9 +83,27 @@ TIME_ZONE = 'America/Argentina/Buenos_Aires'
 USE_I18N = True
 USE_TZ = True
 
-# Static files (not used in this API-only backend)
+# Static files (no hay static de Django; el frontend va por WHITENOISE_ROOT)
 STATIC_URL = 'static/'
 
+# ==============================================================================
+# FRONTEND EN EL MISMO ORIGEN (opcional) - ver config/frontend.py
+# ==============================================================================
+# Con SERVE_FRONTEND=True Django sirve el build de Vite (dist/) con WhiteNoise
+# y las rutas del SPA caen en index.html: sin preflights CORS en el checkout.
+SERVE_FRONTEND = os.getenv('SERVE_FRONTEND', 'False').lower() == 'true'
+FRONTEND_DIST_DIR = Path(os.getenv('FRONTEND_DIST_DIR', '') or BASE_DIR.parent / 'dist')
+
+if SERVE_FRONTEND:
+    from .frontend import add_headers as _frontend_headers, is_hashed_asset as _is_hashed_asset
+
+    # Antes que todo lo demás: los archivos estáticos no pasan por la API
+    MIDDLEWARE.insert(0, 'whitenoise.middleware.WhiteNoiseMiddleware')
+    WHITENOISE_ROOT = FRONTEND_DIST_DIR
+    WHITENOISE_INDEX_FILE = True
+    WHITENOISE_IMMUTABLE_FILE_TEST = _is_hashed_asset
+    WHITENOISE_ADD_HEADERS_FUNCTION = _frontend_headers
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -104,6 +134,7 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'x-tenant',
 ]
 
 # ==============================================================================
@@ -2,8 +2,17 @@
 URL configuration for ALEXCEL backend
 """
 
-from django.urls import path, include
+from django.conf import settings
+from django.urls import path, include, re_path
 
 urlpatterns = [
     path('api/payments/', include('payments.urls')),
 ]
+
+if settings.SERVE_FRONTEND:
+    # Fallback del SPA (/pago-exitoso, /checkout, ...). WhiteNoise ya sirvió
+    # los archivos reales de dist/; lo que quede y no sea /api/ es una ruta
+    # del frontend.
+    from .frontend import spa_index
+
+    urlpatterns.append(re_path(r'^(?!api/).*$', spa_index, name='spa-index'))
@@ -7,3 +7,21 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 application = get_wsgi_application()
+
+# Watcher de pagos pendientes: solo en procesos que sirven requests
+# (no en migrate ni otros comandos). Ver payments/watcher.py
+from payments.watcher import start_watcher
+
+start_watcher()
+
+# Replicación de SQLite (si hay REPLICA_DIR): un worker sube el WAL.
+# Ver payments/replication.py
+from payments.replication import start_replicator
+
+start_replicator()
+
+# Medios de pago y cuotas del checkout: se precalientan y refrescan en
+# segundo plano. Ver payments/checkout_options.py
+from payments.checkout_options import start_options_refresher
+
+start_options_refresher()
@@ -0,0 +1,44 @@
+"""
+Configuración de gunicorn - Datos con Alex
+===========================================
+gunicorn la carga sola desde el directorio de trabajo (backend/), así el
+startCommand de railway.json / Procfile no cambia.
+
+Apagado ordenado (payments/shutdown.py): al recibir SIGTERM el worker deja
+de aceptar trabajo, gunicorn espera los requests en curso y al salir del
+loop se drenan envíos y consultas del watcher, se reencola lo que no
+terminó y se hace flush de eventos y trazas.
+
+graceful_timeout = SHUTDOWN_GRACE_SECONDS + SHUTDOWN_FLUSH_SECONDS: el
+master manda SIGKILL recién después. ``drainingSeconds`` de railway.json
+tiene que ser al menos ese valor.
+===========================================
+"""
+
+import math
+import os
+import signal
+
+graceful_timeout = math.ceil(
+    float(os.getenv('SHUTDOWN_GRACE_SECONDS', '20')) + float(os.getenv('SHUTDOWN_FLUSH_SECONDS', '5'))
+)
+
+
+def post_worker_init(worker):
+    """SIGTERM del worker: además de cortar el loop de gunicorn, empieza el drenado."""
+    from payments.shutdown import coordinator
+
+    def handle_term(sig, frame):
+        coordinator.begin_drain()
+        worker.handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, handle_term)
+
+
+def worker_exit(server, worker):
+    """El loop terminó (requests en curso ya respondidos): drena y reporta."""
+    try:
+        from payments.shutdown import coordinator
+    except Exception:
+        return  # la app no llegó a cargar
+    coordinator.drain()
@@ -0,0 +1,16 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def _repair_search_index(sender, using, **kwargs) -> None:
+    """post_migrate: triggers de búsqueda perdidos al reconstruir ``orders`` (payments/search.py)."""
+    from .search import ensure_search_index
+
+    ensure_search_index(using)
+
+
+class PaymentsConfig(AppConfig):
+    name = 'payments'
+
+    def ready(self) -> None:
+        post_migrate.connect(_repair_search_index, sender=self, dispatch_uid='payments_search_index')
@@ -0,0 +1,307 @@
+"""
+Microbenchmarks de los caminos calientes - Datos con Alex
+==========================================================
+Costo por operación de cada paso de una compra, sin red: Mercado Pago y
+SMTP se reemplazan por stand-ins que hacen el mismo trabajo local (el
+mensaje MIME se serializa a bytes como lo haría el backend SMTP).
+
+- email.mime: _send_product_email completo (HTML, adjuntos personalizados
+  desde el cache, MIME a bytes)
+- files.get_product_files / files.validate_product_files
+- preference.parse: JSON del request -> parse_checkout
+- preference.build: build_preference_data + serialización JSON (lo que
+  manda el SDK)
+- events.log_payment_event: armado y serialización del evento (sin
+  escribir al event store)
+
+Cada benchmark se calibra como ``timeit`` (rondas de al menos
+BENCH_MIN_ROUND_SECONDS, GC apagado) y se repite ``repeat`` veces. Se
+compara el mínimo por operación: es lo que cuesta el código; la mediana
+y el máximo suman ruido de la máquina (se reportan igual).
+
+BASELINES: ``python manage.py bench --save`` guarda los resultados en
+BENCH_BASELINE_FILE (JSON). Las corridas siguientes se comparan contra ese
+archivo: es regresión si el mínimo supera al del baseline en más del
+umbral (BENCH_REGRESSION_THRESHOLD, o ``threshold`` por benchmark en el
+JSON). Los tiempos dependen de la máquina: comparar contra un baseline
+generado en la misma (ej. el runner de CI antes del deploy).
+
+CONFIGURACIÓN:
+- BENCH_BASELINE_FILE: default data/bench/baseline.json
+- BENCH_REGRESSION_THRESHOLD: 0.25 = hasta 25% más lento es aceptable
+- BENCH_MIN_ROUND_SECONDS: default 0.1
+==========================================================
+"""
+
+from __future__ import annotations
+
+import datetime
+import json
+import logging
+import os
+import platform
+import statistics
+import timeit
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional
+from unittest import mock
+
+logger = logging.getLogger(__name__)
+
+BENCH_REGRESSION_THRESHOLD = float(os.getenv('BENCH_REGRESSION_THRESHOLD', '0.25'))
+BENCH_MIN_ROUND_SECONDS = float(os.getenv('BENCH_MIN_ROUND_SECONDS', '0.1'))
+
+
+def default_baseline_file() -> Path:
+    configured = os.getenv('BENCH_BASELINE_FILE')
+    if configured:
+        return Path(configured)
+    from django.conf import settings
+    return Path(settings.BASE_DIR) / 'data' / 'bench' / 'baseline.json'
+
+
+# =============================================================================
+# STAND-INS (sin red)
+# =============================================================================
+
+class NullMailer:
+    """Como PooledMailer, pero solo arma el mensaje (lo que haría el backend SMTP antes de enviarlo)."""
+
+    def __init__(self):
+        self.sent_bytes = 0
+
+    def send(self, message) -> int:
+        self.sent_bytes += len(message.message().as_bytes(linesep='\r\n'))
+        return 1
+
+
+BENCH_CHECKOUT = {
+    'first_name': 'Juana',
+    'last_name': 'Pérez',
+    'document': '20123456789',
+    'email': 'juana.perez@example.com',
+    'items': [
+        {'course_id': 'tracker-habitos', 'title': 'Tracker de Hábitos', 'price': 4900, 'quantity': 1},
+        {'course_id': 'planificador-financiero', 'title': 'Planificador Financiero', 'price': 6900, 'quantity': 1},
+    ],
+}
+
+BENCH_ORDER = dict(
+    id='1164431139273936896',
+    first_name='Juana',
+    last_name='Pérez',
+    email='juana.perez@example.com',
+    course_id='pack-productividad',
+    course_title='Pack Productividad',
+    price=9900,
+    status='approved',
+)
+
+
+@contextmanager
+def stubbed_io() -> Iterator[None]:
+    """
+    Tienda con credenciales de prueba, SMTP reemplazado por NullMailer,
+    event store apagado y logs silenciados mientras corren los benchmarks.
+    """
+    from . import services, views
+    from .tenants import current_tenant, using_tenant
+
+    tenant = replace(
+        current_tenant(),
+        email_host_user='bench@example.com',
+        email_host_password='bench',
+        default_from_email='bench@example.com',
+    )
+    mailer = NullMailer()
+    with ExitStack() as stack:
+        stack.enter_context(using_tenant(tenant))
+        stack.enter_context(mock.patch.object(services, 'mailer_for', lambda tenant: mailer))
+        stack.enter_context(mock.patch.object(views, 'record_event', lambda event: None))
+        previous_disable = logging.root.manager.disable
+        logging.disable(logging.CRITICAL)
+        stack.callback(logging.disable, previous_disable)
+        yield
+
+
+# =============================================================================
+# BENCHMARKS
+# =============================================================================
+
+@dataclass(frozen=True)
+class Benchmark:
+    name: str
+    description: str
+    # Arma el estado (fuera de la medición) y devuelve la función a medir
+    setup: Callable[[], Callable[[], Any]]
+
+
+def _email_mime() -> Callable[[], Any]:
+    from types import SimpleNamespace
+
+    from .services import _send_product_email
+
+    order = SimpleNamespace(**BENCH_ORDER)
+
+    def run():
+        sent, error, _ = _send_product_email(order)
+        if not sent:
+            raise RuntimeError(f"email.mime: {error}")
+
+    run()  # personaliza las planillas una vez: se mide el camino con cache
+    return run
+
+
+def _get_product_files() -> Callable[[], Any]:
+    from .services import get_product_files
+    return lambda: get_product_files('pack-productividad')
+
+
+def _validate_product_files() -> Callable[[], Any]:
+    from .services import validate_product_files
+    return lambda: validate_product_files('pack-productividad')
+
+
+def _preference_parse() -> Callable[[], Any]:
+    from .preferences import parse_checkout
+
+    body = json.dumps(BENCH_CHECKOUT).encode('utf-8')
+    return lambda: parse_checkout(json.loads(body))
+
+
+def _preference_build() -> Callable[[], Any]:
+    from .preferences import build_preference_data, parse_checkout
+
+    customer, cart = parse_checkout(BENCH_CHECKOUT)
+
+    def run():
+        data = build_preference_data(customer, cart, BENCH_ORDER['id'], 'https://example.com')
+        return json.dumps(data)
+    return run
+
+
+def _log_payment_event() -> Callable[[], Any]:
+    from .views import log_payment_event
+
+    details = {
+        'status': 'approved',
+        'external_reference': BENCH_ORDER['id'],
+        'amount': 9900.0,
+        'email': BENCH_ORDER['email'],
+        'course': BENCH_ORDER['course_id'],
+    }
+    return lambda: log_payment_event('WEBHOOK_PAYMENT_STATUS', '98765432101', details)
+
+
+BENCHMARKS: tuple[Benchmark, ...] = (
+    Benchmark('email.mime', "Email con 2 adjuntos (cache) armado como MIME", _email_mime),
+    Benchmark('files.get_product_files', "Rutas de los archivos de un pack", _get_product_files),
+    Benchmark('files.validate_product_files', "Existencia y tamaño de los archivos", _validate_product_files),
+    Benchmark('preference.parse', "JSON del checkout -> Customer + carrito", _preference_parse),
+    Benchmark('preference.build', "Payload de la preferencia + JSON", _preference_build),
+    Benchmark('events.log_payment_event', "Evento de pago serializado", _log_payment_event),
+)
+
+
+def select(names: Optional[list[str]] = None) -> list[Benchmark]:
+    """Benchmarks cuyo nombre empieza con alguno de ``names`` (todos si no hay)."""
+    if not names:
+        return list(BENCHMARKS)
+    return [bench for bench in BENCHMARKS if any(bench.name.startswith(name) for name in names)]
+
+
+# =============================================================================
+# MEDICIÓN
+# =============================================================================
+
+def measure(func: Callable[[], Any], repeat: int = 5, min_round_seconds: float = BENCH_MIN_ROUND_SECONDS) -> dict[str, Any]:
+    """Tiempos por operación (µs) de ``func``: min, mediana y max de ``repeat`` rondas."""
+    timer = timeit.Timer(func)
+    # Iteraciones por ronda: 1, 2, 5, 10, 20, 50... hasta durar min_round_seconds
+    number = 1
+    for number in (scale * factor for scale in (10 ** exponent for exponent in range(8)) for factor in (1, 2, 5)):
+        if timer.timeit(number) >= min_round_seconds:
+            break
+    rounds = [elapsed / number * 1e6 for elapsed in timer.repeat(repeat=repeat, number=number)]
+    return {
+        'iterations': number,
+        'repeat': repeat,
+        'min_us': round(min(rounds), 3),
+        'median_us': round(statistics.median(rounds), 3),
+        'max_us': round(max(rounds), 3),
+    }
+
+
+def run_benchmarks(benchmarks: list[Benchmark], repeat: int = 5) -> dict[str, dict[str, Any]]:
+    results: dict[str, dict[str, Any]] = {}
+    with stubbed_io():
+        for bench in benchmarks:
+            results[bench.name] = measure(bench.setup(), repeat=repeat)
+    return results
+
+
+def environment() -> dict[str, str]:
+    """Datos de la máquina (un baseline de otra máquina no es comparable)."""
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'system': platform.system(),
+        'cpu_count': str(os.cpu_count()),
+    }
+
+
+# =============================================================================
+# BASELINES
+# =============================================================================
+
+def load_baseline(path: Path) -> Optional[dict[str, Any]]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Baseline ilegible ({path}): {e}")
+
+
+def save_baseline(path: Path, results: dict[str, dict[str, Any]], previous: Optional[dict[str, Any]] = None) -> None:
+    """Guarda ``results`` (conserva los umbrales por benchmark y los benchmarks no corridos)."""
+    benchmarks = dict((previous or {}).get('benchmarks', {}))
+    for name, result in results.items():
+        threshold = benchmarks.get(name, {}).get('threshold')
+        benchmarks[name] = {**result, **({'threshold': threshold} if threshold is not None else {})}
+    data = {
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'environment': environment(),
+        'benchmarks': dict(sorted(benchmarks.items())),
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(data, indent=2, ensure_ascii=False) + '\n', encoding='utf-8')
+    os.replace(tmp, path)
+
+
+def compare(
+    results: dict[str, dict[str, Any]],
+    baseline: dict[str, Any],
+    threshold: Optional[float] = None,
+) -> list[dict[str, Any]]:
+    """
+    Una fila por benchmark: mínimo actual vs baseline y si es regresión.
+    ``threshold`` pisa los umbrales del baseline y el default.
+    """
+    rows = []
+    for name, result in results.items():
+        reference = baseline.get('benchmarks', {}).get(name)
+        row: dict[str, Any] = {'name': name, 'min_us': result['min_us'], 'baseline_us': None,
+                               'change': None, 'threshold': None, 'regression': False}
+        if reference and reference.get('min_us'):
+            limit = threshold if threshold is not None else reference.get('threshold', BENCH_REGRESSION_THRESHOLD)
+            change = result['min_us'] / reference['min_us'] - 1
+            row.update(baseline_us=reference['min_us'], change=round(change, 4), threshold=limit,
+                       regression=change > limit)
+        rows.append(row)
+    return rows
@@ -0,0 +1,271 @@
+"""
+Generación masiva de links de pago - Datos con Alex
+====================================================
+Crea N preferencias de Mercado Pago (promociones de OfertasPage, afiliados)
+a partir de filas (comprador, producto, precio) en CSV o JSON.
+
+- Pool acotado de threads: las llamadas a MP son I/O
+- Rate limiter (token bucket) compartido para respetar los límites de MP
+- Reintentos con backoff exponencial ante 429 / 5xx
+- Los resultados se devuelven a medida que terminan (generador), así el
+  endpoint y el comando pueden ir escribiendo sin esperar al lote completo
+
+Las órdenes se registran y las referencias se generan en el thread que
+consume los resultados (no en los workers), así no quedan conexiones de
+base abiertas en el pool (ids.py puede tomar un worker id de la base). La
+tienda se pasa explícita (``tenant``): los workers y el generador de una
+respuesta streaming corren fuera del request que la activó.
+
+CSV esperado (encabezados):
+    first_name,last_name,document,email,course_id,title,price,quantity
+====================================================
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Iterable, Iterator, Optional
+
+from .cart import cart_course_id, cart_title, cart_total
+from .orders import record_preference
+from .preferences import build_preference_data, new_order_reference, parse_checkout
+from .services import product_catalog
+from .tenants import Tenant, current_tenant
+
+logger = logging.getLogger(__name__)
+
+# Defaults (configurables por request / comando)
+BULK_DEFAULT_WORKERS = int(os.getenv('MP_BULK_WORKERS', '8'))
+BULK_MAX_WORKERS = 32
+BULK_DEFAULT_RATE = float(os.getenv('MP_BULK_RATE', '10'))  # preferencias por segundo
+# Tope del rate pedido por request / comando: por encima MP responde 429 y
+# el lote compite con el checkout por la misma cuota de la cuenta
+BULK_MAX_RATE = float(os.getenv('MP_BULK_MAX_RATE', '20'))
+BULK_MAX_ROWS = int(os.getenv('MP_BULK_MAX_ROWS', '10000'))
+BULK_MAX_RETRIES = 4
+
+# Estados de MP que vale la pena reintentar
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """Token bucket thread-safe: como máximo ``rate`` adquisiciones por segundo."""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = max(rate, 0.001)
+        self.capacity = burst or max(1, int(self.rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_seconds = (1 - self._tokens) / self.rate
+            time.sleep(wait_seconds)
+
+
+def clamp_rate(rate: float) -> float:
+    """
+    Rate dentro de (0, BULK_MAX_RATE].
+
+    Raises:
+        ValueError: si no es un número positivo
+    """
+    if not math.isfinite(rate) or rate <= 0:
+        raise ValueError('rate debe ser un número positivo')
+    return min(rate, BULK_MAX_RATE)
+
+
+def parse_bulk_rows(content: bytes | str, content_type: str = '') -> list[dict[str, Any]]:
+    """
+    Lee filas desde JSON (lista o {"rows": [...]}) o CSV.
+
+    Raises:
+        ValueError: si el formato es inválido o supera BULK_MAX_ROWS
+    """
+    text = content.decode('utf-8-sig') if isinstance(content, bytes) else content
+    stripped = text.lstrip()
+
+    if 'csv' in content_type or (stripped and stripped[0] not in '[{'):
+        rows: list[dict[str, Any]] = [dict(row) for row in csv.DictReader(io.StringIO(text))]
+    else:
+        try:
+            payload = json.loads(text)
+        except json.JSONDecodeError:
+            raise ValueError('JSON inválido')
+        rows = payload.get('rows', []) if isinstance(payload, dict) else payload
+        if not isinstance(rows, list):
+            raise ValueError("Se esperaba una lista de filas o {'rows': [...]}")
+
+    if len(rows) > BULK_MAX_ROWS:
+        raise ValueError(f'Máximo {BULK_MAX_ROWS} filas por lote')
+    return rows
+
+
+def _create_remote_preference(sdk, preference_data: dict[str, Any], limiter: RateLimiter) -> tuple[dict, int]:
+    """Llama a MP respetando el rate limit; reintenta 429/5xx con backoff."""
+    attempts = 0
+    while True:
+        attempts += 1
+        limiter.acquire()
+        response = sdk.preference().create(preference_data)
+        status = response.get('status')
+        if status not in RETRYABLE_STATUSES or attempts > BULK_MAX_RETRIES:
+            return response, attempts
+        backoff = min(0.5 * 2 ** (attempts - 1), 8) * (1 + random.random() * 0.25)
+        logger.warning(f"[BULK] MP respondió {status}, reintento {attempts} en {backoff:.1f}s")
+        time.sleep(backoff)
+
+
+def _process_row(
+    index: int,
+    row: dict[str, Any],
+    external_reference: str,
+    sdk,
+    frontend_url: str,
+    limiter: RateLimiter,
+    campaign: Optional[str],
+    tenant: Tenant,
+) -> dict[str, Any]:
+    started = time.perf_counter()
+    if not isinstance(row, dict):
+        return {'row': index, 'success': False, 'email': None, 'error': 'La fila no es un objeto'}
+    result: dict[str, Any] = {'row': index, 'success': False, 'email': row.get('email')}
+
+    try:
+        customer, cart = parse_checkout(row, product_catalog(tenant))
+    except ValueError as e:
+        result['error'] = str(e)
+        return result
+
+    extra_metadata = {'campaign': campaign} if campaign else {}
+    if not tenant.is_default:
+        extra_metadata['tenant'] = tenant.id
+    preference_data = build_preference_data(
+        customer, cart, external_reference, frontend_url, extra_metadata or None,
+        statement_descriptor=tenant.statement_descriptor,
+    )
+
+    try:
+        response, attempts = _create_remote_preference(sdk, preference_data, limiter)
+    except Exception as e:
+        result['error'] = f'Error de conexión con MP: {e}'
+        return result
+
+    preference = response.get('response', {}) or {}
+    result.update({
+        'attempts': attempts,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+        'external_reference': external_reference,
+        'course_id': cart_course_id(cart),
+    })
+
+    if 'id' not in preference:
+        result['error'] = f"Error MP: {preference.get('message', 'Error desconocido de Mercado Pago')}"
+        return result
+
+    result.update({
+        'success': True,
+        'preference_id': preference.get('id'),
+        'init_point': preference.get('init_point'),
+        'sandbox_init_point': preference.get('sandbox_init_point'),
+        # Para registrar la orden en el thread consumidor
+        '_order': {
+            'first_name': customer.first_name,
+            'last_name': customer.last_name,
+            'document': customer.document,
+            'email': customer.email,
+            'course_title': cart_title(cart),
+            'price': cart_total(cart),
+        },
+    })
+    return result
+
+
+def run_bulk(
+    rows: Iterable[dict[str, Any]],
+    sdk,
+    frontend_url: str,
+    workers: int = BULK_DEFAULT_WORKERS,
+    rate: float = BULK_DEFAULT_RATE,
+    campaign: Optional[str] = None,
+    tenant: Optional[Tenant] = None,
+) -> Iterator[dict[str, Any]]:
+    """
+    Crea las preferencias en paralelo y va devolviendo cada resultado
+    apenas termina (no en el orden de entrada; usar ``row`` para ubicarlo).
+
+    Como máximo hay ``2 * workers`` filas en vuelo, así un CSV enorme no
+    se encola entero en memoria.
+
+    ``tenant``: tienda de las preferencias (default: la tienda en curso al
+    empezar a iterar). Una respuesta streaming se itera después de que el
+    middleware desactivó la tienda del request: pasarla explícita.
+    """
+    tenant = tenant or current_tenant()
+    workers = max(1, min(workers, BULK_MAX_WORKERS))
+    limiter = RateLimiter(clamp_rate(rate))
+    max_in_flight = workers * 2
+
+    def finished(future: Future) -> dict[str, Any]:
+        # Un error en una fila queda como resultado de esa fila: el lote sigue
+        # y las preferencias ya creadas se informan igual
+        index = futures_rows.pop(future)
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.exception(f"[BULK] Error inesperado en la fila {index}")
+            return {'row': index, 'success': False, 'error': f'Error inesperado: {e}'}
+        order = result.pop('_order', None)
+        if order:
+            try:
+                recorded = record_preference(
+                    external_reference=result['external_reference'],
+                    preference_id=result['preference_id'],
+                    course_id=result['course_id'],
+                    tenant=tenant.id,
+                    **order,
+                )
+            except Exception:
+                logger.exception(f"[BULK] Error registrando la orden de la fila {index}")
+                recorded = None
+            if recorded is None:
+                # La preferencia existe en MP: se informa con su link aunque no quedó la orden
+                result['warning'] = 'Preferencia creada pero la orden no se pudo registrar'
+        return result
+
+    futures_rows: dict[Future, int] = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mp-bulk') as pool:
+        pending: set[Future] = set()
+        for index, row in enumerate(rows):
+            external_reference = str(new_order_reference())
+            future = pool.submit(
+                _process_row, index, row, external_reference, sdk, frontend_url, limiter, campaign, tenant,
+            )
+            futures_rows[future] = index
+            pending.add(future)
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield finished(future)
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield finished(future)
@@ -0,0 +1,167 @@
+"""
+Carrito de compras - Datos con Alex
+====================================
+Permite comprar varios productos con UNA preferencia de Mercado Pago.
+
+Request (create_preference):
+    "items": [
+        {"course_id": "pack-productividad", "title": "Pack", "price": 2500, "quantity": 1},
+        {"course_id": "tracker-habitos", "title": "Tracker", "price": 1000}
+    ]
+
+Metadata compacta en MP:
+- course_id: IDs separados por coma ("pack-productividad,tracker-habitos")
+- course_title: títulos separados por " + "
+- items: [[course_id, quantity, unit_price], ...] (solo si hay más de un producto)
+
+Con un solo producto la metadata queda igual que antes del carrito.
+Solo se aceptan productos del catálogo de la tienda: los IDs viajan
+unidos en Order.course_id (255 caracteres) y un ID inventado no tiene
+archivos que entregar.
+====================================
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any, Container, Optional
+
+# Separador de IDs de producto en metadata.course_id y Order.course_id
+PRODUCT_ID_SEPARATOR = ','
+
+# Límite de productos distintos por preferencia
+MAX_CART_ITEMS = 20
+
+# Largo de Order.course_id, donde se guardan los IDs unidos por coma
+MAX_COURSE_ID_LENGTH = 255
+
+
+@dataclass
+class CartItem:
+    course_id: str
+    title: str
+    price: float
+    quantity: int = 1
+
+    @property
+    def subtotal(self) -> float:
+        return self.price * self.quantity
+
+
+def parse_cart(data: dict[str, Any], catalog: Optional[Container[str]] = None) -> list[CartItem]:
+    """
+    Lee los productos del request: lista ``items`` o el formato de un solo
+    producto (course_id, title, price, quantity). Los productos repetidos se
+    agrupan sumando cantidades. Con ``catalog`` (services.product_catalog)
+    se rechazan los IDs que no están en él.
+
+    Raises:
+        ValueError: con un mensaje apto para mostrar al usuario
+    """
+    raw_items = data.get('items')
+    if raw_items is None:
+        raw_items = [{
+            'course_id': data.get('course_id', 'tracker-habitos'),
+            'title': data.get('title', 'Producto Digital'),
+            'price': data.get('price', 0),
+            'quantity': data.get('quantity', 1),
+        }]
+
+    if not isinstance(raw_items, list) or not raw_items:
+        raise ValueError('El carrito está vacío')
+    if len(raw_items) > MAX_CART_ITEMS:
+        raise ValueError(f'El carrito admite hasta {MAX_CART_ITEMS} productos')
+
+    items: dict[str, CartItem] = {}
+    for raw in raw_items:
+        if not isinstance(raw, dict):
+            raise ValueError('Producto inválido en el carrito')
+
+        course_id = str(raw.get('course_id', '')).strip()
+        if not course_id or PRODUCT_ID_SEPARATOR in course_id:
+            raise ValueError('Producto sin course_id válido')
+        if catalog is not None and course_id not in catalog:
+            raise ValueError(f'Producto desconocido: {course_id[:50]}')
+
+        try:
+            price = float(raw.get('price', 0))
+            quantity = int(raw.get('quantity', 1))
+        except (TypeError, ValueError):
+            raise ValueError(f'Precio o cantidad inválidos para {course_id}')
+
+        if price <= 0:
+            raise ValueError('El precio debe ser mayor a 0')
+        if quantity <= 0:
+            raise ValueError('La cantidad debe ser mayor a 0')
+
+        if course_id in items:
+            items[course_id].quantity += quantity
+        else:
+            items[course_id] = CartItem(
+                course_id=course_id,
+                title=str(raw.get('title') or 'Producto Digital'),
+                price=price,
+                quantity=quantity,
+            )
+
+    cart = list(items.values())
+    if len(cart_course_id(cart)) > MAX_COURSE_ID_LENGTH:
+        raise ValueError('Demasiados productos en el carrito')
+    return cart
+
+
+def cart_course_id(items: list[CartItem]) -> str:
+    return PRODUCT_ID_SEPARATOR.join(item.course_id for item in items)
+
+
+def cart_title(items: list[CartItem]) -> str:
+    return ' + '.join(item.title for item in items)
+
+
+def cart_total(items: list[CartItem]) -> float:
+    return round(sum(item.subtotal for item in items), 2)
+
+
+def cart_metadata(items: list[CartItem]) -> dict[str, Any]:
+    """Campos de producto para la metadata de la preferencia."""
+    metadata: dict[str, Any] = {
+        'course_id': cart_course_id(items),
+        'course_title': cart_title(items),
+        'price': cart_total(items),
+    }
+    if len(items) > 1:
+        metadata['items'] = [[item.course_id, item.quantity, item.price] for item in items]
+    return metadata
+
+
+def split_product_ids(course_id: str) -> list[str]:
+    """'a,b' -> ['a', 'b'] (tolera espacios y vacíos)."""
+    return [part.strip() for part in str(course_id).split(PRODUCT_ID_SEPARATOR) if part.strip()]
+
+
+def product_amounts(metadata: dict[str, Any], course_id: str, total: Decimal) -> list[tuple[str, Decimal]]:
+    """
+    Reparte ``total`` entre los productos de una orden para los rollups.
+
+    Con metadata ``items`` se usa el subtotal de cada producto (escalado si
+    ``total`` difiere, ej. reembolsos parciales); sin ella, todo va al
+    único course_id.
+    """
+    raw_items = metadata.get('items') if isinstance(metadata, dict) else None
+    if not raw_items:
+        return [(course_id, total)]
+
+    subtotals: list[tuple[str, Decimal]] = []
+    for entry in raw_items:
+        try:
+            item_id, quantity, unit_price = entry[0], entry[1], entry[2]
+            subtotals.append((str(item_id), Decimal(str(unit_price)) * int(quantity)))
+        except (IndexError, TypeError, ValueError, ArithmeticError):
+            return [(course_id, total)]
+
+    cart_sum = sum((amount for _, amount in subtotals), Decimal('0'))
+    if not cart_sum:
+        return [(course_id, total)]
+
+    return [(item_id, (amount * total / cart_sum).quantize(Decimal('0.01'))) for item_id, amount in subtotals]
@@ -0,0 +1,585 @@
+"""
+Medios de pago y cuotas para el checkout - Datos con Alex
+==========================================================
+El checkout no mostraba con qué se puede pagar ni en cuántas cuotas hasta
+redirigir a Mercado Pago, y ahí se caían compras. Ahora el backend
+consulta a MP los medios de pago de la cuenta y los planes de cuotas por
+monto, y los sirve desde un cache en memoria:
+
+- Ningún visitante dispara una llamada a MP en su request: si el dato está
+  se devuelve al instante (aunque esté viejo), y si está viejo o falta se
+  pide en segundo plano (stale-while-revalidate, una sola consulta aunque
+  lleguen muchos requests a la vez).
+- Un thread por worker refresca antes de que venzan los medios de pago,
+  los montos de CHECKOUT_OPTIONS_AMOUNTS y los montos consultados hace
+  poco: en la práctica el checkout siempre encuentra el dato fresco.
+- Cuotas: /v1/payment_methods/installments por cada tarjeta de crédito
+  activa y cada monto (el total del carrito). Como el monto lo manda el
+  cliente, solo se consultan montos conocidos: los precios de
+  CHECKOUT_OPTIONS_AMOUNTS, sus sumas de hasta CHECKOUT_OPTIONS_COMBINATION_SIZE
+  productos y los totales vendidos en los últimos CHECKOUT_OPTIONS_SALES_DAYS.
+  Cualquier otro monto responde sin cuotas y no toca el cache ni a MP (un
+  cliente que recorre montos no desplaza los reales ni gasta el rate de MP).
+- El cache guarda como mucho CHECKOUT_OPTIONS_MAX_AMOUNTS montos (LRU)
+  además de los precalentados, que no se descartan, y las consultas a MP
+  respetan CHECKOUT_OPTIONS_RATE por segundo.
+- Si MP falla se sigue sirviendo lo último que respondió hasta
+  CHECKOUT_OPTIONS_MAX_STALE_SECONDS (después se descarta: cuotas viejas
+  pueden tener otro interés) y se reintenta cada CHECKOUT_OPTIONS_RETRY_SECONDS.
+
+API:
+- GET /api/payments/checkout-options/?amount=4900   (ETag, Cache-Control)
+
+Con varias tiendas cada una tiene sus entradas (cuenta de MP propia).
+
+CONFIGURACIÓN:
+- CHECKOUT_OPTIONS_ENABLED: "False" para no consultar a MP (default True)
+- CHECKOUT_OPTIONS_REFRESH_SECONDS: edad a la que se refresca (default 3600)
+- CHECKOUT_OPTIONS_MAX_STALE_SECONDS: edad máxima servible (default 86400)
+- CHECKOUT_OPTIONS_RETRY_SECONDS: espera tras un error de MP (default 60)
+- CHECKOUT_OPTIONS_AMOUNTS: precios del catálogo, separados por coma
+  (se precalientan y nunca se descartan)
+- CHECKOUT_OPTIONS_COMBINATION_SIZE: productos distintos por carrito cuyas
+  sumas se consideran montos conocidos (default 3)
+- CHECKOUT_OPTIONS_SALES_DAYS: días de ventas cuyos totales se consideran
+  montos conocidos (default 30, 0 = ninguno)
+- CHECKOUT_OPTIONS_MAX_AMOUNTS: otros montos en cache (default 64)
+- CHECKOUT_OPTIONS_RATE: consultas a MP por segundo (default 5)
+==========================================================
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from itertools import combinations
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+from typing import Any, Callable, Optional
+
+from .shutdown import coordinator
+from .tenants import Tenant, get_registry
+
+logger = logging.getLogger(__name__)
+
+CHECKOUT_OPTIONS_ENABLED = os.getenv('CHECKOUT_OPTIONS_ENABLED', 'True').lower() == 'true'
+CHECKOUT_OPTIONS_REFRESH_SECONDS = float(os.getenv('CHECKOUT_OPTIONS_REFRESH_SECONDS', '3600'))
+CHECKOUT_OPTIONS_MAX_STALE_SECONDS = float(os.getenv('CHECKOUT_OPTIONS_MAX_STALE_SECONDS', '86400'))
+CHECKOUT_OPTIONS_RETRY_SECONDS = float(os.getenv('CHECKOUT_OPTIONS_RETRY_SECONDS', '60'))
+CHECKOUT_OPTIONS_MAX_AMOUNTS = int(os.getenv('CHECKOUT_OPTIONS_MAX_AMOUNTS', '64'))
+CHECKOUT_OPTIONS_RATE = float(os.getenv('CHECKOUT_OPTIONS_RATE', '5'))
+CHECKOUT_OPTIONS_COMBINATION_SIZE = int(os.getenv('CHECKOUT_OPTIONS_COMBINATION_SIZE', '3'))
+CHECKOUT_OPTIONS_SALES_DAYS = int(os.getenv('CHECKOUT_OPTIONS_SALES_DAYS', '30'))
+
+# Monto máximo aceptado en ?amount= (ARS)
+MAX_AMOUNT = Decimal('10000000')
+
+# Cada cuánto revisa el thread qué entradas refrescar (segundos)
+REFRESH_TICK_SECONDS = 30.0
+
+# Se refresca un poco antes de CHECKOUT_OPTIONS_REFRESH_SECONDS para que
+# el request no encuentre el dato vencido
+REFRESH_AHEAD = 0.8
+
+# Cargas de montos en cola como máximo (montos nuevos por encima esperan
+# al próximo request: una ráfaga de montos distintos no encola llamadas a MP)
+MAX_PENDING_LOADS = 8
+
+# Cada cuánto se releen de la base los totales vendidos (segundos)
+SALES_AMOUNTS_REFRESH_SECONDS = 300.0
+
+# Espera máxima de la carga de cuotas por los medios de pago en curso
+METHODS_WAIT_SECONDS = 15.0
+
+# Tipos de medio de pago que tienen cuotas
+INSTALLMENT_PAYMENT_TYPES = {'credit_card'}
+
+# Claves del cache (por tienda): medios de pago y cuotas por monto
+METHODS_KEY = 'methods'
+
+
+def parse_amount(value: Any) -> Decimal:
+    """
+    Monto del request normalizado a centavos.
+
+    Raises:
+        ValueError: con un mensaje apto para mostrar al usuario
+    """
+    try:
+        amount = Decimal(str(value).strip().replace(',', '.')).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        raise ValueError('Monto inválido')
+    if not amount.is_finite() or amount <= 0 or amount > MAX_AMOUNT:
+        raise ValueError('Monto inválido')
+    return amount
+
+
+def configured_amounts() -> list[Decimal]:
+    amounts = []
+    for raw in os.getenv('CHECKOUT_OPTIONS_AMOUNTS', '').split(','):
+        if not raw.strip():
+            continue
+        try:
+            amounts.append(parse_amount(raw))
+        except ValueError:
+            logger.warning(f"[CHECKOUT-OPTIONS] Monto inválido en CHECKOUT_OPTIONS_AMOUNTS: {raw!r}")
+    return amounts
+
+
+def combined_amounts(prices: list[Decimal], size: int = CHECKOUT_OPTIONS_COMBINATION_SIZE) -> frozenset[Decimal]:
+    """Precios y sumas de hasta ``size`` de ellos (carritos de productos distintos)."""
+    amounts = set()
+    for count in range(1, max(1, size) + 1):
+        for combination in combinations(prices, count):
+            total = sum(combination, Decimal('0'))
+            if total <= MAX_AMOUNT:
+                amounts.add(total)
+    return frozenset(amounts)
+
+
+class KnownAmounts:
+    """
+    Montos para los que vale la pena pedir cuotas a MP: los del catálogo
+    (CHECKOUT_OPTIONS_AMOUNTS y sus combinaciones) y, por tienda, los
+    totales vendidos hace poco. Las ventas las relee el thread de refresco,
+    nunca el request.
+    """
+
+    def __init__(self, prices: Optional[list[Decimal]] = None):
+        self.prices = frozenset(configured_amounts() if prices is None else prices)
+        self.catalog = combined_amounts(sorted(self.prices))
+        self._sales: dict[str, frozenset[Decimal]] = {}
+        self._sales_loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: tuple[str, Decimal]) -> bool:
+        tenant_id, amount = key
+        if amount in self.catalog:
+            return True
+        with self._lock:
+            return amount in self._sales.get(tenant_id, ())
+
+    def refresh_sales(self, now: Optional[float] = None) -> bool:
+        """Relee los totales vendidos si pasó SALES_AMOUNTS_REFRESH_SECONDS."""
+        now = time.time() if now is None else now
+        if CHECKOUT_OPTIONS_SALES_DAYS <= 0 or now - self._sales_loaded_at < SALES_AMOUNTS_REFRESH_SECONDS:
+            return False
+        from django.db import connection
+        from django.utils import timezone
+
+        from .models import Order
+        from .orders import SALE_STATUSES
+
+        default_id = get_registry().default.id
+        sales: dict[str, set[Decimal]] = {}
+        try:
+            rows = (
+                Order.objects
+                .filter(status__in=SALE_STATUSES, created_at__gte=timezone.now() - timedelta(days=CHECKOUT_OPTIONS_SALES_DAYS))
+                .values_list('tenant', 'price')
+                .distinct()
+            )
+            for tenant_id, price in rows:
+                sales.setdefault(tenant_id or default_id, set()).add(Decimal(str(price)).quantize(Decimal('0.01')))
+        finally:
+            connection.close()
+        with self._lock:
+            self._sales = {tenant_id: frozenset(amounts) for tenant_id, amounts in sales.items()}
+            self._sales_loaded_at = now
+        return True
+
+
+# =============================================================================
+# CONSULTAS A MERCADO PAGO
+# =============================================================================
+
+class MercadoPagoError(Exception):
+    pass
+
+
+def _response(result: dict[str, Any], what: str) -> Any:
+    if result.get('status') != 200:
+        raise MercadoPagoError(f"MP respondió {result.get('status')} a {what}")
+    return result.get('response') or []
+
+
+def fetch_payment_methods(sdk) -> list[dict[str, Any]]:
+    """Medios de pago activos de la cuenta, con lo que necesita el checkout."""
+    methods = _response(sdk.payment_methods().list_all(), 'payment_methods')
+    return [
+        {
+            'id': method.get('id'),
+            'name': method.get('name'),
+            'payment_type_id': method.get('payment_type_id'),
+            'thumbnail': method.get('secure_thumbnail') or method.get('thumbnail'),
+            'min_allowed_amount': method.get('min_allowed_amount'),
+            'max_allowed_amount': method.get('max_allowed_amount'),
+            'accreditation_time': method.get('accreditation_time'),
+        }
+        for method in methods
+        if method.get('status') == 'active'
+    ]
+
+
+def fetch_installments(sdk, amount: Decimal, methods: list[dict[str, Any]], limiter=None) -> list[dict[str, Any]]:
+    """
+    Planes de cuotas para ``amount`` de cada tarjeta de crédito (emisor
+    por defecto de MP). Una tarjeta que falla se omite; si fallan todas,
+    error.
+    """
+    cards = [
+        method for method in methods
+        if method['payment_type_id'] in INSTALLMENT_PAYMENT_TYPES and _allows(method, amount)
+    ]
+    plans, errors = [], 0
+    for method in cards:
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            # El SDK no expone /installments: se usa el GET autenticado del recurso
+            result = sdk.payment_methods()._get(
+                uri='/v1/payment_methods/installments',
+                filters={'amount': str(amount), 'payment_method_id': method['id']},
+            )
+            options = _response(result, f"installments de {method['id']}")
+        except Exception as e:
+            errors += 1
+            logger.warning(f"[CHECKOUT-OPTIONS] Sin cuotas de {method['id']} para ${amount}: {e}")
+            continue
+        if not options:
+            continue
+        costs = [
+            {
+                'installments': cost.get('installments'),
+                'installment_amount': cost.get('installment_amount'),
+                'total_amount': cost.get('total_amount'),
+                'installment_rate': cost.get('installment_rate'),
+                'recommended_message': cost.get('recommended_message'),
+            }
+            for cost in options[0].get('payer_costs') or []
+        ]
+        if not costs:
+            continue
+        plans.append({
+            'payment_method_id': method['id'],
+            'name': method['name'],
+            'thumbnail': method['thumbnail'],
+            'max_installments': max(cost['installments'] or 1 for cost in costs),
+            'interest_free_installments': max(
+                (cost['installments'] or 1 for cost in costs if not cost['installment_rate']), default=1,
+            ),
+            'payer_costs': costs,
+        })
+    if cards and errors == len(cards):
+        raise MercadoPagoError(f"Ninguna tarjeta devolvió cuotas para ${amount}")
+    return plans
+
+
+def _allows(method: dict[str, Any], amount: Decimal) -> bool:
+    low, high = method.get('min_allowed_amount'), method.get('max_allowed_amount')
+    return (low is None or amount >= Decimal(str(low))) and (high is None or amount <= Decimal(str(high)))
+
+
+# =============================================================================
+# CACHE (stale-while-revalidate)
+# =============================================================================
+
+@dataclass
+class Entry:
+    value: Any = None
+    fetched_at: float = 0.0      # time.time() de la última respuesta buena
+    failed_at: float = 0.0       # último error (para no reintentar en cada request)
+    read_at: float = 0.0         # último request que la pidió
+    error: Optional[str] = None
+
+    def age(self, now: float) -> Optional[float]:
+        return now - self.fetched_at if self.fetched_at else None
+
+
+class OptionsCache:
+    """
+    Cache por (tienda, clave) que nunca consulta a MP en el request: los
+    loaders corren en un pool propio, uno por clave a la vez.
+    """
+
+    def __init__(
+        self,
+        max_amounts: int = CHECKOUT_OPTIONS_MAX_AMOUNTS,
+        workers: int = 2,
+        pinned: Optional[frozenset[Decimal]] = None,
+    ):
+        self.max_amounts = max_amounts
+        # Montos precalentados: no cuentan para max_amounts ni se descartan
+        self.pinned = frozenset(configured_amounts()) if pinned is None else pinned
+        self._entries: OrderedDict[tuple[str, Any], Entry] = OrderedDict()
+        self._loading: dict[tuple[str, Any], Future] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mp-options')
+
+    def get(self, key: tuple[str, Any], loader: Callable[[], Any]) -> Entry:
+        """
+        Entrada actual de ``key`` (copia). Si falta o está vieja se agenda
+        ``loader`` en segundo plano; lo que pase de MAX_STALE no se devuelve.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = Entry()
+                self._evict()
+            self._entries.move_to_end(key)
+            entry.read_at = now
+            snapshot = Entry(**vars(entry))
+        if self.needs_refresh(snapshot, now, CHECKOUT_OPTIONS_REFRESH_SECONDS):
+            self.schedule(key, loader)
+        age = snapshot.age(now)
+        if age is not None and age > CHECKOUT_OPTIONS_MAX_STALE_SECONDS:
+            snapshot.value = None
+        return snapshot
+
+    def peek(self, key: tuple[str, Any]) -> Optional[Entry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            return Entry(**vars(entry)) if entry is not None else None
+
+    def store(self, key: tuple[str, Any], value: Any) -> None:
+        with self._lock:
+            entry = self._entries.setdefault(key, Entry())
+            entry.value, entry.fetched_at, entry.error = value, time.time(), None
+            self._evict()
+
+    def schedule(self, key: tuple[str, Any], loader: Callable[[], Any]) -> bool:
+        """Agenda la carga de ``key`` si no hay otra en curso (y hay lugar en la cola)."""
+        with self._lock:
+            if key in self._loading or coordinator.draining:
+                return False
+            if key[1] != METHODS_KEY and len(self._loading) >= MAX_PENDING_LOADS:
+                return False
+            try:
+                self._loading[key] = self._executor.submit(self._load, key, loader)
+            except RuntimeError:  # pool cerrado (apagado)
+                return False
+        return True
+
+    def wait(self, key: tuple[str, Any], timeout: float) -> Optional[Entry]:
+        """Espera la carga en curso de ``key`` (si hay) y devuelve la entrada."""
+        with self._lock:
+            future = self._loading.get(key)
+        if future is not None:
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                pass
+        return self.peek(key)
+
+    def _load(self, key: tuple[str, Any], loader: Callable[[], Any]) -> None:
+        started = time.monotonic()
+        try:
+            value = loader()
+        except Exception as e:
+            logger.warning(f"[CHECKOUT-OPTIONS] Error actualizando {key}: {e}")
+            with self._lock:
+                entry = self._entries.setdefault(key, Entry())
+                entry.failed_at, entry.error = time.time(), str(e)[:200]
+        else:
+            logger.info(f"[CHECKOUT-OPTIONS] {key} actualizado en {time.monotonic() - started:.2f}s")
+            self.store(key, value)
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+
+    def needs_refresh(self, entry: Entry, now: float, refresh_seconds: float) -> bool:
+        if entry.failed_at and now - entry.failed_at < CHECKOUT_OPTIONS_RETRY_SECONDS:
+            return False
+        age = entry.age(now)
+        return age is None or age >= refresh_seconds
+
+    def _evict(self) -> None:
+        # Solo se descartan montos no precalentados (los medios de pago de
+        # cada tienda y los precios del catálogo quedan)
+        amounts = [key for key in self._entries if key[1] != METHODS_KEY and key[1] not in self.pinned]
+        for key in amounts[:max(0, len(amounts) - self.max_amounts)]:
+            if key not in self._loading:
+                del self._entries[key]
+
+    def due(self, now: float) -> list[tuple[str, Any]]:
+        """Claves leídas en la última ventana de refresco que están por vencer."""
+        with self._lock:
+            entries = list(self._entries.items())
+        return [
+            key for key, entry in entries
+            if now - entry.read_at < CHECKOUT_OPTIONS_REFRESH_SECONDS
+            and self.needs_refresh(entry, now, CHECKOUT_OPTIONS_REFRESH_SECONDS * REFRESH_AHEAD)
+        ]
+
+    def stats(self) -> dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            entries = list(self._entries.values())
+            loading = len(self._loading)
+        ages = [age for age in (entry.age(now) for entry in entries) if age is not None]
+        return {
+            'entries': len(entries),
+            'loading': loading,
+            'errors': sum(1 for entry in entries if entry.error),
+            'oldest_seconds': round(max(ages), 1) if ages else None,
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = OptionsCache()
+_known = KnownAmounts()
+_limiter = None
+
+
+def _mp_limiter():
+    global _limiter
+    if _limiter is None:
+        from .bulk import RateLimiter
+        _limiter = RateLimiter(CHECKOUT_OPTIONS_RATE)
+    return _limiter
+
+
+def _loader(tenant: Tenant, key: Any) -> Callable[[], Any]:
+    from .views import tenant_sdk
+
+    def load_methods():
+        _mp_limiter().acquire()
+        return fetch_payment_methods(tenant_sdk(tenant))
+
+    def load_installments():
+        # Las cuotas se piden para las tarjetas de la cuenta: si los medios
+        # de pago se están cargando se espera esa carga (no se piden dos veces)
+        methods = _cache.wait((tenant.id, METHODS_KEY), timeout=METHODS_WAIT_SECONDS)
+        if methods is None or methods.value is None:
+            methods = Entry(value=load_methods())
+            _cache.store((tenant.id, METHODS_KEY), methods.value)
+        return fetch_installments(tenant_sdk(tenant), key, methods.value, limiter=_mp_limiter())
+
+    return load_methods if key == METHODS_KEY else load_installments
+
+
+def checkout_options(tenant: Tenant, amount: Decimal) -> dict[str, Any]:
+    """
+    Medios de pago y cuotas para ``amount`` desde el cache (nunca espera a
+    MP). ``pending``: falta algo que se está pidiendo en segundo plano.
+    Un monto que no está en los conocidos (``KnownAmounts``) no se pide ni
+    se guarda: responde sin cuotas.
+    """
+    methods = _cache.get((tenant.id, METHODS_KEY), _loader(tenant, METHODS_KEY))
+    known = (tenant.id, amount) in _known
+    if known:
+        installments = _cache.get((tenant.id, amount), _loader(tenant, amount))
+    else:
+        installments = Entry()
+
+    now = time.time()
+    fetched = [entry.fetched_at for entry in (methods, installments) if entry.value is not None]
+    stale = any(
+        entry.value is not None and entry.age(now) >= CHECKOUT_OPTIONS_REFRESH_SECONDS
+        for entry in (methods, installments)
+    )
+    available = [method for method in methods.value or [] if _allows(method, amount)]
+    return {
+        'amount': str(amount),
+        'methods': available,
+        'installments': installments.value,
+        'pending': methods.value is None or (known and installments.value is None),
+        'stale': stale,
+        'updated_at': min(fetched) if fetched else None,
+    }
+
+
+def checkout_options_status() -> dict[str, Any]:
+    return {'enabled': CHECKOUT_OPTIONS_ENABLED, **_cache.stats()}
+
+
+# =============================================================================
+# REFRESCO EN SEGUNDO PLANO
+# =============================================================================
+
+class OptionsRefresher:
+    """Thread que refresca antes de vencer lo precalentado y lo consultado hace poco."""
+
+    def __init__(self, tick_seconds: float = REFRESH_TICK_SECONDS):
+        self.tick_seconds = tick_seconds
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name='checkout-options', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 5) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+
+    def warm(self) -> int:
+        """Pide medios de pago y los montos configurados de cada tienda que no estén frescos."""
+        scheduled = 0
+        now = time.time()
+        for tenant in get_registry().by_id.values():
+            for key in (METHODS_KEY, *configured_amounts()):
+                entry = _cache.peek((tenant.id, key)) or Entry()
+                if _cache.needs_refresh(entry, now, CHECKOUT_OPTIONS_REFRESH_SECONDS * REFRESH_AHEAD):
+                    scheduled += _cache.schedule((tenant.id, key), _loader(tenant, key))
+        return scheduled
+
+    def refresh_due(self) -> int:
+        registry = get_registry()
+        scheduled = 0
+        for tenant_id, key in _cache.due(time.time()):
+            tenant = registry.by_id.get(tenant_id)
+            if tenant is not None:
+                scheduled += _cache.schedule((tenant_id, key), _loader(tenant, key))
+        return scheduled
+
+    def run(self) -> None:
+        logger.info(f"[CHECKOUT-OPTIONS] Refresco iniciado (cada {CHECKOUT_OPTIONS_REFRESH_SECONDS:g}s)")
+        while not self._stop.is_set() and not coordinator.draining:
+            try:
+                _known.refresh_sales()
+                self.warm()
+                self.refresh_due()
+            except Exception:
+                logger.exception("[CHECKOUT-OPTIONS] Error en la ronda de refresco")
+            self._stop.wait(self.tick_seconds)
+
+
+_refresher: Optional[OptionsRefresher] = None
+_refresher_lock = threading.Lock()
+
+
+def start_options_refresher() -> Optional[OptionsRefresher]:
+    """Arranca el refresco del proceso (si CHECKOUT_OPTIONS_ENABLED)."""
+    global _refresher
+    if not CHECKOUT_OPTIONS_ENABLED:
+        return None
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = OptionsRefresher()
+        _refresher.start()
+    return _refresher
+
+
+def stop_options_refresher(timeout: Optional[float] = 5) -> None:
+    with _refresher_lock:
+        refresher = _refresher
+    if refresher is not None:
+        refresher.stop(timeout=timeout)
+    _cache.shutdown()
@@ -0,0 +1,42 @@
+"""
+Decoradores compartidos por las vistas de pagos.
+"""
+
+from __future__ import annotations
+
+import hmac
+import os
+from functools import wraps
+
+from django.http import JsonResponse
+
+
+def require_admin_token(view_func):
+    """
+    Restringe una vista interna a quien envíe ``ADMIN_API_TOKEN``.
+
+    El token se acepta como ``Authorization: Bearer <token>`` o en el header
+    ``X-Admin-Token``. Si ADMIN_API_TOKEN no está configurado, la vista solo
+    queda abierta con DEBUG=True (desarrollo local).
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        expected = os.getenv('ADMIN_API_TOKEN', '')
+
+        if not expected:
+            if os.getenv('DEBUG', 'False').lower() == 'true':
+                return view_func(request, *args, **kwargs)
+            return JsonResponse({
+                'success': False,
+                'error': 'ADMIN_API_TOKEN no configurado'
+            }, status=403)
+
+        auth_header = request.headers.get('Authorization', '')
+        provided = auth_header[7:] if auth_header.startswith('Bearer ') else request.headers.get('X-Admin-Token', '')
+
+        if not provided or not hmac.compare_digest(provided.encode(), expected.encode()):
+            return JsonResponse({'success': False, 'error': 'No autorizado'}, status=401)
+
+        return view_func(request, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,306 @@
+"""
+Entregas por email - Datos con Alex
+====================================
+- record_delivery_attempt: registra cada envío de archivos (DeliveryAttempt)
+  y marca la orden como entregada con el primer envío exitoso.
+- resend_order_files: reenvío pedido por el propio comprador (email +
+  número de orden o de operación de MP), con límites para que no se use
+  como relay de spam:
+    * por IP: RESEND_MAX_PER_IP_PER_HOUR consultas (exitosas o no). La IP
+      es la que agregó el proxy de confianza a X-Forwarded-For
+      (TRUSTED_PROXY_HOPS desde la derecha), no la que manda el cliente
+    * por email y por número de orden: RESEND_MAX_PER_TARGET_PER_HOUR
+      consultas cada uno, cambie o no la IP (contra el barrido de datos)
+    * por orden: RESEND_MAX_PER_DAY reenvíos y al menos
+      RESEND_MIN_INTERVAL_SECONDS entre uno y otro (contados en la base,
+      valen para todos los workers)
+  Los adjuntos salen del cache de planillas personalizadas (services.py).
+- payment_delivered: si el pago ya se entregó (en la base: sobrevive a
+  los reinicios, a diferencia del set en memoria de views.py).
+- requeue_delivery: deja una entrega cortada por el apagado agendada para
+  el watcher (shutdown.py).
+
+Ninguna función levanta excepciones de base de datos: se loguean.
+====================================
+"""
+
+from __future__ import annotations
+
+import datetime
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from types import SimpleNamespace
+from typing import Any, Optional
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Q
+from django.utils import timezone
+
+from .tenants import current_tenant, get_tenant, using_tenant
+from .tracing import bind_trace, trace_id_for
+
+logger = logging.getLogger(__name__)
+
+RESEND_MAX_PER_DAY = int(os.getenv('RESEND_MAX_PER_DAY', '3'))
+RESEND_MIN_INTERVAL_SECONDS = int(os.getenv('RESEND_MIN_INTERVAL_SECONDS', '300'))
+RESEND_MAX_PER_IP_PER_HOUR = int(os.getenv('RESEND_MAX_PER_IP_PER_HOUR', '10'))
+RESEND_MAX_PER_TARGET_PER_HOUR = int(os.getenv('RESEND_MAX_PER_TARGET_PER_HOUR', '5'))
+
+# Proxies delante de Django que agregan la IP a X-Forwarded-For (Railway: 1).
+# 0 = usar REMOTE_ADDR
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', '1'))
+
+DELIVERY_SOURCES = {'validate', 'webhook', 'watcher', 'resend', 'manual'}
+
+
+def email_provider() -> str:
+    """Proveedor configurado, ej: 'smtp:smtp.gmail.com'."""
+    backend = settings.EMAIL_BACKEND.rsplit('.', 2)[-2]
+    return f"{backend}:{current_tenant().email_host}" if backend == 'smtp' else backend
+
+
+def record_delivery_attempt(
+    order: Any,
+    source: str,
+    payment_id: Optional[str],
+    success: bool,
+    latency_ms: int,
+    attachments: int = 0,
+    error: Optional[str] = None,
+) -> None:
+    """Registra un envío. ``order`` es la orden (o el SimpleNamespace de las vistas)."""
+    from .models import DeliveryAttempt, Order
+
+    reference = str(getattr(order, 'external_reference', None) or getattr(order, 'id', '') or '')
+    try:
+        if isinstance(order, Order):
+            stored = order
+        elif reference or payment_id:
+            stored = Order.objects.filter(
+                Q(external_reference=reference) | Q(payment_id=payment_id or reference)
+            ).first()
+        else:
+            stored = None
+        DeliveryAttempt.objects.create(
+            order=stored,
+            external_reference=reference[:64],
+            payment_id=payment_id,
+            source=source if source in DELIVERY_SOURCES else 'manual',
+            provider=email_provider()[:100],
+            recipient=getattr(order, 'email', '') or '',
+            success=success,
+            latency_ms=max(0, latency_ms),
+            attachments=attachments,
+            error=error or '',
+        )
+        if success and stored is not None:
+            Order.objects.filter(pk=stored.pk, delivered_at__isnull=True).update(delivered_at=timezone.now())
+    except DatabaseError:
+        logger.exception(f"[DELIVERY] Error registrando el envío de {reference}")
+
+
+def payment_delivered(payment_id: str) -> bool:
+    """True si la orden del pago ya tiene una entrega exitosa."""
+    from .models import Order
+
+    try:
+        return Order.objects.filter(payment_id=payment_id, delivered_at__isnull=False).exists()
+    except DatabaseError:
+        logger.exception(f"[DELIVERY] Error consultando la entrega de {payment_id}")
+        return False
+
+
+def requeue_delivery(order: Any, payment_id: Optional[str]) -> bool:
+    """
+    Agenda la orden para que el watcher la vuelva a entregar (envío que
+    el apagado no pudo esperar). True si quedó agendada.
+    """
+    from .models import Order
+
+    reference = str(getattr(order, 'external_reference', None) or getattr(order, 'id', '') or '')
+    if not reference and not payment_id:
+        return False
+    try:
+        updated = Order.objects.filter(
+            Q(external_reference=reference) | Q(payment_id=payment_id or reference),
+            delivered_at__isnull=True,
+            payment_id__isnull=False,
+        ).update(next_check_at=timezone.now())
+    except DatabaseError:
+        logger.exception(f"[DELIVERY] No se pudo reencolar la entrega de {reference}")
+        return False
+    return bool(updated)
+
+
+def delivery_history(key: str) -> list[dict[str, Any]]:
+    """Intentos de entrega de un pago / orden (más recientes primero)."""
+    from .models import DeliveryAttempt
+
+    try:
+        return list(
+            DeliveryAttempt.objects.filter(Q(external_reference=key) | Q(payment_id=key)).values(
+                'created_at', 'source', 'provider', 'recipient', 'success', 'latency_ms', 'attachments', 'error'
+            )
+        )
+    except DatabaseError:
+        logger.exception(f"[DELIVERY] Error leyendo entregas de {key}")
+        return []
+
+
+class SlidingWindowLimiter:
+    """Como máximo ``limit`` eventos por clave en ``window`` segundos (en memoria)."""
+
+    def __init__(self, limit: int, window: float, max_keys: int = 10000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._hits: OrderedDict[str, deque] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key: str) -> Optional[float]:
+        """Registra un evento. Devuelve None si se permite, o los segundos a esperar."""
+        now = time.monotonic()
+        with self._lock:
+            hits = self._hits.pop(key, None) or deque()
+            while hits and now - hits[0] >= self.window:
+                hits.popleft()
+            self._hits[key] = hits
+            if len(self._hits) > self.max_keys:
+                self._hits.popitem(last=False)
+            if len(hits) >= self.limit:
+                return self.window - (now - hits[0])
+            hits.append(now)
+            return None
+
+
+_ip_limiter = SlidingWindowLimiter(RESEND_MAX_PER_IP_PER_HOUR, 3600)
+_target_limiter = SlidingWindowLimiter(RESEND_MAX_PER_TARGET_PER_HOUR, 3600)
+
+
+def client_ip(request, trusted_hops: int = TRUSTED_PROXY_HOPS) -> str:
+    """
+    IP del cliente según el proxy de confianza: la entrada ``trusted_hops``
+    desde la derecha de X-Forwarded-For (las de la izquierda las puede
+    escribir cualquiera). Sin proxy o sin header, REMOTE_ADDR.
+    """
+    remote_addr = request.META.get('REMOTE_ADDR', '')
+    if trusted_hops <= 0:
+        return remote_addr
+    forwarded = [part.strip() for part in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if part.strip()]
+    if len(forwarded) < trusted_hops:
+        return forwarded[0] if forwarded else remote_addr
+    return forwarded[-trusted_hops]
+
+
+def _order_retry_after(order) -> Optional[int]:
+    """Segundos a esperar antes de otro reenvío de ``order`` (None = permitido)."""
+    from .models import DeliveryAttempt
+
+    now = timezone.now()
+    # Por referencia también: al archivar la orden, ``order`` de los intentos queda en NULL
+    same_order = Q(order_id=order.pk)
+    if order.external_reference:
+        same_order |= Q(external_reference=order.external_reference)
+    resends = DeliveryAttempt.objects.filter(
+        same_order, source='resend', created_at__gte=now - datetime.timedelta(days=1)
+    ).order_by('created_at')
+    timestamps = list(resends.values_list('created_at', flat=True))
+    if timestamps and (now - timestamps[-1]).total_seconds() < RESEND_MIN_INTERVAL_SECONDS:
+        return int(RESEND_MIN_INTERVAL_SECONDS - (now - timestamps[-1]).total_seconds()) + 1
+    if len(timestamps) >= RESEND_MAX_PER_DAY:
+        return int((timestamps[0] + datetime.timedelta(days=1) - now).total_seconds()) + 1
+    return None
+
+
+def _archived_approved_order(reference: str, email: str):
+    """Orden aprobada en el archivo (compras viejas) con ese email, o None."""
+    from .archive import get_archive
+
+    try:
+        order = get_archive().find_order(reference)
+    except (OSError, ValueError):
+        logger.exception(f"[DELIVERY] Error buscando {reference} en el archivo")
+        return None
+    if order is None or order.status != 'approved' or (order.email or '').lower() != email:
+        return None
+    return order
+
+
+def resend_order_files(email: str, reference: str, client_ip: str = '') -> tuple[int, dict[str, Any]]:
+    """
+    Reenvía los archivos de una compra aprobada al email de la orden.
+
+    Returns:
+        (status HTTP, cuerpo JSON). 429 incluye ``retry_after`` en segundos.
+    """
+    from .models import Order
+    from .services import send_product_email
+
+    email = (email or '').strip().lower()
+    reference = (reference or '').strip()
+    if not email or '@' not in email or not reference:
+        return 400, {'success': False, 'error': 'Ingresá el email de la compra y el número de orden'}
+
+    retry_after = _ip_limiter.hit(client_ip or 'unknown')
+    for key in (f"email:{email}", f"reference:{reference}"):
+        if retry_after is None:
+            retry_after = _target_limiter.hit(key)
+    if retry_after is not None:
+        return 429, {
+            'success': False,
+            'error': 'Demasiados intentos. Probá de nuevo más tarde.',
+            'retry_after': int(retry_after) + 1,
+        }
+
+    try:
+        order = Order.objects.filter(
+            Q(external_reference=reference) | Q(payment_id=reference),
+            email__iexact=email,
+            status='approved',
+        ).first()
+        if order is None:
+            order = _archived_approved_order(reference, email)
+        retry_after = _order_retry_after(order) if order else None
+    except DatabaseError:
+        logger.exception(f"[DELIVERY] Error buscando la orden {reference}")
+        return 503, {'success': False, 'error': 'No pudimos procesar el pedido, probá en unos minutos'}
+
+    if order is None:
+        # Mismo mensaje exista o no la orden: no se puede usar para adivinar compras
+        return 404, {'success': False, 'error': 'No encontramos una compra aprobada con ese email y número de orden'}
+
+    if retry_after is not None:
+        return 429, {
+            'success': False,
+            'error': 'Ya te reenviamos los archivos hace poco. Revisá tu casilla (y spam).',
+            'retry_after': retry_after,
+        }
+
+    logger.info(f"[DELIVERY] Reenvío pedido por el comprador: orden {order.external_reference}")
+    bind_trace(trace_id_for(order.external_reference))
+    # Remitente y archivos de la tienda de la orden (no la del request)
+    with using_tenant(get_tenant(order.tenant)):
+        sent = send_product_email(
+            SimpleNamespace(
+                id=order.external_reference or order.payment_id,
+                first_name=order.first_name,
+                last_name=order.last_name,
+                email=order.email,
+                course_title=order.course_title,
+                course_id=order.course_id,
+                price=order.price,
+                status=order.status,
+            ),
+            source='resend',
+            payment_id=order.payment_id,
+        )
+    if not sent:
+        return 502, {
+            'success': False,
+            'error': 'No pudimos reenviar el email. Escribinos a datos.conalex@gmail.com',
+        }
+    return 200, {'success': True, 'message': 'Te reenviamos los archivos. Revisá tu casilla (y spam).'}
@@ -0,0 +1,399 @@
+"""
+Event store de pagos - Datos con Alex
+======================================
+Persiste los eventos de ``log_payment_event`` (que antes solo iban a
+stdout) en un almacenamiento append-only, para poder responder "¿qué pasó
+con el pago X?" después de un redeploy.
+
+FORMATO EN DISCO (EVENT_STORE_DIR):
+    events-<inicio>-<pid>-<seq>.log.gz   Segmento: miembros gzip concatenados
+    events-<inicio>-<pid>-<seq>.idx      Índice: "clave<TAB>offset" por línea
+
+- Cada proceso escribe sus propios segmentos (sin locks entre workers).
+- Escritura con group commit: un thread junta los eventos de hasta
+  EVENT_STORE_FLUSH_MS, los escribe como UN miembro gzip y hace un solo
+  fsync. ``append`` nunca bloquea el request.
+- Al superar EVENT_STORE_SEGMENT_BYTES se rota a un segmento nuevo.
+- El índice guarda, para cada payment_id y external_reference, el offset
+  del miembro gzip que lo contiene: una consulta lee solo los índices y
+  descomprime únicamente los miembros necesarios.
+- Los segmentos viejos se mueven al archivo (archive.py, mismo formato);
+  las lecturas los incluyen.
+
+CONFIGURACIÓN:
+- EVENT_STORE_ENABLED: "False" para desactivar (solo logs)
+- EVENT_STORE_DIR: directorio de segmentos (default backend/data/events).
+  En producción tiene que estar en un volumen persistente (Railway: volumen
+  montado, ej. /data/events): el disco del contenedor se borra en cada
+  deploy. Con DEBUG=False y el store en ese disco se loguea un error y
+  system-status marca ``event_store_persistent`` en falso.
+- EVENT_STORE_SEGMENT_BYTES: tamaño de rotación (default 8 MB)
+- EVENT_STORE_FLUSH_MS: ventana de group commit (default 50 ms)
+======================================
+"""
+
+from __future__ import annotations
+
+import atexit
+import datetime
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+EVENT_STORE_ENABLED = os.getenv('EVENT_STORE_ENABLED', 'True').lower() == 'true'
+EVENT_STORE_SEGMENT_BYTES = int(os.getenv('EVENT_STORE_SEGMENT_BYTES', str(8 * 1024 * 1024)))
+EVENT_STORE_FLUSH_MS = int(os.getenv('EVENT_STORE_FLUSH_MS', '50'))
+
+# Eventos máximos por miembro gzip
+MAX_BATCH_EVENTS = 500
+
+# Campos indexados
+INDEXED_FIELDS = ('payment_id', 'external_reference')
+
+# Valores que no se indexan (placeholders de los logs)
+_UNINDEXED_VALUES = {'', 'N/A', 'None'}
+
+
+def default_store_dir() -> Path:
+    configured = os.getenv('EVENT_STORE_DIR')
+    if configured:
+        return Path(configured)
+    from django.conf import settings
+    return Path(settings.BASE_DIR) / 'data' / 'events'
+
+
+def is_ephemeral_dir(path: Path) -> bool:
+    """
+    True si ``path`` está en el disco del contenedor (dentro de BASE_DIR y
+    sin un punto de montaje en el medio: un volumen montado en
+    backend/data cuenta como persistente).
+    """
+    from django.conf import settings
+
+    base = Path(settings.BASE_DIR).resolve()
+    current = Path(path).resolve()
+    if current != base and base not in current.parents:
+        return False
+    while current != base:
+        if current.exists() and os.path.ismount(current):
+            return False
+        current = current.parent
+    return True
+
+
+def store_is_persistent() -> bool:
+    """Si el event store sobrevive a un redeploy (siempre True con DEBUG o deshabilitado)."""
+    from django.conf import settings
+
+    if not EVENT_STORE_ENABLED or settings.DEBUG:
+        return True
+    return not is_ephemeral_dir(default_store_dir())
+
+
+def _index_keys(event: dict[str, Any]) -> set[str]:
+    keys: set[str] = set()
+    for field in INDEXED_FIELDS:
+        value = event.get(field)
+        if value is not None and str(value) not in _UNINDEXED_VALUES:
+            keys.add(str(value))
+    return keys
+
+
+def _compress_member(lines: list[bytes], level: int = 6) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31 = formato gzip
+    return compressor.compress(b''.join(lines)) + compressor.flush()
+
+
+def _read_member(path: Path, offset: int) -> list[dict[str, Any]]:
+    """Descomprime el miembro gzip que empieza en ``offset``."""
+    decompressor = zlib.decompressobj(31)
+    chunks: list[bytes] = []
+    with open(path, 'rb') as segment:
+        segment.seek(offset)
+        while not decompressor.eof:
+            block = segment.read(64 * 1024)
+            if not block:
+                break
+            chunks.append(decompressor.decompress(block))
+    return [json.loads(line) for line in b''.join(chunks).splitlines() if line]
+
+
+def iter_segment(path: Path) -> Iterator[dict[str, Any]]:
+    """Todos los eventos de un segmento, en orden de escritura."""
+    with open(path, 'rb') as segment:
+        data = segment.read()
+    while data:
+        decompressor = zlib.decompressobj(31)
+        try:
+            payload = decompressor.decompress(data)
+        except zlib.error:
+            logger.warning(f"[EVENTS] Segmento truncado: {path.name}")
+            return
+        if not decompressor.eof:
+            return  # último miembro incompleto (escritura interrumpida)
+        for line in payload.splitlines():
+            if line:
+                yield json.loads(line)
+        data = decompressor.unused_data
+
+
+class EventStore:
+    """Writer append-only con group commit + lector indexado."""
+
+    def __init__(
+        self,
+        directory: Path,
+        segment_bytes: int = EVENT_STORE_SEGMENT_BYTES,
+        flush_ms: int = EVENT_STORE_FLUSH_MS,
+    ):
+        self.directory = Path(directory)
+        self.segment_bytes = segment_bytes
+        self.flush_seconds = flush_ms / 1000
+        self._queue: queue.Queue[Optional[dict[str, Any]]] = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._prefix = f"events-{int(time.time() * 1000)}-{os.getpid()}"
+        self._seq = 0
+        self._segment_size = 0
+        # Índices de segmentos ya leídos: ruta -> (tamaño, {clave: [offsets]})
+        self._index_cache: dict[Path, tuple[int, dict[str, list[int]]]] = {}
+
+    # -------------------------------------------------------------------------
+    # Escritura
+    # -------------------------------------------------------------------------
+
+    def append(self, event: dict[str, Any]) -> None:
+        """Encola un evento. No bloquea: la escritura es en background."""
+        self._ensure_writer()
+        self._queue.put(event)
+
+    def pending(self) -> int:
+        """Eventos encolados que todavía no están en disco."""
+        return self._queue.unfinished_tasks
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Espera (hasta ``timeout``) a que los eventos encolados estén en disco."""
+        deadline = time.monotonic() + timeout
+        while self.pending() and time.monotonic() < deadline:
+            time.sleep(0.005)
+        return not self.pending()
+
+    def close(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+
+    def _ensure_writer(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self.directory.mkdir(parents=True, exist_ok=True)
+            # Tras un fork (gunicorn) el proceso hijo usa sus propios segmentos
+            self._prefix = f"events-{int(time.time() * 1000)}-{os.getpid()}"
+            self._seq = 0
+            self._segment_size = 0
+            self._thread = threading.Thread(target=self._run, name='event-store-writer', daemon=True)
+            self._thread.start()
+
+    def _segment_paths(self) -> tuple[Path, Path]:
+        base = self.directory / f"{self._prefix}-{self._seq:06d}"
+        return base.with_suffix('.log.gz'), base.with_suffix('.idx')
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                self._queue.task_done()
+                return
+
+            batch = [first]
+            deadline = time.monotonic() + self.flush_seconds
+            stop = False
+            while len(batch) < MAX_BATCH_EVENTS:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    event = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if event is None:
+                    stop = True
+                    break
+                batch.append(event)
+
+            try:
+                self._write_batch(batch)
+            except Exception:
+                logger.exception(f"[EVENTS] Error escribiendo {len(batch)} eventos")
+            finally:
+                for _ in range(len(batch) + (1 if stop else 0)):
+                    self._queue.task_done()
+
+            if stop:
+                return
+
+    def _write_batch(self, batch: list[dict[str, Any]]) -> None:
+        if self._segment_size >= self.segment_bytes:
+            self._seq += 1
+            self._segment_size = 0
+
+        log_path, index_path = self._segment_paths()
+        lines = [json.dumps(event, ensure_ascii=False, default=str).encode('utf-8') + b'\n' for event in batch]
+        member = _compress_member(lines)
+
+        # O_APPEND + una sola escritura por miembro: el segmento nunca queda
+        # con un miembro a medio escribir entre dos batches
+        fd = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            offset = os.lseek(fd, 0, os.SEEK_END)
+            os.write(fd, member)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self._segment_size = offset + len(member)
+
+        keys: set[str] = set()
+        for event in batch:
+            keys |= _index_keys(event)
+        if keys:
+            with open(index_path, 'a', encoding='utf-8') as index_file:
+                index_file.write(''.join(f"{key}\t{offset}\n" for key in sorted(keys)))
+
+    # -------------------------------------------------------------------------
+    # Lectura
+    # -------------------------------------------------------------------------
+
+    def hot_segments(self) -> list[Path]:
+        """Segmentos de este directorio en orden cronológico (por nombre)."""
+        if not self.directory.exists():
+            return []
+        return sorted(self.directory.glob('events-*.log.gz'))
+
+    def segments(self, since_iso: Optional[str] = None, until_iso: Optional[str] = None) -> list[Path]:
+        """
+        Segmentos archivados (ver archive.py) que cubren el rango + los del
+        directorio, en orden cronológico.
+        """
+        from .archive import get_archive
+
+        archive = get_archive()
+        try:
+            archived = archive.event_segments(since_iso, until_iso)
+            moved = archive.archived_sources()
+        except (OSError, ValueError):
+            logger.exception("[EVENTS] No se pudo leer el manifest del archivo")
+            archived, moved = [], {}
+        hot = []
+        for path in self.hot_segments():
+            try:
+                # Ya archivado pero sin borrar (corrida interrumpida)
+                if moved.get(path.name) == path.stat().st_mtime_ns:
+                    continue
+            except FileNotFoundError:
+                continue  # lo borró una corrida de archivado en curso
+            hot.append(path)
+        return archived + hot
+
+    def _load_index(self, index_path: Path) -> dict[str, list[int]]:
+        try:
+            size = index_path.stat().st_size
+        except FileNotFoundError:
+            return {}
+        cached = self._index_cache.get(index_path)
+        if cached and cached[0] == size:
+            return cached[1]
+
+        index: dict[str, list[int]] = {}
+        with open(index_path, encoding='utf-8') as index_file:
+            for line in index_file:
+                key, _, offset = line.rstrip('\n').rpartition('\t')
+                if key:
+                    index.setdefault(key, []).append(int(offset))
+        self._index_cache[index_path] = (size, index)
+        return index
+
+    def _find(self, keys: set[str]) -> list[dict[str, Any]]:
+        events: list[dict[str, Any]] = []
+        for log_path in self.segments():
+            index = self._load_index(log_path.with_name(log_path.name.replace('.log.gz', '.idx')))
+            offsets = sorted({offset for key in keys for offset in index.get(key, [])})
+            for offset in offsets:
+                for event in _read_member(log_path, offset):
+                    if _index_keys(event) & keys:
+                        events.append(event)
+        return events
+
+    def timeline(self, key: str) -> list[dict[str, Any]]:
+        """
+        Historia completa de un pago, buscando por payment_id o
+        external_reference. Sigue un salto de relaciones: desde el
+        payment_id se llega a la preferencia (external_reference) y viceversa.
+        """
+        keys = {str(key)}
+        events = self._find(keys)
+        related = set().union(*(_index_keys(event) for event in events)) if events else set()
+        if related - keys:
+            events = self._find(keys | related)
+        events.sort(key=lambda event: event.get('ts', ''))
+        return events
+
+    def iter_events(
+        self,
+        since: Optional[datetime.datetime] = None,
+        until: Optional[datetime.datetime] = None,
+    ) -> Iterator[dict[str, Any]]:
+        """Recorre todos los eventos (para exportación), filtrando por ``ts``."""
+        since_iso = since.astimezone(datetime.timezone.utc).isoformat() if since else None
+        until_iso = until.astimezone(datetime.timezone.utc).isoformat() if until else None
+        for log_path in self.segments(since_iso, until_iso):
+            for event in iter_segment(log_path):
+                ts = event.get('ts', '')
+                if since_iso and ts < since_iso:
+                    continue
+                if until_iso and ts >= until_iso:
+                    continue
+                yield event
+
+
+_store: Optional[EventStore] = None
+_store_lock = threading.Lock()
+
+
+def get_event_store() -> EventStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = EventStore(default_store_dir())
+                atexit.register(_store.close)
+                if not store_is_persistent():
+                    logger.error(
+                        f"[EVENTS] El event store está en el disco efímero del contenedor ({_store.directory}): "
+                        f"el historial de pagos se pierde en cada deploy. Configurar EVENT_STORE_DIR en un volumen."
+                    )
+    return _store
+
+
+def record_event(event: dict[str, Any]) -> None:
+    """
+    Guarda un evento de pago (si el store está habilitado). Nunca levanta.
+    Agrega ``ts`` en UTC (ISO 8601) si el evento no lo trae.
+    """
+    if not EVENT_STORE_ENABLED:
+        return
+    try:
+        event.setdefault('ts', datetime.datetime.now(datetime.timezone.utc).isoformat())
+        get_event_store().append(event)
+    except Exception:
+        logger.exception("[EVENTS] No se pudo encolar el evento")
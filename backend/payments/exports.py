@@ -0,0 +1,217 @@
+"""
+Exportación de órdenes y eventos de pago - Datos con Alex
+==========================================================
+Genera el historial de ventas como CSV o XLSX sin cargarlo en memoria:
+
+- CSV: generador que produce una línea por orden (StreamingHttpResponse)
+- XLSX: workbook write-only de openpyxl, que escribe las filas a un
+  archivo temporal a medida que llegan (memoria constante)
+
+Las órdenes se leen con ``.iterator()`` en bloques, filtrando por rangos
+de ``created_at`` (índices orders_created_idx / orders_course_created_idx).
+Las órdenes archivadas (archive.py) se intercalan por fecha con las de la
+tabla. Los eventos de pago se leen segmento por segmento desde el event
+store (que incluye los segmentos archivados).
+
+Los textos los escribe el comprador (nombre, email): los que empiezan como
+una fórmula (=, +, -, @, tab, CR) en el CSV llevan un apóstrofo adelante
+(``safe_cell``) para que Excel los muestre como texto y no los ejecute. En
+el XLSX el tipo de celda viaja en el archivo: se escriben como celdas de
+texto explícitas (``_xlsx_cell``), sin apóstrofo que se vea en la planilla.
+==========================================================
+"""
+
+from __future__ import annotations
+
+import csv
+import datetime
+import heapq
+import json
+from decimal import Decimal
+from typing import Any, BinaryIO, Iterable, Iterator, Optional
+
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from .archive import get_archive, skip_hot
+from .event_store import get_event_store
+from .models import Order
+
+# Columnas exportadas (encabezado, atributo de Order)
+ORDER_COLUMNS: list[tuple[str, str]] = [
+    ('id', 'id'),
+    ('external_reference', 'external_reference'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+    ('status', 'status'),
+    ('course_id', 'course_id'),
+    ('course_title', 'course_title'),
+    ('price', 'price'),
+    ('first_name', 'first_name'),
+    ('last_name', 'last_name'),
+    ('email', 'email'),
+    ('document', 'document'),
+    ('payment_id', 'payment_id'),
+    ('preference_id', 'preference_id'),
+]
+
+# Inicios de texto que Excel / LibreOffice interpretan como fórmula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+# Filas leídas por viaje a la base de datos
+EXPORT_CHUNK_SIZE = 2000
+
+
+def _start_of_day(day: datetime.date) -> datetime.datetime:
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def filter_orders(
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    course_id: Optional[str] = None,
+    status: Optional[str] = None,
+) -> QuerySet:
+    """
+    Órdenes a exportar, en orden cronológico.
+
+    Los días se convierten a un rango [inicio, fin) de ``created_at``
+    (en vez de ``created_at__date``) para que la consulta use el índice.
+    """
+    queryset = Order.objects.all()
+    if date_from:
+        queryset = queryset.filter(created_at__gte=_start_of_day(date_from))
+    if date_to:
+        queryset = queryset.filter(created_at__lt=_start_of_day(date_to + datetime.timedelta(days=1)))
+    if course_id:
+        queryset = queryset.filter(course_id=course_id)
+    if status:
+        queryset = queryset.filter(status=status)
+    return queryset.order_by('created_at', 'id')
+
+
+def _format_value(value: Any) -> Any:
+    if isinstance(value, datetime.datetime):
+        return timezone.localtime(value).strftime('%Y-%m-%d %H:%M:%S')
+    if value is None:
+        return ''
+    return value
+
+
+def iter_order_rows(queryset: QuerySet) -> Iterator[list[Any]]:
+    """Filas de órdenes (sin encabezado), leídas en bloques."""
+    attributes = [attribute for _, attribute in ORDER_COLUMNS]
+    for values in queryset.values_list(*attributes).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield [_format_value(value) for value in values]
+
+
+def iter_all_order_rows(
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    course_id: Optional[str] = None,
+    status: Optional[str] = None,
+) -> Iterator[list[Any]]:
+    """
+    Como ``iter_order_rows(filter_orders(...))`` pero sumando las órdenes
+    archivadas, en orden cronológico (merge de los dos lados ya ordenados).
+    """
+    attributes = [attribute for _, attribute in ORDER_COLUMNS]
+    hot = filter_orders(date_from, date_to, course_id, status).values_list('created_at', 'id', *attributes)
+    since = _start_of_day(date_from) if date_from else None
+    until = _start_of_day(date_to + datetime.timedelta(days=1)) if date_to else None
+    archived = (
+        (order.created_at, order.pk, *(getattr(order, attribute) for attribute in attributes))
+        for order in skip_hot(get_archive().iter_orders(since, until, course_id, status))
+    )
+    for values in heapq.merge(archived, hot.iterator(chunk_size=EXPORT_CHUNK_SIZE), key=lambda row: row[:2]):
+        yield [_format_value(value) for value in values[2:]]
+
+
+def order_headers() -> list[str]:
+    return [header for header, _ in ORDER_COLUMNS]
+
+
+# Columnas fijas de eventos; el resto de los campos va en "details" (JSON)
+EVENT_COLUMNS: list[str] = ['ts', 'event', 'payment_id', 'external_reference', 'status', 'production']
+
+
+def event_headers() -> list[str]:
+    return EVENT_COLUMNS + ['details']
+
+
+def iter_event_rows(
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+) -> Iterator[list[Any]]:
+    """Filas de eventos de pago del event store (sin encabezado)."""
+    since = _start_of_day(date_from) if date_from else None
+    until = _start_of_day(date_to + datetime.timedelta(days=1)) if date_to else None
+    for event in get_event_store().iter_events(since=since, until=until):
+        details = {key: value for key, value in event.items() if key not in EVENT_COLUMNS}
+        row = [_format_value(event.get(column)) for column in EVENT_COLUMNS]
+        row.append(json.dumps(details, ensure_ascii=False, default=str) if details else '')
+        yield row
+
+
+def safe_cell(value: Any) -> Any:
+    """Texto con apóstrofo adelante si Excel lo tomaría como fórmula (CSV injection)."""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+class _EchoBuffer:
+    """Pseudo-archivo: csv.writer escribe y devolvemos la línea sin acumular."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def iter_csv(headers: list[str], rows: Iterable[list[Any]]) -> Iterator[bytes]:
+    """
+    Genera el CSV línea por línea (UTF-8 con BOM para que Excel
+    reconozca los acentos al abrirlo).
+    """
+    writer = csv.writer(_EchoBuffer())
+    yield '\ufeff'.encode('utf-8') + writer.writerow([safe_cell(value) for value in headers]).encode('utf-8')
+    for row in rows:
+        yield writer.writerow([safe_cell(value) for value in row]).encode('utf-8')
+
+
+def write_xlsx(
+    target: BinaryIO | str,
+    sheets: list[tuple[str, list[str], Iterable[list[Any]]]],
+) -> None:
+    """
+    Escribe un XLSX con openpyxl en modo write-only (memoria constante).
+
+    Args:
+        target: Archivo binario o ruta de destino
+        sheets: Lista de (nombre de hoja, encabezados, filas)
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    for title, headers, rows in sheets:
+        worksheet = workbook.create_sheet(title=title)
+        worksheet.append([_xlsx_cell(worksheet, value) for value in headers])
+        for row in rows:
+            worksheet.append([_xlsx_cell(worksheet, value) for value in row])
+    workbook.save(target)
+
+
+def _xlsx_cell(worksheet, value: Any) -> Any:
+    """
+    Valor para ``worksheet.append``. openpyxl guarda como fórmula todo texto
+    que empieza con '='; esos (y el resto de FORMULA_PREFIXES) van como celda
+    de texto explícita, que Excel muestra tal cual y nunca evalúa.
+    """
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        from openpyxl.cell import WriteOnlyCell
+
+        cell = WriteOnlyCell(worksheet, value=value)
+        cell.data_type = 's'
+        return cell
+    return value
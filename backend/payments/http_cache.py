@@ -0,0 +1,347 @@
+"""
+Cache y compresión HTTP de la API de pagos - Datos con Alex
+============================================================
+Middleware para los endpoints de solo lectura que antes recalculaban su
+JSON en cada hit y lo devolvían sin comprimir ni headers de cache.
+
+- CACHE_POLICIES: por ruta, Cache-Control y cuánto vive la respuesta en
+  el cache en memoria del proceso (la vista no se ejecuta en un hit).
+- ETag (hash del contenido) y Last-Modified en cada respuesta cacheada;
+  If-None-Match / If-Modified-Since responden 304 sin cuerpo.
+- Invalidación por catálogo: las rutas marcadas ``catalog`` se descartan
+  cuando cambia el catálogo de la tienda o cualquier archivo de su
+  carpeta (se revisa como mucho una vez por segundo).
+- Con varias tiendas (tenants.py) la clave incluye la tienda y cada una
+  tiene su propia versión de catálogo.
+- Compresión brotli (si el paquete ``brotli`` está instalado) o gzip para
+  toda respuesta de /api/payments/ mayor a API_COMPRESS_MIN_BYTES. En las
+  respuestas cacheadas cada variante se comprime una sola vez.
+
+CONFIGURACIÓN:
+- API_CACHE_ENABLED: "False" para desactivar el middleware
+- API_COMPRESS_MIN_BYTES: tamaño mínimo para comprimir (default 1024)
+============================================================
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
+
+from .tenants import Tenant, current_tenant, get_registry, get_tenant
+
+try:
+    import brotli
+except ImportError:  # opcional: sin brotli se usa gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+API_CACHE_ENABLED = os.getenv('API_CACHE_ENABLED', 'True').lower() == 'true'
+API_COMPRESS_MIN_BYTES = int(os.getenv('API_COMPRESS_MIN_BYTES', '1024'))
+
+API_PREFIX = '/api/payments/'
+
+# Tipos de contenido que vale la pena comprimir
+COMPRESSIBLE_TYPES = ('application/json', 'text/', 'application/x-ndjson', 'image/svg+xml')
+
+# Entradas máximas del cache en memoria
+CACHE_MAX_ENTRIES = 256
+
+# Cada cuánto se revisa si cambió el catálogo (segundos)
+CATALOG_CHECK_SECONDS = 1.0
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    cache_control: str
+    ttl: float
+    catalog: bool = False  # invalidar cuando cambian productos / archivos
+
+
+# Rutas relativas a /api/payments/ (solo GET/HEAD)
+CACHE_POLICIES: dict[str, CachePolicy] = {
+    'health/': CachePolicy('public, max-age=10', ttl=10),
+    'webhook/': CachePolicy('public, max-age=300', ttl=300),
+    'products-check/': CachePolicy('public, max-age=60', ttl=300, catalog=True),
+    'system-status/': CachePolicy('private, max-age=30', ttl=30, catalog=True),
+    # Corto: una vista previa pendiente (ver previews.py) aparece al generarse
+    'previews/': CachePolicy('public, max-age=60', ttl=30, catalog=True),
+}
+
+
+@dataclass
+class CachedResponse:
+    content: bytes
+    content_type: str
+    etag: str
+    last_modified: float
+    expires: float
+    catalog_version: Optional[str]
+    encoded: dict[str, bytes] = field(default_factory=dict)
+
+
+# =============================================================================
+# CATÁLOGO (productos + archivos)
+# =============================================================================
+
+class CatalogVersion:
+    """Versión del catálogo de una tienda: cambia si cambian sus productos o algún archivo."""
+
+    def __init__(self, files_dir: Optional[Path] = None, tenant_id: Optional[str] = None):
+        self._files_dir = files_dir
+        self.tenant_id = tenant_id
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self._version = ''
+        self._last_modified = 0.0
+
+    @property
+    def files_dir(self) -> Path:
+        if self._files_dir is None:
+            self._files_dir = Path(get_tenant(self.tenant_id).files_dir)
+        return self._files_dir
+
+    def current(self) -> tuple[str, float]:
+        """(versión, mtime más reciente), recalculado como mucho cada segundo."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked < CATALOG_CHECK_SECONDS and self._version:
+                return self._version, self._last_modified
+            self._checked = now
+
+        from .services import product_catalog
+
+        product_files = product_catalog(get_tenant(self.tenant_id))
+        digest = hashlib.sha1(repr(sorted(product_files.items())).encode('utf-8'))
+        last_modified = 0.0
+        try:
+            entries = sorted(os.scandir(self.files_dir), key=lambda entry: entry.name)
+        except OSError:
+            entries = []
+        for entry in entries:
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            digest.update(f"{entry.name}:{stat.st_mtime_ns}:{stat.st_size};".encode('utf-8'))
+            last_modified = max(last_modified, stat.st_mtime)
+
+        version = digest.hexdigest()
+        with self._lock:
+            if self._version and version != self._version:
+                logger.info(f"[HTTP_CACHE] Cambió el catálogo de '{self.tenant_id}', se invalidan las respuestas cacheadas")
+            self._version = version
+            self._last_modified = last_modified
+            return self._version, self._last_modified
+
+
+_catalogs: dict[str, CatalogVersion] = {}
+_catalogs_lock = threading.Lock()
+
+
+def catalog_for(tenant: Tenant) -> CatalogVersion:
+    """Versión del catálogo de ``tenant`` (una instancia por tienda)."""
+    with _catalogs_lock:
+        version = _catalogs.get(tenant.id)
+        if version is None:
+            version = _catalogs[tenant.id] = CatalogVersion(tenant_id=tenant.id)
+        return version
+
+
+# =============================================================================
+# COMPRESIÓN
+# =============================================================================
+
+def _accepted_encodings(accept_encoding: str) -> set[str]:
+    """Codificaciones aceptadas (ignora las que vienen con q=0)."""
+    accepted = set()
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        if re.search(r'q=0(\.0*)?\s*$', params.strip()):
+            continue
+        if name:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = _accepted_encodings(accept_encoding)
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def encode(content: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(content, quality=5)
+    return gzip.compress(content, compresslevel=6, mtime=0)
+
+
+def _is_compressible(response) -> bool:
+    return (
+        not getattr(response, 'streaming', False)
+        and not response.has_header('Content-Encoding')
+        and response.status_code == 200
+        and len(response.content) >= API_COMPRESS_MIN_BYTES
+        and response.get('Content-Type', '').startswith(COMPRESSIBLE_TYPES)
+    )
+
+
+def compress_response(request, response):
+    """Comprime ``response`` in-place si el cliente lo acepta y conviene."""
+    if not _is_compressible(response):
+        return response
+    patch_vary_headers(response, ('Accept-Encoding',))
+    encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+    if encoding is None:
+        return response
+    compressed = encode(response.content, encoding)
+    if len(compressed) >= len(response.content):
+        return response
+    response.content = compressed
+    response['Content-Length'] = str(len(compressed))
+    response['Content-Encoding'] = encoding
+    if response.has_header('ETag') and not response['ETag'].startswith('W/'):
+        response['ETag'] = 'W/' + response['ETag']
+    return response
+
+
+# =============================================================================
+# MIDDLEWARE
+# =============================================================================
+
+def policy_for(request) -> Optional[CachePolicy]:
+    if request.method not in ('GET', 'HEAD') or not request.path.startswith(API_PREFIX):
+        return None
+    return CACHE_POLICIES.get(request.path[len(API_PREFIX):])
+
+
+class ResponseCache:
+    """LRU en memoria de respuestas por (tienda, path, query)."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, catalog_version: Optional[str]) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires <= time.monotonic() or entry.catalog_version != catalog_version:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: CachedResponse) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = ResponseCache()
+
+
+class ApiCacheMiddleware:
+    """Cache en memoria + ETag/Last-Modified + compresión para /api/payments/."""
+
+    def __init__(self, get_response):
+        if not API_CACHE_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        policy = policy_for(request)
+        if policy is None:
+            response = self.get_response(request)
+            if request.path.startswith(API_PREFIX):
+                compress_response(request, response)
+            return response
+
+        tenant = getattr(request, 'tenant', None) or current_tenant()
+        key = f"{tenant.id}:{request.get_full_path()}"
+        catalog_version, catalog_modified = catalog_for(tenant).current() if policy.catalog else (None, 0.0)
+        entry = response_cache.get(key, catalog_version)
+        cache_status = 'HIT'
+
+        if entry is None:
+            cache_status = 'MISS'
+            response = self.get_response(request)
+            if response.status_code != 200 or getattr(response, 'streaming', False):
+                return compress_response(request, response)
+            entry = CachedResponse(
+                content=response.content,
+                content_type=response.get('Content-Type', 'application/json'),
+                etag='"%s"' % hashlib.sha1(response.content).hexdigest()[:20],
+                last_modified=int(catalog_modified or time.time()),
+                expires=time.monotonic() + policy.ttl,
+                catalog_version=catalog_version,
+            )
+            response_cache.set(key, entry)
+
+        return self._serve(request, entry, policy, cache_status)
+
+    def _serve(self, request, entry: CachedResponse, policy: CachePolicy, cache_status: str):
+        encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+        if len(entry.content) < API_COMPRESS_MIN_BYTES:
+            encoding = None
+        etag = f'W/{entry.etag}' if encoding else entry.etag
+
+        if self._not_modified(request, entry):
+            response = HttpResponseNotModified()
+        else:
+            if encoding:
+                if encoding not in entry.encoded:
+                    entry.encoded[encoding] = encode(entry.content, encoding)
+                body = entry.encoded[encoding]
+            else:
+                body = entry.content
+            response = HttpResponse(body, content_type=entry.content_type)
+            response['Content-Length'] = str(len(body))
+            if encoding:
+                response['Content-Encoding'] = encoding
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(entry.last_modified)
+        response['Cache-Control'] = policy.cache_control
+        response['X-Cache'] = cache_status
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if get_registry().multi_tenant:
+            # La misma URL responde distinto según la tienda
+            patch_vary_headers(response, ('X-Tenant', 'Origin'))
+        return response
+
+    @staticmethod
+    def _not_modified(request, entry: CachedResponse) -> bool:
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            # Comparación débil: la variante comprimida comparte el hash
+            tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+            return '*' in tags or entry.etag in tags
+        since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        return since is not None and int(entry.last_modified) <= since
@@ -0,0 +1,225 @@
+"""
+IDs de orden ordenables por tiempo - Datos con Alex
+====================================================
+Reemplaza al timestamp en milisegundos como external_reference: dos
+checkouts en el mismo milisegundo (o en dos workers) ya no colisionan.
+
+Formato (63 bits, siempre positivo, estilo Snowflake):
+
+    | 41 bits: ms desde 2018-01-01 | 10 bits: worker id | 12 bits: secuencia |
+
+- Ordenados por tiempo (k-sorted): los inserts en el índice de
+  external_reference van al final del B-tree. Los filtros por fecha siguen
+  usando created_at: las referencias viejas (timestamp en ms, 13 dígitos)
+  no se ordenan como texto junto a las de 19.
+- Desde 2026 hasta ~2087 todos tienen 19 dígitos, así que como texto
+  (external_reference es CharField) se ordenan igual que como número.
+- Worker id: cada proceso reserva uno libre en la base (IdWorkerLease) y
+  lo renueva cada ORDER_ID_LEASE_SECONDS / 2 al generar; al vencer se puede
+  reutilizar. Vale entre workers de gunicorn y entre réplicas que
+  comparten la base. Si la base no responde se usa uno al azar (con aviso).
+- Generar un ID no consulta la base ni a otros procesos: solo enteros en
+  memoria (la reserva se hace una vez y se renueva cada tanto). Entre
+  threads del mismo proceso hay un ``threading.Lock`` a propósito: ver
+  ``OrderIdGenerator.next_id``.
+- Monotónico por proceso aunque el reloj retroceda (se sigue desde el
+  último ms usado) o se generen más de 4096 IDs en un ms.
+
+CONFIGURACIÓN:
+- ORDER_ID_LEASE_SECONDS: duración de la reserva del worker id (default 600)
+====================================================
+"""
+
+from __future__ import annotations
+
+import atexit
+import datetime
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+ORDER_ID_LEASE_SECONDS = int(os.getenv('ORDER_ID_LEASE_SECONDS', '600'))
+
+EPOCH_MS = 1514764800000  # 2018-01-01T00:00:00Z
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+SEQUENCE_MASK = (1 << SEQUENCE_BITS) - 1
+TIMESTAMP_SHIFT = WORKER_BITS + SEQUENCE_BITS
+
+
+# =============================================================================
+# RESERVA DE WORKER ID
+# =============================================================================
+
+def claim_worker_id(owner: str, lease_seconds: int = ORDER_ID_LEASE_SECONDS) -> int:
+    """Reserva un worker id libre o vencido. Levanta DatabaseError si la base falla."""
+    from django.db import IntegrityError, transaction
+    from django.utils import timezone
+
+    from .models import IdWorkerLease
+
+    now = timezone.now()
+    expires_at = now + datetime.timedelta(seconds=lease_seconds)
+    taken = set(IdWorkerLease.objects.filter(expires_at__gte=now).values_list('worker_id', flat=True))
+    free = [worker_id for worker_id in range(MAX_WORKER_ID + 1) if worker_id not in taken]
+    random.shuffle(free)
+    for worker_id in free:
+        # Vencido: se toma con un UPDATE condicional; nunca usado: INSERT
+        if IdWorkerLease.objects.filter(worker_id=worker_id, expires_at__lt=now).update(owner=owner, expires_at=expires_at):
+            return worker_id
+        try:
+            with transaction.atomic():
+                IdWorkerLease.objects.create(worker_id=worker_id, owner=owner, expires_at=expires_at)
+            return worker_id
+        except IntegrityError:
+            continue  # otro proceso lo tomó recién
+    raise RuntimeError(f"No hay worker ids libres ({MAX_WORKER_ID + 1} en uso)")
+
+
+def renew_worker_id(worker_id: int, owner: str, lease_seconds: int = ORDER_ID_LEASE_SECONDS) -> bool:
+    """Extiende la reserva. False si ya no es nuestra."""
+    from django.utils import timezone
+
+    from .models import IdWorkerLease
+
+    expires_at = timezone.now() + datetime.timedelta(seconds=lease_seconds)
+    return bool(IdWorkerLease.objects.filter(worker_id=worker_id, owner=owner).update(expires_at=expires_at))
+
+
+def release_worker_id(worker_id: int, owner: str) -> None:
+    from .models import IdWorkerLease
+
+    IdWorkerLease.objects.filter(worker_id=worker_id, owner=owner).delete()
+
+
+# =============================================================================
+# GENERADOR
+# =============================================================================
+
+class OrderIdGenerator:
+    """Genera IDs de 63 bits (timestamp, worker id, secuencia) para un proceso."""
+
+    def __init__(self, lease_seconds: int = ORDER_ID_LEASE_SECONDS, clock=time.time):
+        self.lease_seconds = lease_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._lease_lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._owner = ''
+        self._worker_id: Optional[int] = None
+        self._leased = False
+        self._renew_at = 0.0
+        self._lease_expires = 0.0
+        self._last_ms = -1
+        self._sequence = 0
+
+    @property
+    def worker_id(self) -> int:
+        self._ensure_worker()
+        return self._worker_id
+
+    def next_id(self) -> int:
+        """
+        Siguiente ID del proceso.
+
+        El lock es deliberado, no un paso previo a una versión lock-free:
+        Python no tiene compare-and-swap, así que avanzar (ms, secuencia)
+        sin lock dependería de que el GIL haga atómicas operaciones que no
+        garantiza (y se rompe en los builds sin GIL). La sección crítica
+        son unas pocas operaciones con enteros: ~2 µs por ID con un thread
+        y lo mismo con 16 threads generando a la vez, así que el lock no
+        es un cuello de botella con los threads de gunicorn.
+        """
+        self._ensure_worker()
+        with self._lock:
+            now_ms = int(self._clock() * 1000) - EPOCH_MS
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = 0
+            else:
+                # Mismo ms (o el reloj retrocedió): siguiente secuencia
+                self._sequence = (self._sequence + 1) & SEQUENCE_MASK
+                if self._sequence == 0:
+                    self._last_ms += 1
+            return (self._last_ms << TIMESTAMP_SHIFT) | (self._worker_id << SEQUENCE_BITS) | self._sequence
+
+    def _ensure_worker(self) -> None:
+        if self._pid == os.getpid() and time.monotonic() < self._renew_at:
+            return
+        with self._lease_lock:
+            if self._pid != os.getpid():
+                # Proceso nuevo (fork de gunicorn): la reserva del padre no vale
+                self._pid = os.getpid()
+                self._owner = f"{socket.gethostname()}:{self._pid}:{uuid.uuid4().hex[:8]}"[:100]
+                self._worker_id = None
+                self._leased = False
+                self._renew_at = 0.0
+            if time.monotonic() < self._renew_at:
+                return
+            self._refresh_lease()
+
+    def _refresh_lease(self) -> None:
+        from django.db import DatabaseError
+
+        now = time.monotonic()
+        try:
+            renewed = self._leased and renew_worker_id(self._worker_id, self._owner, self.lease_seconds)
+            if not renewed:
+                previous = self._worker_id
+                self._worker_id = claim_worker_id(self._owner, self.lease_seconds)
+                self._leased = True
+                if previous is None:
+                    logger.info(f"[ORDER_ID] Worker id {self._worker_id} reservado ({self._owner})")
+                else:
+                    logger.warning(f"[ORDER_ID] Se perdió el worker id {previous}, nuevo: {self._worker_id}")
+            self._lease_expires = now + self.lease_seconds
+            self._renew_at = now + self.lease_seconds / 2
+        except (DatabaseError, RuntimeError):
+            if self._leased and now < self._lease_expires:
+                # La reserva sigue vigente: se reintenta en el próximo ID
+                logger.warning(f"[ORDER_ID] No se pudo renovar el worker id {self._worker_id}, se reintenta")
+                return
+            self._worker_id = random.randint(0, MAX_WORKER_ID)
+            self._leased = False
+            self._renew_at = now + 30
+            logger.exception(f"[ORDER_ID] Sin reserva de worker id, usando {self._worker_id} al azar")
+
+    def release(self) -> None:
+        """Libera la reserva (al terminar el proceso)."""
+        if self._leased and self._pid == os.getpid():
+            try:
+                release_worker_id(self._worker_id, self._owner)
+            except Exception:
+                pass
+            self._leased = False
+
+
+generator = OrderIdGenerator()
+atexit.register(generator.release)
+
+
+def next_order_id() -> int:
+    return generator.next_id()
+
+
+# =============================================================================
+# LECTURA DE IDS
+# =============================================================================
+
+def order_id_datetime(order_id: int) -> datetime.datetime:
+    """Momento (UTC) en que se generó un ID."""
+    ms = (int(order_id) >> TIMESTAMP_SHIFT) + EPOCH_MS
+    return datetime.datetime.fromtimestamp(ms / 1000, tz=datetime.timezone.utc)
+
+
+def order_id_worker(order_id: int) -> int:
+    return (int(order_id) >> SEQUENCE_BITS) & MAX_WORKER_ID
+
@@ -0,0 +1,50 @@
+"""
+Archiva órdenes finales y eventos de pago viejos en segmentos comprimidos.
+
+Uso:
+    python manage.py archive_data                  # ARCHIVE_AFTER_DAYS (180)
+    python manage.py archive_data --days 365
+    python manage.py archive_data --dry-run        # solo cuenta
+    python manage.py archive_data --orders-only
+
+Se puede correr en cualquier momento (cron): una corrida a la vez, y las
+exportaciones / historias de pago siguen viendo lo archivado. Ver
+payments/archive.py.
+"""
+
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from payments.archive import ARCHIVE_AFTER_DAYS, get_archive
+from payments.event_store import get_event_store
+
+
+class Command(BaseCommand):
+    help = "Mueve órdenes y eventos viejos a segmentos comprimidos (ARCHIVE_DIR)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS, help="Antigüedad mínima en días")
+        parser.add_argument('--dry-run', action='store_true', help="Contar sin mover nada")
+        only = parser.add_mutually_exclusive_group()
+        only.add_argument('--orders-only', action='store_true')
+        only.add_argument('--events-only', action='store_true')
+
+    def handle(self, *args, **options):
+        archive = get_archive()
+        days, dry_run = options['days'], options['dry_run']
+        prefix = "🔎 (dry-run) " if dry_run else "✅ "
+
+        if not options['events_only']:
+            stats = archive.archive_orders(days, dry_run=dry_run)
+            self.stderr.write(
+                f"{prefix}Órdenes: {stats['orders']} archivadas en {stats['segments']} segmentos "
+                f"({stats['bytes'] / 1024:.1f} KB)"
+            )
+        if not options['orders_only']:
+            stats = archive.archive_events(get_event_store(), days, dry_run=dry_run)
+            self.stderr.write(
+                f"{prefix}Eventos: {stats['segments_in']} segmentos del event store -> "
+                f"{stats['events']} eventos en {stats['segments']} segmentos ({stats['bytes'] / 1024:.1f} KB)"
+            )
+        self.stderr.write(f"📁 {archive.directory}")
@@ -0,0 +1,93 @@
+"""
+Microbenchmarks de los caminos calientes con baseline y umbral de regresión.
+
+Uso:
+    python manage.py bench                          # corre todo y compara contra el baseline
+    python manage.py bench --save                   # guarda el resultado como baseline
+    python manage.py bench --only email preference  # solo los que empiezan así
+    python manage.py bench --threshold 0.1 --json   # umbral 10% y salida JSON
+    python manage.py bench --list
+
+Sale con error si algún benchmark es más lento que el baseline por encima
+del umbral (para cortar el deploy). Ver payments/bench.py.
+"""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.bench import (
+    compare,
+    default_baseline_file,
+    environment,
+    load_baseline,
+    run_benchmarks,
+    save_baseline,
+    select,
+)
+
+
+class Command(BaseCommand):
+    help = "Mide el costo por operación de los caminos calientes (MP y SMTP simulados)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', nargs='+', metavar='NOMBRE', help="Prefijos de benchmarks a correr")
+        parser.add_argument('--repeat', type=int, default=5, help="Rondas por benchmark")
+        parser.add_argument('--baseline', help="Archivo JSON de baseline (default BENCH_BASELINE_FILE)")
+        parser.add_argument('--save', action='store_true', help="Guardar los resultados como baseline")
+        parser.add_argument('--threshold', type=float, help="Regresión tolerada (0.25 = 25%%), pisa el baseline")
+        parser.add_argument('--json', action='store_true', help="Salida JSON")
+        parser.add_argument('--list', action='store_true', help="Listar los benchmarks")
+
+    def handle(self, *args, **options):
+        benchmarks = select(options['only'])
+        if options['list']:
+            for bench in benchmarks:
+                self.stdout.write(f"{bench.name:<32} {bench.description}")
+            return
+        if not benchmarks:
+            raise CommandError(f"Ningún benchmark coincide con {options['only']}")
+
+        path = Path(options['baseline']) if options['baseline'] else default_baseline_file()
+        try:
+            baseline = load_baseline(path)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        results = run_benchmarks(benchmarks, repeat=options['repeat'])
+        rows = compare(results, baseline or {}, options['threshold'])
+        regressions = [row for row in rows if row['regression']]
+
+        if options['json']:
+            self.stdout.write(json.dumps({'environment': environment(), 'results': results, 'comparison': rows}, indent=2))
+        else:
+            self._print_table(rows, results)
+
+        if baseline and baseline.get('environment') != environment():
+            self.stderr.write(f"⚠️ El baseline es de otra máquina/Python ({baseline.get('environment')}): comparar con cuidado")
+        if options['save']:
+            save_baseline(path, results, baseline)
+            self.stderr.write(f"💾 Baseline guardado en {path}")
+        elif baseline is None:
+            self.stderr.write(f"ℹ️ Sin baseline en {path} (crearlo con --save)")
+
+        if regressions and not options['save']:
+            names = ', '.join(f"{row['name']} ({row['change']:+.0%})" for row in regressions)
+            raise CommandError(f"Regresiones de performance: {names}")
+        if baseline is not None and not options['save']:
+            self.stderr.write(f"✅ {len(rows)} benchmarks dentro del umbral")
+
+    def _print_table(self, rows, results) -> None:
+        self.stdout.write(f"{'benchmark':<32} {'min':>12} {'mediana':>12} {'baseline':>12} {'cambio':>8}")
+        for row in rows:
+            result = results[row['name']]
+            baseline = f"{row['baseline_us']:.2f}µs" if row['baseline_us'] is not None else '-'
+            change = f"{row['change']:+.1%}" if row['change'] is not None else '-'
+            flag = ' ❌' if row['regression'] else ''
+            self.stdout.write(
+                f"{row['name']:<32} {result['min_us']:>10.2f}µs {result['median_us']:>10.2f}µs "
+                f"{baseline:>12} {change:>8}{flag}"
+            )
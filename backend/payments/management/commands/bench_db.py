@@ -0,0 +1,157 @@
+"""
+Benchmark de escritura de órdenes con workers concurrentes.
+
+Uso:
+    python manage.py bench_db --workers 8 --ops 500
+    python manage.py bench_db --database default   # mide la base real
+
+Por default corre sobre una base SQLite temporal (migrada, con los mismos
+PRAGMAs y en el mismo disco que la configurada) y la borra al terminar:
+nunca escribe órdenes de prueba en la base de producción. ``--database``
+mide una base configurada; escribe y después borra sus órdenes ``bench-*``.
+
+Cada worker (thread con su propia conexión) hace upserts de Order sobre un
+espacio de claves compartido, así que se mezclan inserts y updates que
+compiten por el lock de escritura. Reporta throughput y latencias.
+"""
+
+from __future__ import annotations
+
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+
+from payments.models import Order
+
+
+# Alias de la base temporal
+BENCH_ALIAS = 'bench'
+
+
+class Command(BaseCommand):
+    help = "Mide el throughput de upserts de órdenes con workers concurrentes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Threads escritores concurrentes")
+        parser.add_argument('--ops', type=int, default=250, help="Upserts por worker")
+        parser.add_argument('--keys', type=int, default=1000, help="Cantidad de órdenes distintas")
+        parser.add_argument('--keep', action='store_true', help="No borrar las órdenes generadas")
+        parser.add_argument(
+            '--database',
+            help="Alias de una base configurada a medir (default: SQLite temporal)",
+        )
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        if alias is not None:
+            if alias not in connections:
+                raise CommandError(f"Base desconocida: {alias}")
+            self._bench(alias, options)
+            return
+
+        default = connections['default']
+        if default.vendor != 'sqlite':
+            raise CommandError(
+                f"La base configurada es {default.vendor}: para medirla usar --database default "
+                f"(escribe órdenes de prueba en ella)"
+            )
+
+        directory = tempfile.mkdtemp(prefix='bench-db-', dir=Path(default.settings_dict['NAME']).parent)
+        databases = {**settings.DATABASES, BENCH_ALIAS: {
+            **settings.DATABASES['default'],
+            'NAME': str(Path(directory) / 'bench.sqlite3'),
+        }}
+        connections.settings[BENCH_ALIAS] = connections.configure_settings(databases)[BENCH_ALIAS]
+        try:
+            call_command('migrate', database=BENCH_ALIAS, verbosity=0)
+            self._bench(BENCH_ALIAS, options)
+        finally:
+            connections[BENCH_ALIAS].close()
+            del connections[BENCH_ALIAS]
+            del connections.settings[BENCH_ALIAS]
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def _bench(self, alias: str, options) -> None:
+        workers: int = options['workers']
+        ops: int = options['ops']
+        keys: int = options['keys']
+        prefix = f"bench-{int(time.time())}-"
+        orders = Order.objects.using(alias)
+
+        self.stdout.write(self._describe_database(alias))
+
+        def run_worker(worker_id: int) -> tuple[list[float], int]:
+            rng = random.Random(worker_id)
+            latencies: list[float] = []
+            errors = 0
+            try:
+                for _ in range(ops):
+                    key = rng.randrange(keys)
+                    start = time.perf_counter()
+                    try:
+                        orders.update_or_create(
+                            external_reference=f"{prefix}{key}",
+                            defaults={
+                                'first_name': 'Bench',
+                                'last_name': f"Worker {worker_id}",
+                                'document': '12345678',
+                                'email': f"bench{key}@example.com",
+                                'course_id': 'tracker-habitos',
+                                'course_title': 'Tracker de Hábitos',
+                                'price': Decimal('1.00'),
+                                'status': rng.choice(['pending', 'approved']),
+                            },
+                        )
+                    except OperationalError:
+                        errors += 1
+                        continue
+                    latencies.append(time.perf_counter() - start)
+            finally:
+                connections.close_all()
+            return latencies, errors
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(run_worker, range(workers)))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(lat for worker_lat, _ in results for lat in worker_lat)
+        errors = sum(err for _, err in results)
+        done = len(latencies)
+
+        self.stdout.write(f"Workers: {workers} | Upserts OK: {done} | Errores de lock: {errors}")
+        self.stdout.write(f"Tiempo total: {elapsed:.2f}s | Throughput: {done / elapsed:.0f} upserts/s")
+        if latencies:
+            p95 = latencies[int(len(latencies) * 0.95) - 1]
+            self.stdout.write(
+                f"Latencia p50: {statistics.median(latencies) * 1000:.2f}ms | "
+                f"p95: {p95 * 1000:.2f}ms | max: {latencies[-1] * 1000:.2f}ms"
+            )
+
+        if not options['keep'] and alias != BENCH_ALIAS:
+            deleted, _ = orders.filter(external_reference__startswith=prefix).delete()
+            self.stdout.write(f"Limpieza: {deleted} órdenes de benchmark borradas")
+
+    def _describe_database(self, alias: str) -> str:
+        connection = connections[alias]
+        settings_dict = connection.settings_dict
+        description = f"Base de datos: {connection.vendor} ({settings_dict['NAME']})"
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode;')
+                journal_mode = cursor.fetchone()[0]
+                cursor.execute('PRAGMA synchronous;')
+                synchronous = cursor.fetchone()[0]
+            description += f" | journal_mode={journal_mode} synchronous={synchronous}"
+        description += f" | CONN_MAX_AGE={settings_dict.get('CONN_MAX_AGE')}"
+        return description
@@ -0,0 +1,39 @@
+"""
+Genera la vista previa (hojas, encabezados, muestra y miniaturas) de las planillas.
+
+Uso:
+    python manage.py build_previews           # solo los .xlsx que cambiaron (hash)
+    python manage.py build_previews --force   # regenerar todo
+
+Corre en el arranque (railway.json / Procfile): si los archivos no
+cambiaron no abre ningún .xlsx. Ver payments/previews.py.
+"""
+
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from payments.previews import catalog_workbooks, get_preview_store
+
+
+class Command(BaseCommand):
+    help = "Precalcula las vistas previas de los .xlsx del catálogo (PREVIEWS_DIR)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Regenerar aunque el archivo no haya cambiado")
+
+    def handle(self, *args, **options):
+        store = get_preview_store()
+        paths = catalog_workbooks()
+        missing = [path for path in paths if not path.exists()]
+        for path in missing:
+            self.stderr.write(f"⚠️ No existe {path}")
+
+        stats = store.build([path for path in paths if path.exists()], force=options['force'])
+        self.stderr.write(
+            f"✅ {stats['built']} generadas, {stats['unchanged']} sin cambios, "
+            f"{stats['removed']} artefactos viejos borrados"
+        )
+        if stats['failed']:
+            self.stderr.write(f"❌ {stats['failed']} planillas no se pudieron leer (ver logs)")
+        self.stderr.write(f"📁 {store.directory}")
@@ -0,0 +1,82 @@
+"""
+Genera links de pago en lote desde un CSV o JSON.
+
+Uso:
+    python manage.py bulk_preferences --input promo.csv --output links.jsonl --workers 8 --rate 10
+    python manage.py bulk_preferences --input afiliados.json --campaign afiliado-juan
+    python manage.py bulk_preferences --input promo.csv --tenant planillas-pro
+
+Cada línea de salida es el resultado de una fila (JSON) apenas MP responde.
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payments import views
+from payments.bulk import BULK_DEFAULT_RATE, BULK_DEFAULT_WORKERS, clamp_rate, parse_bulk_rows, run_bulk
+from payments.tenants import get_registry
+
+
+class Command(BaseCommand):
+    help = "Crea preferencias de Mercado Pago en paralelo desde CSV/JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--input', '-i', required=True, help="Archivo .csv o .json con las filas")
+        parser.add_argument('--output', '-o', help="Archivo .jsonl de resultados (stdout si se omite)")
+        parser.add_argument('--workers', type=int, default=BULK_DEFAULT_WORKERS)
+        parser.add_argument('--rate', type=float, default=BULK_DEFAULT_RATE, help="Preferencias por segundo")
+        parser.add_argument('--campaign', help="Se guarda en la metadata de cada preferencia")
+        parser.add_argument('--tenant', help="Id de la tienda (TENANTS_FILE); default: la tienda default")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['input'], 'rb') as source:
+                content = source.read()
+            content_type = 'text/csv' if options['input'].endswith('.csv') else 'application/json'
+            rows = parse_bulk_rows(content, content_type)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"No se pudo leer {options['input']}: {e}")
+
+        tenant = get_registry().get(options['tenant'])
+        if tenant is None:
+            raise CommandError(f"Tienda desconocida: {options['tenant']}")
+        try:
+            rate = clamp_rate(options['rate'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        output = open(options['output'], 'w', encoding='utf-8') if options['output'] else sys.stdout
+        started = time.perf_counter()
+        ok = failed = 0
+
+        try:
+            for result in run_bulk(
+                rows,
+                views.tenant_sdk(tenant),
+                views.tenant_frontend_url(tenant),
+                workers=options['workers'],
+                rate=rate,
+                campaign=options['campaign'],
+                tenant=tenant,
+            ):
+                output.write(json.dumps(result, ensure_ascii=False) + '\n')
+                output.flush()
+                if result['success']:
+                    ok += 1
+                else:
+                    failed += 1
+                    self.stderr.write(f"❌ Fila {result['row']}: {result.get('error')}")
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        elapsed = time.perf_counter() - started
+        self.stderr.write(
+            f"✅ {ok} links generados, {failed} con error, en {elapsed:.1f}s "
+            f"({(ok + failed) / elapsed if elapsed else 0:.1f} filas/s)"
+        )
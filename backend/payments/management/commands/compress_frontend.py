@@ -0,0 +1,49 @@
+"""
+Precomprime el build de Vite (brotli + gzip) para que WhiteNoise lo sirva.
+
+Uso:
+    npm run build                                  # en la raíz del repo
+    python manage.py compress_frontend             # FRONTEND_DIST_DIR
+    python manage.py compress_frontend --dir ../dist
+
+Deja ``archivo.br`` / ``archivo.gz`` al lado de cada archivo comprimible.
+Brotli solo si el paquete ``brotli`` está instalado (whitenoise[brotli]).
+Ver config/frontend.py.
+"""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from whitenoise.compress import Compressor
+
+
+class Command(BaseCommand):
+    help = "Genera versiones .br y .gz del frontend compilado (dist/)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', type=Path, default=settings.FRONTEND_DIST_DIR, help="Directorio del build")
+
+    def handle(self, *args, **options):
+        dist = options['dir']
+        if not dist.is_dir():
+            raise CommandError(f"No existe {dist}: corré 'npm run build' primero")
+
+        compressor = Compressor(quiet=True)
+        if not compressor.use_brotli:
+            self.stderr.write("⚠️ brotli no instalado: solo se genera gzip")
+
+        files = [
+            os.path.join(root, name)
+            for root, _dirs, names in os.walk(dist)
+            for name in names
+            if compressor.should_compress(name)
+        ]
+        written = 0
+        for path in files:
+            written += len(compressor.compress(path))
+
+        self.stderr.write(f"✅ {len(files)} archivos procesados, {written} versiones comprimidas en {dist}")
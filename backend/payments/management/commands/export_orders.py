@@ -0,0 +1,76 @@
+"""
+Exporta el historial de órdenes (o los eventos de pago) a CSV o XLSX.
+
+Uso:
+    python manage.py export_orders --format xlsx --output ventas.xlsx --from 2026-01-01
+    python manage.py export_orders --course-id tracker-habitos > ventas.csv
+    python manage.py export_orders --dataset events --from 2026-01-01 > eventos.csv
+"""
+
+from __future__ import annotations
+
+import datetime
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.exports import (
+    event_headers,
+    iter_all_order_rows,
+    iter_csv,
+    iter_event_rows,
+    order_headers,
+    write_xlsx,
+)
+
+
+def _parse_date(value: str) -> datetime.date:
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Fecha inválida: '{value}' (usar YYYY-MM-DD)")
+
+
+class Command(BaseCommand):
+    help = "Exporta órdenes o eventos de pago a CSV o XLSX sin cargarlos en memoria"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dataset', choices=['orders', 'events'], default='orders')
+        parser.add_argument('--format', choices=['csv', 'xlsx'], default='csv')
+        parser.add_argument('--output', '-o', help="Archivo de destino (CSV: stdout si se omite)")
+        parser.add_argument('--from', dest='date_from', type=_parse_date, help="Desde (YYYY-MM-DD)")
+        parser.add_argument('--to', dest='date_to', type=_parse_date, help="Hasta inclusive (YYYY-MM-DD)")
+        parser.add_argument('--course-id', help="Filtrar por producto")
+        parser.add_argument('--status', help="Filtrar por estado (approved, pending, ...)")
+
+    def handle(self, *args, **options):
+        if options['dataset'] == 'events':
+            headers = event_headers()
+            sheet_title = 'Eventos'
+            rows = iter_event_rows(options['date_from'], options['date_to'])
+        else:
+            headers = order_headers()
+            sheet_title = 'Órdenes'
+            rows = iter_all_order_rows(
+                date_from=options['date_from'],
+                date_to=options['date_to'],
+                course_id=options['course_id'],
+                status=options['status'],
+            )
+
+        if options['format'] == 'xlsx':
+            if not options['output']:
+                raise CommandError("El formato xlsx requiere --output")
+            write_xlsx(options['output'], [(sheet_title, headers, rows)])
+            self.stderr.write(f"✅ Exportado a {options['output']}")
+            return
+
+        if options['output']:
+            with open(options['output'], 'wb') as target:
+                for chunk in iter_csv(headers, rows):
+                    target.write(chunk)
+            self.stderr.write(f"✅ Exportado a {options['output']}")
+        else:
+            for chunk in iter_csv(headers, rows):
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.flush()
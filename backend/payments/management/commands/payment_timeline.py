@@ -0,0 +1,49 @@
+"""
+Muestra la historia completa de un pago desde el event store.
+
+Uso:
+    python manage.py payment_timeline 123456789          # payment_id
+    python manage.py payment_timeline 1769042512345      # external_reference
+    python manage.py payment_timeline 123456789 --json
+"""
+
+from __future__ import annotations
+
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments.event_store import get_event_store
+
+
+class Command(BaseCommand):
+    help = "Historia de un pago por payment_id o external_reference"
+
+    def add_arguments(self, parser):
+        parser.add_argument('key', help="payment_id o external_reference")
+        parser.add_argument('--json', action='store_true', help="Salida JSON (una línea por evento)")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        events = get_event_store().timeline(options['key'])
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        if not events:
+            self.stderr.write(f"Sin eventos para '{options['key']}'")
+            return
+
+        for event in events:
+            if options['json']:
+                self.stdout.write(json.dumps(event, ensure_ascii=False, default=str))
+                continue
+            details = {
+                key: value for key, value in event.items()
+                if key not in ('ts', 'event', 'payment_id', 'production')
+            }
+            self.stdout.write(
+                f"{event.get('ts', '?')}  {event.get('event', '?'):<28} "
+                f"payment={event.get('payment_id')}  {json.dumps(details, ensure_ascii=False, default=str)}"
+            )
+
+        self.stderr.write(f"{len(events)} eventos en {elapsed_ms:.1f}ms")
@@ -0,0 +1,27 @@
+"""
+Genera un token para perfilar requests puntuales en producción.
+
+Uso:
+    python manage.py profile_token
+    curl -H "X-Profile-Token: <token>" https://.../api/payments/validate/?payment_id=...
+
+Requiere REQUEST_PROFILING_ENABLED=True en el servidor. El token vale
+PROFILE_TOKEN_MAX_AGE segundos y está firmado con DJANGO_SECRET_KEY, así
+que solo sirve contra instancias con la misma clave. Ver payments/profiling.py.
+"""
+
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.profiling import PROFILE_HEADER, PROFILE_TOKEN_MAX_AGE, insecure_secret_key, make_profile_token
+
+
+class Command(BaseCommand):
+    help = "Imprime un token firmado para el header X-Profile-Token"
+
+    def handle(self, *args, **options):
+        if insecure_secret_key():
+            raise CommandError("DJANGO_SECRET_KEY no está configurada: el servidor no acepta tokens firmados con la clave de desarrollo")
+        self.stderr.write(f"🔑 {PROFILE_HEADER} (válido {PROFILE_TOKEN_MAX_AGE}s):")
+        self.stdout.write(make_profile_token())
@@ -0,0 +1,267 @@
+"""
+Reenvía tráfico grabado de /webhook/ y /validate/ (ver payments/traffic.py).
+
+Uso:
+    python manage.py replay_traffic data/traffic/capture.jsonl              # 1x
+    python manage.py replay_traffic capture.jsonl --speed 10 --max-gap 5    # 10x
+    python manage.py replay_traffic capture.jsonl --speed max --workers 32  # tormenta
+    python manage.py replay_traffic capture.jsonl --target http://localhost:8000
+
+Sin --target el replay corre en este proceso: las vistas usan el stand-in
+de MP grabado y los emails se simulan (se generan los adjuntos, no se envían).
+Con --target, la instancia local debe arrancar con DEBUG=True y
+MP_STANDIN_CAPTURE=<captura> (solo se cuentan entregas exitosas).
+
+En proceso, el replay corre sobre una base SQLite temporal (migrada) y
+un event store y archivo temporales, que se borran al terminar: los
+webhooks grabados (datos viejos, metadata sin PII) nunca tocan las
+órdenes, los rollups ni el historial reales. ``--allow-db-writes`` usa la
+base y el event store configurados (solo con DEBUG=True, para una copia
+local con órdenes precargadas).
+"""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import shutil
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import override_settings
+
+from payments import archive, event_store, views
+from payments.traffic import (
+    RecordedMercadoPago,
+    load_captures,
+    replay,
+    simulated_send_product_email,
+    summarize,
+)
+from payments.webhook_security import ReplayCache
+
+
+def _parse_speed(value: str) -> float:
+    if value.lower() in ('max', '0'):
+        return 0.0
+    try:
+        speed = float(value.lower().rstrip('x'))
+    except ValueError:
+        raise CommandError(f"Velocidad inválida: '{value}' (usar 1, 10, 10x o max)")
+    if speed <= 0:
+        raise CommandError("La velocidad debe ser mayor a 0 (o 'max')")
+    return speed
+
+
+def _decode(content: bytes) -> Optional[dict[str, Any]]:
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+class InProcessSender:
+    """Envía cada captura por el stack de Django de este proceso (un Client por thread)."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def __call__(self, capture: dict[str, Any]) -> tuple[int, Optional[dict[str, Any]]]:
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = Client(raise_request_exception=False)
+        headers = dict(capture.get('headers') or {})
+        content_type = headers.pop('content-type', 'application/json')
+        query = capture.get('query')
+        response = client.generic(
+            capture.get('method', 'GET'),
+            capture['path'] + (f"?{query}" if query else ''),
+            data=(capture.get('body') or '').encode('utf-8'),
+            content_type=content_type,
+            headers=headers,
+        )
+        return response.status_code, _decode(response.content)
+
+
+class HttpSender:
+    """Envía cada captura por HTTP a una instancia local (--target)."""
+
+    def __init__(self, target: str, timeout: float = 30):
+        self.target = target.rstrip('/')
+        self.timeout = timeout
+
+    def __call__(self, capture: dict[str, Any]) -> tuple[int, Optional[dict[str, Any]]]:
+        query = capture.get('query')
+        body = capture.get('body') or ''
+        request = urllib.request.Request(
+            self.target + capture['path'] + (f"?{query}" if query else ''),
+            data=body.encode('utf-8') if capture.get('method') != 'GET' else None,
+            headers=capture.get('headers') or {},
+            method=capture.get('method', 'GET'),
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, _decode(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, _decode(e.read())
+
+
+class Command(BaseCommand):
+    help = "Reenvía tráfico grabado de webhooks/validate y reporta latencias y entregas duplicadas"
+
+    def add_arguments(self, parser):
+        parser.add_argument('captures', nargs='+', help="Archivos de captura (.jsonl)")
+        parser.add_argument('--speed', type=_parse_speed, default=1.0, help="1, 10 (o 10x), max")
+        parser.add_argument('--workers', type=int, default=8, help="Requests concurrentes máximos")
+        parser.add_argument('--max-gap', type=float, help="Recortar silencios de más de N segundos")
+        parser.add_argument('--endpoint', choices=['webhook', 'validate'], help="Reenviar solo un endpoint")
+        parser.add_argument('--target', help="URL de una instancia local (default: en este proceso)")
+        parser.add_argument(
+            '--mp-latency', choices=['recorded', 'none'], default='recorded',
+            help="El stand-in de MP responde con la latencia grabada o al instante",
+        )
+        parser.add_argument(
+            '--verify-signatures', action='store_true',
+            help="Verificar x-signature con el MP_WEBHOOK_SECRET local (default: desactivado)",
+        )
+        parser.add_argument(
+            '--allow-db-writes', action='store_true',
+            help="En proceso: usar la base y el event store configurados (requiere DEBUG=True)",
+        )
+        parser.add_argument('--json', action='store_true', help="Imprimir el resumen como JSON")
+
+    def handle(self, *args, **options):
+        try:
+            captures = load_captures(options['captures'])
+        except OSError as e:
+            raise CommandError(f"No se pudo leer la captura: {e}")
+        if options['endpoint']:
+            captures = [capture for capture in captures if capture.get('endpoint') == options['endpoint']]
+        if not captures:
+            raise CommandError("La captura no tiene requests para reenviar")
+
+        if options['allow_db_writes'] and not options['target'] and not settings.DEBUG:
+            raise CommandError("--allow-db-writes escribe órdenes y eventos viejos en la base configurada: requiere DEBUG=True")
+
+        speed = options['speed']
+        self.stderr.write(
+            f"▶️ Reenviando {len(captures)} requests a {'máxima velocidad' if not speed else f'{speed:g}x'} "
+            f"({options['target'] or 'en proceso'})"
+        )
+
+        started = time.perf_counter()
+        if options['target']:
+            results = replay(captures, HttpSender(options['target']), speed, options['workers'], options['max_gap'])
+        else:
+            results = self._replay_in_process(captures, options)
+        summary = summarize(results, time.perf_counter() - started)
+
+        if options['json']:
+            self.stdout.write(json.dumps(summary, indent=2, ensure_ascii=False))
+        else:
+            self._print_summary(summary)
+
+    @contextlib.contextmanager
+    def _sandbox(self) -> Iterator[Path]:
+        """
+        Base SQLite, event store y archivo temporales durante el replay: los
+        threads del replay abren sus conexiones con el NAME cambiado.
+        """
+        database = connections['default']
+        if database.vendor != 'sqlite':
+            raise CommandError(
+                f"La base configurada es {database.vendor}: el replay en proceso necesita SQLite "
+                f"(o --allow-db-writes con DEBUG=True, o --target)"
+            )
+        directory = Path(tempfile.mkdtemp(prefix='replay-'))
+        settings_dict = database.settings_dict
+        original_name = settings_dict['NAME']
+        originals = (event_store._store, archive._archive)
+
+        connections.close_all()
+        settings_dict['NAME'] = str(directory / 'replay.sqlite3')
+        event_store._store = event_store.EventStore(directory / 'events')
+        archive._archive = archive.Archive(directory / 'archive')
+        try:
+            call_command('migrate', verbosity=0)
+            yield directory
+        finally:
+            event_store._store.close()
+            event_store._store, archive._archive = originals
+            connections.close_all()
+            settings_dict['NAME'] = original_name
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def _replay_in_process(self, captures: list[dict[str, Any]], options: dict[str, Any]) -> list[dict[str, Any]]:
+        """Reemplaza MP, email, base y estado en memoria de las vistas solo durante el replay."""
+        latency_scale = 1.0 if options['mp_latency'] == 'recorded' else 0.0
+        recorded_mp = RecordedMercadoPago(captures, latency_scale=latency_scale)
+        patched = {
+            'sdk': recorded_mp,
+            # Capturas con ?tenant=: tenant_sdk() usa sdk_for para las otras tiendas
+            'sdk_for': lambda tenant: recorded_mp,
+            'send_product_email': simulated_send_product_email,
+            '_processed_payments': set(),
+            '_webhook_replay_cache': ReplayCache(max_size=100_000),
+            # Las capturas son viejas: sin ventana de tolerancia
+            'MP_WEBHOOK_TOLERANCE_SECONDS': 0,
+        }
+        if not options['verify_signatures']:
+            patched['MP_WEBHOOK_SECRET'] = ''
+            patched['tenant_webhook_secret'] = lambda tenant=None: ''
+
+        originals = {name: getattr(views, name) for name in patched}
+        for name, value in patched.items():
+            setattr(views, name, value)
+        try:
+            with contextlib.ExitStack() as stack:
+                if not options['allow_db_writes']:
+                    stack.enter_context(self._sandbox())
+                stack.enter_context(override_settings(ALLOWED_HOSTS=['*']))
+                return replay(captures, InProcessSender(), options['speed'], options['workers'], options['max_gap'])
+        finally:
+            for name, value in originals.items():
+                setattr(views, name, value)
+
+    def _print_summary(self, summary: dict[str, Any]) -> None:
+        self.stdout.write(
+            f"Requests: {summary['requests']} en {summary['elapsed_seconds']:.2f}s "
+            f"({summary['throughput_rps']} req/s) | retraso vs. agenda p99: "
+            f"{summary['schedule_lag_ms']['p99']:.1f}ms"
+        )
+        for endpoint, stats in summary['endpoints'].items():
+            latency, recorded = stats['latency_ms'], stats['recorded_latency_ms']
+            self.stdout.write(f"\n/{endpoint}/ ({stats['requests']} requests)")
+            self.stdout.write(
+                f"  Latencia replay   p50 {latency['p50']:.1f}ms | p90 {latency['p90']:.1f}ms | "
+                f"p99 {latency['p99']:.1f}ms | max {latency['max']:.1f}ms"
+            )
+            self.stdout.write(
+                f"  Latencia grabada  p50 {recorded['p50']:.1f}ms | p90 {recorded['p90']:.1f}ms | "
+                f"p99 {recorded['p99']:.1f}ms | max {recorded['max']:.1f}ms"
+            )
+            self.stdout.write(f"  Status: {stats['statuses']} | Resultados: {stats['outcomes']}")
+            if stats['status_mismatches'] or stats['outcome_mismatches']:
+                self.stdout.write(
+                    f"  ⚠️ Distintos a lo grabado: {stats['status_mismatches']} status, "
+                    f"{stats['outcome_mismatches']} resultados"
+                )
+
+        self.stdout.write(
+            f"\nEntregas: {summary['deliveries']} (grabadas: {summary['recorded_deliveries']}) | "
+            f"Duplicadas: {summary['duplicate_deliveries']} "
+            f"(grabadas: {summary['recorded_duplicate_deliveries']})"
+        )
+        if summary['duplicate_payments']:
+            self.stdout.write(f"⚠️ Pagos con más de un email: {', '.join(summary['duplicate_payments'][:20])}")
@@ -0,0 +1,84 @@
+"""
+Restaura la base SQLite desde la réplica (REPLICA_DIR): snapshot + WAL.
+
+Uso:
+    python manage.py restore_db --if-missing                 # arranque (railway.json): solo si no hay base
+    python manage.py restore_db --until "2026-10-19 14:30"   # punto en el tiempo (hora local)
+    python manage.py restore_db --output /tmp/copia.sqlite3  # a otro archivo, sin tocar la base
+    python manage.py restore_db --force                      # pisa la base existente (app detenida)
+    python manage.py restore_db --list                       # generaciones y rango restaurable
+
+Sin REPLICA_DIR, ``--if-missing`` no hace nada (el deploy arranca igual).
+Ver payments/replication.py.
+"""
+
+from __future__ import annotations
+
+import datetime
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from payments.replication import get_replica_store, sqlite_path
+
+
+class Command(BaseCommand):
+    help = "Reconstruye db.sqlite3 desde el último snapshot + WAL de la réplica"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--if-missing', action='store_true', help="Restaurar solo si la base no existe o está vacía")
+        parser.add_argument('--until', help="Fecha/hora ISO a la que restaurar (sin zona = TIME_ZONE)")
+        parser.add_argument('--output', help="Archivo destino (default: la base configurada)")
+        parser.add_argument('--force', action='store_true', help="Reemplazar la base existente")
+        parser.add_argument('--list', action='store_true', help="Listar generaciones de la réplica")
+
+    def handle(self, *args, **options):
+        store = get_replica_store()
+        database = sqlite_path()
+        if store is None or database is None:
+            if options['if_missing']:
+                self.stderr.write("ℹ️ Sin REPLICA_DIR o la base no es SQLite: nada que restaurar")
+                return
+            raise CommandError("La restauración requiere REPLICA_DIR y una base SQLite")
+
+        if options['list']:
+            self.stdout.write(json.dumps(store.describe(), indent=2, ensure_ascii=False))
+            return
+
+        target = Path(options['output']) if options['output'] else database
+        exists = target.exists() and target.stat().st_size > 0
+        if exists and options['if_missing']:
+            self.stderr.write(f"ℹ️ {target} ya existe: no se restaura")
+            return
+        if exists and not options['force']:
+            raise CommandError(f"{target} ya existe (usar --force con la app detenida, o --output)")
+
+        until = self._parse_until(options['until']) if options['until'] else None
+        try:
+            summary = store.restore(target, until=until)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if summary is None:
+            if options['if_missing']:
+                self.stderr.write(f"ℹ️ La réplica en {store.directory} está vacía: la base arranca de cero")
+                return
+            raise CommandError(f"No hay snapshots en {store.directory}" + (f" anteriores a {until}" if until else ""))
+
+        self.stderr.write(
+            f"✅ Restaurada {target} ({summary['bytes'] / 1024:.1f} KB) hasta {summary['restored_until']}: "
+            f"snapshot {summary['snapshot']} + {summary['segments']} segmentos "
+            f"({summary['commits']} commits) en {summary['elapsed_seconds']}s"
+        )
+
+    @staticmethod
+    def _parse_until(value: str) -> datetime.datetime:
+        try:
+            moment = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f"--until inválido: {value!r} (formato ISO, ej. 2026-10-19T14:30)")
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
@@ -0,0 +1,50 @@
+"""
+Busca órdenes por comprador o IDs (mismo índice que /api/payments/orders/search/).
+
+Uso:
+    python manage.py search_orders "juan perez"
+    python manage.py search_orders jperez@gm --status approved
+    python manage.py search_orders 20123456789 --json
+"""
+
+from __future__ import annotations
+
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from payments.search import search_orders
+
+
+class Command(BaseCommand):
+    help = "Busca órdenes por nombre, email, DNI/CUIT, payment_id o preferencia"
+
+    def add_arguments(self, parser):
+        parser.add_argument('query', help="Texto a buscar (prefijos, sin acentos)")
+        parser.add_argument('--status', help="Filtrar por estado")
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--json', action='store_true', help="Salida JSON (una línea por orden)")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        results = search_orders(options['query'], limit=options['limit'], status=options['status'])
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        if not results:
+            self.stderr.write(f"Sin órdenes para '{options['query']}'")
+            return
+
+        for row in results:
+            if options['json']:
+                self.stdout.write(json.dumps(row, ensure_ascii=False, cls=DjangoJSONEncoder))
+                continue
+            created = timezone.localtime(row['created_at']).strftime('%Y-%m-%d %H:%M')
+            self.stdout.write(
+                f"{created}  {row['external_reference'] or row['id']:<20} {row['status']:<10} "
+                f"{row['first_name']} {row['last_name']} <{row['email']}> doc={row['document']} "
+                f"pago={row['payment_id'] or '-'} {row['course_id']}"
+            )
+        self.stderr.write(f"✅ {len(results)} órdenes en {elapsed_ms:.1f} ms")
@@ -0,0 +1,57 @@
+"""
+Cascada de spans de una compra desde el archivo de export de trazas.
+
+Uso:
+    python manage.py show_trace 1769042512345                  # external_reference
+    python manage.py show_trace 3f1c...e9 --file spans.jsonl   # trace id
+
+Requiere TRACING_ENABLED=True en el servidor (ver payments/tracing.py).
+El archivo es OTLP/JSON: también se puede importar en Jaeger / Tempo.
+Se leen también sus copias rotadas (spans.jsonl.1, .2...).
+"""
+
+from __future__ import annotations
+
+import re
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.tracing import default_export_file, load_spans, rotated_file, trace_id_for
+
+
+class Command(BaseCommand):
+    help = "Muestra dónde se fue el tiempo de una compra (spans exportados)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('key', help="external_reference o trace id (32 hex)")
+        parser.add_argument('--file', type=Path, default=None, help="Archivo de export (default TRACE_EXPORT_FILE)")
+
+    def handle(self, *args, **options):
+        path = options['file'] or default_export_file()
+        if path is None or not (path.exists() or rotated_file(path, 1).exists()):
+            raise CommandError(f"No hay archivo de trazas ({path})")
+
+        key = options['key']
+        trace_id = key if re.fullmatch(r'[0-9a-f]{32}', key) else trace_id_for(key)
+        spans = load_spans(path, trace_id)
+        if not spans:
+            self.stderr.write(f"Sin spans para {key} (trace {trace_id})")
+            return
+
+        depth = {}
+        start = int(spans[0]['startTimeUnixNano'])
+        end = max(int(s['endTimeUnixNano']) for s in spans)
+        for s in spans:
+            depth[s['spanId']] = depth.get(s.get('parentSpanId'), -1) + 1
+            offset_ms = (int(s['startTimeUnixNano']) - start) / 1e6
+            duration_ms = (int(s['endTimeUnixNano']) - int(s['startTimeUnixNano'])) / 1e6
+            attributes = ' '.join(
+                f"{a['key']}={next(iter(a['value'].values()))}" for a in s.get('attributes', [])
+            )
+            error = ' ❌ ' + s['status'].get('message', '') if s.get('status', {}).get('code') == 2 else ''
+            self.stdout.write(
+                f"{offset_ms:>12.1f}ms {duration_ms:>9.1f}ms  {'  ' * depth[s['spanId']]}{s['name']}  {attributes}{error}"
+            )
+
+        self.stderr.write(f"trace {trace_id}: {len(spans)} spans, {(end - start) / 1e6:.1f}ms de punta a punta")
@@ -0,0 +1,69 @@
+"""
+Consulta a MP los pagos pendientes / en proceso hasta que terminen.
+
+Uso:
+    python manage.py watch_payments            # loop (proceso aparte)
+    python manage.py watch_payments --once     # una ronda (cron)
+
+Los workers web ya corren el mismo watcher como thread
+(PAYMENT_WATCHER_ENABLED); este comando sirve para correrlo aparte o para
+forzar una ronda. Las órdenes se reclaman por ronda, así que pueden
+convivir ambos sin consultar dos veces el mismo pago.
+
+SIGTERM / Ctrl+C: termina la ronda en curso (hasta SHUTDOWN_GRACE_SECONDS),
+libera lo que no consultó y hace flush (ver payments/shutdown.py).
+"""
+
+from __future__ import annotations
+
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Min
+
+from payments.models import Order
+from payments.shutdown import coordinator
+from payments.watcher import PAYMENT_WATCH_TICK_SECONDS, WATCHED_STATUSES, poll_due_payments
+
+
+class Command(BaseCommand):
+    help = "Vuelve a consultar a Mercado Pago los pagos pendientes con backoff"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Ejecutar una sola ronda")
+        parser.add_argument('--tick', type=float, default=PAYMENT_WATCH_TICK_SECONDS, help="Segundos entre rondas")
+
+    def handle(self, *args, **options):
+        tracked = Order.objects.filter(status__in=WATCHED_STATUSES, next_check_at__isnull=False).aggregate(
+            total=Count('id'), next_due=Min('next_check_at')
+        )
+        self.stderr.write(f"⏳ Pagos en seguimiento: {tracked['total']} (próxima consulta: {tracked['next_due'] or '-'})")
+
+        stop = threading.Event()
+
+        def handle_stop(sig, frame):
+            coordinator.begin_drain()
+            stop.set()
+
+        signal.signal(signal.SIGTERM, handle_stop)
+        signal.signal(signal.SIGINT, handle_stop)
+
+        while not stop.is_set():
+            stats = poll_due_payments()
+            if stats['checked'] or stats['released'] or options['once']:
+                self.stderr.write(
+                    f"✅ Consultados {stats['checked']} | cambiaron {stats['changed']} | "
+                    f"entregados {stats['delivered']} | errores {stats['errors']}"
+                    + (f" | liberados {stats['released']}" if stats['released'] else "")
+                )
+            if options['once']:
+                break
+            stop.wait(options['tick'])
+
+        if stop.is_set():
+            report = coordinator.drain()
+            self.stderr.write(
+                f"🛑 Apagado en {report['elapsed_seconds']}s: {report['completed']} terminadas, "
+                f"{report['requeued']} reencoladas, {report['lost']} perdidas"
+            )
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='external_reference',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True, verbose_name='Referencia externa MP'),
+        ),
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Día')),
+                ('course_id', models.CharField(max_length=100, verbose_name='ID del curso')),
+                ('status', models.CharField(choices=[('created', 'Preferencia creada'), ('approved', 'Aprobado'), ('refunded', 'Reembolsado')], max_length=20, verbose_name='Estado')),
+                ('orders', models.PositiveIntegerField(default=0, verbose_name='Cantidad de órdenes')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Monto')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Fecha de actualización')),
+            ],
+            options={
+                'verbose_name': 'Acumulado de ventas',
+                'verbose_name_plural': 'Acumulados de ventas',
+                'db_table': 'sales_rollups',
+                'ordering': ['day', 'course_id', 'status'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'course_id', 'status'), name='unique_rollup_day_course_status')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0003_order_export_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='course_id',
+            field=models.CharField(max_length=255, verbose_name='ID del curso'),
+        ),
+    ]
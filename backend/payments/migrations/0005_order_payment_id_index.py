@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0004_order_course_id_cart'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['payment_id'], name='orders_payment_id_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0005_order_payment_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='check_attempts',
+            field=models.PositiveIntegerField(default=0, verbose_name='Consultas a MP realizadas'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='next_check_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Próxima consulta a MP'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['next_check_at'], name='orders_next_check_idx'),
+        ),
+    ]
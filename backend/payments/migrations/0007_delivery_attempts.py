@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0006_order_payment_watcher'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='delivered_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Fecha de entrega'),
+        ),
+        migrations.CreateModel(
+            name='DeliveryAttempt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('external_reference', models.CharField(blank=True, max_length=64, verbose_name='Referencia externa MP')),
+                ('payment_id', models.CharField(blank=True, max_length=100, null=True, verbose_name='ID de pago MP')),
+                ('source', models.CharField(choices=[('validate', 'Página de pago exitoso'), ('webhook', 'Webhook de MP'), ('watcher', 'Watcher de pagos pendientes'), ('resend', 'Reenvío pedido por el comprador'), ('manual', 'Manual')], max_length=20, verbose_name='Origen')),
+                ('provider', models.CharField(max_length=100, verbose_name='Proveedor de email')),
+                ('recipient', models.EmailField(max_length=254, verbose_name='Destinatario')),
+                ('success', models.BooleanField(verbose_name='Enviado')),
+                ('latency_ms', models.PositiveIntegerField(default=0, verbose_name='Duración (ms)')),
+                ('attachments', models.PositiveSmallIntegerField(default=0, verbose_name='Adjuntos')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha')),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='delivery_attempts', to='payments.order', verbose_name='Orden')),
+            ],
+            options={
+                'verbose_name': 'Intento de entrega',
+                'verbose_name_plural': 'Intentos de entrega',
+                'db_table': 'delivery_attempts',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['external_reference', 'created_at'], name='deliveries_ref_created_idx')],
+            },
+        ),
+    ]
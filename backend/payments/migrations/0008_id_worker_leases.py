@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0007_delivery_attempts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdWorkerLease',
+            fields=[
+                ('worker_id', models.PositiveSmallIntegerField(primary_key=True, serialize=False, verbose_name='Worker id')),
+                ('owner', models.CharField(max_length=100, verbose_name='Proceso')),
+                ('expires_at', models.DateTimeField(verbose_name='Vence')),
+            ],
+            options={
+                'verbose_name': 'Worker id reservado',
+                'verbose_name_plural': 'Worker ids reservados',
+                'db_table': 'id_worker_leases',
+            },
+        ),
+    ]
@@ -0,0 +1,111 @@
+"""
+Índice de búsqueda de texto sobre órdenes (ver payments/search.py).
+
+- SQLite: tabla FTS5 ``orders_search`` con contenido externo (la tabla
+  ``orders``), sin acentos y con índices de prefijo; triggers la mantienen
+  al día en cada INSERT / DELETE / UPDATE de las columnas buscables.
+- Postgres: índice GIN de trigramas (pg_trgm) sobre el texto sin acentos
+  (unaccent). Si las extensiones no se pueden instalar, la búsqueda usa
+  icontains.
+"""
+
+import logging
+
+from django.db import migrations, transaction
+
+logger = logging.getLogger(__name__)
+
+SEARCH_COLUMNS = ('first_name', 'last_name', 'email', 'document', 'payment_id', 'preference_id', 'external_reference')
+
+_columns = ', '.join(SEARCH_COLUMNS)
+_new = ', '.join(f'new.{column}' for column in SEARCH_COLUMNS)
+_old = ', '.join(f'old.{column}' for column in SEARCH_COLUMNS)
+
+SQLITE_CREATE = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS orders_search USING fts5(
+        {_columns},
+        content='orders', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS orders_search_ai AFTER INSERT ON orders BEGIN
+        INSERT INTO orders_search(rowid, {_columns}) VALUES (new.id, {_new});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS orders_search_ad AFTER DELETE ON orders BEGIN
+        INSERT INTO orders_search(orders_search, rowid, {_columns}) VALUES ('delete', old.id, {_old});
+    END
+    """,
+    # Solo columnas buscables: los cambios de estado (lo más frecuente) no tocan el índice
+    f"""
+    CREATE TRIGGER IF NOT EXISTS orders_search_au AFTER UPDATE OF {_columns} ON orders BEGIN
+        INSERT INTO orders_search(orders_search, rowid, {_columns}) VALUES ('delete', old.id, {_old});
+        INSERT INTO orders_search(rowid, {_columns}) VALUES (new.id, {_new});
+    END
+    """,
+    "INSERT INTO orders_search(orders_search) VALUES ('rebuild')",
+]
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS orders_search_ai",
+    "DROP TRIGGER IF EXISTS orders_search_ad",
+    "DROP TRIGGER IF EXISTS orders_search_au",
+    "DROP TABLE IF EXISTS orders_search",
+]
+
+_document = " || ' ' || ".join(f"coalesce({column}, '')" for column in SEARCH_COLUMNS)
+
+POSTGRES_CREATE = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    # unaccent() no es IMMUTABLE: el wrapper permite usarlo en un índice
+    """
+    CREATE OR REPLACE FUNCTION orders_search_unaccent(text) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$
+    """,
+    f"""
+    CREATE INDEX IF NOT EXISTS orders_search_trgm_idx ON orders
+    USING gin (orders_search_unaccent(lower({_document})) gin_trgm_ops)
+    """,
+]
+
+POSTGRES_DROP = [
+    "DROP INDEX IF EXISTS orders_search_trgm_idx",
+    "DROP FUNCTION IF EXISTS orders_search_unaccent(text)",
+]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for statement in SQLITE_CREATE:
+            schema_editor.execute(statement)
+    elif vendor == 'postgresql':
+        try:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                for statement in POSTGRES_CREATE:
+                    schema_editor.execute(statement)
+        except Exception as e:
+            logger.warning(f"[SEARCH] Sin índice de trigramas (pg_trgm/unaccent no disponibles): {e}")
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {'sqlite': SQLITE_DROP, 'postgresql': POSTGRES_DROP}.get(vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0008_id_worker_leases'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
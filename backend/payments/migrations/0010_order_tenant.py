@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0009_order_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='tenant',
+            field=models.CharField(blank=True, max_length=50, null=True, verbose_name='Tienda'),
+        ),
+    ]
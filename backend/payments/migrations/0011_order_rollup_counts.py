@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0010_order_tenant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='rollup_counts',
+            field=models.JSONField(blank=True, null=True, verbose_name='Montos contados en rollups'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pendiente'), ('approved', 'Aprobado'), ('rejected', 'Rechazado'), ('cancelled', 'Cancelado'), ('in_process', 'En proceso'), ('refunded', 'Reembolsado'), ('partially_refunded', 'Reembolsado parcialmente'), ('charged_back', 'Contracargo')], default='pending', max_length=20, verbose_name='Estado'),
+        ),
+        migrations.AlterField(
+            model_name='salesrollup',
+            name='status',
+            field=models.CharField(choices=[('created', 'Preferencia creada'), ('approved', 'Aprobado'), ('refunded', 'Reembolsado'), ('charged_back', 'Contracargo')], max_length=20, verbose_name='Estado'),
+        ),
+    ]
@@ -34,8 +34,9 @@ class Order(models.Model):
     )
     
     # Información del producto
+    # Uno o varios productos separados por coma (carrito)
     course_id = models.CharField(
-        max_length=100,
+        max_length=255,
         verbose_name="ID del curso"
     )
     course_title = models.CharField(
@@ -61,6 +62,13 @@ class Order(models.Model):
         blank=True,
         verbose_name="ID de preferencia MP"
     )
+    external_reference = models.CharField(
+        max_length=64,
+        unique=True,
+        null=True,
+        blank=True,
+        verbose_name="Referencia externa MP"
+    )
     
     # Estado del pedido
     STATUS_CHOICES = [
@@ -70,6 +78,8 @@ class Order(models.Model):
         ('cancelled', 'Cancelado'),
         ('in_process', 'En proceso'),
         ('refunded', 'Reembolsado'),
+        ('partially_refunded', 'Reembolsado parcialmente'),
+        ('charged_back', 'Contracargo'),
     ]
     status = models.CharField(
         max_length=20,
@@ -78,6 +88,43 @@ class Order(models.Model):
         verbose_name="Estado"
     )
     
+    # Seguimiento de pagos pendientes / en proceso (watcher.py)
+    next_check_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Próxima consulta a MP"
+    )
+    check_attempts = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Consultas a MP realizadas"
+    )
+    
+    # Entrega de archivos (ver DeliveryAttempt)
+    delivered_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Fecha de entrega"
+    )
+    
+    # Lo ya sumado a los rollups de ventas por esta orden: {"approved": "1500.00",
+    # "refunded": "300.00", ...} (ver orders.py). Null = orden anterior a este
+    # campo, se deduce del estado. Nullable por lo mismo que ``tenant``
+    rollup_counts = models.JSONField(
+        null=True,
+        blank=True,
+        verbose_name="Montos contados en rollups"
+    )
+    
+    # Tienda (tenants.py); vacío = tienda default. Nullable a propósito: en
+    # SQLite un campo con default reconstruye la tabla y borra los triggers
+    # del índice de búsqueda (migración 0009)
+    tenant = models.CharField(
+        max_length=50,
+        null=True,
+        blank=True,
+        verbose_name="Tienda"
+    )
+    
     # Timestamps
     created_at = models.DateTimeField(
         auto_now_add=True,
@@ -93,6 +140,185 @@ class Order(models.Model):
         verbose_name = 'Orden'
         verbose_name_plural = 'Órdenes'
         ordering = ['-created_at']
+        indexes = [
+            # Filtros por rango de fechas y por producto (exportación, reportes)
+            models.Index(fields=['created_at'], name='orders_created_idx'),
+            models.Index(fields=['course_id', 'created_at'], name='orders_course_created_idx'),
+            # Búsqueda por pago (webhook, stream de estado)
+            models.Index(fields=['payment_id'], name='orders_payment_id_idx'),
+            # Pagos pendientes a consultar (watcher)
+            models.Index(fields=['next_check_at'], name='orders_next_check_idx'),
+        ]
     
     def __str__(self):
         return f"Order #{self.id} - {self.first_name} {self.last_name} - {self.status}"
+
+
+class SalesRollup(models.Model):
+    """
+    Acumulado de ventas por día, producto y estado.
+    
+    Se actualiza incrementalmente (ver rollups.py) cada vez que se crea una
+    preferencia o un pago pasa a aprobado/reembolsado/contracargo, así el dashboard
+    no necesita recorrer la tabla de órdenes.
+    """
+    
+    STATUS_CHOICES = [
+        ('created', 'Preferencia creada'),
+        ('approved', 'Aprobado'),
+        ('refunded', 'Reembolsado'),  # totales y parciales
+        ('charged_back', 'Contracargo'),
+    ]
+    
+    day = models.DateField(
+        verbose_name="Día"
+    )
+    course_id = models.CharField(
+        max_length=100,
+        verbose_name="ID del curso"
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        verbose_name="Estado"
+    )
+    orders = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Cantidad de órdenes"
+    )
+    revenue = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        verbose_name="Monto"
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Fecha de actualización"
+    )
+    
+    class Meta:
+        db_table = 'sales_rollups'
+        verbose_name = 'Acumulado de ventas'
+        verbose_name_plural = 'Acumulados de ventas'
+        ordering = ['day', 'course_id', 'status']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'course_id', 'status'],
+                name='unique_rollup_day_course_status'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.day} {self.course_id} {self.status}: {self.orders} (${self.revenue})"
+
+
+class DeliveryAttempt(models.Model):
+    """
+    Un intento de envío de los archivos de una orden por email.
+    
+    Se registra cada envío (pago_exitoso, webhook, watcher, reenvío pedido
+    por el comprador o manual) con su resultado, para soporte y para
+    limitar los reenvíos (ver deliveries.py).
+    """
+    
+    SOURCE_CHOICES = [
+        ('validate', 'Página de pago exitoso'),
+        ('webhook', 'Webhook de MP'),
+        ('watcher', 'Watcher de pagos pendientes'),
+        ('resend', 'Reenvío pedido por el comprador'),
+        ('manual', 'Manual'),
+    ]
+    
+    order = models.ForeignKey(
+        Order,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='delivery_attempts',
+        verbose_name="Orden"
+    )
+    external_reference = models.CharField(
+        max_length=64,
+        blank=True,
+        verbose_name="Referencia externa MP"
+    )
+    payment_id = models.CharField(
+        max_length=100,
+        null=True,
+        blank=True,
+        verbose_name="ID de pago MP"
+    )
+    source = models.CharField(
+        max_length=20,
+        choices=SOURCE_CHOICES,
+        verbose_name="Origen"
+    )
+    provider = models.CharField(
+        max_length=100,
+        verbose_name="Proveedor de email"
+    )
+    recipient = models.EmailField(
+        verbose_name="Destinatario"
+    )
+    success = models.BooleanField(
+        verbose_name="Enviado"
+    )
+    latency_ms = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Duración (ms)"
+    )
+    attachments = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name="Adjuntos"
+    )
+    error = models.TextField(
+        blank=True,
+        verbose_name="Error"
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Fecha"
+    )
+    
+    class Meta:
+        db_table = 'delivery_attempts'
+        verbose_name = 'Intento de entrega'
+        verbose_name_plural = 'Intentos de entrega'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['external_reference', 'created_at'], name='deliveries_ref_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.external_reference} {self.source} {'OK' if self.success else 'ERROR'}"
+
+
+class IdWorkerLease(models.Model):
+    """
+    Worker id (0-1023) reservado por un proceso para generar IDs de orden.
+    
+    Cada worker de gunicorn / réplica toma un worker_id libre (o vencido) y
+    lo renueva mientras vive; así dos procesos nunca generan el mismo ID
+    (ver ids.py).
+    """
+    
+    worker_id = models.PositiveSmallIntegerField(
+        primary_key=True,
+        verbose_name="Worker id"
+    )
+    owner = models.CharField(
+        max_length=100,
+        verbose_name="Proceso"
+    )
+    expires_at = models.DateTimeField(
+        verbose_name="Vence"
+    )
+    
+    class Meta:
+        db_table = 'id_worker_leases'
+        verbose_name = 'Worker id reservado'
+        verbose_name_plural = 'Worker ids reservados'
+    
+    def __str__(self):
+        return f"worker {self.worker_id} → {self.owner} (hasta {self.expires_at})"
@@ -0,0 +1,217 @@
+"""
+Registro de órdenes - Datos con Alex
+=====================================
+Persiste cada checkout en la tabla ``orders`` y sus cambios de estado.
+
+La entrega sigue dependiendo de la metadata de Mercado Pago; la base de
+datos es un registro para métricas y soporte. Por eso ninguna función de
+este módulo levanta excepciones de base de datos: se loguean y el flujo
+de pago continúa.
+=====================================
+"""
+
+from __future__ import annotations
+
+import logging
+from decimal import Decimal
+from typing import Any, Optional
+
+from django.db import DatabaseError, IntegrityError, transaction
+
+from .archive import restore_order
+from .cart import product_amounts, split_product_ids
+from .models import Order
+from .rollups import increment_rollup
+from .status_stream import publish_status
+from .tenants import current_tenant
+from .watcher import schedule_for
+
+logger = logging.getLogger(__name__)
+
+# Estados de un pago que fue una venta: se cuenta la aprobación una sola
+# vez, aunque el pago vuelva a in_process / in_mediation y a approved
+SALE_STATUSES = ('approved', 'partially_refunded', 'refunded', 'charged_back')
+
+
+def record_preference(
+    external_reference: str,
+    preference_id: str,
+    first_name: str,
+    last_name: str,
+    document: str,
+    email: str,
+    course_id: str,
+    course_title: str,
+    price: float,
+    tenant: Optional[str] = None,
+) -> Optional[Order]:
+    """
+    Registra una orden pendiente al crear la preferencia de pago.
+
+    Returns:
+        La orden creada, o None si falló la escritura.
+    """
+    try:
+        with transaction.atomic():
+            order = Order.objects.create(
+                external_reference=external_reference,
+                preference_id=preference_id,
+                first_name=first_name[:100],
+                last_name=last_name[:100],
+                document=document[:20],
+                email=email,
+                course_id=course_id,
+                course_title=course_title[:255],
+                price=Decimal(str(price)),
+                status='pending',
+                tenant=tenant,
+            )
+            for product_id in split_product_ids(course_id):
+                increment_rollup(product_id, 'created')
+        return order
+    except DatabaseError:
+        logger.exception(f"[DB] Error registrando orden {external_reference}")
+        return None
+
+
+def _counted_rollups(order: Order) -> dict[str, Decimal]:
+    """Montos que la orden ya sumó a los rollups, por estado del rollup."""
+    if order.rollup_counts is not None:
+        return {key: Decimal(str(value)) for key, value in order.rollup_counts.items()}
+    # Orden anterior a rollup_counts: se contó al pasar a approved / refunded
+    price = order.price or Decimal('0')
+    if order.status == 'approved':
+        return {'approved': price}
+    if order.status == 'refunded':
+        return {'approved': price, 'refunded': price}
+    return {}
+
+
+def _rollup_changes(
+    status: str,
+    payment_data: dict[str, Any],
+    counted: dict[str, Decimal],
+) -> list[tuple[str, Decimal, int]]:
+    """
+    (estado del rollup, monto, órdenes) que faltan sumar para ``status``;
+    actualiza ``counted``.
+
+    - La venta (approved) se cuenta una vez por orden.
+    - Reembolsos totales y parciales (``partially_refunded`` o approved con
+      ``transaction_amount_refunded``) suman a refunded solo lo que se
+      devolvió desde la última vez: varios parciales y un total posterior
+      no se cuentan dos veces.
+    - Un contracargo descuenta lo que no se había reembolsado.
+    """
+    changes: list[tuple[str, Decimal, int]] = []
+    if status not in SALE_STATUSES:
+        return changes
+
+    total = Decimal(str(payment_data.get('transaction_amount') or 0))
+    if 'approved' not in counted:
+        changes.append(('approved', total, 1))
+        counted['approved'] = total
+
+    refunded = payment_data.get('transaction_amount_refunded') or (total if status == 'refunded' else 0)
+    refunded = Decimal(str(refunded))
+    already_refunded = counted.get('refunded', Decimal('0'))
+    if refunded > already_refunded:
+        changes.append(('refunded', refunded - already_refunded, 0 if 'refunded' in counted else 1))
+        counted['refunded'] = refunded
+
+    if status == 'charged_back' and 'charged_back' not in counted:
+        charged_back = max(total - counted.get('refunded', Decimal('0')), Decimal('0'))
+        changes.append(('charged_back', charged_back, 1))
+        counted['charged_back'] = charged_back
+    return changes
+
+
+def _order_from_metadata(payment_id: str, payment_data: dict[str, Any]) -> dict[str, Any]:
+    """Campos de una orden reconstruida desde la metadata del pago."""
+    metadata = payment_data.get('metadata', {}) or {}
+    return {
+        'first_name': str(metadata.get('customer_first_name', 'Cliente'))[:100],
+        'last_name': str(metadata.get('customer_last_name', ''))[:100],
+        'document': '',
+        'email': metadata.get('customer_email', ''),
+        'course_id': metadata.get('course_id', 'tracker-habitos'),
+        'course_title': str(metadata.get('course_title', 'Producto Digital'))[:255],
+        'price': Decimal(str(metadata.get('price') or payment_data.get('transaction_amount') or 0)),
+        'payment_id': payment_id,
+        'status': 'pending',
+        'tenant': str(metadata.get('tenant') or current_tenant().id)[:50],
+    }
+
+
+def apply_payment_status(payment_id: str, payment_data: dict[str, Any]) -> bool:
+    """
+    Sincroniza la orden con el estado del pago informado por Mercado Pago.
+
+    Si la orden no existe (preferencia creada antes de persistir órdenes, o
+    base efímera), se reconstruye desde la metadata. Los rollups de ventas
+    se actualizan con lo que la orden todavía no contó (``rollup_counts``,
+    ver ``_rollup_changes``), así pago_exitoso, webhook y watcher pueden
+    llamar todos, y un pago que vuelve a approved, no duplica ventas.
+    Cada cambio se publica a los streams de estado abiertos (status_stream.py)
+    y los pagos pendientes / en proceso quedan agendados para el watcher.
+
+    Returns:
+        True si el estado de la orden cambió.
+    """
+    status = payment_data.get('status')
+    if not status:
+        return False
+
+    external_reference = payment_data.get('external_reference') or None
+
+    try:
+        with transaction.atomic():
+            orders = Order.objects.select_for_update()
+            if external_reference:
+                order = orders.filter(external_reference=external_reference).first()
+            else:
+                order = orders.filter(payment_id=payment_id).first()
+
+            if order is None:
+                # Compra vieja archivada (ej. reembolso meses después): vuelve
+                # a la tabla con su estado, así el rollup no se cuenta dos veces
+                order = restore_order(external_reference or payment_id)
+            created = order is None
+            if created:
+                order = Order.objects.create(
+                    external_reference=external_reference,
+                    **_order_from_metadata(payment_id, payment_data),
+                )
+
+            previous_status = order.status
+            counted = _counted_rollups(order)
+            changes = _rollup_changes(status, payment_data, counted)
+            # Mismo estado pero con un nuevo reembolso parcial: hay que contarlo
+            if previous_status == status and order.payment_id == payment_id and not created and not changes:
+                return False
+
+            order.status = status
+            order.payment_id = payment_id
+            order.rollup_counts = {key: str(value) for key, value in counted.items()}
+            # Pagos no finales quedan agendados para el watcher; los finales salen
+            order.next_check_at = schedule_for(status, payment_data)
+            order.check_attempts = 0
+            order.save(update_fields=[
+                'status', 'payment_id', 'rollup_counts', 'next_check_at', 'check_attempts', 'updated_at',
+            ])
+
+            metadata = payment_data.get('metadata', {}) or {}
+            for rollup_status, amount, count in changes:
+                for product_id, product_amount in product_amounts(metadata, order.course_id, amount):
+                    increment_rollup(product_id, rollup_status, product_amount, count=count)
+
+        logger.info(f"[DB] Orden {order.external_reference or order.id}: {previous_status} -> {status}")
+        publish_status(payment_id, order.external_reference, status)
+        return previous_status != status
+    except IntegrityError:
+        # Otro worker creó la misma orden en paralelo: ya registró el cambio
+        logger.info(f"[DB] Orden {external_reference} creada en paralelo, se omite")
+        return False
+    except DatabaseError:
+        logger.exception(f"[DB] Error actualizando orden para payment {payment_id}")
+        return False
@@ -0,0 +1,120 @@
+"""
+Armado de preferencias de Mercado Pago - Datos con Alex
+========================================================
+Lógica compartida por create_preference (un checkout) y la generación
+masiva de links de pago (bulk.py):
+
+- parse_checkout: valida cliente + productos del request
+- new_order_reference: external_reference único y ordenado por tiempo (ids.py)
+- build_preference_data: payload para sdk.preference().create()
+========================================================
+"""
+
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Any, Container, Optional
+
+from .cart import CartItem, cart_metadata, parse_cart
+from .ids import next_order_id
+from .tracing import trace_id_for
+
+
+@dataclass
+class Customer:
+    first_name: str
+    last_name: str
+    document: str
+    email: str
+
+
+def parse_checkout(
+    data: dict[str, Any],
+    catalog: Optional[Container[str]] = None,
+) -> tuple[Customer, list[CartItem]]:
+    """
+    Valida los datos del comprador y los productos (del ``catalog`` de la
+    tienda, si se pasa).
+
+    Raises:
+        ValueError: con un mensaje apto para mostrar al usuario
+    """
+    customer = Customer(
+        first_name=str(data.get('first_name', '')).strip(),
+        last_name=str(data.get('last_name', '')).strip(),
+        document=str(data.get('document', '')).strip(),
+        email=str(data.get('email', '')).strip().lower(),
+    )
+
+    if not all([customer.first_name, customer.last_name, customer.email]) or (
+        'items' not in data and not data.get('price')
+    ):
+        raise ValueError('Faltan datos requeridos (nombre, apellido, email, precio)')
+
+    if '@' not in customer.email or '.' not in customer.email:
+        raise ValueError('Email inválido')
+
+    # Productos: carrito ("items") o un solo producto (course_id, price...)
+    return customer, parse_cart(data, catalog)
+
+
+def new_order_reference() -> int:
+    """
+    ID de referencia único entre procesos y réplicas, ordenado por tiempo
+    (timestamp + worker id + secuencia, ver ids.py).
+    """
+    return next_order_id()
+
+
+def build_preference_data(
+    customer: Customer,
+    cart: list[CartItem],
+    external_reference: str,
+    frontend_url: str,
+    extra_metadata: Optional[dict[str, Any]] = None,
+    statement_descriptor: str = "DATOS CON ALEX",
+) -> dict[str, Any]:
+    """Payload de la preferencia con los datos del cliente en la metadata."""
+    return {
+        "items": [
+            {
+                "id": item.course_id,
+                "title": item.title,
+                "currency_id": "ARS",
+                "unit_price": item.price,
+                "quantity": item.quantity,
+                "description": f"Archivo Excel: {item.title}",
+                "category_id": "learnings",
+            }
+            for item in cart
+        ],
+        "back_urls": {
+            "success": f"{frontend_url}/pago-exitoso",
+            "failure": f"{frontend_url}/pago-fallido",
+            "pending": f"{frontend_url}/pago-pendiente",
+        },
+        "auto_return": "approved",
+        "external_reference": external_reference,
+        "statement_descriptor": statement_descriptor,
+        "payer": {
+            "name": customer.first_name,
+            "surname": customer.last_name,
+            "email": customer.email,
+            "identification": {
+                "type": "DNI",
+                "number": customer.document.replace('.', '').replace('-', '').replace(' ', '')
+            }
+        },
+        # METADATA CRÍTICA - Aquí viajan los datos del cliente
+        "metadata": {
+            "customer_first_name": customer.first_name,
+            "customer_last_name": customer.last_name,
+            "customer_email": customer.email,
+            **cart_metadata(cart),
+            **(extra_metadata or {}),
+            # Correlation id de la compra: vuelve en los datos del pago (tracing.py)
+            "trace_id": trace_id_for(external_reference),
+            "created_at": time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+    }
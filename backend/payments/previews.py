@@ -0,0 +1,484 @@
+"""
+Vista previa de las planillas - Datos con Alex
+===============================================
+La página de detalle solo mostraba una imagen fija y los compradores
+preguntaban qué trae cada planilla. Ahora cada .xlsx de ``files/`` se
+analiza UNA vez (``python manage.py build_previews``, en el arranque) y se
+guarda un artefacto por archivo:
+
+- por hoja: nombre, tamaño usado, encabezados (primera fila con datos) y
+  una grilla de muestra (PREVIEW_SAMPLE_ROWS x PREVIEW_SAMPLE_COLS) con
+  los valores como se ven (fórmulas sin calcular: el texto de la fórmula)
+- una miniatura SVG por hoja dibujada desde la muestra (anchos de columna,
+  rellenos, color y negrita de la fuente, como en Excel). Sin Pillow.
+
+Los artefactos tienen el hash del contenido del .xlsx en el nombre
+(``<sha256[:16]>.json``, ``<sha256[:16]>-<hoja>.svg``): se sirven con
+``Cache-Control: immutable`` y un archivo nuevo genera nombres nuevos.
+
+manifest.json (PREVIEWS_DIR) guarda por archivo su huella (tamaño, mtime),
+sha256 y el resumen de hojas que devuelve la API. En un request no se abre
+ningún .xlsx: si la huella cambió, un thread en segundo plano recalcula el
+hash y solo si cambió vuelve a generar la vista previa.
+
+API:
+- GET /api/payments/previews/?product_id=tracker-habitos  (resumen, ETag)
+- GET /api/payments/previews/files/<artefacto>            (immutable)
+
+CONFIGURACIÓN:
+- PREVIEWS_DIR: default data/previews
+- PREVIEW_SAMPLE_ROWS / PREVIEW_SAMPLE_COLS: tamaño de la muestra (12 x 8)
+===============================================
+"""
+
+from __future__ import annotations
+
+import datetime
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional
+from xml.sax.saxutils import escape
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_SAMPLE_ROWS = int(os.getenv('PREVIEW_SAMPLE_ROWS', '12'))
+PREVIEW_SAMPLE_COLS = int(os.getenv('PREVIEW_SAMPLE_COLS', '8'))
+
+# Texto máximo por celda en la muestra
+PREVIEW_MAX_CELL_CHARS = 80
+
+PREVIEW_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Artefactos válidos (lo que se acepta en la URL)
+ARTIFACT_RE = re.compile(r'^[0-9a-f]{16}(-\d+\.svg|\.json)$')
+
+# Miniatura: px por unidad de ancho de columna de Excel, alto de fila, límites
+THUMB_CHAR_PX = 7
+THUMB_ROW_PX = 20
+THUMB_MIN_COL_PX = 40
+THUMB_MAX_COL_PX = 180
+THUMB_GUTTER_PX = 28
+THUMB_DEFAULT_WIDTH = 8.43
+
+
+def default_previews_dir() -> Path:
+    configured = os.getenv('PREVIEWS_DIR')
+    if configured:
+        return Path(configured)
+    from django.conf import settings
+    return Path(settings.BASE_DIR) / 'data' / 'previews'
+
+
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _fingerprint(path: Path) -> Optional[list[int]]:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+# =============================================================================
+# EXTRACCIÓN
+# =============================================================================
+
+def cell_text(value: Any) -> str:
+    """Valor de una celda como se muestra (fechas dd/mm/aaaa, números sin ceros de más)."""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'VERDADERO' if value else 'FALSO'
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%d/%m/%Y %H:%M' if value.time() != datetime.time() else '%d/%m/%Y')
+    if isinstance(value, datetime.date):
+        return value.strftime('%d/%m/%Y')
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() else f"{value:.2f}".rstrip('0')
+    text = str(value).strip()
+    return text[:PREVIEW_MAX_CELL_CHARS - 1] + '…' if len(text) > PREVIEW_MAX_CELL_CHARS else text
+
+
+def _rgb(color) -> Optional[str]:
+    """'#RRGGBB' de un color de openpyxl (los de tema / indexados no se resuelven)."""
+    rgb = getattr(color, 'rgb', None) if getattr(color, 'type', None) == 'rgb' else None
+    if not isinstance(rgb, str) or len(rgb) not in (6, 8):
+        return None
+    return f"#{rgb[-6:].upper()}"
+
+
+def extract_workbook(
+    path: Path,
+    max_rows: int = PREVIEW_SAMPLE_ROWS,
+    max_cols: int = PREVIEW_SAMPLE_COLS,
+) -> list[dict[str, Any]]:
+    """
+    Hojas visibles de ``path`` con encabezados, muestra y estilos de la
+    muestra (para la miniatura).
+    """
+    from openpyxl import load_workbook
+    from openpyxl.utils import get_column_letter
+
+    values_book = load_workbook(path, data_only=True)
+    formulas_book = load_workbook(path, read_only=True)
+    try:
+        sheets = []
+        for worksheet in values_book.worksheets:
+            if worksheet.sheet_state != 'visible':
+                continue
+            rows = min(max_rows, worksheet.max_row)
+            cols = min(max_cols, worksheet.max_column)
+            # Sin valores cacheados (archivo nunca abierto en Excel): se muestra la fórmula
+            formulas = list(formulas_book[worksheet.title].iter_rows(max_row=rows, max_col=cols, values_only=True))
+
+            sample, styles = [], []
+            for r, row in enumerate(worksheet.iter_rows(min_row=1, max_row=rows, max_col=cols)):
+                texts, row_styles = [], []
+                for c, cell in enumerate(row):
+                    value = cell.value
+                    if value is None and r < len(formulas) and c < len(formulas[r]):
+                        value = formulas[r][c]
+                    texts.append(cell_text(value))
+                    fill = _rgb(cell.fill.fgColor) if cell.fill is not None and cell.fill.fill_type == 'solid' else None
+                    row_styles.append({
+                        'fill': fill,
+                        'color': _rgb(cell.font.color) if cell.font is not None and cell.font.color is not None else None,
+                        'bold': bool(cell.font is not None and cell.font.b),
+                    })
+                sample.append(texts)
+                styles.append(row_styles)
+
+            header_row = next((index for index, texts in enumerate(sample) if any(texts)), None)
+            headers = sample[header_row] if header_row is not None else []
+            while headers and not headers[-1]:
+                headers = headers[:-1]
+            widths = [
+                worksheet.column_dimensions[get_column_letter(c + 1)].width or THUMB_DEFAULT_WIDTH
+                for c in range(cols)
+            ]
+            sheets.append({
+                'name': worksheet.title,
+                'dimensions': worksheet.dimensions,
+                'rows': worksheet.max_row,
+                'columns': worksheet.max_column,
+                'header_row': header_row + 1 if header_row is not None else None,
+                'headers': headers,
+                'sample': sample,
+                '_styles': styles,
+                '_widths': widths,
+            })
+        return sheets
+    finally:
+        values_book.close()
+        formulas_book.close()
+
+
+def render_thumbnail(sheet: dict[str, Any]) -> str:
+    """Miniatura SVG de la muestra de una hoja (encabezados de fila / columna como Excel)."""
+    from openpyxl.utils import get_column_letter
+
+    widths = [
+        max(THUMB_MIN_COL_PX, min(THUMB_MAX_COL_PX, round(width * THUMB_CHAR_PX))) for width in sheet['_widths']
+    ] or [round(THUMB_DEFAULT_WIDTH * THUMB_CHAR_PX)]
+    rows = max(len(sheet['sample']), 1)
+    width = THUMB_GUTTER_PX + sum(widths)
+    height = THUMB_ROW_PX * (rows + 1)
+    lefts = [THUMB_GUTTER_PX + sum(widths[:index]) for index in range(len(widths))]
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}" '
+        f'font-family="Calibri, Arial, sans-serif" font-size="11">',
+        f'<rect width="{width}" height="{height}" fill="#FFFFFF"/>',
+        f'<rect width="{width}" height="{THUMB_ROW_PX}" fill="#F3F3F3"/>',
+        f'<rect y="{THUMB_ROW_PX}" width="{THUMB_GUTTER_PX}" height="{height - THUMB_ROW_PX}" fill="#F3F3F3"/>',
+    ]
+    for index, left in enumerate(lefts):
+        parts.append(
+            f'<text x="{left + widths[index] // 2}" y="14" fill="#666666" text-anchor="middle">'
+            f'{get_column_letter(index + 1)}</text>'
+        )
+    for r in range(rows):
+        top = THUMB_ROW_PX * (r + 1)
+        parts.append(f'<text x="{THUMB_GUTTER_PX // 2}" y="{top + 14}" fill="#666666" text-anchor="middle">{r + 1}</text>')
+        texts = sheet['sample'][r] if r < len(sheet['sample']) else []
+        for c, text in enumerate(texts):
+            style = sheet['_styles'][r][c]
+            if style['fill']:
+                parts.append(f'<rect x="{lefts[c]}" y="{top}" width="{widths[c]}" height="{THUMB_ROW_PX}" fill="{style["fill"]}"/>')
+            if text:
+                visible = text if len(text) * 6 <= widths[c] - 6 else text[:max(1, (widths[c] - 6) // 6 - 1)] + '…'
+                weight = ' font-weight="bold"' if style['bold'] else ''
+                parts.append(
+                    f'<text x="{lefts[c] + 3}" y="{top + 14}" fill="{style["color"] or "#000000"}"{weight}>'
+                    f'{escape(visible)}</text>'
+                )
+
+    grid = [f'M{x} 0V{height}' for x in [THUMB_GUTTER_PX, *[left + w for left, w in zip(lefts, widths)]]]
+    grid += [f'M0 {THUMB_ROW_PX * (r + 1)}H{width}' for r in range(rows)]
+    parts.append(f'<path d="{"".join(grid)}" stroke="#D4D4D4" stroke-width="1" fill="none"/>')
+    parts.append('</svg>')
+    return ''.join(parts)
+
+
+# =============================================================================
+# ARTEFACTOS
+# =============================================================================
+
+class PreviewStore:
+    """Artefactos de vista previa + manifest.json en PREVIEWS_DIR."""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.manifest_path = self.directory / 'manifest.json'
+        self._cache_lock = threading.Lock()
+        self._manifest_cache: tuple[Optional[float], dict[str, Any]] = (None, {})
+        self._refresh_lock = threading.Lock()
+        self._refreshing: set[str] = set()
+
+    def manifest(self) -> dict[str, Any]:
+        try:
+            mtime = self.manifest_path.stat().st_mtime
+        except FileNotFoundError:
+            return {}
+        with self._cache_lock:
+            if self._manifest_cache[0] != mtime:
+                with open(self.manifest_path, encoding='utf-8') as f:
+                    self._manifest_cache = (mtime, json.load(f))
+            return self._manifest_cache[1]
+
+    def _save_manifest(self, manifest: dict[str, Any]) -> None:
+        tmp = self.manifest_path.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.manifest_path)
+
+    @contextmanager
+    def _job_lock(self) -> Iterator[None]:
+        """Una sola generación a la vez (entre procesos)."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / '.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def artifact_path(self, name: str) -> Optional[Path]:
+        """Ruta de un artefacto por nombre (None si el nombre no es válido)."""
+        return self.directory / name if ARTIFACT_RE.match(name) else None
+
+    # -------------------------------------------------------------------------
+    # Generación
+    # -------------------------------------------------------------------------
+
+    def build(self, paths: Iterable[Path], force: bool = False) -> dict[str, int]:
+        """
+        Genera la vista previa de los archivos cuyo contenido cambió (o de
+        todos con ``force``) y borra los artefactos que ya nadie usa.
+        """
+        stats = {'built': 0, 'unchanged': 0, 'failed': 0, 'removed': 0}
+        with self._job_lock():
+            manifest = dict(self.manifest())
+            for path in paths:
+                path = Path(path).resolve()
+                key = str(path)
+                fingerprint = _fingerprint(path)
+                if fingerprint is None:
+                    manifest.pop(key, None)
+                    continue
+                entry = manifest.get(key)
+                if not force and entry and entry['fingerprint'] == fingerprint and self._complete(entry):
+                    stats['unchanged'] += 1
+                    continue
+                try:
+                    digest = file_digest(path)
+                    if not force and entry and entry['sha256'] == digest and self._complete(entry):
+                        # Mismo contenido (ej. copiado de nuevo en el deploy): solo la huella
+                        manifest[key] = {**entry, 'fingerprint': fingerprint}
+                        stats['unchanged'] += 1
+                        continue
+                    manifest[key] = self._build_file(path, digest, fingerprint)
+                    stats['built'] += 1
+                    logger.info(f"[PREVIEWS] {path.name}: {len(manifest[key]['sheets'])} hojas ({digest[:16]})")
+                except Exception:
+                    logger.exception(f"[PREVIEWS] Error generando la vista previa de {path.name}")
+                    stats['failed'] += 1
+
+            manifest = {key: entry for key, entry in manifest.items() if Path(key).exists()}
+            self._save_manifest(manifest)
+            stats['removed'] = self._remove_unused(manifest)
+        return stats
+
+    def _build_file(self, path: Path, digest: str, fingerprint: list[int]) -> dict[str, Any]:
+        prefix = digest[:16]
+        sheets = extract_workbook(path)
+        summary = []
+        for index, sheet in enumerate(sheets):
+            thumbnail = f"{prefix}-{index}.svg"
+            self._write(thumbnail, render_thumbnail(sheet).encode('utf-8'))
+            summary.append({
+                'name': sheet['name'],
+                'rows': sheet['rows'],
+                'columns': sheet['columns'],
+                'headers': sheet['headers'],
+                'thumbnail': thumbnail,
+            })
+            sheet['thumbnail'] = thumbnail
+
+        artifact = f"{prefix}.json"
+        content = {
+            'file': path.name,
+            'sha256': digest,
+            'sheets': [{key: value for key, value in sheet.items() if not key.startswith('_')} for sheet in sheets],
+        }
+        self._write(artifact, json.dumps(content, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        return {
+            'file': path.name,
+            'sha256': digest,
+            'fingerprint': fingerprint,
+            'artifact': artifact,
+            'sheets': summary,
+        }
+
+    def _write(self, name: str, data: bytes) -> None:
+        path = self.directory / name
+        tmp = path.with_name(f".{name}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    def _complete(self, entry: dict[str, Any]) -> bool:
+        names = [entry['artifact'], *[sheet['thumbnail'] for sheet in entry['sheets']]]
+        return all((self.directory / name).exists() for name in names)
+
+    def _remove_unused(self, manifest: dict[str, Any]) -> int:
+        used = {
+            name
+            for entry in manifest.values()
+            for name in [entry['artifact'], *[sheet['thumbnail'] for sheet in entry['sheets']]]
+        }
+        removed = 0
+        for artifact in self.directory.iterdir():
+            if ARTIFACT_RE.match(artifact.name) and artifact.name not in used:
+                artifact.unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+    # -------------------------------------------------------------------------
+    # Lectura (requests)
+    # -------------------------------------------------------------------------
+
+    def entry_for(self, path: Path) -> Optional[dict[str, Any]]:
+        """
+        Vista previa vigente de ``path`` o None. Si el archivo cambió desde
+        la última generación se revisa en segundo plano (el request no
+        espera ni abre el .xlsx).
+        """
+        path = Path(path).resolve()
+        entry = self.manifest().get(str(path))
+        if entry is not None and entry['fingerprint'] == _fingerprint(path):
+            return entry
+        if path.exists():
+            self.refresh_in_background([path])
+        return None
+
+    def refresh_in_background(self, paths: list[Path]) -> None:
+        with self._refresh_lock:
+            pending = [path for path in paths if str(path) not in self._refreshing]
+            self._refreshing.update(str(path) for path in pending)
+        if not pending:
+            return
+
+        def run():
+            try:
+                self.build(pending)
+            except Exception:
+                logger.exception("[PREVIEWS] Error actualizando vistas previas")
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.difference_update(str(path) for path in pending)
+
+        threading.Thread(target=run, name='preview-refresh', daemon=True).start()
+
+
+_store: Optional[PreviewStore] = None
+_store_lock = threading.Lock()
+
+
+def get_preview_store() -> PreviewStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PreviewStore(default_previews_dir())
+        return _store
+
+
+def catalog_workbooks() -> list[Path]:
+    """Todos los .xlsx de los catálogos de todas las tiendas (sin repetir)."""
+    from .services import product_catalog
+    from .tenants import get_registry
+
+    paths: list[Path] = []
+    for tenant in get_registry().by_id.values():
+        for filenames in product_catalog(tenant).values():
+            for filename in filenames:
+                path = (Path(tenant.files_dir) / filename).resolve()
+                if path.suffix.lower() == '.xlsx' and path not in paths:
+                    paths.append(path)
+    return paths
+
+
+def product_previews(product_id: str, tenant=None) -> Optional[dict[str, Any]]:
+    """
+    Resumen de la vista previa de un producto de la tienda (None si no
+    existe). ``pending``: archivos que todavía no tienen vista previa.
+    """
+    from django.urls import reverse
+
+    from .services import product_catalog
+    from .tenants import current_tenant
+
+    tenant = tenant or current_tenant()
+    filenames = product_catalog(tenant).get(product_id)
+    if not filenames:
+        return None
+
+    store = get_preview_store()
+    files, pending = [], []
+    for filename in filenames:
+        path = Path(tenant.files_dir) / filename
+        entry = store.entry_for(path)
+        if entry is None:
+            if path.suffix.lower() == '.xlsx' and path.exists():
+                pending.append(filename)
+            continue
+        files.append({
+            'file': entry['file'],
+            'sha256': entry['sha256'],
+            'preview_url': reverse('payments:workbook_preview_file', args=[entry['artifact']]),
+            'sheets': [
+                {
+                    'name': sheet['name'],
+                    'rows': sheet['rows'],
+                    'columns': sheet['columns'],
+                    'headers': sheet['headers'],
+                    'thumbnail_url': reverse('payments:workbook_preview_file', args=[sheet['thumbnail']]),
+                }
+                for sheet in entry['sheets']
+            ],
+        })
+    return {'product_id': product_id, 'files': files, 'pending': pending}
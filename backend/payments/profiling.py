@@ -0,0 +1,283 @@
+"""
+Profiling de requests de pago - Datos con Alex
+===============================================
+Para investigar checkouts lentos en producción sin tocar el código.
+
+- Solo mira ``create_preference`` (/create-preference/), ``pago_exitoso``
+  (/validate/) y ``webhook`` (/webhook/).
+- Cada request a esas rutas lleva un desglose de tiempo por categoría:
+    * mp: llamadas HTTP al SDK de Mercado Pago
+    * smtp: conexión y envío por SMTP
+    * mime: armado del email (planillas personalizadas + mensaje MIME)
+    * django: el resto (vista, base de datos, middlewares)
+  Si el request supera PROFILE_SLOW_MS se loguea con el desglose.
+- Un request se perfila con cProfile (archivo .prof) si trae el header
+  ``X-Profile-Token`` firmado (``python manage.py profile_token``) o si
+  sale sorteado por PROFILE_SAMPLE_RATE. Los .prof van a PROFILE_DIR y se
+  conservan los últimos PROFILE_MAX_FILES. Con token la respuesta incluye
+  ``Server-Timing`` y ``X-Profile-Id``.
+- Con REQUEST_PROFILING_ENABLED=False (default) el middleware no se instala
+  y no se parchea nada: costo cero.
+- El token se firma con SECRET_KEY: sin DJANGO_SECRET_KEY (clave de
+  desarrollo ``django-insecure-...``, pública en el repo) el profiling no
+  se activa y no se aceptan tokens, porque cualquiera podría firmarlos.
+
+Leer un perfil:
+    python -m pstats backend/data/profiles/<archivo>.prof
+
+CONFIGURACIÓN:
+- REQUEST_PROFILING_ENABLED: "True" para activar
+- PROFILE_SAMPLE_RATE: fracción de requests perfilados al azar (default 0)
+- PROFILE_SLOW_MS: umbral de request lento (default 2000)
+- PROFILE_DIR: default backend/data/profiles
+- PROFILE_MAX_FILES: perfiles conservados (default 50)
+- PROFILE_TOKEN_MAX_AGE: validez del token en segundos (default 3600)
+===============================================
+"""
+
+from __future__ import annotations
+
+import cProfile
+import functools
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+
+logger = logging.getLogger(__name__)
+
+REQUEST_PROFILING_ENABLED = os.getenv('REQUEST_PROFILING_ENABLED', 'False').lower() == 'true'
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_SLOW_MS = float(os.getenv('PROFILE_SLOW_MS', '2000'))
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', '50'))
+PROFILE_TOKEN_MAX_AGE = int(os.getenv('PROFILE_TOKEN_MAX_AGE', '3600'))
+
+PROFILE_HEADER = 'X-Profile-Token'
+_TOKEN_SALT = 'payments.profiling'
+
+# Sufijo de ruta -> nombre del endpoint
+PROFILED_PATHS = {
+    '/create-preference/': 'create_preference',
+    '/validate/': 'pago_exitoso',
+    '/webhook/': 'webhook',
+}
+
+CATEGORIES = ('mp', 'smtp', 'mime')
+
+
+def default_profile_dir() -> Path:
+    configured = os.getenv('PROFILE_DIR')
+    if configured:
+        return Path(configured)
+    from django.conf import settings
+    return Path(settings.BASE_DIR) / 'data' / 'profiles'
+
+
+# =============================================================================
+# TOKEN FIRMADO
+# =============================================================================
+
+def insecure_secret_key() -> bool:
+    """True si SECRET_KEY es la clave de desarrollo (falta DJANGO_SECRET_KEY)."""
+    return not settings.SECRET_KEY or settings.SECRET_KEY.startswith('django-insecure')
+
+
+def make_profile_token() -> str:
+    """Token para el header X-Profile-Token (firmado con SECRET_KEY)."""
+    return signing.TimestampSigner(salt=_TOKEN_SALT).sign('profile')
+
+
+def is_valid_token(token: str) -> bool:
+    if insecure_secret_key():
+        return False
+    try:
+        return signing.TimestampSigner(salt=_TOKEN_SALT).unsign(token, max_age=PROFILE_TOKEN_MAX_AGE) == 'profile'
+    except signing.BadSignature:
+        return False
+
+
+# =============================================================================
+# DESGLOSE POR CATEGORÍA
+# =============================================================================
+
+_state = threading.local()
+
+
+class Breakdown:
+    """Tiempo propio por categoría (lo anidado se descuenta del padre)."""
+
+    def __init__(self):
+        self.totals = dict.fromkeys(CATEGORIES, 0.0)
+        self._stack: list[list] = []
+
+    def enter(self, category: str) -> None:
+        self._stack.append([category, time.perf_counter(), 0.0])
+
+    def exit(self) -> None:
+        category, started, children = self._stack.pop()
+        elapsed = time.perf_counter() - started
+        self.totals[category] += elapsed - children
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+    def as_ms(self, total_seconds: float) -> dict[str, float]:
+        result = {name: round(seconds * 1000, 1) for name, seconds in self.totals.items()}
+        result['django'] = round(max(0.0, total_seconds - sum(self.totals.values())) * 1000, 1)
+        return result
+
+
+def _timed(category: str, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        breakdown = getattr(_state, 'breakdown', None)
+        if breakdown is None:
+            return func(*args, **kwargs)
+        breakdown.enter(category)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            breakdown.exit()
+    wrapper._profiling_category = category
+    return wrapper
+
+
+def _instrument(owner, attribute: str, category: str) -> None:
+    original = getattr(owner, attribute)
+    if getattr(original, '_profiling_category', None) is None:
+        setattr(owner, attribute, _timed(category, original))
+
+
+_instrumented = False
+_instrument_lock = threading.Lock()
+
+
+def install_instrumentation() -> None:
+    """Envuelve los puntos de medición (una sola vez, solo si el profiling está activo)."""
+    global _instrumented
+    with _instrument_lock:
+        if _instrumented:
+            return
+        from django.core.mail.backends.smtp import EmailBackend
+        from django.core.mail.message import EmailMessage
+        from mercadopago.http.http_client import HttpClient
+
+        from . import services
+
+        _instrument(HttpClient, 'request', 'mp')
+        _instrument(EmailBackend, 'open', 'smtp')
+        _instrument(EmailBackend, 'send_messages', 'smtp')
+        _instrument(EmailMessage, 'message', 'mime')
+        _instrument(services, 'get_personalized_attachments', 'mime')
+        _instrumented = True
+
+
+# =============================================================================
+# PERFILES
+# =============================================================================
+
+class ProfileWriter:
+    """Guarda .prof en un directorio y conserva solo los más nuevos."""
+
+    def __init__(self, directory: Path, max_files: int = PROFILE_MAX_FILES):
+        self.directory = directory
+        self.max_files = max_files
+        self._lock = threading.Lock()
+
+    def write(self, profile: cProfile.Profile, endpoint: str, duration_ms: float) -> Optional[Path]:
+        profile_id = uuid.uuid4().hex[:8]
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{int(duration_ms)}ms-{profile_id}.prof"
+        path = self.directory / name
+        try:
+            with self._lock:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                profile.dump_stats(str(path))
+                self._rotate()
+        except OSError:
+            logger.exception(f"[PROFILE] No se pudo guardar el perfil en {self.directory}")
+            return None
+        return path
+
+    def _rotate(self) -> None:
+        profiles = sorted(self.directory.glob('*.prof'), key=lambda p: p.stat().st_mtime)
+        for old in profiles[:max(0, len(profiles) - self.max_files)]:
+            try:
+                old.unlink()
+            except OSError:
+                pass
+
+
+# cProfile no admite dos perfiles activos a la vez en 3.12+: uno por proceso
+_profile_lock = threading.Lock()
+
+
+class RequestProfilingMiddleware:
+    """Desglose de tiempos + cProfile opt-in para los endpoints de pago."""
+
+    def __init__(self, get_response):
+        if not REQUEST_PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        if insecure_secret_key():
+            logger.error("[PROFILE] No se activa: falta DJANGO_SECRET_KEY (con la clave de desarrollo cualquiera firma tokens)")
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.writer = ProfileWriter(default_profile_dir())
+        install_instrumentation()
+        logger.warning(
+            f"[PROFILE] Activo (sample_rate={PROFILE_SAMPLE_RATE:g}, lento>{PROFILE_SLOW_MS:g}ms, dir={self.writer.directory})"
+        )
+
+    def __call__(self, request):
+        endpoint = next((name for suffix, name in PROFILED_PATHS.items() if request.path.endswith(suffix)), None)
+        if endpoint is None:
+            return self.get_response(request)
+
+        token = request.headers.get(PROFILE_HEADER)
+        signed = bool(token) and is_valid_token(token)
+        sampled = signed or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE)
+        profile = cProfile.Profile() if sampled and _profile_lock.acquire(blocking=False) else None
+
+        if profile is not None:
+            try:
+                profile.enable()
+            except ValueError:  # otra herramienta de profiling activa
+                _profile_lock.release()
+                profile = None
+
+        _state.breakdown = breakdown = Breakdown()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.breakdown = None
+            if profile is not None:
+                profile.disable()
+                _profile_lock.release()
+
+        total = time.perf_counter() - started
+        duration_ms = total * 1000
+        timings = breakdown.as_ms(total)
+        profile_path = self.writer.write(profile, endpoint, duration_ms) if profile is not None else None
+
+        if duration_ms >= PROFILE_SLOW_MS:
+            detail = ' '.join(f"{name}={ms:g}ms" for name, ms in timings.items())
+            logger.warning(
+                f"[PROFILE] Request lento {endpoint} {request.method} {duration_ms:.0f}ms "
+                f"(status {response.status_code}): {detail}"
+                + (f" perfil={profile_path.name}" if profile_path else "")
+            )
+
+        if signed:
+            response['Server-Timing'] = ', '.join(
+                [f"{name};dur={ms:g}" for name, ms in timings.items()] + [f"total;dur={duration_ms:.1f}"]
+            )
+            if profile_path:
+                response['X-Profile-Id'] = profile_path.name
+        return response
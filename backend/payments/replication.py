@@ -0,0 +1,900 @@
+"""
+Replicación continua de SQLite y restauración a un punto en el tiempo - Datos con Alex
+========================================================================================
+El disco de Railway es efímero: en cada redeploy ``db.sqlite3`` arranca
+vacío. Con REPLICA_DIR configurado la base se replica en caliente y se
+restaura sola al arrancar, sin dejar SQLite embebido:
+
+- WAL shipping: cada REPLICA_SYNC_SECONDS se leen del archivo ``-wal`` los
+  frames nuevos hasta el último commit completo (según el wal-index,
+  ``-shm``) y se suben como un segmento inmutable comprimido. Un frame es una página
+  completa de la base, así que aplicar los segmentos en orden sobre un
+  snapshot reproduce la base en ese punto.
+- Checkpoints: con replicación activa las conexiones de Django no hacen
+  autocheckpoint (config/database.py); el replicador sube los frames y
+  recién ahí hace el checkpoint, así el WAL nunca se recicla con frames
+  sin subir. Si la subida falla el WAL crece sin límite: pasado
+  REPLICA_MAX_WAL_BYTES se hace checkpoint igual (la base sigue andando
+  y la réplica abre una generación nueva con snapshot).
+- Snapshots: copia página a página (API de backup de SQLite) comprimida.
+  Uno al abrir cada generación y otro cada REPLICA_SNAPSHOT_HOURS (la
+  restauración no tiene que reaplicar días de WAL). Los segmentos y
+  snapshots anteriores a REPLICA_RETENTION_HOURS se borran.
+- Generaciones: una historia continua de WAL. Se abre una nueva cuando no
+  se puede verificar la continuidad (base restaurada, WAL reciclado por
+  otro proceso): arranca con un snapshot.
+- Un solo replicador a la vez: cada worker de gunicorn arranca el thread
+  y el que toma el lock (``<base>-replica.lock``) replica; los demás
+  reintentan y toman la posta si ese worker muere (retoman la misma
+  generación desde ``<base>-replica.json`` si el WAL sigue siendo el mismo).
+- Restauración: ``python manage.py restore_db --if-missing`` antes de
+  migrate (railway.json / Procfile). ``--until`` restaura a un punto en el
+  tiempo (resolución: REPLICA_SYNC_SECONDS).
+- Lag: ``replication_status()`` (system-status y health) calcula desde
+  cualquier worker los segundos con escrituras sin subir.
+
+FORMATO EN REPLICA_DIR (claves tipo object store, nada se modifica):
+    generations/<generación>/generation.json                 Tamaño de página, creación
+    generations/<generación>/snapshots/<seq>-<ts_ms>.db.gz   Base completa antes del segmento <seq>
+    generations/<generación>/wal/<seq>-<ts_ms>.wal.gz        Frames del WAL (commits completos)
+La generación se llama <UTC con milisegundos>Z-<azar>: ordenadas por
+nombre quedan en orden de creación.
+
+CONFIGURACIÓN:
+- REPLICA_DIR: destino de la réplica (vacío = sin replicación). Un volumen
+  o un bucket montado; el local sirve para probar
+- REPLICA_SYNC_SECONDS: cada cuánto se suben los frames (default 1)
+- REPLICA_SNAPSHOT_HOURS: snapshot periódico (default 24)
+- REPLICA_RETENTION_HOURS: ventana restaurable (default 72)
+- REPLICA_CHECKPOINT_FRAMES: checkpoint a partir de N frames en el WAL (default 1000)
+- REPLICA_MAX_WAL_BYTES: tamaño del WAL a partir del cual, con la subida
+  fallando, se hace checkpoint sin subir (default 1 GB)
+========================================================================================
+"""
+
+from __future__ import annotations
+
+import datetime
+import fcntl
+import gzip
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import struct
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+REPLICA_SYNC_SECONDS = float(os.getenv('REPLICA_SYNC_SECONDS', '1'))
+REPLICA_SNAPSHOT_HOURS = float(os.getenv('REPLICA_SNAPSHOT_HOURS', '24'))
+REPLICA_RETENTION_HOURS = float(os.getenv('REPLICA_RETENTION_HOURS', '72'))
+REPLICA_CHECKPOINT_FRAMES = int(os.getenv('REPLICA_CHECKPOINT_FRAMES', '1000'))
+REPLICA_MAX_WAL_BYTES = int(os.getenv('REPLICA_MAX_WAL_BYTES', str(1024 * 1024 * 1024)))
+
+# Formato del WAL: https://www.sqlite.org/fileformat.html#the_write_ahead_log
+WAL_HEADER = struct.Struct('>8I')
+FRAME_HEADER = struct.Struct('>6I')
+# Header del wal-index en el orden de bytes nativo (dos copias seguidas)
+WAL_INDEX_HEADER = struct.Struct('=3IBBH8I')
+WAL_MAGIC_LE = 0x377f0682
+WAL_MAGIC_BE = 0x377f0683
+_MASK = 0xFFFFFFFF
+
+_SEGMENT_RE = re.compile(r'^(\d{10})-(\d{13})\.(wal|db)\.gz$')
+
+
+def default_replica_dir() -> Optional[Path]:
+    configured = os.getenv('REPLICA_DIR', '').strip()
+    return Path(configured) if configured else None
+
+
+def sqlite_path() -> Optional[Path]:
+    """Archivo de la base default si es SQLite (con Postgres no hay nada que replicar)."""
+    from django.conf import settings
+
+    database = settings.DATABASES['default']
+    if database['ENGINE'] != 'django.db.backends.sqlite3' or str(database['NAME']) == ':memory:':
+        return None
+    return Path(database['NAME'])
+
+
+def replication_enabled() -> bool:
+    return default_replica_dir() is not None and sqlite_path() is not None
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+# =============================================================================
+# WAL
+# =============================================================================
+
+@dataclass(frozen=True)
+class WalHeader:
+    page_size: int
+    checkpoint_seq: int
+    salt1: int
+    salt2: int
+    checksum: tuple[int, int]
+    big_endian: bool
+
+    @property
+    def frame_size(self) -> int:
+        return FRAME_HEADER.size + self.page_size
+
+
+@dataclass(frozen=True)
+class WalIndex:
+    """Parte del header del wal-index (-shm) que usa el replicador."""
+
+    max_frame: int
+    salt1: int
+    salt2: int
+    # Checksum acumulado del frame max_frame
+    checksum: tuple[int, int]
+
+
+def _checksum(data: bytes, s0: int, s1: int, big_endian: bool) -> tuple[int, int]:
+    words = struct.unpack(f"{'>' if big_endian else '<'}{len(data) // 4}I", data)
+    for i in range(0, len(words), 2):
+        s0 = (s0 + words[i] + s1) & _MASK
+        s1 = (s1 + words[i + 1] + s0) & _MASK
+    return s0, s1
+
+
+def read_wal_header(wal_path: Path) -> Optional[WalHeader]:
+    """Header del WAL, o None si no existe / está vacío / no es válido."""
+    try:
+        with open(wal_path, 'rb') as f:
+            raw = f.read(WAL_HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(raw) < WAL_HEADER.size:
+        return None
+    magic, _version, page_size, checkpoint_seq, salt1, salt2, c0, c1 = WAL_HEADER.unpack(raw)
+    if magic not in (WAL_MAGIC_LE, WAL_MAGIC_BE):
+        return None
+    big_endian = magic == WAL_MAGIC_BE
+    if _checksum(raw[:24], 0, 0, big_endian) != (c0, c1):
+        return None
+    return WalHeader(page_size, checkpoint_seq, salt1, salt2, (c0, c1), big_endian)
+
+
+def read_wal_index(shm_path: Path, retries: int = 5) -> Optional[WalIndex]:
+    """
+    Header del wal-index (archivo ``-shm``): hasta qué frame hay commits
+    completos. SQLite lo escribe dos veces seguidas; si las copias no
+    coinciden se está actualizando y se vuelve a leer.
+    Formato: https://www.sqlite.org/walformat.html
+    """
+    for _ in range(retries):
+        try:
+            with open(shm_path, 'rb') as f:
+                raw = f.read(WAL_INDEX_HEADER.size * 2)
+        except FileNotFoundError:
+            return None
+        if len(raw) < WAL_INDEX_HEADER.size * 2:
+            return None
+        if raw[:WAL_INDEX_HEADER.size] == raw[WAL_INDEX_HEADER.size:]:
+            _version, _unused, _change, is_init, _big_endian, _page, max_frame, _pages, c0, c1, salt1, salt2, _, _ = (
+                WAL_INDEX_HEADER.unpack(raw[:WAL_INDEX_HEADER.size])
+            )
+            if not is_init:
+                return None
+            # Los salts se copian tal cual del header del WAL (big-endian)
+            salt1, salt2 = struct.unpack('>2I', struct.pack('=2I', salt1, salt2))
+            return WalIndex(max_frame, salt1, salt2, (c0, c1))
+        time.sleep(0.001)
+    return None
+
+
+def read_frames(
+    wal_path: Path,
+    header: WalHeader,
+    start_frame: int,
+    end_frame: int,
+) -> tuple[bytes, int, Optional[tuple[int, int]]]:
+    """
+    Frames [start_frame, end_frame) del WAL hasta el último commit.
+
+    ``end_frame`` sale del wal-index (commits completos, ya validados por
+    SQLite); igual se corta en el primer frame con otros salts por si el WAL
+    se recicló entre las dos lecturas.
+
+    Returns:
+        (frames crudos, cantidad, checksum acumulado del último frame o None)
+    """
+    frame_size = header.frame_size
+    with open(wal_path, 'rb') as f:
+        f.seek(WAL_HEADER.size + start_frame * frame_size)
+        data = f.read(max(0, end_frame - start_frame) * frame_size)
+
+    committed_end, checksum = 0, None
+    for offset in range(0, len(data) - frame_size + 1, frame_size):
+        _pgno, db_size, salt1, salt2, c0, c1 = FRAME_HEADER.unpack_from(data, offset)
+        if (salt1, salt2) != (header.salt1, header.salt2):
+            break
+        if db_size:
+            committed_end, checksum = offset + frame_size, (c0, c1)
+    return data[:committed_end], committed_end // frame_size, checksum
+
+
+def apply_frames(db_file, frames: bytes, page_size: int) -> int:
+    """
+    Escribe en ``db_file`` (abierto en r+b) las páginas de los commits
+    completos de ``frames``. Devuelve la cantidad de commits aplicados.
+    """
+    frame_size = FRAME_HEADER.size + page_size
+    pending: dict[int, bytes] = {}
+    commits = 0
+    for offset in range(0, len(frames) - frame_size + 1, frame_size):
+        pgno, db_size = struct.unpack_from('>2I', frames, offset)
+        pending[pgno] = frames[offset + FRAME_HEADER.size:offset + frame_size]
+        if db_size:
+            for number, page in sorted(pending.items()):
+                db_file.seek((number - 1) * page_size)
+                db_file.write(page)
+            db_file.truncate(db_size * page_size)
+            pending.clear()
+            commits += 1
+    return commits
+
+
+# =============================================================================
+# RÉPLICA (directorio con claves tipo object store)
+# =============================================================================
+
+@dataclass(frozen=True)
+class ReplicaFile:
+    generation: str
+    seq: int
+    timestamp_ms: int
+    path: Path
+
+    @property
+    def created_at(self) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(self.timestamp_ms / 1000, tz=datetime.timezone.utc)
+
+
+class ReplicaStore:
+    """Generaciones, snapshots y segmentos de WAL en REPLICA_DIR."""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.generations_dir = self.directory / 'generations'
+
+    # -------------------------------------------------------------------------
+    # Lectura
+    # -------------------------------------------------------------------------
+
+    def generations(self) -> list[str]:
+        """Generaciones de la más vieja a la más nueva."""
+        try:
+            return sorted(entry.name for entry in self.generations_dir.iterdir() if entry.is_dir())
+        except FileNotFoundError:
+            return []
+
+    def generation_info(self, generation: str) -> dict[str, Any]:
+        with open(self.generations_dir / generation / 'generation.json', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _files(self, generation: str, kind: str) -> list[ReplicaFile]:
+        folder = self.generations_dir / generation / ('snapshots' if kind == 'db' else 'wal')
+        files = []
+        try:
+            entries = list(folder.iterdir())
+        except FileNotFoundError:
+            return []
+        for entry in entries:
+            match = _SEGMENT_RE.match(entry.name)
+            if match and match.group(3) == kind:
+                files.append(ReplicaFile(generation, int(match.group(1)), int(match.group(2)), entry))
+        return sorted(files, key=lambda item: (item.seq, item.timestamp_ms))
+
+    def snapshots(self, generation: str) -> list[ReplicaFile]:
+        return self._files(generation, 'db')
+
+    def segments(self, generation: str) -> list[ReplicaFile]:
+        return self._files(generation, 'wal')
+
+    def describe(self) -> list[dict[str, Any]]:
+        """Resumen por generación: snapshots, segmentos y rango restaurable."""
+        summary = []
+        for generation in self.generations():
+            snapshots, segments = self.snapshots(generation), self.segments(generation)
+            if not snapshots:
+                continue
+            last = max([*snapshots, *segments], key=lambda item: item.timestamp_ms)
+            summary.append({
+                'generation': generation,
+                'snapshots': len(snapshots),
+                'segments': len(segments),
+                'bytes': sum(item.path.stat().st_size for item in [*snapshots, *segments]),
+                'restorable_from': snapshots[0].created_at.isoformat(timespec='seconds'),
+                'restorable_until': last.created_at.isoformat(timespec='seconds'),
+            })
+        return summary
+
+    # -------------------------------------------------------------------------
+    # Escritura
+    # -------------------------------------------------------------------------
+
+    def new_generation(self, page_size: int) -> str:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        # Con milisegundos: el orden de los nombres es el orden de creación
+        # también para dos generaciones abiertas en el mismo segundo
+        generation = f"{now:%Y%m%dT%H%M%S}{now.microsecond // 1000:03d}Z-{uuid.uuid4().hex[:6]}"
+        info = {'page_size': page_size, 'created_at': now.isoformat(timespec='seconds')}
+        _write_atomic(self.generations_dir / generation / 'generation.json', json.dumps(info).encode('utf-8'))
+        return generation
+
+    def put_segment(self, generation: str, seq: int, frames: bytes, timestamp_ms: int) -> Path:
+        """``timestamp_ms``: cuándo se leyó el WAL (todos los commits del segmento son anteriores)."""
+        path = self.generations_dir / generation / 'wal' / f"{seq:010d}-{timestamp_ms:013d}.wal.gz"
+        _write_atomic(path, gzip.compress(frames, compresslevel=6))
+        return path
+
+    def put_snapshot(self, generation: str, seq: int, db_copy: Path) -> Path:
+        path = self.generations_dir / generation / 'snapshots' / f"{seq:010d}-{_now_ms():013d}.db.gz"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.tmp")
+        with open(db_copy, 'rb') as source, open(tmp, 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6) as target:
+                shutil.copyfileobj(source, target, 1024 * 1024)
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp, path)
+        return path
+
+    def prune(self, current: Optional[str], retention_hours: float = REPLICA_RETENTION_HOURS) -> dict[str, int]:
+        """
+        Borra lo que quedó fuera de la ventana restaurable: generaciones
+        viejas enteras y, en la actual, snapshots y segmentos anteriores al
+        último snapshot previo al límite.
+        """
+        cutoff_ms = _now_ms() - int(retention_hours * 3600 * 1000)
+        stats = {'generations': 0, 'files': 0}
+        for generation in self.generations():
+            if generation == current:
+                continue
+            files = [*self.snapshots(generation), *self.segments(generation)]
+            if not files or max(item.timestamp_ms for item in files) < cutoff_ms:
+                shutil.rmtree(self.generations_dir / generation, ignore_errors=True)
+                stats['generations'] += 1
+
+        if current:
+            snapshots = self.snapshots(current)
+            anchors = [item for item in snapshots if item.timestamp_ms <= cutoff_ms]
+            if anchors:
+                anchor = anchors[-1]
+                for item in [*snapshots, *self.segments(current)]:
+                    if item.seq < anchor.seq or (item in snapshots and item.timestamp_ms < anchor.timestamp_ms):
+                        item.path.unlink(missing_ok=True)
+                        stats['files'] += 1
+        return stats
+
+    # -------------------------------------------------------------------------
+    # Restauración
+    # -------------------------------------------------------------------------
+
+    def restore_plan(self, until: Optional[datetime.datetime] = None) -> Optional[tuple[ReplicaFile, list[ReplicaFile]]]:
+        """Snapshot + segmentos a aplicar para llegar a ``until`` (o al final)."""
+        until_ms = int(until.timestamp() * 1000) if until else None
+        for generation in reversed(self.generations()):
+            snapshots = [
+                item for item in self.snapshots(generation)
+                if until_ms is None or item.timestamp_ms <= until_ms
+            ]
+            if not snapshots:
+                continue
+            snapshot = snapshots[-1]
+            segments, expected = [], snapshot.seq
+            for segment in self.segments(generation):
+                if segment.seq < expected:
+                    continue
+                if segment.seq != expected:
+                    logger.warning(f"[REPLICA] Falta el segmento {expected} de {generation}: se restaura hasta ahí")
+                    break
+                if until_ms is not None and segment.timestamp_ms > until_ms:
+                    break
+                segments.append(segment)
+                expected += 1
+            return snapshot, segments
+        return None
+
+    def restore(self, target: Path, until: Optional[datetime.datetime] = None) -> Optional[dict[str, Any]]:
+        """
+        Reconstruye la base en ``target`` (reemplazo atómico, borra -wal /
+        -shm viejos). Devuelve un resumen, o None si la réplica está vacía.
+
+        Raises:
+            ValueError: si la base reconstruida no pasa quick_check
+        """
+        plan = self.restore_plan(until)
+        if plan is None:
+            return None
+        snapshot, segments = plan
+        page_size = self.generation_info(snapshot.generation)['page_size']
+        started = time.monotonic()
+
+        target = Path(target)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(f"{target.name}.restoring")
+        with gzip.open(snapshot.path, 'rb') as source, open(tmp, 'wb') as db_file:
+            shutil.copyfileobj(source, db_file, 1024 * 1024)
+
+        commits = 0
+        with open(tmp, 'r+b') as db_file:
+            for segment in segments:
+                commits += apply_frames(db_file, gzip.decompress(segment.path.read_bytes()), page_size)
+            db_file.flush()
+            os.fsync(db_file.fileno())
+
+        connection = sqlite3.connect(tmp)
+        try:
+            result = connection.execute('PRAGMA quick_check').fetchone()[0]
+        finally:
+            connection.close()
+        if result != 'ok':
+            tmp.unlink(missing_ok=True)
+            raise ValueError(f"La base restaurada no pasa quick_check: {result}")
+
+        for suffix in ('-wal', '-shm', '-replica.json'):
+            Path(f"{target}{suffix}").unlink(missing_ok=True)
+        os.replace(tmp, target)
+
+        restored_at = segments[-1] if segments else snapshot
+        return {
+            'generation': snapshot.generation,
+            'snapshot': snapshot.created_at.isoformat(timespec='seconds'),
+            'segments': len(segments),
+            'commits': commits,
+            'restored_until': restored_at.created_at.isoformat(timespec='seconds'),
+            'bytes': target.stat().st_size,
+            'elapsed_seconds': round(time.monotonic() - started, 2),
+        }
+
+
+def get_replica_store() -> Optional[ReplicaStore]:
+    directory = default_replica_dir()
+    return ReplicaStore(directory) if directory else None
+
+
+# =============================================================================
+# REPLICADOR
+# =============================================================================
+
+@dataclass
+class Position:
+    """Hasta dónde se subió el WAL actual (se guarda en <base>-replica.json)."""
+
+    generation: str
+    next_seq: int
+    page_size: int
+    salt1: int
+    salt2: int
+    frame: int
+    checksum: tuple[int, int]
+    # El WAL quedó entero en la base: el próximo escritor lo recicla con salts nuevos
+    checkpointed: bool = False
+
+
+class Replicator:
+    """Thread que sube el WAL de una base SQLite a un ReplicaStore."""
+
+    def __init__(
+        self,
+        db_path: Path,
+        store: ReplicaStore,
+        sync_seconds: float = REPLICA_SYNC_SECONDS,
+        snapshot_hours: float = REPLICA_SNAPSHOT_HOURS,
+    ):
+        self.db_path = Path(db_path)
+        self.wal_path = Path(f"{db_path}-wal")
+        self.state_path = Path(f"{db_path}-replica.json")
+        self.lock_path = Path(f"{db_path}-replica.lock")
+        self.store = store
+        self.sync_seconds = sync_seconds
+        self.snapshot_hours = snapshot_hours
+        self.position: Optional[Position] = None
+        self.last_sync_at: Optional[float] = None
+        self.last_snapshot_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._lock_file = None
+        self._connection: Optional[sqlite3.Connection] = None
+        self._writer: Optional[sqlite3.Connection] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._mutex = threading.RLock()
+
+    # -------------------------------------------------------------------------
+    # Ciclo de vida
+    # -------------------------------------------------------------------------
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name='sqlite-replicator', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 5, final: bool = True) -> None:
+        """
+        Detiene el thread. Con ``final`` sube lo que quede (tomando el lock
+        si otro worker ya lo soltó) antes de cerrar.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+        with self._mutex:
+            if final and (self._lock_file is not None or self._acquire()):
+                try:
+                    self.tick(maintenance=False)
+                except Exception:
+                    logger.exception("[REPLICA] Error en la sincronización final")
+            self._release()
+
+    def run(self) -> None:
+        logger.info(f"[REPLICA] Replicando {self.db_path.name} en {self.store.directory} cada {self.sync_seconds:g}s")
+        while not self._stop.is_set():
+            with self._mutex:
+                if self._lock_file is not None or self._acquire():
+                    try:
+                        self.tick()
+                    except Exception as e:
+                        # Se vuelve a verificar la continuidad en la próxima ronda
+                        logger.exception("[REPLICA] Error replicando")
+                        self.last_error = f"{type(e).__name__}: {e}"
+                        self._save_state()
+                        self.position = None
+                        self._close_connections()
+                        self.guard_wal_size()
+            self._stop.wait(self.sync_seconds)
+
+    def tick(self, maintenance: bool = True) -> int:
+        """Una ronda: sube los frames nuevos y, si hace falta, checkpoint / snapshot."""
+        if self.position is None:
+            self._resume() or self.snapshot(new_generation=True)
+        shipped = self.sync()
+        if maintenance:
+            if self.position.frame >= REPLICA_CHECKPOINT_FRAMES and not self.position.checkpointed:
+                self.checkpoint()
+            if self.last_snapshot_at is None or time.time() - self.last_snapshot_at >= self.snapshot_hours * 3600:
+                self.snapshot()
+        self.last_error = None
+        self._save_state()
+        return shipped
+
+    def guard_wal_size(self, max_bytes: Optional[int] = None) -> bool:
+        """
+        Checkpoint de emergencia: con la subida fallando nadie hace
+        checkpoint (wal_autocheckpoint=0) y el WAL crece hasta llenar el
+        disco. Pasado ``max_bytes`` se pasa a la base sin subir; la réplica
+        pierde continuidad y la próxima ronda que funcione abre una
+        generación nueva. True si hizo el checkpoint.
+        """
+        max_bytes = REPLICA_MAX_WAL_BYTES if max_bytes is None else max_bytes
+        try:
+            size = self.wal_path.stat().st_size
+        except FileNotFoundError:
+            return False
+        if size < max_bytes:
+            return False
+
+        logger.error(
+            f"[REPLICA] WAL de {size / 1024 / 1024:.0f} MB sin poder subirlo: checkpoint sin replicar "
+            f"(la réplica sigue en una generación nueva cuando la subida vuelva a funcionar)"
+        )
+        connection = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            connection.execute('PRAGMA busy_timeout=5000')
+            busy, _, _ = connection.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+        finally:
+            connection.close()
+        # La posición guardada ya no describe la base: que nadie la retome
+        self.position = None
+        self._save_state()
+        return busy == 0
+
+    def _acquire(self) -> bool:
+        """Toma el lock de replicador (uno por base, entre procesos)."""
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _release(self) -> None:
+        self._close_connections()
+        self.position = None
+        if self._lock_file is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            # Conexión abierta mientras se replica: el WAL no se borra al
+            # cerrarse la última conexión de la app
+            self._connection = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+            self._writer = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+            for connection in (self._connection, self._writer):
+                connection.execute('PRAGMA busy_timeout=5000')
+                connection.execute('PRAGMA wal_autocheckpoint=0')
+            # La primera lectura recupera un WAL huérfano y arma el wal-index
+            self._connection.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        return self._connection
+
+    def _close_connections(self) -> None:
+        for connection in (self._connection, self._writer):
+            if connection is not None:
+                try:
+                    connection.close()
+                except sqlite3.Error:
+                    pass
+        self._connection = self._writer = None
+
+    # -------------------------------------------------------------------------
+    # WAL shipping
+    # -------------------------------------------------------------------------
+
+    def _read_wal(self) -> Optional[tuple[WalHeader, WalIndex]]:
+        """Header del WAL + wal-index, o None si no hay WAL (o se está reciclando)."""
+        header = read_wal_header(self.wal_path)
+        index = read_wal_index(Path(f"{self.db_path}-shm"))
+        if header is None or index is None or (header.salt1, header.salt2) != (index.salt1, index.salt2):
+            return None
+        return header, index
+
+    def sync(self) -> int:
+        """Sube los commits nuevos del WAL. Devuelve la cantidad de frames."""
+        self._connect()
+        position = self.position
+        started = time.time()
+        wal = self._read_wal()
+        if wal is None:
+            self.last_sync_at = started
+            return 0
+        header, index = wal
+
+        if (header.salt1, header.salt2) != (position.salt1, position.salt2):
+            if not position.checkpointed:
+                raise RuntimeError("El WAL se recicló con frames sin subir")
+            # Reciclado tras nuestro checkpoint: la historia sigue en el WAL nuevo
+            position.salt1, position.salt2 = header.salt1, header.salt2
+            position.frame, position.checksum = 0, header.checksum
+            position.checkpointed = False
+        if index.max_frame < position.frame:
+            raise RuntimeError(f"El WAL retrocedió al frame {index.max_frame} (subido hasta {position.frame})")
+
+        frames, count, checksum = read_frames(self.wal_path, header, position.frame, index.max_frame)
+        if count:
+            self.store.put_segment(position.generation, position.next_seq, frames, int(started * 1000))
+            position.next_seq += 1
+            position.frame += count
+            position.checksum = checksum
+            position.checkpointed = False
+        self.last_sync_at = started
+        return count
+
+    def checkpoint(self) -> bool:
+        """
+        Pasa el WAL a la base con las escrituras bloqueadas: primero se
+        sube lo último, así el WAL reciclado no pierde nada. True si quedó
+        entero en la base.
+        """
+        writer = self._writer
+        writer.execute('BEGIN IMMEDIATE')
+        try:
+            self.sync()
+            busy, log_frames, checkpointed = self._connection.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+        finally:
+            writer.execute('ROLLBACK')
+        complete = busy == 0 and log_frames == checkpointed == self.position.frame
+        self.position.checkpointed = complete
+        return complete
+
+    # -------------------------------------------------------------------------
+    # Snapshots / generaciones
+    # -------------------------------------------------------------------------
+
+    def snapshot(self, new_generation: bool = False) -> Path:
+        """
+        Copia completa de la base en la generación actual (o en una nueva).
+        Las escrituras se bloquean solo para fijar la posición; la copia se
+        hace sobre una transacción de lectura.
+        """
+        connection = self._connect()
+        writer = self._writer
+        writer.execute('BEGIN IMMEDIATE')
+        try:
+            if new_generation or self.position is None:
+                # Lo que ya está en el WAL entra en el snapshot: se pasa a la
+                # base para que el próximo reciclado no corte la historia
+                busy, log_frames, checkpointed = connection.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+                wal = self._read_wal()
+                page_size = connection.execute('PRAGMA page_size').fetchone()[0]
+                generation = self.store.new_generation(page_size)
+                if wal is None:
+                    position = Position(generation, 0, page_size, 0, 0, 0, (0, 0), checkpointed=True)
+                else:
+                    header, index = wal
+                    position = Position(
+                        generation, 0, page_size, header.salt1, header.salt2, index.max_frame,
+                        index.checksum if index.max_frame else header.checksum,
+                        checkpointed=busy == 0 and log_frames == checkpointed == index.max_frame,
+                    )
+            else:
+                self.sync()
+                position = self.position
+            connection.execute('BEGIN')
+            connection.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        finally:
+            writer.execute('ROLLBACK')
+
+        copy_path = Path(f"{self.db_path}-snapshot.tmp")
+        try:
+            target = sqlite3.connect(copy_path)
+            try:
+                connection.backup(target)
+            finally:
+                target.close()
+            connection.execute('COMMIT')
+            path = self.store.put_snapshot(position.generation, position.next_seq, copy_path)
+        finally:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+            copy_path.unlink(missing_ok=True)
+
+        previous = self.position
+        self.position = position
+        self.last_snapshot_at = time.time()
+        self._save_state()
+        if previous is None or previous.generation != position.generation:
+            logger.info(f"[REPLICA] Generación {position.generation} (snapshot {path.stat().st_size / 1024:.1f} KB)")
+        try:
+            pruned = self.store.prune(position.generation)
+            if pruned['generations'] or pruned['files']:
+                logger.info(f"[REPLICA] Retención: {pruned['generations']} generaciones y {pruned['files']} archivos borrados")
+        except OSError:
+            logger.exception("[REPLICA] Error aplicando la retención")
+        return path
+
+    def _resume(self) -> bool:
+        """
+        Retoma la generación del replicador anterior (otro worker o el
+        mismo proceso tras un error) si el WAL sigue siendo el que subió.
+        """
+        try:
+            state = json.loads(self.state_path.read_text(encoding='utf-8'))
+            position = Position(**{**state['position'], 'checksum': tuple(state['position']['checksum'])})
+        except (FileNotFoundError, KeyError, TypeError, ValueError):
+            return False
+
+        segments = self.store.segments(position.generation)
+        snapshots = self.store.snapshots(position.generation)
+        latest = max([segment.seq + 1 for segment in segments[-1:]] + [snapshot.seq for snapshot in snapshots[-1:]], default=-1)
+        if not snapshots or latest != position.next_seq:
+            return False
+
+        self._connect()
+        wal = self._read_wal()
+        if wal is not None and (wal[0].salt1, wal[0].salt2) == (position.salt1, position.salt2):
+            header, index = wal
+            if index.max_frame < position.frame:
+                return False
+            # Cada frame guarda el checksum acumulado: el de la posición tiene que coincidir
+            if position.frame == 0:
+                checksum = header.checksum
+            else:
+                _, _, checksum = read_frames(self.wal_path, header, position.frame - 1, position.frame)
+            if checksum != position.checksum:
+                return False
+        elif not position.checkpointed:
+            return False
+
+        self.position = position
+        self.last_snapshot_at = state.get('last_snapshot_at')
+        logger.info(f"[REPLICA] Retomando la generación {position.generation} (segmento {position.next_seq})")
+        return True
+
+    def _save_state(self) -> None:
+        state = {
+            'pid': os.getpid(),
+            'position': asdict(self.position) if self.position else None,
+            'last_sync_at': self.last_sync_at,
+            'last_snapshot_at': self.last_snapshot_at,
+            'last_error': self.last_error,
+        }
+        _write_atomic(self.state_path, json.dumps(state).encode('utf-8'))
+
+
+_replicator: Optional[Replicator] = None
+_replicator_lock = threading.Lock()
+
+
+def start_replicator() -> Optional[Replicator]:
+    """Arranca el thread de replicación del proceso (si hay REPLICA_DIR y la base es SQLite)."""
+    global _replicator
+    if not replication_enabled():
+        return None
+    with _replicator_lock:
+        if _replicator is None:
+            _replicator = Replicator(sqlite_path(), get_replica_store())
+        _replicator.start()
+    return _replicator
+
+
+def stop_replicator(timeout: Optional[float] = 5) -> None:
+    """Sincronización final y cierre (lo llama el apagado ordenado, ver shutdown.py)."""
+    with _replicator_lock:
+        replicator = _replicator
+    if replicator is not None:
+        replicator.stop(timeout=timeout)
+
+
+def replication_status() -> dict[str, Any]:
+    """
+    Estado de la réplica visto desde cualquier worker (lee <base>-replica.json).
+
+    ``lag_seconds``: segundos desde la última subida si después hubo
+    escrituras en el WAL (0 si está todo arriba). ``healthy``: el
+    replicador sincronizó hace poco y sin errores.
+    """
+    if not replication_enabled():
+        return {'enabled': False}
+    db_path = sqlite_path()
+    try:
+        state = json.loads(Path(f"{db_path}-replica.json").read_text(encoding='utf-8'))
+    except (FileNotFoundError, ValueError):
+        state = {}
+
+    now = time.time()
+    last_sync_at = state.get('last_sync_at')
+    try:
+        wal_modified = os.stat(f"{db_path}-wal").st_mtime
+    except FileNotFoundError:
+        wal_modified = 0
+    if last_sync_at is None:
+        lag = None
+    else:
+        lag = round(max(0.0, now - last_sync_at), 3) if wal_modified > last_sync_at else 0.0
+
+    position = state.get('position') or {}
+    stale_after = max(30.0, REPLICA_SYNC_SECONDS * 10)
+    return {
+        'enabled': True,
+        'generation': position.get('generation'),
+        'next_segment': position.get('next_seq'),
+        'lag_seconds': lag,
+        'last_sync_seconds_ago': round(now - last_sync_at, 1) if last_sync_at else None,
+        'last_snapshot_at': (
+            datetime.datetime.fromtimestamp(state['last_snapshot_at'], tz=datetime.timezone.utc).isoformat(timespec='seconds')
+            if state.get('last_snapshot_at') else None
+        ),
+        'replicator_pid': state.get('pid'),
+        'error': state.get('last_error'),
+        'healthy': bool(last_sync_at) and now - last_sync_at < stale_after and not state.get('last_error'),
+    }
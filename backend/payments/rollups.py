@@ -0,0 +1,172 @@
+"""
+Acumulados de ventas (rollups) - Datos con Alex
+================================================
+Mantiene la tabla SalesRollup (día, producto, estado) actualizada de forma
+incremental y arma el resumen que sirve el dashboard de ventas.
+
+- increment_rollup: suma una orden (y su monto) a la fila correspondiente
+- get_sales_summary: ingresos, órdenes y conversión en un rango de fechas
+- rollup_version: (última actualización, filas) para ETag / Last-Modified
+================================================
+"""
+
+from __future__ import annotations
+
+import datetime
+import logging
+from decimal import Decimal
+from typing import Any, Optional
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Sum
+from django.utils import timezone
+
+from .models import SalesRollup
+
+logger = logging.getLogger(__name__)
+
+
+def increment_rollup(
+    course_id: str,
+    status: str,
+    amount: Decimal | float | int = 0,
+    day: Optional[datetime.date] = None,
+    count: int = 1,
+) -> None:
+    """
+    Suma ``count`` órdenes y ``amount`` al acumulado (día, producto, estado).
+
+    Usa UPDATE ... SET orders = orders + 1 para no perder incrementos
+    concurrentes; si la fila no existe la crea.
+    """
+    day = day or timezone.localdate()
+    amount = Decimal(str(amount or 0))
+    lookup = {'day': day, 'course_id': course_id, 'status': status}
+
+    updated = SalesRollup.objects.filter(**lookup).update(
+        orders=F('orders') + count,
+        revenue=F('revenue') + amount,
+        updated_at=timezone.now(),
+    )
+    if updated:
+        return
+
+    try:
+        with transaction.atomic():
+            SalesRollup.objects.create(orders=count, revenue=amount, **lookup)
+    except IntegrityError:
+        # Otro worker creó la fila entre el UPDATE y el INSERT
+        SalesRollup.objects.filter(**lookup).update(
+            orders=F('orders') + count,
+            revenue=F('revenue') + amount,
+            updated_at=timezone.now(),
+        )
+
+
+def _rollup_queryset(
+    date_from: datetime.date,
+    date_to: datetime.date,
+    course_id: Optional[str] = None,
+):
+    queryset = SalesRollup.objects.filter(day__gte=date_from, day__lte=date_to)
+    if course_id:
+        queryset = queryset.filter(course_id=course_id)
+    return queryset
+
+
+def rollup_version(
+    date_from: datetime.date,
+    date_to: datetime.date,
+    course_id: Optional[str] = None,
+) -> tuple[Optional[datetime.datetime], int]:
+    """
+    Retorna (última actualización, cantidad de filas) del rango.
+    Cambia cada vez que un incremento toca el rango: sirve como validador HTTP.
+    """
+    aggregate = _rollup_queryset(date_from, date_to, course_id).aggregate(
+        last_update=Max('updated_at'),
+        rows=Count('id'),
+    )
+    return aggregate['last_update'], aggregate['rows']
+
+
+def _conversion(approved: int, created: int) -> Optional[float]:
+    if not created:
+        return None
+    return round(approved / created, 4)
+
+
+def get_sales_summary(
+    date_from: datetime.date,
+    date_to: datetime.date,
+    course_id: Optional[str] = None,
+) -> dict[str, Any]:
+    """
+    Resumen de ventas calculado SOLO desde los acumulados.
+
+    Returns:
+        Dict con totales, desglose por producto y serie diaria
+    """
+    rows = (
+        _rollup_queryset(date_from, date_to, course_id)
+        .values('day', 'course_id', 'status')
+        .annotate(orders_sum=Sum('orders'), revenue_sum=Sum('revenue'))
+        .order_by('day', 'course_id')
+    )
+
+    def empty_bucket() -> dict[str, Any]:
+        return {
+            'preferences': 0,
+            'approved': 0,
+            'refunded': 0,
+            'charged_back': 0,
+            'revenue': Decimal('0'),
+            'refunded_amount': Decimal('0'),
+            'charged_back_amount': Decimal('0'),
+        }
+
+    totals = empty_bucket()
+    by_product: dict[str, dict[str, Any]] = {}
+    by_day: dict[str, dict[str, Any]] = {}
+
+    for row in rows:
+        day_key = row['day'].isoformat()
+        buckets = (
+            totals,
+            by_product.setdefault(row['course_id'], empty_bucket()),
+            by_day.setdefault(day_key, empty_bucket()),
+        )
+        for bucket in buckets:
+            if row['status'] == 'created':
+                bucket['preferences'] += row['orders_sum']
+            elif row['status'] == 'approved':
+                bucket['approved'] += row['orders_sum']
+                bucket['revenue'] += row['revenue_sum']
+            elif row['status'] == 'refunded':
+                bucket['refunded'] += row['orders_sum']
+                bucket['refunded_amount'] += row['revenue_sum']
+            elif row['status'] == 'charged_back':
+                bucket['charged_back'] += row['orders_sum']
+                bucket['charged_back_amount'] += row['revenue_sum']
+
+    def serialize(bucket: dict[str, Any]) -> dict[str, Any]:
+        return {
+            'preferences': bucket['preferences'],
+            'approved': bucket['approved'],
+            'refunded': bucket['refunded'],
+            'revenue': float(bucket['revenue']),
+            'refunded_amount': float(bucket['refunded_amount']),
+            'charged_back': bucket['charged_back'],
+            'charged_back_amount': float(bucket['charged_back_amount']),
+            'net_revenue': float(bucket['revenue'] - bucket['refunded_amount'] - bucket['charged_back_amount']),
+            'conversion': _conversion(bucket['approved'], bucket['preferences']),
+        }
+
+    return {
+        'from': date_from.isoformat(),
+        'to': date_to.isoformat(),
+        'course_id': course_id,
+        'totals': serialize(totals),
+        'by_product': {key: serialize(value) for key, value in sorted(by_product.items())},
+        'by_day': [{'day': key, **serialize(value)} for key, value in sorted(by_day.items())],
+    }
@@ -0,0 +1,195 @@
+"""
+Búsqueda de órdenes para soporte - Datos con Alex
+==================================================
+"Pagué ayer, soy Juan Pérez, no me llegó el archivo": buscar la orden por
+nombre, apellido, email, DNI/CUIT, payment_id, preferencia o número de
+orden, sin revisar los logs de Railway.
+
+- Cada palabra de la búsqueda debe aparecer en algún campo (AND), como
+  prefijo: "juan per" encuentra a "Juan Pérez"; "perez@gm" a
+  "jperez@gmail.com" (el email se parte en palabras).
+- Sin distinción de mayúsculas ni acentos: "perez" = "Pérez".
+- SQLite: tabla FTS5 ``orders_search`` (migración 0009) mantenida por
+  triggers en cada escritura, también en ``.update()`` y borrados.
+  Una migración que reconstruye ``orders`` (SQLite lo hace en muchos
+  ALTER) borra los triggers: después de cada ``migrate``
+  ``ensure_search_index`` (payments/apps.py) los re-crea y reconstruye el
+  índice con lo que cambió mientras faltaban.
+- Postgres: índice GIN de trigramas sobre el texto sin acentos; cada
+  palabra se busca como substring.
+- Resultados de la más nueva a la más vieja (el caso típico es una compra
+  reciente). En FTS5 eso es recorrer el índice por rowid y cortar en
+  ``limit``: ordenar por relevancia (bm25) obliga a puntuar todas las
+  coincidencias y con prefijos comunes ("gm" de gmail) es 30x más lento.
+- Si el índice no existe (otra base, extensiones sin instalar) se usa
+  ``icontains`` sobre los mismos campos: correcto, pero recorre la tabla.
+
+Las órdenes archivadas (archive.py) no están en el índice; para una
+compra vieja usar la historia del pago (/api/payments/events/).
+==================================================
+"""
+
+from __future__ import annotations
+
+import importlib
+import logging
+import re
+from typing import Any, Optional
+
+from django.db import DatabaseError, connection, connections
+from django.db.models import Q
+
+from .models import Order
+
+logger = logging.getLogger(__name__)
+
+SEARCH_FIELDS = ('first_name', 'last_name', 'email', 'document', 'payment_id', 'preference_id', 'external_reference')
+
+# Campos devueltos por cada resultado
+RESULT_FIELDS = (
+    'id', 'external_reference', 'created_at', 'status', 'course_id', 'course_title', 'price',
+    'first_name', 'last_name', 'email', 'document', 'payment_id', 'preference_id', 'delivered_at',
+)
+
+SEARCH_MAX_LIMIT = 200
+SEARCH_MAX_TERMS = 8
+
+SEARCH_TRIGGERS = ('orders_search_ai', 'orders_search_ad', 'orders_search_au')
+SEARCH_MIGRATION = ('payments', '0009_order_search_index')
+
+# Palabras como las parte el tokenizer unicode61 de FTS5 (letras y dígitos)
+_TERM_RE = re.compile(r'[^\W_]+')
+
+
+def search_terms(query: str) -> list[str]:
+    """Palabras de la búsqueda (en minúsculas, sin repetir, como máximo SEARCH_MAX_TERMS)."""
+    terms: list[str] = []
+    for term in _TERM_RE.findall((query or '').lower()):
+        if term not in terms:
+            terms.append(term)
+    return terms[:SEARCH_MAX_TERMS]
+
+
+# =============================================================================
+# BACKENDS
+# =============================================================================
+
+def _fts_query(terms: list[str]) -> str:
+    # Cada palabra como string FTS5 con prefijo: "juan"* "per"*
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _search_sqlite(terms: list[str], limit: int, status: Optional[str]) -> list[int]:
+    sql = (
+        "SELECT orders.id FROM orders_search JOIN orders ON orders.id = orders_search.rowid "
+        "WHERE orders_search MATCH %s"
+    )
+    params: list[Any] = [_fts_query(terms)]
+    if status:
+        sql += " AND orders.status = %s"
+        params.append(status)
+    sql += " ORDER BY orders_search.rowid DESC LIMIT %s"
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _search_postgres(terms: list[str], limit: int, status: Optional[str]) -> list[int]:
+    document = " || ' ' || ".join(f"coalesce({field}, '')" for field in SEARCH_FIELDS)
+    # Misma expresión que el índice orders_search_trgm_idx
+    expression = f"orders_search_unaccent(lower({document}))"
+    conditions = [f"{expression} LIKE '%%' || orders_search_unaccent(%s) || '%%'" for _ in terms]
+    params: list[Any] = [term.replace('\\', '\\\\').replace('%', '\\%') for term in terms]
+    if status:
+        conditions.append("status = %s")
+        params.append(status)
+    params.append(limit)
+    sql = f"SELECT id FROM orders WHERE {' AND '.join(conditions)} ORDER BY created_at DESC, id DESC LIMIT %s"
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _search_fallback(terms: list[str], limit: int, status: Optional[str]) -> list[int]:
+    queryset = Order.objects.all()
+    for term in terms:
+        matches = Q()
+        for field in SEARCH_FIELDS:
+            matches |= Q(**{f'{field}__icontains': term})
+        queryset = queryset.filter(matches)
+    if status:
+        queryset = queryset.filter(status=status)
+    return list(queryset.order_by('-created_at', '-id').values_list('id', flat=True)[:limit])
+
+
+_BACKENDS = {
+    'sqlite': _search_sqlite,
+    'postgresql': _search_postgres,
+}
+
+
+# =============================================================================
+# MANTENIMIENTO DEL ÍNDICE
+# =============================================================================
+
+def ensure_search_index(using: str = 'default') -> bool:
+    """
+    Re-crea la tabla FTS5 y los triggers que falten (SQLite) y reconstruye
+    el índice. No hace nada si la migración 0009 no está aplicada.
+    Devuelve True si tuvo que reparar algo.
+    """
+    from django.db.migrations.recorder import MigrationRecorder
+
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return False
+    if SEARCH_MIGRATION not in MigrationRecorder(db).applied_migrations():
+        return False
+    with db.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE name = 'orders_search' OR (type = 'trigger' AND tbl_name = 'orders')"
+        )
+        present = {row[0] for row in cursor.fetchall()}
+    missing = [name for name in ('orders_search',) + SEARCH_TRIGGERS if name not in present]
+    if not missing:
+        return False
+
+    # Mismo SQL que la migración (CREATE ... IF NOT EXISTS + 'rebuild')
+    migration = importlib.import_module(f'payments.migrations.{SEARCH_MIGRATION[1]}')
+    with db.cursor() as cursor:
+        for statement in migration.SQLITE_CREATE:
+            cursor.execute(statement)
+    logger.warning(f"[SEARCH] Índice de búsqueda reparado (faltaban: {', '.join(missing)})")
+    return True
+
+
+# =============================================================================
+# API
+# =============================================================================
+
+def search_orders(query: str, limit: int = 50, status: Optional[str] = None) -> list[dict[str, Any]]:
+    """
+    Órdenes que coinciden con ``query`` (más nuevas primero).
+    Levanta DatabaseError si la base no responde.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+
+    backend = _BACKENDS.get(connection.vendor)
+    ids: Optional[list[int]] = None
+    if backend is not None:
+        try:
+            ids = backend(terms, limit, status)
+        except DatabaseError as e:
+            # Índice no creado (migración pendiente, sin pg_trgm/unaccent...)
+            logger.warning(f"[SEARCH] Índice de búsqueda no disponible, usando icontains: {e}")
+            if connection.vendor == 'postgresql' and connection.in_atomic_block:
+                raise
+    if ids is None:
+        ids = _search_fallback(terms, limit, status)
+
+    rows = {row['id']: row for row in Order.objects.filter(pk__in=ids).values(*RESULT_FIELDS)}
+    return [rows[pk] for pk in ids if pk in rows]
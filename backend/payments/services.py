@@ -11,6 +11,10 @@ CONFIGURACIÓN REQUERIDA EN .env o variables de entorno:
 - EMAIL_HOST_PASSWORD: App Password de Gmail (16 caracteres)
 
 IMPORTANTE: Los archivos deben existir en backend/files/
+
+Con varias tiendas (tenants.py) el remitente, la conexión SMTP (reutilizada
+entre envíos), el catálogo y la carpeta de archivos son los de la tienda
+en curso.
 ===========================================================
 """
 
@@ -18,12 +22,20 @@ from __future__ import annotations
 
 import os
 import logging
-from pathlib import Path
+import threading
+import time
+from collections import OrderedDict
 from typing import Any, Optional
 
-from django.conf import settings
 from django.core.mail import EmailMessage
 
+from .cart import split_product_ids
+from .deliveries import record_delivery_attempt, requeue_delivery
+from .shutdown import in_flight
+from .tenants import Tenant, current_tenant, mailer_for
+from .tracing import KIND_CLIENT, set_attribute, span, trace_id_for
+from .watermark import render_personalized_files
+
 logger = logging.getLogger(__name__)
 
 
@@ -33,6 +45,7 @@ logger = logging.getLogger(__name__)
 
 # Mapeo de product_id a archivos (puede ser uno o varios)
 # IMPORTANTE: Los IDs deben coincidir EXACTAMENTE con los del frontend (data/planillas.ts)
+# (catálogo de la tienda default; las demás declaran "products" en TENANTS_FILE)
 PRODUCT_FILES: dict[str, list[str]] = {
     'tracker-habitos': ['tracker-habitos.xlsx'],
     'planificador-financiero': ['planificador-financiero.xlsx'],
@@ -44,9 +57,10 @@ PRODUCT_FILES: dict[str, list[str]] = {
 # VALIDACIÓN DE CONFIGURACIÓN
 # =============================================================================
 
-def validate_email_config() -> dict[str, Any]:
+def validate_email_config(tenant: Optional[Tenant] = None) -> dict[str, Any]:
     """
-    Valida que las variables de entorno críticas para email estén configuradas.
+    Valida que las variables de entorno críticas para email estén configuradas
+    (las de la tienda en curso).
     
     Returns:
         Dict con estado de configuración y errores si los hay.
@@ -54,8 +68,9 @@ def validate_email_config() -> dict[str, Any]:
     errors: list[str] = []
     warnings: list[str] = []
     
-    email_host_user = os.environ.get('EMAIL_HOST_USER', '')
-    email_host_password = os.environ.get('EMAIL_HOST_PASSWORD', '')
+    tenant = tenant or current_tenant()
+    email_host_user = tenant.email_host_user
+    email_host_password = tenant.email_host_password
     
     if not email_host_user:
         errors.append("EMAIL_HOST_USER no está configurado")
@@ -89,6 +104,12 @@ def validate_email_config() -> dict[str, Any]:
 # FUNCIONES DE ARCHIVOS
 # =============================================================================
 
+def product_catalog(tenant: Optional[Tenant] = None) -> dict[str, list[str]]:
+    """Catálogo (product_id -> archivos) de la tienda en curso."""
+    tenant = tenant or current_tenant()
+    return PRODUCT_FILES if tenant.product_files is None else tenant.product_files
+
+
 def get_product_files(product_id: str) -> list[str]:
     """
     Retorna lista de rutas absolutas a los archivos del producto.
@@ -99,16 +120,84 @@ def get_product_files(product_id: str) -> list[str]:
     Returns:
         Lista de paths absolutos a los archivos
     """
-    filenames = PRODUCT_FILES.get(product_id)
+    tenant = current_tenant()
+    filenames = product_catalog(tenant).get(product_id)
     
     if not filenames:
-        logger.warning(f"[FILES] Producto '{product_id}' no encontrado en PRODUCT_FILES. Usando fallback.")
+        logger.warning(f"[FILES] Producto '{product_id}' no encontrado en el catálogo de '{tenant.id}'. Usando fallback.")
         filenames = [f"{product_id}.xlsx"]
     
-    base_path = Path(settings.BASE_DIR) / 'files'
+    base_path = tenant.files_dir
     return [str(base_path / f) for f in filenames]
 
 
+def get_order_files(course_id: str) -> list[str]:
+    """
+    Archivos de una orden con uno o varios productos ('a,b').
+    
+    Une los archivos de todos los productos sin repetir (ej: pack +
+    planilla suelta incluida en el pack se envía una sola vez).
+    
+    Returns:
+        Lista de paths absolutos, en el orden de los productos
+    """
+    file_paths: list[str] = []
+    for product_id in split_product_ids(course_id):
+        for path in get_product_files(product_id):
+            if path not in file_paths:
+                file_paths.append(path)
+    return file_paths
+
+
+# Adjuntos personalizados recientes (por archivo, versión y comprador): un
+# reenvío al mismo comprador no vuelve a generar las planillas
+ATTACHMENT_CACHE_MAX_BYTES = int(os.getenv('ATTACHMENT_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+_attachment_cache: OrderedDict[tuple, bytes] = OrderedDict()
+_attachment_cache_bytes = 0
+_attachment_cache_lock = threading.Lock()
+
+
+def get_personalized_attachments(file_paths: list[str], buyer_name: str, order_id: str) -> dict[str, bytes]:
+    """
+    Planillas personalizadas, desde el cache si ya se generaron para este
+    comprador y esta versión del archivo (mtime/tamaño).
+    
+    Returns:
+        {path: bytes} (los archivos que no se pudieron personalizar no están)
+    """
+    global _attachment_cache_bytes
+    
+    keys: dict[str, tuple] = {}
+    for path in file_paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        keys[path] = (path, stat.st_mtime_ns, stat.st_size, buyer_name, order_id)
+    
+    attachments: dict[str, bytes] = {}
+    with _attachment_cache_lock:
+        for path, key in keys.items():
+            if key in _attachment_cache:
+                _attachment_cache.move_to_end(key)
+                attachments[path] = _attachment_cache[key]
+    
+    missing = [path for path in keys if path not in attachments]
+    if missing:
+        rendered = render_personalized_files(missing, buyer_name, order_id)
+        attachments.update(rendered)
+        with _attachment_cache_lock:
+            for path, content in rendered.items():
+                if keys[path] not in _attachment_cache:
+                    _attachment_cache[keys[path]] = content
+                    _attachment_cache_bytes += len(content)
+            while _attachment_cache_bytes > ATTACHMENT_CACHE_MAX_BYTES and _attachment_cache:
+                _, evicted = _attachment_cache.popitem(last=False)
+                _attachment_cache_bytes -= len(evicted)
+    
+    return attachments
+
+
 def validate_product_files(product_id: str) -> dict[str, Any]:
     """
     Valida que los archivos de un producto existan.
@@ -141,18 +230,26 @@ def validate_product_files(product_id: str) -> dict[str, Any]:
 
 class OrderData:
     """Interfaz para datos de orden (Type Hint helper)."""
+    id: str
     course_id: str
     course_title: str
     first_name: str
+    last_name: str
     email: str
 
 
-def send_product_email(order: Any) -> bool:
+def send_product_email(order: Any, source: str = 'manual', payment_id: Optional[str] = None) -> bool:
     """
     Envía el email con el/los producto(s) adjunto(s) usando Django EmailBackend (Gmail SMTP).
     
+    Cada intento queda registrado (DeliveryAttempt) con su origen,
+    proveedor, duración, resultado y error.
+    
     Args:
         order: Objeto con atributos: course_id, course_title, first_name, email
+               (opcionales: last_name, id - usados para personalizar las planillas)
+        source: Quién dispara el envío (validate, webhook, watcher, resend, manual)
+        payment_id: ID de pago de MP, si se conoce
         
     Returns:
         True si el email se envió correctamente, False en caso contrario.
@@ -160,11 +257,38 @@ def send_product_email(order: Any) -> bool:
     Raises:
         No levanta excepciones - todos los errores se loguean y retorna False.
     """
+    started = time.perf_counter()
+    # Un apagado que no puede esperar el envío deja la orden agendada para el watcher
+    with in_flight('delivery', getattr(order, 'id', payment_id), requeue=lambda: requeue_delivery(order, payment_id)):
+        with span("email.send", trace_id=trace_id_for(getattr(order, 'id', None)), source=source, payment_id=payment_id):
+            sent, error, attachments = _send_product_email(order)
+            set_attribute('email.sent', sent)
+            set_attribute('email.attachments', attachments)
+        record_delivery_attempt(
+            order,
+            source=source,
+            payment_id=payment_id,
+            success=sent,
+            latency_ms=int((time.perf_counter() - started) * 1000),
+            attachments=attachments,
+            error=error,
+        )
+    return sent
+
+
+def _send_product_email(order: Any) -> tuple[bool, Optional[str], int]:
+    """
+    Envío propiamente dicho.
+    
+    Returns:
+        (enviado, error, cantidad de adjuntos)
+    """
     # 0. Validar configuración antes de intentar enviar
-    config_check = validate_email_config()
+    tenant = current_tenant()
+    config_check = validate_email_config(tenant)
     if not config_check["valid"]:
         logger.critical("[EMAIL ABORTED] Configuración de email inválida. Revisar variables de entorno.")
-        return False
+        return False, "Configuración de email inválida: " + "; ".join(config_check["errors"]), 0
     
     try:
         # 1. Validar datos del destinatario
@@ -175,14 +299,18 @@ def send_product_email(order: Any) -> bool:
         
         if not recipient_email or '@' not in recipient_email:
             logger.error(f"[EMAIL ABORTED] Email de destinatario inválido: '{recipient_email}'")
-            return False
+            return False, f"Email de destinatario inválido: '{recipient_email}'", 0
         
         if not product_id:
             logger.error("[EMAIL ABORTED] No se especificó product_id/course_id")
-            return False
+            return False, "No se especificó product_id/course_id", 0
         
-        # 2. Obtener archivos del producto
-        file_paths = get_product_files(product_id)
+        # 2. Obtener archivos (uno o varios productos) y personalizarlos con la licencia
+        file_paths = get_order_files(product_id)
+        buyer_name = f"{customer_name} {getattr(order, 'last_name', '') or ''}".strip()
+        order_reference = str(getattr(order, 'id', '') or '')
+        with span("email.attachments", files=len(file_paths)):
+            personalized = get_personalized_attachments(file_paths, buyer_name, order_reference)
         
         # 3. Construir HTML del email
         html_content = f"""
@@ -201,10 +329,11 @@ def send_product_email(order: Any) -> bool:
                         📎 <strong>Tus archivos están adjuntos a este correo.</strong>
                     </p>
                 </div>
+                <p style="font-size: 14px; color: #666;">Número de orden: <strong>{order_reference}</strong> (con este número y tu email podés pedir el reenvío de los archivos desde la web).</p>
                 <p style="font-size: 14px; color: #666;">¿Alguna duda? Respondé directamente a este email.</p>
                 <hr style="border: none; border-top: 1px solid #eee; margin: 20px 0;">
                 <p style="font-size: 12px; color: #999; text-align: center;">
-                    Datos con Alex · Tu compañero de productividad
+                    {tenant.name} · Tu compañero de productividad
                 </p>
             </div>
         </body>
@@ -212,8 +341,8 @@ def send_product_email(order: Any) -> bool:
         """
 
         # 4. Crear objeto EmailMessage
-        from_email: str = settings.DEFAULT_FROM_EMAIL or settings.EMAIL_HOST_USER
-        reply_to: str = settings.EMAIL_HOST_USER
+        from_email: str = tenant.default_from_email
+        reply_to: str = tenant.email_host_user
         
         email = EmailMessage(
             subject=f"🎉 Tu compra: {product_title}",
@@ -227,7 +356,15 @@ def send_product_email(order: Any) -> bool:
         # 5. Adjuntar archivos
         attachments_count: int = 0
         for file_path in file_paths:
-            if os.path.exists(file_path):
+            if file_path in personalized:
+                email.attach(
+                    os.path.basename(file_path),
+                    personalized[file_path],
+                    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                )
+                attachments_count += 1
+                logger.info(f"[EMAIL] ✅ Adjuntado (personalizado): {os.path.basename(file_path)}")
+            elif os.path.exists(file_path):
                 try:
                     email.attach_file(file_path)
                     attachments_count += 1
@@ -239,18 +376,20 @@ def send_product_email(order: Any) -> bool:
 
         if attachments_count == 0:
             logger.critical(f"[EMAIL ABORTED] No hay archivos válidos para enviar. Producto: {product_id}")
-            return False
+            return False, f"No hay archivos válidos para enviar (producto {product_id})", 0
 
         # 6. ENVIAR
         logger.info(f"[EMAIL] 📤 Enviando a {recipient_email}...")
-        email.send(fail_silently=False)
+        # Conexión de la tienda, abierta entre envíos (tenants.py)
+        with span("email.smtp", kind=KIND_CLIENT, host=tenant.email_host, tenant=tenant.id):
+            mailer_for(tenant).send(email)
         
         logger.info(f"[EMAIL SUCCESS] ✅ Email enviado a {recipient_email} vía Gmail SMTP ({attachments_count} adjuntos)")
-        return True
+        return True, None, attachments_count
 
     except Exception as e:
         logger.exception(f"[EMAIL FAILED] ❌ Error crítico enviando email: {str(e)}")
-        return False
+        return False, f"{type(e).__name__}: {e}", 0
 
 
 # =============================================================================
@@ -265,14 +404,16 @@ def test_email_connection() -> dict[str, Any]:
     Returns:
         Dict con estado de la configuración
     """
-    config = validate_email_config()
+    tenant = current_tenant()
+    config = validate_email_config(tenant)
     
     return {
         "service": "Gmail SMTP",
-        "host": os.environ.get('EMAIL_HOST', 'smtp.gmail.com'),
-        "port": os.environ.get('EMAIL_PORT', '587'),
-        "tls_enabled": os.environ.get('EMAIL_USE_TLS', 'True'),
-        "from_email": settings.DEFAULT_FROM_EMAIL,
+        "tenant": tenant.id,
+        "host": tenant.email_host,
+        "port": str(tenant.email_port),
+        "tls_enabled": str(tenant.email_use_tls),
+        "from_email": tenant.default_from_email,
         "config_valid": config["valid"],
         "errors": config["errors"],
         "warnings": config["warnings"]
@@ -288,7 +429,7 @@ def list_available_products() -> dict[str, Any]:
     """
     result: dict[str, Any] = {"products": []}
     
-    for product_id in PRODUCT_FILES.keys():
+    for product_id in product_catalog().keys():
         validation = validate_product_files(product_id)
         all_exist = all(f["exists"] for f in validation["files"])
         
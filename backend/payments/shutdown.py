@@ -0,0 +1,261 @@
+"""
+Apagado ordenado en redeploys - Datos con Alex
+===============================================
+Railway reinicia los workers en cada deploy (SIGTERM). Sin coordinar, un
+SIGTERM en medio de un envío perdía la entrega. Ahora el apagado drena:
+
+1. Deja de aceptar trabajo: DrainMiddleware responde 503 (Retry-After) a
+   los requests nuevos de /api/payments/ (MP reintenta el webhook) y el
+   watcher no reclama más pagos.
+2. Espera hasta SHUTDOWN_GRACE_SECONDS (desde el SIGTERM) a que terminen
+   las operaciones registradas con ``in_flight()``: envíos de archivos y
+   consultas del watcher. Los requests en curso los espera gunicorn.
+3. Lo que no terminó se reencola en la base:
+   - entrega: la orden queda agendada (``next_check_at`` = ahora) y el
+     watcher de cualquier worker la vuelve a entregar;
+   - consulta del watcher: se libera el reclamo de la orden.
+   Un envío cortado justo después de que el SMTP lo aceptó se reenvía
+   (al menos una vez: mejor un email repetido que uno perdido).
+4. Flush de eventos (event_store), trazas y logs; cierra las conexiones
+   SMTP abiertas y sube a la réplica lo último del WAL (replication.py).
+5. Reporta: ``[SHUTDOWN] Apagado en 3.2s: 4 terminadas, 1 reencoladas, 0 perdidas``.
+
+Lo dispara gunicorn.conf.py (SIGTERM del worker -> begin_drain, al salir
+del loop -> drain) o ``watch_payments`` al recibir SIGTERM / Ctrl+C.
+
+CONFIGURACIÓN:
+- SHUTDOWN_GRACE_SECONDS: espera máxima para el trabajo en curso (default 20)
+- SHUTDOWN_FLUSH_SECONDS: margen extra para el flush (default 5). Railway
+  (``drainingSeconds``) y gunicorn (``graceful_timeout``) deben esperar
+  al menos la suma de ambos antes del SIGKILL.
+===============================================
+"""
+
+from __future__ import annotations
+
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, Optional
+
+from django.http import JsonResponse
+
+logger = logging.getLogger(__name__)
+
+SHUTDOWN_GRACE_SECONDS = float(os.getenv('SHUTDOWN_GRACE_SECONDS', '20'))
+SHUTDOWN_FLUSH_SECONDS = float(os.getenv('SHUTDOWN_FLUSH_SECONDS', '5'))
+
+API_PREFIX = '/api/payments/'
+
+
+@dataclass
+class Operation:
+    """Trabajo en curso que el apagado espera o reencola."""
+
+    kind: str
+    key: str
+    requeue: Optional[Callable[[], bool]] = None
+    started: float = field(default_factory=time.monotonic)
+    id: int = 0
+
+
+class ShutdownCoordinator:
+    """Registro de operaciones en curso + drenado al apagar (uno por proceso)."""
+
+    def __init__(self):
+        self._operations: dict[int, Operation] = {}
+        self._ids = itertools.count(1)
+        self._condition = threading.Condition()
+        self._draining = threading.Event()
+        self._drain_started: Optional[float] = None
+        self._finished_while_draining = 0
+        self._report: Optional[dict[str, Any]] = None
+
+    # -------------------------------------------------------------------------
+    # Operaciones en curso
+    # -------------------------------------------------------------------------
+
+    @property
+    def draining(self) -> bool:
+        return self._draining.is_set()
+
+    def start(self, kind: str, key: Any, requeue: Optional[Callable[[], bool]] = None) -> Operation:
+        operation = Operation(kind=kind, key=str(key), requeue=requeue)
+        with self._condition:
+            operation.id = next(self._ids)
+            self._operations[operation.id] = operation
+        return operation
+
+    def finish(self, operation: Operation) -> None:
+        with self._condition:
+            if self._operations.pop(operation.id, None) is not None and self.draining:
+                self._finished_while_draining += 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def in_flight(self, kind: str, key: Any, requeue: Optional[Callable[[], bool]] = None) -> Iterator[Operation]:
+        """
+        Registra un bloque de trabajo. ``requeue`` (opcional) lo deja
+        pendiente en la base si el apagado no puede esperarlo; devuelve
+        True si quedó reencolado.
+        """
+        operation = self.start(kind, key, requeue)
+        try:
+            yield operation
+        finally:
+            self.finish(operation)
+
+    def in_progress(self) -> list[Operation]:
+        with self._condition:
+            return list(self._operations.values())
+
+    # -------------------------------------------------------------------------
+    # Drenado
+    # -------------------------------------------------------------------------
+
+    def begin_drain(self) -> None:
+        """Deja de aceptar trabajo nuevo. Seguro de llamar desde un signal handler."""
+        if self._draining.is_set():
+            return
+        self._drain_started = time.monotonic()
+        self._draining.set()
+
+    def drain(self, grace: float = SHUTDOWN_GRACE_SECONDS) -> dict[str, Any]:
+        """
+        Espera el trabajo en curso (hasta ``grace`` segundos desde
+        begin_drain), reencola lo que quede, hace flush y reporta.
+        Idempotente: la segunda llamada devuelve el mismo reporte.
+        """
+        if self._report is not None:
+            return self._report
+        self.begin_drain()
+        pending = len(self.in_progress())
+        logger.info(f"[SHUTDOWN] Drenando: {pending} operaciones en curso, hasta {grace:g}s")
+
+        from .watcher import stop_watcher
+        stop_watcher(timeout=0)
+        from .checkout_options import stop_options_refresher
+        stop_options_refresher(timeout=0)
+
+        deadline = self._drain_started + grace
+        with self._condition:
+            while self._operations:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            leftover = list(self._operations.values())
+            completed = self._finished_while_draining
+
+        requeued = lost = 0
+        for operation in leftover:
+            if self._requeue(operation):
+                requeued += 1
+            else:
+                lost += 1
+
+        flushed = flush_buffers(SHUTDOWN_FLUSH_SECONDS)
+        elapsed = time.monotonic() - self._drain_started
+        self._report = {
+            'elapsed_seconds': round(elapsed, 2),
+            'completed': completed,
+            'requeued': requeued,
+            'lost': lost,
+            'flushed': flushed,
+        }
+        message = (
+            f"[SHUTDOWN] Apagado en {elapsed:.1f}s: {completed} terminadas, "
+            f"{requeued} reencoladas, {lost} perdidas"
+        )
+        (logger.warning if lost or not flushed else logger.info)(message)
+        _flush_logs()
+        return self._report
+
+    @staticmethod
+    def _requeue(operation: Operation) -> bool:
+        age = time.monotonic() - operation.started
+        if operation.requeue is None:
+            logger.warning(f"[SHUTDOWN] {operation.kind} {operation.key} sin terminar tras {age:.1f}s (no reencolable)")
+            return False
+        try:
+            requeued = bool(operation.requeue())
+        except Exception:
+            logger.exception(f"[SHUTDOWN] Error reencolando {operation.kind} {operation.key}")
+            return False
+        if requeued:
+            logger.info(f"[SHUTDOWN] {operation.kind} {operation.key} reencolada tras {age:.1f}s")
+        else:
+            logger.warning(f"[SHUTDOWN] {operation.kind} {operation.key} sin terminar y no se pudo reencolar")
+        return requeued
+
+
+coordinator = ShutdownCoordinator()
+
+
+def is_draining() -> bool:
+    return coordinator.draining
+
+
+def in_flight(kind: str, key: Any, requeue: Optional[Callable[[], bool]] = None):
+    return coordinator.in_flight(kind, key, requeue)
+
+
+# =============================================================================
+# FLUSH
+# =============================================================================
+
+def flush_buffers(timeout: float = SHUTDOWN_FLUSH_SECONDS) -> bool:
+    """Escribe lo que quedó en memoria (eventos, trazas) y cierra SMTP. True si no quedó nada."""
+    ok = True
+    from .event_store import EVENT_STORE_ENABLED, get_event_store
+
+    if EVENT_STORE_ENABLED:
+        store = get_event_store()
+        if not store.flush(timeout=timeout):
+            logger.warning(f"[SHUTDOWN] {store.pending()} eventos sin escribir")
+            ok = False
+        store.close()
+
+    from .tracing import exporter
+    try:
+        exporter.flush()
+    except Exception:
+        logger.exception("[SHUTDOWN] Error exportando trazas")
+        ok = False
+
+    from .tenants import _mail_pool
+    _mail_pool.clear()
+
+    from .replication import stop_replicator
+    stop_replicator(timeout=timeout)
+    return ok
+
+
+def _flush_logs() -> None:
+    for handler in logging.getLogger().handlers:
+        try:
+            handler.flush()
+        except Exception:
+            pass
+
+
+# =============================================================================
+# MIDDLEWARE
+# =============================================================================
+
+class DrainMiddleware:
+    """Durante el apagado rechaza requests nuevos a la API (503 + Retry-After)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if coordinator.draining and request.path.startswith(API_PREFIX):
+            response = JsonResponse({'success': False, 'error': 'Servidor reiniciando, reintentar'}, status=503)
+            response['Retry-After'] = '5'
+            return response
+        return self.get_response(request)
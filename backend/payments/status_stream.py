@@ -0,0 +1,244 @@
+"""
+Stream de estado de pagos (Server-Sent Events) - Datos con Alex
+================================================================
+Las páginas de pago exitoso / pendiente mantienen UNA conexión abierta a
+``/api/payments/status-stream/?payment_id=xxx`` (o ``?external_reference=``)
+en vez de volver a llamar a /validate/ (que consulta a MP cada vez).
+
+- El webhook, pago_exitoso y cualquier proceso que actualice una orden
+  publican el estado en el hub del proceso: los streams abiertos en ese
+  worker lo reciben al instante.
+- Si el cambio ocurrió en OTRO worker de gunicorn, el stream lo ve igual
+  leyendo la orden en la base cada STATUS_STREAM_POLL_SECONDS (una
+  consulta indexada, nunca una llamada a MP).
+- El stream termina con un estado final o a los STATUS_STREAM_MAX_SECONDS;
+  EventSource reconecta solo (campo ``retry``).
+- Cada stream abierto ocupa un thread de gunicorn (gthread): la conexión
+  dura pocos segundos y como mucho STATUS_STREAM_MAX_CONCURRENT streams
+  por worker. Por encima se responde 503 con Retry-After y la página
+  reintenta; el resto de los threads queda para checkout y webhooks.
+
+Formato de cada evento:
+    event: status
+    data: {"status": "approved", "payment_id": "...", "external_reference": "..."}
+================================================================
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Iterator, Optional
+
+from django.db import DatabaseError
+
+logger = logging.getLogger(__name__)
+
+STATUS_STREAM_MAX_SECONDS = int(os.getenv('STATUS_STREAM_MAX_SECONDS', '15'))
+STATUS_STREAM_MAX_CONCURRENT = int(os.getenv('STATUS_STREAM_MAX_CONCURRENT', '4'))
+STATUS_STREAM_POLL_SECONDS = float(os.getenv('STATUS_STREAM_POLL_SECONDS', '2'))
+STATUS_STREAM_HEARTBEAT_SECONDS = 15
+STATUS_STREAM_RETRY_MS = 3000
+
+# Estados después de los cuales el pago ya no cambia (salvo reembolso)
+FINAL_STATUSES = {'approved', 'rejected', 'cancelled', 'refunded', 'charged_back'}
+
+# Máximo de pagos recordados por el hub (los más viejos se descartan)
+HUB_MAX_ENTRIES = 10000
+
+
+class PaymentStatusHub:
+    """Último estado conocido por pago (por payment_id y external_reference) + notificación."""
+
+    def __init__(self, max_entries: int = HUB_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._snapshots: dict[str, dict[str, Any]] = {}
+        self._condition = threading.Condition()
+
+    def publish(
+        self,
+        payment_id: Optional[str],
+        external_reference: Optional[str],
+        status: str,
+        **extra: Any,
+    ) -> None:
+        keys = [str(key) for key in (payment_id, external_reference) if key]
+        if not keys or not status:
+            return
+        with self._condition:
+            previous = next((self._snapshots[key] for key in keys if key in self._snapshots), {})
+            snapshot = {
+                **previous,
+                'status': status,
+                'payment_id': str(payment_id) if payment_id else previous.get('payment_id'),
+                'external_reference': external_reference or previous.get('external_reference'),
+                **extra,
+            }
+            for key in keys:
+                self._snapshots.pop(key, None)  # reinsertar = más reciente
+                self._snapshots[key] = snapshot
+            while len(self._snapshots) > self.max_entries:
+                self._snapshots.pop(next(iter(self._snapshots)))
+            self._condition.notify_all()
+
+    def get(self, key: str) -> Optional[dict[str, Any]]:
+        with self._condition:
+            return self._snapshots.get(key)
+
+    def wait(self, key: str, known: Optional[dict[str, Any]], timeout: float) -> Optional[dict[str, Any]]:
+        """Espera hasta ``timeout`` a que el estado de ``key`` sea distinto de ``known``."""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                snapshot = self._snapshots.get(key)
+                if snapshot is not None and snapshot != known:
+                    return snapshot
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+
+hub = PaymentStatusHub()
+
+
+def publish_status(
+    payment_id: Optional[str],
+    external_reference: Optional[str],
+    status: Optional[str],
+    **extra: Any,
+) -> None:
+    """Publica un estado de pago para los streams abiertos. Nunca levanta."""
+    if not status:
+        return
+    try:
+        hub.publish(payment_id, external_reference, status, **extra)
+    except Exception:
+        logger.exception("[STREAM] No se pudo publicar el estado")
+
+
+def _stored_status(payment_id: Optional[str], external_reference: Optional[str]) -> Optional[dict[str, Any]]:
+    """Estado guardado en la base (lo que escribió cualquier worker)."""
+    from .models import Order
+
+    orders = Order.objects.only('status', 'payment_id', 'external_reference')
+    try:
+        if external_reference:
+            order = orders.filter(external_reference=external_reference).first()
+        else:
+            order = orders.filter(payment_id=payment_id).order_by('-updated_at').first()
+    except DatabaseError:
+        logger.exception("[STREAM] Error leyendo el estado de la orden")
+        return None
+    if order is None:
+        # Compra vieja ya archivada (archive.py)
+        from .archive import get_archive
+
+        try:
+            order = get_archive().find_order(external_reference or payment_id)
+        except (OSError, ValueError):
+            logger.exception("[STREAM] Error leyendo el archivo de órdenes")
+            return None
+    if order is None:
+        return None
+    return {'status': order.status, 'payment_id': order.payment_id, 'external_reference': order.external_reference}
+
+
+class StreamSlots:
+    """Cupo de streams abiertos en el proceso (cada uno retiene un thread)."""
+
+    def __init__(self, limit: int = STATUS_STREAM_MAX_CONCURRENT):
+        self.limit = limit
+        self.open = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        with self._lock:
+            if self.open >= self.limit:
+                return False
+            self.open += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.open = max(0, self.open - 1)
+
+
+stream_slots = StreamSlots()
+
+
+class SlotStream:
+    """
+    Iterador del stream que libera su cupo al cerrarse. Es una clase (no un
+    generador) porque Django llama ``close()`` aunque el cliente se vaya
+    antes de leer el primer evento.
+    """
+
+    def __init__(self, events: Iterator[str], slots: StreamSlots = stream_slots):
+        self._events = events
+        self._slots = slots
+        self._released = False
+
+    def __iter__(self) -> 'SlotStream':
+        return self
+
+    def __next__(self) -> str:
+        return next(self._events)
+
+    def close(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        try:
+            close = getattr(self._events, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            self._slots.release()
+
+
+def _sse(event: str, data: dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def iter_status_events(
+    payment_id: Optional[str],
+    external_reference: Optional[str],
+    max_seconds: float = STATUS_STREAM_MAX_SECONDS,
+    poll_seconds: float = STATUS_STREAM_POLL_SECONDS,
+) -> Iterator[str]:
+    """Genera el stream SSE de un pago hasta un estado final o ``max_seconds``."""
+    key = external_reference or payment_id
+    deadline = time.monotonic() + max_seconds
+    last_output = time.monotonic()
+    sent_status: Optional[str] = None
+
+    yield f"retry: {STATUS_STREAM_RETRY_MS}\n\n"
+
+    known = hub.get(key)
+    snapshot = known or _stored_status(payment_id, external_reference)
+    while True:
+        if snapshot is not None and snapshot.get('status') != sent_status:
+            sent_status = snapshot['status']
+            yield _sse('status', snapshot)
+            last_output = time.monotonic()
+            if sent_status in FINAL_STATUSES:
+                return
+
+        now = time.monotonic()
+        if now >= deadline:
+            yield _sse('timeout', {'reconnect': True})
+            return
+        if now - last_output >= STATUS_STREAM_HEARTBEAT_SECONDS:
+            yield ": keepalive\n\n"
+            last_output = now
+
+        # Cambios de este worker llegan al instante; los de otros, por la base
+        fresh = hub.wait(key, known, min(poll_seconds, deadline - now))
+        if fresh is not None:
+            known = snapshot = fresh
+        else:
+            snapshot = _stored_status(payment_id, external_reference) or snapshot
@@ -0,0 +1,460 @@
+"""
+Varias tiendas en un mismo deploy - Datos con Alex
+===================================================
+Cada tienda (tenant) tiene su cuenta de Mercado Pago, su remitente SMTP,
+su frontend y su catálogo de archivos. La tienda de siempre (variables
+MP_ACCESS_TOKEN, EMAIL_*, FRONTEND_URL) es la default; las demás se
+declaran en TENANTS_FILE (JSON):
+
+    {"tenants": [{
+        "id": "planillas-pro",
+        "name": "Planillas Pro",
+        "hosts": ["planillaspro.com", "www.planillaspro.com"],
+        "mp_access_token": "env:PLANILLAS_PRO_MP_ACCESS_TOKEN",
+        "mp_webhook_secret": "env:PLANILLAS_PRO_MP_WEBHOOK_SECRET",
+        "frontend_url": "https://planillaspro.com",
+        "statement_descriptor": "PLANILLAS PRO",
+        "email": {"host": "smtp-relay.brevo.com", "port": 587, "use_tls": true,
+                  "user": "env:PLANILLAS_PRO_SMTP_USER", "password": "env:PLANILLAS_PRO_SMTP_PASSWORD",
+                  "from": "ventas@planillaspro.com"},
+        "files_dir": "files/planillas-pro",
+        "products": {"presupuesto-anual": ["presupuesto-anual.xlsx"]}
+    }]}
+
+Los valores "env:VARIABLE" se leen del entorno (los secretos no van en el
+archivo). Lo que no se declara (email, files_dir, products...) se hereda
+de la tienda default; ``files_dir`` relativo es relativo a backend/.
+
+RESOLUCIÓN (TenantMiddleware, en este orden):
+1. Header ``X-Tenant`` o parámetro ``?tenant=`` (id). Un id desconocido
+   responde 400. Para webhooks: configurar en el panel de MP la URL
+   ``.../webhook/?tenant=<id>`` (o un dominio propio de la API).
+2. Host del header ``Origin`` (frontend en otro dominio llamando a la API).
+3. Host del request (frontend servido desde el mismo dominio, o un dominio
+   de API por tienda; agregarlo a ALLOWED_HOSTS).
+4. La tienda default.
+Fuera de un request (watcher, comandos) la tienda sale de la orden
+(``Order.tenant``) o de la metadata del pago (``tenant``).
+
+CLIENTES: el SDK de MP y la conexión SMTP de cada tienda se crean una vez
+y se reutilizan (conexiones keep-alive) desde un LRU acotado
+(TENANT_CLIENT_POOL_SIZE por tipo): con muchas tiendas, las menos usadas
+se cierran. Cada tienda tiene hasta SMTP_POOL_SIZE conexiones SMTP (un
+envío por conexión a la vez); las ociosas más de SMTP_IDLE_SECONDS se
+cierran y se abre otra.
+
+CONFIGURACIÓN:
+- TENANTS_FILE: JSON con las tiendas adicionales (sin definir = solo default)
+- DEFAULT_TENANT: id de la tienda default (default "default")
+- TENANT_CLIENT_POOL_SIZE: clientes MP / SMTP abiertos por proceso (default 16)
+- SMTP_IDLE_SECONDS: default 60
+- SMTP_POOL_SIZE: conexiones SMTP por tienda y proceso (default 4)
+===================================================
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import smtplib
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional
+from urllib.parse import urlsplit
+
+from django.http import JsonResponse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TENANT = os.getenv('DEFAULT_TENANT', 'default')
+TENANT_CLIENT_POOL_SIZE = int(os.getenv('TENANT_CLIENT_POOL_SIZE', '16'))
+SMTP_IDLE_SECONDS = float(os.getenv('SMTP_IDLE_SECONDS', '60'))
+SMTP_POOL_SIZE = int(os.getenv('SMTP_POOL_SIZE', '4'))
+
+TENANT_HEADER = 'X-Tenant'
+TENANT_PARAM = 'tenant'
+
+
+@dataclass(frozen=True)
+class Tenant:
+    id: str
+    name: str
+    mp_access_token: str
+    mp_webhook_secret: str
+    frontend_url: str
+    statement_descriptor: str
+    email_host: str
+    email_port: int
+    email_use_tls: bool
+    email_host_user: str
+    email_host_password: str
+    default_from_email: str
+    files_dir: Path
+    # None = catálogo de services.PRODUCT_FILES
+    product_files: Optional[dict[str, list[str]]] = field(default=None, hash=False)
+    hosts: tuple[str, ...] = ()
+    is_default: bool = False
+
+    @property
+    def is_production(self) -> bool:
+        return self.mp_access_token.startswith('APP_USR-')
+
+
+def _env_value(value: Any) -> Any:
+    """``"env:VARIABLE"`` -> valor de la variable de entorno."""
+    if isinstance(value, str) and value.startswith('env:'):
+        return os.getenv(value[4:], '')
+    return value
+
+
+def default_tenant_from_env() -> Tenant:
+    from django.conf import settings
+
+    return Tenant(
+        id=DEFAULT_TENANT,
+        name='Datos con Alex',
+        mp_access_token=os.getenv('MP_ACCESS_TOKEN', ''),
+        mp_webhook_secret=os.getenv('MP_WEBHOOK_SECRET', ''),
+        frontend_url=os.getenv('FRONTEND_URL', 'http://localhost:5173'),
+        statement_descriptor='DATOS CON ALEX',
+        email_host=settings.EMAIL_HOST,
+        email_port=settings.EMAIL_PORT,
+        email_use_tls=settings.EMAIL_USE_TLS,
+        email_host_user=settings.EMAIL_HOST_USER,
+        email_host_password=settings.EMAIL_HOST_PASSWORD,
+        default_from_email=settings.DEFAULT_FROM_EMAIL or settings.EMAIL_HOST_USER,
+        files_dir=Path(settings.BASE_DIR) / 'files',
+        is_default=True,
+    )
+
+
+def tenant_from_config(config: dict[str, Any], default: Tenant) -> Tenant:
+    """Tienda desde una entrada de TENANTS_FILE (hereda lo que falte de ``default``)."""
+    from django.conf import settings
+
+    tenant_id = str(config.get('id') or '').strip()
+    if not tenant_id:
+        raise ValueError("Falta 'id'")
+    email = config.get('email') or {}
+    files_dir = Path(config['files_dir']) if config.get('files_dir') else default.files_dir
+    if not files_dir.is_absolute():
+        files_dir = Path(settings.BASE_DIR) / files_dir
+    email_user = _env_value(email.get('user')) if 'user' in email else default.email_host_user
+    products = config.get('products')
+
+    return replace(
+        default,
+        id=tenant_id,
+        name=config.get('name') or tenant_id,
+        mp_access_token=_env_value(config.get('mp_access_token', '')),
+        mp_webhook_secret=_env_value(config.get('mp_webhook_secret', '')),
+        frontend_url=str(config.get('frontend_url') or default.frontend_url).rstrip('/'),
+        statement_descriptor=str(config.get('statement_descriptor') or default.statement_descriptor)[:22],
+        email_host=email.get('host', default.email_host),
+        email_port=int(email.get('port', default.email_port)),
+        email_use_tls=bool(email.get('use_tls', default.email_use_tls)),
+        email_host_user=email_user,
+        email_host_password=_env_value(email.get('password')) if 'password' in email else default.email_host_password,
+        default_from_email=_env_value(email.get('from')) or email_user or default.default_from_email,
+        files_dir=files_dir,
+        product_files={str(k): list(v) for k, v in products.items()} if isinstance(products, dict) else default.product_files,
+        hosts=tuple(str(host).lower() for host in config.get('hosts', [])),
+        is_default=False,
+    )
+
+
+# =============================================================================
+# REGISTRO
+# =============================================================================
+
+class TenantRegistry:
+    """Tiendas por id y por host."""
+
+    def __init__(self, tenants: list[Tenant]):
+        self.by_id = {tenant.id: tenant for tenant in tenants}
+        self.default = next(tenant for tenant in tenants if tenant.is_default)
+        self.by_host = {host: tenant for tenant in tenants for host in tenant.hosts}
+
+    @property
+    def multi_tenant(self) -> bool:
+        return len(self.by_id) > 1
+
+    def get(self, tenant_id: Optional[str]) -> Optional[Tenant]:
+        """Tienda por id ('' / None = default)."""
+        if not tenant_id:
+            return self.default
+        return self.by_id.get(tenant_id)
+
+    def for_host(self, host: str) -> Optional[Tenant]:
+        return self.by_host.get(host.lower().rsplit(':', 1)[0]) if host else None
+
+
+def load_registry(path: Optional[str] = None) -> TenantRegistry:
+    default = default_tenant_from_env()
+    tenants = [default]
+    path = path if path is not None else os.getenv('TENANTS_FILE', '')
+    if path:
+        try:
+            with open(path, encoding='utf-8') as f:
+                configs = json.load(f).get('tenants', [])
+        except (OSError, ValueError):
+            logger.exception(f"[TENANT] No se pudo leer TENANTS_FILE={path}, solo tienda default")
+            configs = []
+        for config in configs:
+            try:
+                tenant = tenant_from_config(config, default)
+            except (KeyError, TypeError, ValueError) as e:
+                logger.error(f"[TENANT] Tienda inválida en {path}: {e} ({config.get('id', '?')})")
+                continue
+            if tenant.id in {t.id for t in tenants}:
+                logger.error(f"[TENANT] Id de tienda repetido: {tenant.id}")
+                continue
+            if not tenant.mp_access_token:
+                logger.warning(f"[TENANT] {tenant.id}: sin mp_access_token")
+            tenants.append(tenant)
+        logger.info(f"[TENANT] {len(tenants)} tiendas: {', '.join(t.id for t in tenants)}")
+    return TenantRegistry(tenants)
+
+
+_registry: Optional[TenantRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> TenantRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = load_registry()
+    return _registry
+
+
+def get_tenant(tenant_id: Optional[str] = None) -> Tenant:
+    """Tienda por id; ids desconocidos (ej. tienda dada de baja) caen en la default."""
+    registry = get_registry()
+    tenant = registry.get(tenant_id)
+    if tenant is None:
+        logger.warning(f"[TENANT] Tienda '{tenant_id}' no configurada, se usa la default")
+        return registry.default
+    return tenant
+
+
+def tenant_for_payment(payment_data: dict[str, Any]) -> Tenant:
+    """Tienda de un pago (metadata ``tenant``) o la tienda en curso."""
+    tenant_id = (payment_data.get('metadata') or {}).get('tenant')
+    return get_tenant(tenant_id) if tenant_id else current_tenant()
+
+
+# =============================================================================
+# TIENDA EN CURSO
+# =============================================================================
+
+_context = threading.local()
+
+
+def current_tenant() -> Tenant:
+    return getattr(_context, 'tenant', None) or get_registry().default
+
+
+@contextmanager
+def using_tenant(tenant: Tenant) -> Iterator[Tenant]:
+    """Ejecuta un bloque como ``tenant`` (watcher, comandos, threads)."""
+    previous = getattr(_context, 'tenant', None)
+    _context.tenant = tenant
+    try:
+        yield tenant
+    finally:
+        _context.tenant = previous
+
+
+def _origin_host(request) -> str:
+    origin = request.headers.get('Origin', '')
+    return (urlsplit(origin).hostname or '') if origin and origin != 'null' else ''
+
+
+def resolve_tenant(request) -> Optional[Tenant]:
+    """Tienda del request (None si pide explícitamente una que no existe)."""
+    registry = get_registry()
+    explicit = request.headers.get(TENANT_HEADER) or request.GET.get(TENANT_PARAM)
+    if explicit:
+        return registry.get(explicit.strip())
+    if not registry.multi_tenant:
+        return registry.default
+    return (
+        registry.for_host(_origin_host(request))
+        or registry.for_host(request.get_host())
+        or registry.default
+    )
+
+
+class TenantMiddleware:
+    """Resuelve la tienda del request (``request.tenant``) y la activa en el thread."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        tenant = resolve_tenant(request)
+        if tenant is None:
+            return JsonResponse({'success': False, 'error': 'Tienda desconocida'}, status=400)
+        request.tenant = tenant
+        with using_tenant(tenant):
+            return self.get_response(request)
+
+
+# =============================================================================
+# CLIENTES (LRU acotado)
+# =============================================================================
+
+class ClientPool:
+    """LRU de clientes por clave; ``close`` se llama al desalojar."""
+
+    def __init__(self, max_size: int = TENANT_CLIENT_POOL_SIZE, close: Optional[Callable[[Any], None]] = None):
+        self.max_size = max(1, max_size)
+        self._close = close
+        self._clients: OrderedDict[tuple, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, factory: Callable[[], Any]) -> Any:
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._clients.move_to_end(key)
+                return client
+        client = factory()  # fuera del lock: crear un cliente puede tardar
+        evicted = []
+        with self._lock:
+            if key in self._clients:  # otro thread lo creó mientras tanto
+                evicted.append(client)
+                client = self._clients[key]
+                self._clients.move_to_end(key)
+            else:
+                self._clients[key] = client
+                while len(self._clients) > self.max_size:
+                    evicted.append(self._clients.popitem(last=False)[1])
+        for old in evicted:
+            self._discard(old)
+        return client
+
+    def clear(self) -> None:
+        with self._lock:
+            clients, self._clients = list(self._clients.values()), OrderedDict()
+        for client in clients:
+            self._discard(client)
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def _discard(self, client: Any) -> None:
+        if self._close is None:
+            return
+        try:
+            self._close(client)
+        except Exception:
+            logger.exception("[TENANT] Error cerrando un cliente desalojado")
+
+
+class PooledMailer:
+    """
+    Conexiones de email de una tienda que quedan abiertas entre envíos.
+
+    Hasta ``size`` conexiones, cada una usada por un envío a la vez
+    (smtplib no es thread-safe): un envío lento, con adjuntos grandes, no
+    frena a los demás compradores. Si están todas ocupadas el envío espera
+    a que se libere una. Las ociosas más de ``idle_seconds`` se cierran al
+    tomarlas (el servidor probablemente ya las cortó).
+    """
+
+    def __init__(self, connect, size: int = SMTP_POOL_SIZE, idle_seconds: float = SMTP_IDLE_SECONDS):
+        self._connect = connect
+        self.size = max(1, size)
+        self.idle_seconds = idle_seconds
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        # (conexión, último uso), la más reciente al final
+        self._idle: list[tuple[Any, float]] = []
+
+    def _checkout(self):
+        with self._lock:
+            while self._idle:
+                connection, last_used = self._idle.pop()
+                if time.monotonic() - last_used <= self.idle_seconds:
+                    return connection
+                _close_quietly(connection)
+        return self._connect()
+
+    def _checkin(self, connection) -> None:
+        with self._lock:
+            self._idle.append((connection, time.monotonic()))
+
+    def send(self, message) -> int:
+        with self._slots:
+            connection = self._checkout()
+            message.connection = connection
+            try:
+                try:
+                    connection.open()
+                    sent = connection.send_messages([message])
+                except (smtplib.SMTPServerDisconnected, ConnectionError):
+                    # Conexión vieja cortada por el servidor: una reconexión
+                    logger.info(f"[EMAIL] Conexión SMTP cerrada por el servidor, reconectando ({getattr(connection, 'host', '')})")
+                    connection.close()
+                    connection.open()
+                    sent = connection.send_messages([message])
+            except Exception:
+                _close_quietly(connection)
+                raise
+            self._checkin(connection)
+            return sent
+
+    def close(self) -> None:
+        """Cierra las conexiones ociosas (las que están enviando vuelven y se cierran por inactividad)."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            _close_quietly(connection)
+
+
+def _close_quietly(connection) -> None:
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+_sdk_pool = ClientPool()
+_mail_pool = ClientPool(close=PooledMailer.close)
+atexit.register(_mail_pool.clear)
+
+
+def sdk_for(tenant: Tenant):
+    """SDK de Mercado Pago de la tienda (reutilizado)."""
+    import mercadopago
+
+    from .traffic import wrap_sdk
+
+    # El token en la clave: si cambia la configuración, cliente nuevo
+    return _sdk_pool.get((tenant.id, tenant.mp_access_token), lambda: wrap_sdk(mercadopago.SDK(tenant.mp_access_token)))
+
+
+def mailer_for(tenant: Tenant) -> PooledMailer:
+    """Conexiones de email de la tienda (reutilizadas, con EMAIL_BACKEND)."""
+    from django.conf import settings
+    from django.core.mail import get_connection
+
+    key = (tenant.id, tenant.email_host, tenant.email_port, tenant.email_host_user, tenant.email_host_password)
+    return _mail_pool.get(key, lambda: PooledMailer(lambda: get_connection(
+        fail_silently=False,
+        host=tenant.email_host,
+        port=tenant.email_port,
+        username=tenant.email_host_user,
+        password=tenant.email_host_password,
+        use_tls=tenant.email_use_tls,
+        timeout=getattr(settings, 'EMAIL_TIMEOUT', None),
+    )))
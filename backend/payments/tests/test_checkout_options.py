@@ -0,0 +1,75 @@
+"""
+Montos que el checkout puede pedir a MP (payments/checkout_options.py).
+"""
+
+from __future__ import annotations
+
+from decimal import Decimal
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from payments import checkout_options
+from payments.checkout_options import METHODS_KEY, KnownAmounts, OptionsCache, combined_amounts
+from payments.tenants import get_registry
+
+
+class CombinedAmountsTests(SimpleTestCase):
+
+    def test_sums_of_distinct_products(self):
+        amounts = combined_amounts([Decimal('4900'), Decimal('6900'), Decimal('9900')], size=2)
+        self.assertEqual(
+            sorted(amounts),
+            [Decimal(value) for value in ('4900', '6900', '9900', '11800', '14800', '16800')],
+        )
+
+
+class KnownAmountsTests(SimpleTestCase):
+
+    def test_catalog_and_sales(self):
+        known = KnownAmounts(prices=[Decimal('4900'), Decimal('6900')])
+        known._sales = {'tienda': frozenset({Decimal('1234.50')})}
+        self.assertIn(('otra', Decimal('11800')), known)
+        self.assertIn(('tienda', Decimal('1234.50')), known)
+        self.assertNotIn(('otra', Decimal('1234.50')), known)
+        self.assertNotIn(('tienda', Decimal('4901')), known)
+
+
+class OptionsCacheEvictionTests(SimpleTestCase):
+
+    def test_pinned_amounts_survive(self):
+        cache = OptionsCache(max_amounts=2, workers=1, pinned=frozenset({Decimal('4900')}))
+        self.addCleanup(cache.shutdown)
+        for key in (METHODS_KEY, Decimal('4900'), Decimal('1'), Decimal('2'), Decimal('3')):
+            cache.store(('tienda', key), [])
+        self.assertIsNotNone(cache.peek(('tienda', METHODS_KEY)))
+        self.assertIsNotNone(cache.peek(('tienda', Decimal('4900'))))
+        self.assertIsNone(cache.peek(('tienda', Decimal('1'))))
+        self.assertEqual(cache.stats()['entries'], 4)
+
+
+class UnknownAmountTests(SimpleTestCase):
+
+    def setUp(self):
+        cache = OptionsCache(workers=1, pinned=frozenset())
+        self.addCleanup(cache.shutdown)
+        cache.store((get_registry().default.id, METHODS_KEY), [])
+        patcher = mock.patch.multiple(checkout_options, _cache=cache, _known=KnownAmounts(prices=[Decimal('4900')]))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = cache
+
+    def test_unknown_amount_is_not_loaded_nor_cached(self):
+        tenant = get_registry().default
+        with mock.patch.object(self.cache, 'schedule') as schedule:
+            options = checkout_options.checkout_options(tenant, Decimal('4901'))
+        schedule.assert_not_called()
+        self.assertIsNone(self.cache.peek((tenant.id, Decimal('4901'))))
+        self.assertEqual((options['installments'], options['pending']), (None, False))
+
+    def test_known_amount_is_scheduled(self):
+        tenant = get_registry().default
+        with mock.patch.object(self.cache, 'schedule') as schedule:
+            options = checkout_options.checkout_options(tenant, Decimal('4900'))
+        schedule.assert_called_once()
+        self.assertTrue(options['pending'])
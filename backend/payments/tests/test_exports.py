@@ -0,0 +1,29 @@
+"""
+Celdas que parecen fórmulas en los exports CSV y XLSX (payments/exports.py).
+"""
+
+from __future__ import annotations
+
+import io
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+
+from payments.exports import iter_csv, write_xlsx
+
+
+class FormulaCellTests(SimpleTestCase):
+
+    def test_csv_prefixes_apostrophe(self):
+        content = b''.join(iter_csv(['nombre'], [['=Juan'], ['Ana']])).decode('utf-8-sig')
+        self.assertEqual(content.splitlines(), ['nombre', "'=Juan", 'Ana'])
+
+    def test_xlsx_writes_plain_text_cells(self):
+        from openpyxl import load_workbook
+
+        buffer = io.BytesIO()
+        write_xlsx(buffer, [('ordenes', ['nombre', 'precio'], [['=Juan', Decimal('1500.50')], ['@Ana', 3]])])
+        buffer.seek(0)
+        rows = list(load_workbook(buffer)['ordenes'].iter_rows(min_row=2))
+        self.assertEqual([(cell.value, cell.data_type) for cell in rows[0]], [('=Juan', 's'), (1500.5, 'n')])
+        self.assertEqual([(cell.value, cell.data_type) for cell in rows[1]], [('@Ana', 's'), (3, 'n')])
@@ -0,0 +1,172 @@
+"""
+Replicación de SQLite (payments/replication.py): subida del WAL,
+restauración, retomar tras un reinicio y estado de la réplica.
+
+Cada test usa una base SQLite propia en un directorio temporal (no la de
+Django) y corre las rondas del replicador a mano con ``tick()``.
+"""
+
+from __future__ import annotations
+
+import shutil
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from payments import replication
+from payments.replication import Replicator, ReplicaStore
+
+
+def _rows(path: Path) -> list[tuple]:
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute('SELECT id, note FROM items ORDER BY id').fetchall()
+    finally:
+        connection.close()
+
+
+class ReplicationTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp(prefix='replica-test-'))
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.db_path = self.directory / 'db.sqlite3'
+        self.store = ReplicaStore(self.directory / 'replica')
+        # Como las conexiones de Django con REPLICA_DIR (config/database.py)
+        self.app = sqlite3.connect(self.db_path, isolation_level=None)
+        self.app.execute('PRAGMA journal_mode=WAL')
+        self.app.execute('PRAGMA wal_autocheckpoint=0')
+        self.app.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, note TEXT)')
+        self.addCleanup(self.app.close)
+
+    def replicator(self) -> Replicator:
+        replicator = Replicator(self.db_path, self.store, sync_seconds=0.01)
+        self.assertTrue(replicator._acquire())
+        self.addCleanup(replicator._release)
+        return replicator
+
+    def write(self, start: int, count: int) -> None:
+        self.app.execute('BEGIN')
+        for number in range(start, start + count):
+            self.app.execute('INSERT INTO items (id, note) VALUES (?, ?)', (number, 'x' * 200))
+        self.app.execute('COMMIT')
+
+    def restored_rows(self) -> list[tuple]:
+        target = self.directory / 'restored.sqlite3'
+        self.assertIsNotNone(self.store.restore(target))
+        return _rows(target)
+
+    def test_restore_round_trip(self):
+        replicator = self.replicator()
+        replicator.tick()
+        self.write(1, 50)
+        self.assertGreater(replicator.tick(), 0)
+        self.app.execute('UPDATE items SET note = ? WHERE id <= 10', ('editada',))
+        self.app.execute('DELETE FROM items WHERE id > 40')
+        replicator.tick()
+
+        self.assertEqual(self.restored_rows(), _rows(self.db_path))
+
+    def test_restore_across_checkpoints(self):
+        replicator = self.replicator()
+        with mock.patch.object(replication, 'REPLICA_CHECKPOINT_FRAMES', 5):
+            for batch in range(6):
+                self.write(batch * 20 + 1, 20)
+                replicator.tick()
+        generation = replicator.position.generation
+
+        self.assertEqual(self.restored_rows(), _rows(self.db_path))
+        self.assertEqual(self.store.generations(), [generation])
+
+    def test_resume_after_restart(self):
+        first = self.replicator()
+        first.tick()
+        self.write(1, 30)
+        first.tick()
+        generation, next_seq = first.position.generation, first.position.next_seq
+        first.stop(timeout=0)
+
+        self.write(31, 30)
+        second = self.replicator()
+        second.tick()
+
+        self.assertEqual(second.position.generation, generation)
+        self.assertGreater(second.position.next_seq, next_seq)
+        self.assertEqual(self.store.generations(), [generation])
+        self.assertEqual(self.restored_rows(), _rows(self.db_path))
+
+    def test_new_generation_when_wal_cannot_be_verified(self):
+        first = self.replicator()
+        first.tick()
+        self.write(1, 10)
+        first.tick()
+        first.stop(timeout=0)
+        # Otro proceso recicla el WAL sin que se suban los frames
+        self.write(11, 10)
+        self.app.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        self.write(21, 10)
+
+        second = self.replicator()
+        second.tick()
+
+        self.assertEqual(len(self.store.generations()), 2)
+        self.assertEqual(self.restored_rows(), _rows(self.db_path))
+
+    def test_status_unhealthy_when_replicator_stops(self):
+        replicator = self.replicator()
+        replicator.tick()
+        self.write(1, 5)
+        replicator.tick()
+
+        def status(now: float) -> dict:
+            with mock.patch.dict('os.environ', {'REPLICA_DIR': str(self.store.directory)}), \
+                    mock.patch.object(replication, 'sqlite_path', return_value=self.db_path), \
+                    mock.patch.object(replication.time, 'time', return_value=now):
+                return replication.replication_status()
+
+        self.assertTrue(status(time.time())['healthy'])
+
+        replicator.stop(timeout=0)
+        self.write(6, 5)
+        stopped = status(time.time() + 120)
+        self.assertFalse(stopped['healthy'])
+        self.assertGreater(stopped['lag_seconds'], 60)
+
+    def test_status_unhealthy_after_error(self):
+        replicator = self.replicator()
+        replicator.tick()
+        replicator.last_error = 'OSError: disco lleno'
+        replicator._save_state()
+
+        with mock.patch.dict('os.environ', {'REPLICA_DIR': str(self.store.directory)}), \
+                mock.patch.object(replication, 'sqlite_path', return_value=self.db_path):
+            status = replication.replication_status()
+
+        self.assertFalse(status['healthy'])
+        self.assertEqual(status['error'], 'OSError: disco lleno')
+
+    def test_guard_checkpoints_oversized_wal(self):
+        replicator = self.replicator()
+        replicator.tick()
+        # La réplica deja de aceptar escrituras: el WAL solo crece
+        with mock.patch.object(self.store, 'put_segment', side_effect=OSError('sin espacio')):
+            self.write(1, 200)
+            with self.assertRaises(OSError):
+                replicator.tick()
+        wal_size = replicator.wal_path.stat().st_size
+        replicator.position = None
+        replicator._close_connections()
+
+        self.assertFalse(replicator.guard_wal_size(max_bytes=wal_size + 1))
+        self.assertTrue(replicator.guard_wal_size(max_bytes=wal_size))
+        self.assertEqual(replicator.wal_path.stat().st_size, 0)
+        self.assertEqual(len(_rows(self.db_path)), 200)
+
+        # Con la subida andando otra vez sigue en una generación nueva
+        replicator.tick()
+        self.assertEqual(len(self.store.generations()), 2)
+        self.assertEqual(self.restored_rows(), _rows(self.db_path))
@@ -0,0 +1,47 @@
+"""
+Rotación por tamaño del archivo de export de spans (payments/tracing.py).
+"""
+
+from __future__ import annotations
+
+import json
+import tempfile
+from pathlib import Path
+
+from django.test import SimpleTestCase
+
+from payments.tracing import load_spans, rotate_export_file, rotated_file
+
+
+def span_line(trace_id: str, start: int) -> str:
+    span = {'traceId': trace_id, 'spanId': f'{start:016x}', 'startTimeUnixNano': str(start), 'endTimeUnixNano': str(start + 1)}
+    return json.dumps({'resourceSpans': [{'scopeSpans': [{'spans': [span]}]}]}) + '\n'
+
+
+class RotateExportFileTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / 'spans.jsonl'
+
+    def test_small_or_missing_file_is_kept(self):
+        self.assertFalse(rotate_export_file(self.path, max_bytes=10, max_files=2))
+        self.path.write_text('x')
+        self.assertFalse(rotate_export_file(self.path, max_bytes=10, max_files=2))
+        self.assertTrue(self.path.exists())
+
+    def test_shifts_and_drops_oldest(self):
+        for generation in ('a', 'b', 'c'):
+            self.path.write_text(generation * 20)
+            self.assertTrue(rotate_export_file(self.path, max_bytes=10, max_files=2))
+        self.assertFalse(self.path.exists())
+        self.assertEqual(rotated_file(self.path, 1).read_text(), 'c' * 20)
+        self.assertEqual(rotated_file(self.path, 2).read_text(), 'b' * 20)
+        self.assertFalse(rotated_file(self.path, 3).exists())
+
+    def test_load_spans_reads_rotated_files(self):
+        trace_id = 'f' * 32
+        rotated_file(self.path, 1).write_text(span_line(trace_id, 1) + span_line('0' * 32, 2))
+        self.path.write_text(span_line(trace_id, 3))
+        self.assertEqual([span['startTimeUnixNano'] for span in load_spans(self.path, trace_id)], ['1', '3'])
@@ -0,0 +1,173 @@
+"""
+Firma y anti-replay de los webhooks de MP (payments/webhook_security.py)
+y su uso en la vista ``webhook``.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+from unittest import mock
+
+from django.test import Client, SimpleTestCase
+
+from payments import views
+from payments.webhook_security import (
+    ReplayCache,
+    build_manifest,
+    data_id_matches,
+    notified_data_id,
+    parse_signature_header,
+    verify_mp_signature,
+)
+
+SECRET = 'clave-de-prueba'
+NOW = 1_704_908_010
+
+
+def sign(data_id, request_id='req-1', ts=str(NOW), secret=SECRET) -> str:
+    manifest = build_manifest(data_id, request_id, ts)
+    return f"ts={ts},v1={hmac.new(secret.encode(), manifest.encode(), hashlib.sha256).hexdigest()}"
+
+
+class ParseSignatureHeaderTests(SimpleTestCase):
+
+    def test_ts_and_v1(self):
+        self.assertEqual(parse_signature_header('ts=1704908010,v1=abc123'), ('1704908010', 'abc123'))
+
+    def test_spaces_and_unknown_parts(self):
+        self.assertEqual(parse_signature_header(' ts = 17 , v2=x, v1= ff '), ('17', 'ff'))
+
+    def test_missing_parts(self):
+        self.assertEqual(parse_signature_header('v1=abc'), (None, 'abc'))
+        self.assertEqual(parse_signature_header('ts=17'), ('17', None))
+        self.assertEqual(parse_signature_header('basura'), (None, None))
+        self.assertEqual(parse_signature_header(''), (None, None))
+
+
+class VerifySignatureTests(SimpleTestCase):
+
+    def verify(self, header, data_id='123', request_id='req-1', tolerance=300, now=NOW):
+        return verify_mp_signature(SECRET, header, request_id, data_id, tolerance_seconds=tolerance, now=now)
+
+    def test_valid(self):
+        self.assertEqual(self.verify(sign('123')), (True, 'ok', str(NOW)))
+
+    def test_alphanumeric_id_signed_lowercase(self):
+        self.assertTrue(self.verify(sign('abc'), data_id='ABC')[0])
+
+    def test_uppercase_hex_accepted(self):
+        ts, v1 = parse_signature_header(sign('123'))
+        self.assertTrue(self.verify(f"ts={ts},v1={v1.upper()}")[0])
+
+    def test_missing_header(self):
+        self.assertEqual(self.verify(''), (False, 'missing_signature', None))
+
+    def test_missing_parts(self):
+        self.assertEqual(self.verify('v1=abc')[:2], (False, 'malformed_signature'))
+        self.assertEqual(self.verify(f'ts={NOW}')[:2], (False, 'malformed_signature'))
+
+    def test_non_numeric_ts(self):
+        self.assertEqual(self.verify('ts=ayer,v1=abc')[:2], (False, 'malformed_signature'))
+
+    def test_bad_hex(self):
+        self.assertEqual(self.verify(f'ts={NOW},v1=zz-no-es-hex')[:2], (False, 'invalid_signature'))
+        self.assertEqual(self.verify(f'ts={NOW},v1=' + '0' * 64)[:2], (False, 'invalid_signature'))
+
+    def test_other_id_or_request_or_secret(self):
+        self.assertEqual(self.verify(sign('123'), data_id='124')[:2], (False, 'invalid_signature'))
+        self.assertEqual(self.verify(sign('123'), request_id='req-2')[:2], (False, 'invalid_signature'))
+        self.assertEqual(self.verify(sign('123', secret='otra'))[:2], (False, 'invalid_signature'))
+
+    def test_stale_timestamp(self):
+        self.assertEqual(self.verify(sign('123'), now=NOW + 301)[:2], (False, 'stale_timestamp'))
+        self.assertEqual(self.verify(sign('123'), now=NOW - 301)[:2], (False, 'stale_timestamp'))
+        self.assertTrue(self.verify(sign('123'), now=NOW + 299)[0])
+
+    def test_timestamp_in_milliseconds(self):
+        header = sign('123', ts=str(NOW * 1000))
+        self.assertTrue(self.verify(header, now=NOW + 10)[0])
+        self.assertEqual(self.verify(header, now=NOW + 1000)[:2], (False, 'stale_timestamp'))
+
+    def test_no_tolerance(self):
+        self.assertTrue(self.verify(sign('123'), tolerance=0, now=NOW + 10 ** 6)[0])
+
+
+class NotifiedDataIdTests(SimpleTestCase):
+
+    def test_body_shapes(self):
+        self.assertEqual(notified_data_id({'data': {'id': 123}}), '123')
+        self.assertEqual(notified_data_id({'data.id': 'ABC'}), 'ABC')
+        self.assertIsNone(notified_data_id({'data': 'x'}))
+        self.assertIsNone(notified_data_id([1]))
+
+    def test_matches_signed_id(self):
+        self.assertTrue(data_id_matches('abc', 'ABC'))
+        self.assertTrue(data_id_matches('123', None))
+        self.assertFalse(data_id_matches('123', '999'))
+
+
+class ReplayCacheTests(SimpleTestCase):
+
+    def test_seen(self):
+        cache = ReplayCache(max_size=10)
+        self.assertFalse(cache.seen('req-1', '1'))
+        self.assertTrue(cache.seen('req-1', '1'))
+        self.assertFalse(cache.seen('req-1', '2'))
+
+    def test_evicts_least_recently_seen(self):
+        cache = ReplayCache(max_size=2)
+        cache.seen('a', '1')
+        cache.seen('b', '1')
+        cache.seen('a', '1')  # 'a' pasa a ser el más reciente
+        cache.seen('c', '1')  # sale 'b'
+        self.assertEqual(len(cache), 2)
+        self.assertTrue(cache.seen('a', '1'))
+        self.assertFalse(cache.seen('b', '1'))
+
+    def test_clear(self):
+        cache = ReplayCache()
+        cache.seen('a', '1')
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertFalse(cache.seen('a', '1'))
+
+
+class WebhookSignatureViewTests(SimpleTestCase):
+    """La vista rechaza antes de consultar a MP (el SDK no se llama)."""
+
+    def setUp(self):
+        patcher = mock.patch.multiple(
+            views,
+            MP_WEBHOOK_SECRET=SECRET,
+            MP_WEBHOOK_TOLERANCE_SECONDS=0,
+            _webhook_replay_cache=ReplayCache(),
+            sdk=mock.Mock(side_effect=AssertionError('no debería consultar a MP')),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = Client()
+
+    def post(self, query, body_id, signed_id='123'):
+        return self.client.post(
+            f'/api/payments/webhook/{query}',
+            data=json.dumps({'type': 'payment', 'action': 'payment.updated', 'data': {'id': body_id}}),
+            content_type='application/json',
+            headers={'x-signature': sign(signed_id), 'x-request-id': 'req-1'},
+        )
+
+    def test_missing_query_data_id(self):
+        response = self.post('?type=payment', '123', signed_id=None)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['reason'], 'missing_data_id')
+
+    def test_body_id_differs_from_signed_id(self):
+        response = self.post('?type=payment&data.id=123', '999')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['reason'], 'data_id_mismatch')
+
+    def test_invalid_signature(self):
+        response = self.post('?type=payment&data.id=124', '124')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['reason'], 'invalid_signature')
@@ -0,0 +1,355 @@
+"""
+Trazas de compras - Datos con Alex
+===================================
+Una compra pasa por create_preference, Mercado Pago, pago_exitoso,
+webhook, watcher y el envío del email. Para verla como una sola cosa:
+
+- Correlation id = trace id (32 hex, formato W3C/OpenTelemetry) derivado
+  del external_reference: cualquier componente que conozca la orden llega
+  al mismo id sin consultar nada. Además viaja en la metadata de MP
+  (``trace_id``), así el webhook lo recupera de los datos del pago.
+- log_payment_event agrega ``trace_id`` a cada evento: los logs de una
+  compra se filtran por ese valor.
+- span(): mide un tramo (llamada a MP, base, email, SMTP...). Los spans de
+  un request cuelgan del span raíz de la vista (@traced). Si la vista
+  recién conoce la orden a mitad de camino (webhook), bind_trace() mueve
+  todo el request a la traza de la compra.
+- Export en OTLP/JSON (el formato de OpenTelemetry): a un archivo JSONL
+  (TRACE_EXPORT_FILE) y/o a un collector (OTEL_EXPORTER_OTLP_ENDPOINT),
+  desde un thread en segundo plano. ``python manage.py show_trace`` arma
+  la cascada de una compra desde el archivo.
+- El archivo rota por tamaño: al pasar TRACE_EXPORT_MAX_BYTES se renombra
+  a spans.jsonl.1 (el .1 pasa a .2, etc.) y se conservan
+  TRACE_EXPORT_MAX_FILES copias; show_trace lee también las rotadas.
+
+Con TRACING_ENABLED=False (default) los spans no se exportan; los
+trace_id en logs, metadata y X-Trace-Id se mantienen.
+
+CONFIGURACIÓN:
+- TRACING_ENABLED: "True" para registrar y exportar spans
+- TRACE_EXPORT_FILE: default backend/data/traces/spans.jsonl ("off" = no escribir archivo)
+- TRACE_EXPORT_MAX_BYTES: tamaño al que rota el archivo (default 50 MB)
+- TRACE_EXPORT_MAX_FILES: archivos rotados que se conservan (default 5)
+- OTEL_EXPORTER_OTLP_ENDPOINT: ej. http://localhost:4318 (se envía a /v1/traces)
+- OTEL_SERVICE_NAME: default alexcel-backend
+===================================
+"""
+
+from __future__ import annotations
+
+import functools
+import hashlib
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'False').lower() == 'true'
+OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT', '').rstrip('/')
+OTEL_SERVICE_NAME = os.getenv('OTEL_SERVICE_NAME', 'alexcel-backend')
+TRACE_EXPORT_MAX_BYTES = int(os.getenv('TRACE_EXPORT_MAX_BYTES', str(50 * 1024 * 1024)))
+TRACE_EXPORT_MAX_FILES = int(os.getenv('TRACE_EXPORT_MAX_FILES', '5'))
+
+# Export en lotes
+EXPORT_BATCH_SIZE = 256
+EXPORT_INTERVAL_SECONDS = 2.0
+EXPORT_QUEUE_MAX = 10000
+
+# OTLP: SpanKind y StatusCode
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT = 1, 2, 3
+STATUS_OK, STATUS_ERROR = 1, 2
+
+
+def default_export_file() -> Optional[Path]:
+    configured = os.getenv('TRACE_EXPORT_FILE')
+    if configured == 'off':
+        return None
+    if configured:
+        return Path(configured)
+    from django.conf import settings
+    return Path(settings.BASE_DIR) / 'data' / 'traces' / 'spans.jsonl'
+
+
+def rotated_file(path: Path, index: int) -> Path:
+    return path.with_name(f"{path.name}.{index}")
+
+
+def rotate_export_file(path: Path, max_bytes: int = TRACE_EXPORT_MAX_BYTES, max_files: int = TRACE_EXPORT_MAX_FILES) -> bool:
+    """
+    Si ``path`` pasó ``max_bytes`` lo renombra a ``path.1`` corriendo los
+    anteriores (el más viejo, ``path.<max_files>``, se descarta).
+    """
+    try:
+        if max_bytes <= 0 or path.stat().st_size < max_bytes:
+            return False
+    except FileNotFoundError:
+        return False
+    if max_files <= 0:
+        path.unlink(missing_ok=True)
+        return True
+    rotated_file(path, max_files).unlink(missing_ok=True)
+    for index in range(max_files - 1, 0, -1):
+        older = rotated_file(path, index)
+        if older.exists():
+            os.replace(older, rotated_file(path, index + 1))
+    # Otro worker pudo rotarlo recién: el que llega segundo no encuentra el archivo
+    try:
+        os.replace(path, rotated_file(path, 1))
+    except FileNotFoundError:
+        return False
+    return True
+
+
+# =============================================================================
+# CORRELATION ID
+# =============================================================================
+
+def trace_id_for(external_reference: Any) -> Optional[str]:
+    """Trace id de una compra (mismo valor en todos los procesos)."""
+    if external_reference in (None, '', 'N/A', 'None'):
+        return None
+    return hashlib.sha256(f"alexcel-trace:{external_reference}".encode('utf-8')).hexdigest()[:32]
+
+
+def trace_id_for_payment(payment_data: dict[str, Any]) -> Optional[str]:
+    """Trace id desde los datos de un pago de MP (metadata o external_reference)."""
+    metadata = payment_data.get('metadata') or {}
+    return metadata.get('trace_id') or trace_id_for(payment_data.get('external_reference'))
+
+
+# =============================================================================
+# SPANS
+# =============================================================================
+
+class Trace:
+    """Spans de un request/tarea; el trace id puede cambiar hasta el final."""
+
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.bound = trace_id is not None
+        self.spans: list[dict[str, Any]] = []
+        self.stack: list[dict[str, Any]] = []
+
+
+_context = threading.local()
+
+
+def _current() -> Optional[Trace]:
+    return getattr(_context, 'trace', None)
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _current()
+    return trace.trace_id if trace is not None and trace.bound else None
+
+
+def bind_trace(trace_id: Optional[str]) -> None:
+    """Asocia el request en curso a la traza de una compra (la primera vez gana)."""
+    trace = _current()
+    if trace is not None and trace_id and not trace.bound:
+        trace.trace_id = trace_id
+        trace.bound = True
+
+
+def set_attribute(key: str, value: Any) -> None:
+    """Atributo en el span abierto más interno."""
+    trace = _current()
+    if trace is not None and trace.stack:
+        trace.stack[-1]['attributes'][key] = value
+
+
+@contextmanager
+def span(name: str, trace_id: Optional[str] = None, kind: int = KIND_INTERNAL, **attributes) -> Iterator[None]:
+    """
+    Mide un tramo. Sin traza en curso abre una nueva (raíz); con ``trace_id``
+    asocia la traza en curso a esa compra.
+    """
+    trace = _current()
+    root = trace is None
+    if root:
+        trace = _context.trace = Trace(trace_id)
+    else:
+        bind_trace(trace_id)
+
+    record = {
+        'spanId': secrets.token_hex(8),
+        'parentSpanId': trace.stack[-1]['spanId'] if trace.stack else '',
+        'name': name,
+        'kind': kind,
+        'startTimeUnixNano': time.time_ns(),
+        'attributes': {key: value for key, value in attributes.items() if value is not None},
+        'status': {'code': STATUS_OK},
+    }
+    trace.stack.append(record)
+    try:
+        yield
+    except Exception as e:
+        record['status'] = {'code': STATUS_ERROR, 'message': f"{type(e).__name__}: {e}"[:200]}
+        raise
+    finally:
+        record['endTimeUnixNano'] = time.time_ns()
+        trace.stack.pop()
+        trace.spans.append(record)
+        if root:
+            _context.trace = None
+            if TRACING_ENABLED:
+                exporter.submit(trace)
+
+
+def traced(name: str):
+    """Decorador de vistas: span raíz del request con método y status."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            with span(name, kind=KIND_SERVER, **{'http.method': request.method, 'http.route': request.path}):
+                response = view(request, *args, **kwargs)
+                set_attribute('http.status_code', response.status_code)
+                trace_id = current_trace_id()
+                if trace_id:
+                    response['X-Trace-Id'] = trace_id
+                return response
+        return wrapper
+    return decorator
+
+
+# =============================================================================
+# EXPORT (OTLP/JSON)
+# =============================================================================
+
+def _otlp_value(value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def to_otlp(traces: list[Trace]) -> dict[str, Any]:
+    """ExportTraceServiceRequest en JSON (OTLP) con los spans de ``traces``."""
+    spans = []
+    for trace in traces:
+        for record in trace.spans:
+            spans.append({
+                **record,
+                'traceId': trace.trace_id,
+                'startTimeUnixNano': str(record['startTimeUnixNano']),
+                'endTimeUnixNano': str(record['endTimeUnixNano']),
+                'attributes': [{'key': key, 'value': _otlp_value(value)} for key, value in record['attributes'].items()],
+            })
+    return {
+        'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': OTEL_SERVICE_NAME}}]},
+            'scopeSpans': [{'scope': {'name': 'payments.tracing'}, 'spans': spans}],
+        }]
+    }
+
+
+class SpanExporter:
+    """Exporta trazas terminadas en lotes desde un thread (nunca bloquea el request)."""
+
+    def __init__(self):
+        self._queue: queue.Queue[Trace] = queue.Queue(maxsize=EXPORT_QUEUE_MAX)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._file: Optional[Path] = None
+
+    def submit(self, trace: Trace) -> None:
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            logger.warning("[TRACE] Cola de export llena, se descarta una traza")
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._file = default_export_file()
+                    self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+                    self._thread.start()
+
+    def flush(self) -> None:
+        """Exporta lo pendiente en el thread actual (comandos, tests)."""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._export(batch)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + EXPORT_INTERVAL_SECONDS
+            while len(batch) < EXPORT_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._export(batch)
+
+    def _export(self, batch: list[Trace]) -> None:
+        payload = json.dumps(to_otlp(batch), ensure_ascii=False)
+        if self._file is not None:
+            try:
+                self._file.parent.mkdir(parents=True, exist_ok=True)
+                if rotate_export_file(self._file):
+                    logger.info(f"[TRACE] {self._file} rotado (más de {TRACE_EXPORT_MAX_BYTES} bytes)")
+                with open(self._file, 'a', encoding='utf-8') as f:
+                    f.write(payload + '\n')
+            except OSError:
+                logger.exception(f"[TRACE] No se pudo escribir {self._file}")
+        if OTEL_EXPORTER_OTLP_ENDPOINT:
+            request = urllib.request.Request(
+                f"{OTEL_EXPORTER_OTLP_ENDPOINT}/v1/traces",
+                data=payload.encode('utf-8'),
+                headers={'Content-Type': 'application/json'},
+                method='POST',
+            )
+            try:
+                urllib.request.urlopen(request, timeout=5).close()
+            except Exception as e:
+                logger.warning(f"[TRACE] Collector no disponible ({OTEL_EXPORTER_OTLP_ENDPOINT}): {e}")
+
+
+exporter = SpanExporter()
+
+
+def load_spans(path: Path, trace_id: str) -> list[dict[str, Any]]:
+    """
+    Spans de ``trace_id`` en un archivo de export y sus rotados
+    (``path.1``, ``path.2``...), ordenados por inicio.
+    """
+    spans = []
+    index = 1
+    paths = [path]
+    while rotated_file(path, index).exists():
+        paths.append(rotated_file(path, index))
+        index += 1
+    for current in paths:
+        if not current.exists():
+            continue
+        with open(current, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    batch = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                for resource in batch.get('resourceSpans', []):
+                    for scope in resource.get('scopeSpans', []):
+                        spans.extend(s for s in scope.get('spans', []) if s.get('traceId') == trace_id)
+    return sorted(spans, key=lambda s: int(s['startTimeUnixNano']))
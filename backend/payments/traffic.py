@@ -0,0 +1,465 @@
+"""
+Captura y replay de tráfico de pagos - Datos con Alex
+======================================================
+Para reproducir offline tormentas de webhooks y carreras entre
+``pago_exitoso`` (/validate/) y ``webhook`` (/webhook/).
+
+CAPTURA (opt-in, TRAFFIC_CAPTURE_ENABLED=True):
+- TrafficCaptureMiddleware graba cada request a /webhook/ y /validate/
+  (método, query, headers relevantes, body, status, duración y respuesta)
+  como una línea JSON en TRAFFIC_CAPTURE_FILE.
+- RecordingSDK envuelve al SDK de MP y guarda, junto al request, las
+  respuestas de ``payment().get()`` (con su latencia): son las que después
+  sirve el stand-in.
+- Los datos personales (emails, nombres, documentos, teléfonos...) se
+  reemplazan por seudónimos deterministas (HMAC con SECRET_KEY): el mismo
+  comprador mantiene el mismo seudónimo en toda la captura.
+
+REPLAY (``python manage.py replay_traffic``):
+- RecordedMercadoPago: stand-in del SDK que responde con lo grabado
+- replay(): reenvía los requests respetando los intervalos originales
+  (1x, Nx o a máxima velocidad) con un pool de threads, así los requests
+  que se solapaban en producción se vuelven a solapar
+- summarize(): distribución de latencias por endpoint y entregas
+  duplicadas (más de un email por pago)
+
+CONFIGURACIÓN:
+- TRAFFIC_CAPTURE_ENABLED: "True" para grabar (default False)
+- TRAFFIC_CAPTURE_FILE: archivo JSONL (default backend/data/traffic/capture.jsonl)
+- MP_STANDIN_CAPTURE: capturas (separadas por coma) para que una instancia
+  local con DEBUG=True use el stand-in en vez de MP (replay con --target)
+======================================================
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional
+from urllib.parse import parse_qsl, urlencode
+
+from django.core.exceptions import MiddlewareNotUsed
+
+logger = logging.getLogger(__name__)
+
+TRAFFIC_CAPTURE_ENABLED = os.getenv('TRAFFIC_CAPTURE_ENABLED', 'False').lower() == 'true'
+
+# Endpoints que se graban (por sufijo del path)
+CAPTURED_PATHS = ('/webhook/', '/validate/')
+
+# Headers que se conservan (el resto puede traer cookies, IPs, tokens)
+CAPTURED_HEADERS = ('content-type', 'user-agent', 'x-signature', 'x-request-id')
+
+# Claves con datos personales: el valor (o todo el sub-objeto) se seudonimiza
+PII_KEYS = {
+    'email', 'customer_email', 'first_name', 'last_name', 'customer_first_name',
+    'customer_last_name', 'name', 'surname', 'document', 'identification',
+    'phone', 'address', 'cardholder', 'ip_address', 'to',
+}
+
+CAPTURE_VERSION = 1
+
+
+# =============================================================================
+# SCRUBBING DE DATOS PERSONALES
+# =============================================================================
+
+def _pseudonym_key() -> bytes:
+    from django.conf import settings
+    return settings.SECRET_KEY.encode('utf-8')
+
+
+def pseudonymize(value: Any) -> Any:
+    """Reemplazo determinista de un dato personal (conserva la forma de los emails)."""
+    if value is None or value == '':
+        return value
+    digest = hmac.new(_pseudonym_key(), str(value).lower().encode('utf-8'), hashlib.sha256).hexdigest()[:12]
+    if isinstance(value, str) and '@' in value:
+        return f"buyer-{digest}@example.com"
+    if isinstance(value, (int, float)) or (isinstance(value, str) and value.isdigit()):
+        return str(int(digest, 16))[:8]
+    return f"anon-{digest}"
+
+
+def scrub(value: Any, sensitive: bool = False) -> Any:
+    """Copia de ``value`` con los datos personales seudonimizados."""
+    if isinstance(value, dict):
+        return {key: scrub(item, sensitive or key in PII_KEYS) for key, item in value.items()}
+    if isinstance(value, list):
+        return [scrub(item, sensitive) for item in value]
+    if sensitive and not isinstance(value, bool):
+        return pseudonymize(value)
+    return value
+
+
+def scrub_query(query_string: str) -> str:
+    pairs = parse_qsl(query_string, keep_blank_values=True)
+    return urlencode([(key, pseudonymize(value) if key in PII_KEYS else value) for key, value in pairs])
+
+
+def _scrub_body(raw: bytes) -> str:
+    text = raw.decode('utf-8', errors='replace')
+    try:
+        return json.dumps(scrub(json.loads(text)), ensure_ascii=False)
+    except ValueError:
+        return text if not text.strip() else scrub_query(text)
+
+
+# =============================================================================
+# CAPTURA
+# =============================================================================
+
+# Llamadas a MP del request en curso (las completa RecordingSDK)
+_context = threading.local()
+
+
+def default_capture_file() -> Path:
+    configured = os.getenv('TRAFFIC_CAPTURE_FILE')
+    if configured:
+        return Path(configured)
+    from django.conf import settings
+    return Path(settings.BASE_DIR) / 'data' / 'traffic' / 'capture.jsonl'
+
+
+class CaptureWriter:
+    """Agrega capturas (una línea JSON) con O_APPEND: seguro entre workers."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def write(self, record: dict[str, Any]) -> None:
+        line = (json.dumps(record, ensure_ascii=False, default=str) + '\n').encode('utf-8')
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+class _RecordingPayment:
+    def __init__(self, inner):
+        self._inner = inner
+
+    def get(self, payment_id, *args, **kwargs):
+        started = time.perf_counter()
+        response = self._inner.get(payment_id, *args, **kwargs)
+        calls = getattr(_context, 'mp_calls', None)
+        if calls is not None:
+            calls.append({
+                'op': 'payment.get',
+                'id': str(payment_id),
+                'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+                'response': scrub(response),
+            })
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._inner, name)
+
+
+class RecordingSDK:
+    """Proxy del SDK de MP que graba las respuestas de ``payment().get()``."""
+
+    def __init__(self, sdk):
+        self._sdk = sdk
+
+    def payment(self):
+        return _RecordingPayment(self._sdk.payment())
+
+    def __getattr__(self, name):
+        return getattr(self._sdk, name)
+
+
+class TrafficCaptureMiddleware:
+    """Graba los requests a /webhook/ y /validate/ (solo si TRAFFIC_CAPTURE_ENABLED)."""
+
+    def __init__(self, get_response):
+        if not TRAFFIC_CAPTURE_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.writer = CaptureWriter(default_capture_file())
+        logger.warning(f"[TRAFFIC] Captura activa en {self.writer.path}")
+
+    def __call__(self, request):
+        if not request.path.endswith(CAPTURED_PATHS):
+            return self.get_response(request)
+
+        body = request.body  # leerlo antes que la vista (queda cacheado)
+        started_at = time.time()
+        started = time.perf_counter()
+        _context.mp_calls = []
+        try:
+            response = self.get_response(request)
+        finally:
+            mp_calls, _context.mp_calls = _context.mp_calls, None
+        duration_ms = (time.perf_counter() - started) * 1000
+
+        try:
+            self.writer.write({
+                'v': CAPTURE_VERSION,
+                't': started_at,
+                'endpoint': 'webhook' if request.path.endswith('/webhook/') else 'validate',
+                'method': request.method,
+                'path': request.path,
+                'query': scrub_query(request.META.get('QUERY_STRING', '')),
+                'headers': {
+                    name: request.headers[name] for name in CAPTURED_HEADERS if name in request.headers
+                },
+                'body': _scrub_body(body),
+                'status': response.status_code,
+                'duration_ms': round(duration_ms, 2),
+                'response': _response_json(response),
+                'mp_calls': mp_calls,
+            })
+        except Exception:
+            logger.exception("[TRAFFIC] No se pudo grabar el request")
+        return response
+
+
+def _response_json(response) -> Optional[dict[str, Any]]:
+    if getattr(response, 'streaming', False) or 'json' not in response.get('Content-Type', ''):
+        return None
+    try:
+        return scrub(json.loads(response.content))
+    except ValueError:
+        return None
+
+
+def wrap_sdk(sdk):
+    """
+    SDK a usar en las vistas: con captura activa, el proxy que graba; con
+    MP_STANDIN_CAPTURE (solo DEBUG), el stand-in; si no, el SDK real.
+    """
+    if TRAFFIC_CAPTURE_ENABLED:
+        return RecordingSDK(sdk)
+    standin = os.getenv('MP_STANDIN_CAPTURE', '')
+    if standin:
+        if os.getenv('DEBUG', 'False').lower() != 'true':
+            logger.error("[TRAFFIC] MP_STANDIN_CAPTURE ignorado: solo se permite con DEBUG=True")
+            return sdk
+        logger.warning(f"[TRAFFIC] Usando stand-in de MP grabado: {standin}")
+        return RecordedMercadoPago(load_captures(standin.split(',')))
+    return sdk
+
+
+# =============================================================================
+# REPLAY
+# =============================================================================
+
+def load_captures(paths: Iterable[str | Path]) -> list[dict[str, Any]]:
+    """Lee una o más capturas y las ordena por momento de llegada."""
+    captures: list[dict[str, Any]] = []
+    for path in paths:
+        with open(path, encoding='utf-8') as capture_file:
+            for number, line in enumerate(capture_file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    captures.append(json.loads(line))
+                except ValueError:
+                    logger.warning(f"[TRAFFIC] Línea {number} inválida en {path}, se ignora")
+    captures.sort(key=lambda capture: capture.get('t', 0))
+    return captures
+
+
+class RecordedMercadoPago:
+    """
+    Stand-in del SDK de MP para el replay: ``payment().get(id)`` devuelve,
+    en orden, las respuestas grabadas para ese pago (la última se repite),
+    con la misma latencia que tuvo MP (``latency_scale=0`` para no esperar).
+    """
+
+    def __init__(self, captures: Iterable[dict[str, Any]], latency_scale: float = 1.0):
+        self.latency_scale = latency_scale
+        self._responses: dict[str, list[dict[str, Any]]] = defaultdict(list)
+        self._cursor: Counter[str] = Counter()
+        self._lock = threading.Lock()
+        for capture in captures:
+            for call in capture.get('mp_calls') or []:
+                if call.get('op') == 'payment.get':
+                    self._responses[call['id']].append(call)
+
+    def payment(self):
+        return _StandInPayment(self)
+
+    def _next(self, payment_id: str) -> dict[str, Any]:
+        with self._lock:
+            calls = self._responses.get(payment_id)
+            if not calls:
+                return {'status': 404, 'response': {'message': f'payment {payment_id} no grabado'}}
+            call = calls[min(self._cursor[payment_id], len(calls) - 1)]
+            self._cursor[payment_id] += 1
+        if self.latency_scale:
+            time.sleep(call.get('duration_ms', 0) / 1000 * self.latency_scale)
+        return call['response']
+
+
+class _StandInPayment:
+    def __init__(self, standin: RecordedMercadoPago):
+        self._standin = standin
+
+    def get(self, payment_id, *args, **kwargs):
+        return self._standin._next(str(payment_id))
+
+
+def capture_payment_id(capture: dict[str, Any]) -> Optional[str]:
+    """payment_id al que se refiere un request grabado."""
+    query = dict(parse_qsl(capture.get('query', '')))
+    if capture.get('endpoint') == 'validate':
+        return query.get('payment_id') or query.get('collection_id')
+    try:
+        body = json.loads(capture.get('body') or '{}')
+    except ValueError:
+        body = {}
+    payment_id = (body.get('data') or {}).get('id') if isinstance(body, dict) else None
+    payment_id = payment_id or query.get('data.id') or query.get('id')
+    return str(payment_id) if payment_id else None
+
+
+def _is_delivery(response: Optional[dict[str, Any]]) -> bool:
+    return bool(response and response.get('email_sent'))
+
+
+def schedule_offsets(captures: list[dict[str, Any]], speed: float, max_gap: Optional[float] = None) -> list[float]:
+    """
+    Segundos desde el inicio en que se envía cada request. ``speed=0`` es
+    máxima velocidad; ``max_gap`` recorta los silencios largos de la captura.
+    """
+    offsets: list[float] = []
+    elapsed = 0.0
+    previous = captures[0].get('t', 0) if captures else 0
+    for capture in captures:
+        gap = max(0.0, capture.get('t', 0) - previous)
+        previous = capture.get('t', 0)
+        if max_gap is not None:
+            gap = min(gap, max_gap)
+        elapsed += gap / speed if speed else 0.0
+        offsets.append(elapsed)
+    return offsets
+
+
+def replay(
+    captures: list[dict[str, Any]],
+    send: Callable[[dict[str, Any]], tuple[int, Optional[dict[str, Any]]]],
+    speed: float = 1.0,
+    workers: int = 8,
+    max_gap: Optional[float] = None,
+) -> list[dict[str, Any]]:
+    """
+    Reenvía las capturas con ``send(capture) -> (status, respuesta_json)``
+    respetando los intervalos originales divididos por ``speed``.
+    """
+    offsets = schedule_offsets(captures, speed, max_gap)
+    results: list[Optional[dict[str, Any]]] = [None] * len(captures)
+
+    def run(index: int, scheduled: float, started_at: float) -> None:
+        capture = captures[index]
+        lag_ms = (time.perf_counter() - started_at - scheduled) * 1000
+        started = time.perf_counter()
+        try:
+            status, response = send(capture)
+        except Exception as e:
+            logger.exception("[TRAFFIC] Error reenviando request")
+            status, response = 0, {'error': str(e)}
+        results[index] = {
+            'endpoint': capture.get('endpoint'),
+            'payment_id': capture_payment_id(capture),
+            'status': status,
+            'recorded_status': capture.get('status'),
+            'latency_ms': (time.perf_counter() - started) * 1000,
+            'recorded_ms': capture.get('duration_ms'),
+            'lag_ms': max(0.0, lag_ms),
+            'outcome': (response or {}).get('status'),
+            'recorded_outcome': (capture.get('response') or {}).get('status'),
+            'delivered': _is_delivery(response),
+            'recorded_delivered': _is_delivery(capture.get('response')),
+        }
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='replay') as pool:
+        started_at = time.perf_counter()
+        for index, scheduled in enumerate(offsets):
+            delay = started_at + scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(run, index, scheduled, started_at)
+
+    return [result for result in results if result is not None]
+
+
+def _percentile(values: list[float], percent: float) -> float:
+    """Percentil por rango más cercano (``values`` ordenado)."""
+    if not values:
+        return 0.0
+    rank = max(1, int(round(percent / 100 * len(values))))
+    return values[min(rank, len(values)) - 1]
+
+
+def _latency_stats(values: Iterable[Optional[float]]) -> dict[str, float]:
+    ordered = sorted(value for value in values if value is not None)
+    return {
+        'p50': round(_percentile(ordered, 50), 2),
+        'p90': round(_percentile(ordered, 90), 2),
+        'p99': round(_percentile(ordered, 99), 2),
+        'max': round(ordered[-1], 2) if ordered else 0.0,
+    }
+
+
+def _duplicates(results: list[dict[str, Any]], field: str) -> dict[str, int]:
+    deliveries = Counter(result['payment_id'] for result in results if result[field] and result['payment_id'])
+    return {payment_id: count for payment_id, count in deliveries.items() if count > 1}
+
+
+def summarize(results: list[dict[str, Any]], elapsed: float) -> dict[str, Any]:
+    """Latencias por endpoint, diferencias con lo grabado y entregas duplicadas."""
+    endpoints: dict[str, Any] = {}
+    by_endpoint: dict[str, list[dict[str, Any]]] = defaultdict(list)
+    for result in results:
+        by_endpoint[result['endpoint']].append(result)
+
+    for endpoint, items in sorted(by_endpoint.items()):
+        endpoints[endpoint] = {
+            'requests': len(items),
+            'latency_ms': _latency_stats(item['latency_ms'] for item in items),
+            'recorded_latency_ms': _latency_stats(item['recorded_ms'] for item in items),
+            'statuses': dict(Counter(str(item['status']) for item in items)),
+            'outcomes': dict(Counter(str(item['outcome']) for item in items)),
+            'status_mismatches': sum(1 for item in items if item['status'] != item['recorded_status']),
+            'outcome_mismatches': sum(1 for item in items if item['outcome'] != item['recorded_outcome']),
+        }
+
+    duplicates = _duplicates(results, 'delivered')
+    recorded_duplicates = _duplicates(results, 'recorded_delivered')
+    return {
+        'requests': len(results),
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_rps': round(len(results) / elapsed, 1) if elapsed else 0.0,
+        'schedule_lag_ms': _latency_stats(result['lag_ms'] for result in results),
+        'endpoints': endpoints,
+        'deliveries': sum(1 for result in results if result['delivered']),
+        'duplicate_deliveries': sum(count - 1 for count in duplicates.values()),
+        'duplicate_payments': sorted(duplicates),
+        'recorded_deliveries': sum(1 for result in results if result['recorded_delivered']),
+        'recorded_duplicate_deliveries': sum(count - 1 for count in recorded_duplicates.values()),
+    }
+
+
+def simulated_send_product_email(order: Any, **kwargs: Any) -> bool:
+    """
+    Reemplazo de send_product_email para el replay: genera los adjuntos
+    (mismo costo de CPU que una entrega real) pero no envía nada por SMTP.
+    """
+    from .services import get_order_files
+    from .watermark import render_personalized_files
+
+    buyer_name = f"{getattr(order, 'first_name', '')} {getattr(order, 'last_name', '') or ''}".strip()
+    render_personalized_files(get_order_files(getattr(order, 'course_id', '')), buyer_name, str(getattr(order, 'id', '')))
+    return True
@@ -7,6 +7,7 @@ Datos con Alex - Sistema de Pagos
 from django.urls import path
 from . import views
 from . import views_debug
+from . import views_admin
 
 app_name = 'payments'
 
@@ -27,10 +28,58 @@ urlpatterns = [
     # Recibe notificaciones de Mercado Pago (backup)
     path('webhook/', views.webhook, name='webhook'),
     
+    # GET /api/payments/status-stream/?payment_id=xxx | ?external_reference=xxx
+    # Estado del pago en vivo (Server-Sent Events) para pago exitoso/pendiente
+    path('status-stream/', views.payment_status_stream, name='payment_status_stream'),
+    
+    # POST /api/payments/resend/  {"email": "...", "reference": "..."}
+    # Reenvío de archivos pedido por el comprador (limitado por IP y orden)
+    path('resend/', views.resend_files, name='resend_files'),
+    
+    # GET /api/payments/previews/?product_id=xxx
+    # Hojas, encabezados y miniaturas de las planillas (precalculado)
+    path('previews/', views.workbook_preview, name='workbook_preview'),
+    
+    # GET /api/payments/previews/files/<sha>.json | <sha>-<n>.svg
+    # Artefactos de vista previa (Cache-Control immutable)
+    path('previews/files/<str:name>', views.workbook_preview_file, name='workbook_preview_file'),
+    
+    # GET /api/payments/checkout-options/?amount=4900
+    # Medios de pago y cuotas para el checkout (cache, sin llamar a MP)
+    path('checkout-options/', views.payment_options, name='payment_options'),
+    
     # GET /api/payments/download/<order_id>/
     # Legacy - ya no funciona (archivos van por email)
     path('download/<int:order_id>/', views.download_file, name='download_file'),
     
+    # ==========================================================================
+    # ENDPOINTS INTERNOS (requieren ADMIN_API_TOKEN)
+    # ==========================================================================
+    
+    # GET /api/payments/dashboard/sales/?from=YYYY-MM-DD&to=YYYY-MM-DD
+    # Ingresos, órdenes y conversión desde los rollups (con ETag)
+    path('dashboard/sales/', views_admin.sales_dashboard, name='sales_dashboard'),
+    
+    # GET /api/payments/export/orders/?format=csv|xlsx&from=&to=&course_id=
+    # Historial de órdenes como descarga (streaming)
+    path('export/orders/', views_admin.export_orders, name='export_orders'),
+    
+    # GET /api/payments/export/events/?format=csv|xlsx&from=&to=
+    # Eventos de pago del event store como descarga
+    path('export/events/', views_admin.export_events, name='export_events'),
+    
+    # GET /api/payments/events/?payment_id=xxx | ?external_reference=xxx
+    # Historia completa de un pago (event store indexado)
+    path('events/', views_admin.payment_timeline, name='payment_timeline'),
+    
+    # GET /api/payments/orders/search/?q=juan+perez&status=approved
+    # Búsqueda de órdenes por comprador, email, DNI o IDs (FTS5 / trigramas)
+    path('orders/search/', views_admin.search_orders, name='search_orders'),
+    
+    # POST /api/payments/bulk-preferences/?workers=8&rate=10&campaign=xxx
+    # Links de pago masivos desde CSV/JSON (respuesta NDJSON en streaming)
+    path('bulk-preferences/', views_admin.bulk_preferences, name='bulk_preferences'),
+    
     # ==========================================================================
     # ENDPOINTS DE DIAGNÓSTICO
     # ==========================================================================
@@ -7,12 +7,20 @@ Este módulo maneja:
 1. create_preference - Crea preferencias de pago con metadata del cliente
 2. pago_exitoso - Valida pagos por redirección y envía emails
 3. webhook - FUENTE DE VERDAD para notificaciones de Mercado Pago (backup)
-
-ARQUITECTURA STATELESS:
-- No usamos base de datos para órdenes
-- Los datos del cliente viajan en la metadata de Mercado Pago
+4. payment_status_stream - Estado del pago en vivo (SSE) sin consultar a MP
+5. resend_files - Reenvío de archivos pedido por el comprador
+6. workbook_preview - Vista previa precalculada de las planillas (previews.py)
+7. payment_options - Medios de pago y cuotas para el checkout (checkout_options.py)
+
+ARQUITECTURA:
+- Los datos del cliente viajan en la metadata de Mercado Pago (fuente para la entrega)
+- Las órdenes se registran en base de datos para métricas y soporte (orders.py)
 - El webhook actúa como backup si pago_exitoso falla
 
+VARIAS TIENDAS: cada request corre como la tienda que resolvió
+TenantMiddleware (tenants.py): su SDK de MP, su FRONTEND_URL, su clave de
+webhooks y su remitente. Las variables de abajo son las de la tienda default.
+
 IMPORTANTE PARA PRODUCCIÓN:
 - MP_ACCESS_TOKEN debe ser APP_USR-xxxx (no TEST-xxxx)
 - FRONTEND_URL debe apuntar al dominio de Vercel
@@ -20,21 +28,38 @@ IMPORTANTE PARA PRODUCCIÓN:
 =============================================================================
 """
 
+import hashlib
 import json
 import os
-import time
-import hashlib
-import hmac
 from types import SimpleNamespace
 from pathlib import Path
-from django.http import JsonResponse, FileResponse
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 import mercadopago
 from dotenv import load_dotenv
 
 import logging
-from .services import send_product_email
+from .services import product_catalog, send_product_email
+from .deliveries import client_ip, payment_delivered, resend_order_files
+from .orders import apply_payment_status, record_preference
+from .event_store import record_event
+from .cart import cart_course_id, cart_title, cart_total
+from .preferences import build_preference_data, new_order_reference, parse_checkout
+from .webhook_security import (
+    ReplayCache,
+    data_id_matches,
+    notified_data_id,
+    parse_signature_header,
+    verify_mp_signature,
+)
+from .traffic import wrap_sdk
+from .status_stream import SlotStream, iter_status_events, stream_slots
+from .checkout_options import CHECKOUT_OPTIONS_ENABLED, checkout_options, parse_amount
+from .previews import PREVIEW_CACHE_CONTROL, get_preview_store, product_previews
+from .tenants import current_tenant, get_registry, sdk_for
+from .tracing import KIND_CLIENT, bind_trace, current_trace_id, span, trace_id_for, trace_id_for_payment, traced
 
 logger = logging.getLogger(__name__)
 
@@ -45,9 +70,10 @@ logger = logging.getLogger(__name__)
 BACKEND_DIR = Path(__file__).resolve().parent.parent
 load_dotenv(BACKEND_DIR / '.env')
 
-# Inicializar SDK de Mercado Pago
+# Inicializar SDK de Mercado Pago (tienda default; las demás: tenant_sdk)
+# (con TRAFFIC_CAPTURE_ENABLED se graban sus respuestas, ver traffic.py)
 MP_ACCESS_TOKEN = os.getenv('MP_ACCESS_TOKEN', '')
-sdk = mercadopago.SDK(MP_ACCESS_TOKEN)
+sdk = wrap_sdk(mercadopago.SDK(MP_ACCESS_TOKEN))
 
 # URL del frontend para redirecciones (Railway/Vercel)
 FRONTEND_URL = os.getenv('FRONTEND_URL', 'http://localhost:5173')
@@ -55,25 +81,73 @@ FRONTEND_URL = os.getenv('FRONTEND_URL', 'http://localhost:5173')
 # Modo debug (desactivar en producción)
 DEBUG_MODE = os.getenv('DEBUG', 'False').lower() == 'true'
 
-# Cache simple en memoria para evitar envío duplicado de emails
-# En producción real, usar Redis o similar
+# Cache en memoria para evitar envío duplicado de emails; lo que no está
+# acá se consulta en la base (already_processed), así un worker recién
+# reiniciado no reenvía lo ya entregado
 _processed_payments = set()
 
+# Firma de webhooks (Tus integraciones > Webhooks > Clave secreta)
+# Si no está configurada, las notificaciones se aceptan sin verificar
+MP_WEBHOOK_SECRET = os.getenv('MP_WEBHOOK_SECRET', '')
+MP_WEBHOOK_TOLERANCE_SECONDS = int(os.getenv('MP_WEBHOOK_TOLERANCE_SECONDS', '300'))
+
+# Notificaciones ya vistas (x-request-id, ts) para descartar reenvíos
+_webhook_replay_cache = ReplayCache(max_size=int(os.getenv('MP_WEBHOOK_REPLAY_CACHE_SIZE', '10000')))
+
+
+def already_processed(payment_id: str) -> bool:
+    """True si el pago ya se entregó (en este proceso o según la base)."""
+    if payment_id in _processed_payments:
+        return True
+    if payment_delivered(payment_id):
+        _processed_payments.add(payment_id)
+        return True
+    return False
+
+
+def tenant_sdk(tenant=None):
+    """SDK de MP de la tienda (en curso por defecto), reutilizado entre requests."""
+    tenant = tenant or current_tenant()
+    return sdk if tenant.is_default else sdk_for(tenant)
+
+
+def tenant_frontend_url(tenant=None) -> str:
+    tenant = tenant or current_tenant()
+    return FRONTEND_URL if tenant.is_default else tenant.frontend_url
+
+
+def tenant_webhook_secret(tenant=None) -> str:
+    tenant = tenant or current_tenant()
+    return MP_WEBHOOK_SECRET if tenant.is_default else tenant.mp_webhook_secret
+
 
 def is_production_token():
-    """Verifica si estamos usando credenciales de producción."""
-    return MP_ACCESS_TOKEN.startswith('APP_USR-')
+    """Verifica si estamos usando credenciales de producción (de la tienda en curso)."""
+    tenant = current_tenant()
+    return MP_ACCESS_TOKEN.startswith('APP_USR-') if tenant.is_default else tenant.is_production
 
 
 def log_payment_event(event_type: str, payment_id: str, details: dict):
-    """Log estructurado para monitoreo en Railway."""
+    """
+    Log estructurado para monitoreo en Railway.
+    También se persiste en el event store (consultable por payment_id o
+    external_reference después de un redeploy).
+    """
+    tenant = current_tenant()
     log_data = {
         "event": event_type,
         "payment_id": payment_id,
         "production": is_production_token(),
         **details
     }
+    if not tenant.is_default:
+        log_data.setdefault("tenant", tenant.id)
+    # Correlation id de la compra (ver tracing.py)
+    trace_id = current_trace_id()
+    if trace_id and "trace_id" not in log_data:
+        log_data["trace_id"] = trace_id
     logger.info(f"[PAYMENT_EVENT] {json.dumps(log_data)}")
+    record_event(log_data)
 
 
 # =============================================================================
@@ -82,12 +156,13 @@ def log_payment_event(event_type: str, payment_id: str, details: dict):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@traced("create_preference")
 def create_preference(request):
     """
     Crea un ID de preferencia en Mercado Pago.
     
-    STATELESS: Los datos del cliente se guardan en 'metadata' de MP,
-    no en base de datos local.
+    Los datos del cliente viajan en 'metadata' de MP (fuente para la entrega)
+    y la orden se registra en base de datos.
     
     Request Body:
     {
@@ -101,101 +176,66 @@ def create_preference(request):
         "quantity": 1
     }
     
+    Carrito (varios productos, UNA preferencia y UN email), en lugar de
+    course_id/title/price/quantity:
+    {
+        ...datos del cliente...,
+        "items": [
+            {"course_id": "pack-productividad", "title": "Pack", "price": 2500, "quantity": 1},
+            {"course_id": "tracker-habitos", "title": "Tracker", "price": 1000}
+        ]
+    }
+    
     Response:
     {
         "success": true,
         "init_point": "https://www.mercadopago.com.ar/checkout/...",
         "preference_id": "xxx-xxx-xxx",
-        "order_id": 1234567890
+        "order_id": "1234567890123456789"
     }
     """
     try:
         data = json.loads(request.body)
         
-        # Validar campos requeridos
-        first_name = data.get('first_name', '').strip()
-        last_name = data.get('last_name', '').strip()
-        document = data.get('document', '').strip()
-        email = data.get('email', '').strip().lower()
-        course_id = data.get('course_id', 'tracker-habitos')
-        title = data.get('title', 'Producto Digital')
-        price = float(data.get('price', 0))
-        quantity = int(data.get('quantity', 1))
-
-        # Validaciones básicas
-        if not all([first_name, last_name, email, price]):
-            return JsonResponse({
-                'success': False, 
-                'error': 'Faltan datos requeridos (nombre, apellido, email, precio)'
-            }, status=400)
-        
-        if '@' not in email or '.' not in email:
+        # Validar cliente y productos (carrito o un solo producto)
+        try:
+            customer, cart = parse_checkout(data, product_catalog(current_tenant()))
+        except ValueError as e:
             return JsonResponse({
                 'success': False, 
-                'error': 'Email inválido'
+                'error': str(e)
             }, status=400)
         
-        if price <= 0:
-            return JsonResponse({
-                'success': False, 
-                'error': 'El precio debe ser mayor a 0'
-            }, status=400)
-
-        # Generar ID de referencia (timestamp único)
-        temp_order_id = int(time.time() * 1000)  # Milisegundos para mayor unicidad
-
-        # Construir preferencia de Mercado Pago
-        preference_data = {
-            "items": [
-                {
-                    "id": course_id,
-                    "title": title,
-                    "currency_id": "ARS",
-                    "unit_price": price,
-                    "quantity": quantity,
-                    "description": f"Archivo Excel: {title}",
-                    "category_id": "learnings",
-                }
-            ],
-            "back_urls": {
-                "success": f"{FRONTEND_URL}/pago-exitoso",
-                "failure": f"{FRONTEND_URL}/pago-fallido",
-                "pending": f"{FRONTEND_URL}/pago-pendiente",
-            },
-            "auto_return": "approved",
-            "external_reference": str(temp_order_id),
-            "statement_descriptor": "DATOS CON ALEX",
-            "payer": {
-                "name": first_name,
-                "surname": last_name,
-                "email": email,
-                "identification": {
-                    "type": "DNI",
-                    "number": document.replace('.', '').replace('-', '').replace(' ', '')
-                }
-            },
-            # METADATA CRÍTICA - Aquí viajan los datos del cliente
-            "metadata": {
-                "customer_first_name": first_name,
-                "customer_last_name": last_name,
-                "customer_email": email,
-                "course_id": course_id,
-                "course_title": title,
-                "price": price,
-                "created_at": time.strftime("%Y-%m-%d %H:%M:%S")
-            }
-        }
+        course_id = cart_course_id(cart)
+        title = cart_title(cart)
+        price = cart_total(cart)
+        email = customer.email
+
+        # Generar ID de referencia (único entre workers, ordenado por tiempo)
+        temp_order_id = new_order_reference()
+        bind_trace(trace_id_for(temp_order_id))
+
+        # Construir preferencia de Mercado Pago (la tienda viaja en la metadata)
+        tenant = current_tenant()
+        frontend_url = tenant_frontend_url(tenant)
+        preference_data = build_preference_data(
+            customer, cart, str(temp_order_id), frontend_url,
+            extra_metadata=None if tenant.is_default else {"tenant": tenant.id},
+            statement_descriptor=tenant.statement_descriptor,
+        )
         
         # Log de inicio
         log_payment_event("PREFERENCE_CREATING", str(temp_order_id), {
+            "external_reference": str(temp_order_id),
             "email": email,
             "course": course_id,
             "price": price,
-            "frontend_url": FRONTEND_URL
+            "frontend_url": frontend_url
         })
         
         # Crear preferencia en MP
-        preference_response = sdk.preference().create(preference_data)
+        with span("mp.preference.create", kind=KIND_CLIENT, external_reference=str(temp_order_id)):
+            preference_response = tenant_sdk(tenant).preference().create(preference_data)
         preference = preference_response.get("response", {})
         
         if "id" not in preference:
@@ -207,9 +247,25 @@ def create_preference(request):
             }, status=500)
         
         log_payment_event("PREFERENCE_CREATED", str(temp_order_id), {
+            "external_reference": str(temp_order_id),
             "preference_id": preference.get('id'),
             "init_point": preference.get('init_point', '')[:50] + "..."
         })
+        
+        # Registrar la orden pendiente (no bloquea el checkout si falla)
+        with span("db.record_preference"):
+            record_preference(
+                external_reference=str(temp_order_id),
+                preference_id=preference.get('id'),
+                first_name=customer.first_name,
+                last_name=customer.last_name,
+                document=customer.document,
+                email=email,
+                course_id=course_id,
+                course_title=title,
+                price=price,
+                tenant=tenant.id,
+            )
             
         # Respuesta exitosa
         # PRODUCCIÓN: usamos init_point
@@ -217,7 +273,8 @@ def create_preference(request):
         response_data = {
             'success': True,
             'preference_id': preference.get('id'),
-            'order_id': temp_order_id
+            # String: 63 bits no entran en un Number de JavaScript
+            'order_id': str(temp_order_id)
         }
         
         if is_production_token():
@@ -244,6 +301,7 @@ def create_preference(request):
 
 @csrf_exempt
 @require_http_methods(["GET"])
+@traced("pago_exitoso")
 def pago_exitoso(request):
     """
     Valida el pago consultando a MP y envía el email.
@@ -271,6 +329,9 @@ def pago_exitoso(request):
                 'error': 'Falta payment_id en la URL'
             }, status=400)
         
+        # MP agrega external_reference a la back_url: la traza se conoce desde ya
+        bind_trace(trace_id_for(request.GET.get('external_reference')))
+        
         log_payment_event("VALIDATE_START", payment_id, {
             "source": "pago_exitoso",
             "params": dict(request.GET)
@@ -278,7 +339,8 @@ def pago_exitoso(request):
         
         # Consultar a Mercado Pago para obtener datos REALES del pago
         try:
-            payment_response = sdk.payment().get(payment_id)
+            with span("mp.payment.get", kind=KIND_CLIENT, payment_id=payment_id):
+                payment_response = tenant_sdk().payment().get(payment_id)
             
             if payment_response.get("status") != 200:
                 logger.error(f"[MP_ERROR] get payment {payment_id}: {payment_response}")
@@ -289,16 +351,21 @@ def pago_exitoso(request):
             
             payment_data = payment_response.get("response", {})
             status = payment_data.get("status")
+            bind_trace(trace_id_for_payment(payment_data))
             
             # Extraer metadata (MP convierte keys a snake_case)
             metadata = payment_data.get("metadata", {})
             
             log_payment_event("PAYMENT_DATA_RETRIEVED", payment_id, {
                 "status": status,
+                "external_reference": payment_data.get("external_reference"),
                 "amount": payment_data.get("transaction_amount"),
                 "metadata_keys": list(metadata.keys())
             })
             
+            with span("db.apply_payment_status", status=status):
+                apply_payment_status(payment_id, payment_data)
+            
         except Exception as e:
             logger.exception(f"[CRITICAL] Error recuperando pago {payment_id}")
             return JsonResponse({
@@ -309,7 +376,7 @@ def pago_exitoso(request):
         # Solo procesamos pagos APROBADOS
         if status == 'approved':
             # Verificar si ya procesamos este pago (evitar doble envío)
-            if payment_id in _processed_payments:
+            if already_processed(payment_id):
                 logger.info(f"[SKIP] Payment {payment_id} ya fue procesado")
                 return JsonResponse({
                     'success': True,
@@ -337,6 +404,7 @@ def pago_exitoso(request):
             fake_order = SimpleNamespace(
                 id=payment_data.get("external_reference", payment_id),
                 first_name=metadata.get("customer_first_name", "Cliente"),
+                last_name=metadata.get("customer_last_name", ""),
                 email=customer_email,
                 course_title=metadata.get("course_title", "Producto Digital"),
                 course_id=metadata.get("course_id", "tracker-habitos"),
@@ -350,7 +418,7 @@ def pago_exitoso(request):
             
             try:
                 logger.info(f"[EMAIL] Enviando a {fake_order.email} - Producto: {fake_order.course_id}")
-                email_sent = send_product_email(fake_order)
+                email_sent = send_product_email(fake_order, source='validate', payment_id=payment_id)
                 
                 if email_sent:
                     _processed_payments.add(payment_id)
@@ -377,8 +445,9 @@ def pago_exitoso(request):
                 'email_sent': email_sent,
                 'email_error': email_error,
                 'customer_email': customer_email[:3] + "***",  # Mostrar parcialmente por privacidad
+                'external_reference': payment_data.get("external_reference"),
                 'message': '¡Pago exitoso! Revisá tu email (y la carpeta de spam).' if email_sent 
-                          else '¡Pago exitoso! Hubo un problema enviando el email, contactanos a datos.conalex@gmail.com'
+                          else '¡Pago exitoso! Hubo un problema enviando el email. Podés pedir el reenvío desde esta página o escribirnos a datos.conalex@gmail.com'
             })
         
         elif status == 'pending':
@@ -407,6 +476,174 @@ def pago_exitoso(request):
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
 
 
+# =============================================================================
+# STATUS STREAM - Estado del pago en vivo (Server-Sent Events)
+# =============================================================================
+
+# Espera sugerida cuando el worker ya tiene el máximo de streams abiertos
+STATUS_STREAM_BUSY_RETRY_SECONDS = 5
+
+
+@require_http_methods(["GET"])
+def payment_status_stream(request):
+    """
+    Stream SSE con los cambios de estado de un pago.
+    
+    Query params: payment_id o external_reference
+    
+    Reemplaza el polling a /validate/: no consulta a Mercado Pago, solo
+    transmite lo que ya registraron el webhook y pago_exitoso. Termina con
+    un estado final (approved, rejected, ...) o por timeout; el navegador
+    (EventSource) reconecta automáticamente. Con el cupo de streams del
+    worker lleno responde 503 + Retry-After (ver status_stream.py).
+    """
+    payment_id = request.GET.get('payment_id') or request.GET.get('collection_id')
+    external_reference = request.GET.get('external_reference')
+    
+    if not payment_id and not external_reference:
+        return JsonResponse({'error': 'payment_id o external_reference requerido'}, status=400)
+    
+    # Cada stream retiene un thread: por encima del cupo, reintentar más tarde
+    if not stream_slots.acquire():
+        response = HttpResponse(f"retry: {STATUS_STREAM_BUSY_RETRY_SECONDS * 1000}\n\n",
+                                status=503, content_type='text/event-stream')
+        response['Retry-After'] = str(STATUS_STREAM_BUSY_RETRY_SECONDS)
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    response = StreamingHttpResponse(
+        SlotStream(iter_status_events(payment_id, external_reference)),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # sin buffering en proxies
+    return response
+
+
+# =============================================================================
+# VISTA PREVIA - Hojas, encabezados y miniaturas de cada planilla
+# =============================================================================
+
+@require_http_methods(["GET"])
+def workbook_preview(request):
+    """
+    Resumen de la vista previa de un producto: hojas, encabezados y URLs
+    de las miniaturas / muestra (artefactos con hash, ver previews.py).
+    GET /api/payments/previews/?product_id=tracker-habitos
+
+    No abre ningún .xlsx: si un archivo todavía no tiene vista previa queda
+    en ``pending`` y se genera en segundo plano.
+    """
+    product_id = (request.GET.get('product_id') or '').strip()
+    if not product_id:
+        return JsonResponse({'success': False, 'error': 'product_id requerido'}, status=400)
+
+    previews = product_previews(product_id)
+    if previews is None:
+        return JsonResponse({'success': False, 'error': 'Producto no encontrado'}, status=404)
+    return JsonResponse({'success': True, **previews})
+
+
+@require_http_methods(["GET"])
+def workbook_preview_file(request, name):
+    """
+    Artefacto de vista previa (JSON con la muestra o miniatura SVG).
+    GET /api/payments/previews/files/<sha>.json | <sha>-<hoja>.svg
+
+    El nombre lleva el hash del .xlsx: el contenido nunca cambia (immutable).
+    """
+    path = get_preview_store().artifact_path(name)
+    etag = f'"{name}"'
+    if path is None or not path.is_file():
+        return JsonResponse({'success': False, 'error': 'Vista previa no encontrada'}, status=404)
+
+    if etag in {tag.strip().removeprefix('W/') for tag in request.headers.get('If-None-Match', '').split(',')}:
+        response = HttpResponseNotModified()
+    else:
+        content_type = 'image/svg+xml' if name.endswith('.svg') else 'application/json'
+        response = HttpResponse(path.read_bytes(), content_type=content_type)
+    response['ETag'] = etag
+    response['Cache-Control'] = PREVIEW_CACHE_CONTROL
+    return response
+
+
+# =============================================================================
+# OPCIONES DE PAGO - Medios de pago y cuotas antes de ir a Mercado Pago
+# =============================================================================
+
+# Lo que el navegador puede reusar sin volver a preguntar (la respuesta
+# ya sale de un cache, ver checkout_options.py)
+PAYMENT_OPTIONS_CACHE_CONTROL = 'public, max-age=300, stale-while-revalidate=3600'
+
+
+@require_http_methods(["GET"])
+def payment_options(request):
+    """
+    Medios de pago de la tienda y planes de cuotas para el total del carrito.
+    GET /api/payments/checkout-options/?amount=4900
+
+    Nunca consulta a MP en el request: si todavía no hay datos para el monto
+    responde con ``pending: true`` (se piden en segundo plano) y el checkout
+    puede volver a preguntar en unos segundos. Un monto que no es precio del
+    catálogo (ni suma de precios ni total ya vendido) responde sin cuotas.
+    """
+    if not CHECKOUT_OPTIONS_ENABLED:
+        return JsonResponse({'success': False, 'error': 'Opciones de pago no disponibles'}, status=404)
+    try:
+        amount = parse_amount(request.GET.get('amount', ''))
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    options = checkout_options(current_tenant(), amount)
+    response = JsonResponse({'success': True, **options})
+    etag = '"%s"' % hashlib.sha1(response.content).hexdigest()[:20]
+    if etag in {tag.strip().removeprefix('W/') for tag in request.headers.get('If-None-Match', '').split(',')}:
+        response = HttpResponseNotModified()
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache' if options['pending'] else PAYMENT_OPTIONS_CACHE_CONTROL
+    if get_registry().multi_tenant:
+        # Cada tienda tiene su cuenta de MP: un cache compartido no debe mezclarlas
+        patch_vary_headers(response, ('X-Tenant', 'Origin'))
+    return response
+
+
+# =============================================================================
+# RESEND FILES - Reenvío pedido por el comprador
+# =============================================================================
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@traced("resend_files")
+def resend_files(request):
+    """
+    Reenvía los archivos de una compra aprobada al email de la orden.
+    
+    Request Body:
+    {
+        "email": "cliente@email.com",
+        "reference": "1739999999999"   (número de orden o de operación de MP)
+    }
+    
+    Limitado por IP, por email, por número de orden y por orden (ver
+    deliveries.py); responde 429 con Retry-After cuando se supera el límite.
+    """
+    try:
+        data = json.loads(request.body)
+    except (json.JSONDecodeError, ValueError):
+        return JsonResponse({'success': False, 'error': 'JSON inválido'}, status=400)
+    
+    status, payload = resend_order_files(data.get('email', ''), str(data.get('reference', '')), client_ip(request))
+    log_payment_event("RESEND_REQUESTED", "N/A", {
+        "external_reference": str(data.get('reference', ''))[:64],
+        "result": status
+    })
+    
+    response = JsonResponse(payload, status=status)
+    if status == 429:
+        response['Retry-After'] = str(payload['retry_after'])
+    return response
+
+
 # =============================================================================
 # DOWNLOAD FILE - Legacy endpoint
 # =============================================================================
@@ -423,12 +660,81 @@ def download_file(request, order_id):
     }, status=410)
 
 
+# =============================================================================
+# ENTREGA - Envío del producto para un pago aprobado
+# =============================================================================
+
+def deliver_approved_payment(payment_id: str, payment_data: dict, source: str) -> dict:
+    """
+    Envía el producto de un pago aprobado usando la metadata de MP.
+    
+    La usan el webhook y el watcher de pagos pendientes (pago_exitoso tiene
+    su propio flujo con mensajes para el usuario). Los eventos se loguean
+    como <source>_EMAIL_SUCCESS / _FAILED / _EXCEPTION.
+    
+    Returns:
+        {'email_sent': bool, 'reason': None | 'already_processed' |
+         'no_customer_email' | 'email_failed', 'error': str | None}
+    """
+    # Sin request en curso (watcher) abre su propia traza, la de la compra
+    with span("deliver_approved_payment", trace_id=trace_id_for_payment(payment_data), source=source.lower()):
+        return _deliver_approved_payment(payment_id, payment_data, source)
+
+
+def _deliver_approved_payment(payment_id: str, payment_data: dict, source: str) -> dict:
+    if already_processed(payment_id):
+        logger.info(f"[{source}] Payment {payment_id} ya procesado, skipping")
+        return {'email_sent': False, 'reason': 'already_processed', 'error': None}
+    
+    metadata = payment_data.get("metadata", {}) or {}
+    customer_email = metadata.get("customer_email", "")
+    
+    if not customer_email:
+        logger.error(f"[{source}] No email en metadata para {payment_id}")
+        return {'email_sent': False, 'reason': 'no_customer_email', 'error': None}
+    
+    # Construir orden para envío de email
+    fake_order = SimpleNamespace(
+        id=payment_data.get("external_reference", payment_id),
+        first_name=metadata.get("customer_first_name", "Cliente"),
+        last_name=metadata.get("customer_last_name", ""),
+        email=customer_email,
+        course_title=metadata.get("course_title", "Producto Digital"),
+        course_id=metadata.get("course_id", "tracker-habitos"),
+        price=metadata.get("price", payment_data.get("transaction_amount", 0)),
+        status=payment_data.get("status")
+    )
+    
+    try:
+        logger.info(f"[{source}] Enviando email a {customer_email} para payment {payment_id}")
+        email_sent = send_product_email(fake_order, source=source.lower(), payment_id=payment_id)
+    except Exception as e:
+        logger.exception(f"[{source}] Error enviando email para {payment_id}")
+        log_payment_event(f"{source}_EMAIL_EXCEPTION", payment_id, {
+            "error": str(e)
+        })
+        return {'email_sent': False, 'reason': 'email_failed', 'error': str(e)}
+    
+    if email_sent:
+        _processed_payments.add(payment_id)
+        log_payment_event(f"{source}_EMAIL_SUCCESS", payment_id, {
+            "to": customer_email,
+            "product": fake_order.course_id
+        })
+    else:
+        log_payment_event(f"{source}_EMAIL_FAILED", payment_id, {
+            "to": customer_email
+        })
+    return {'email_sent': email_sent, 'reason': None, 'error': None}
+
+
 # =============================================================================
 # WEBHOOK - Fuente de verdad y backup (Mercado Pago notifica aquí)
 # =============================================================================
 
 @csrf_exempt
 @require_http_methods(["POST", "GET"])
+@traced("webhook")
 def webhook(request):
     """
     Webhook de Mercado Pago - FUENTE DE VERDAD para notificaciones.
@@ -443,24 +749,62 @@ def webhook(request):
     - Se actualiza el estado de un pago
     - Se realiza una devolución
     
-    IMPORTANTE: Siempre responder 200 OK para que MP no reintente.
+    SEGURIDAD: Si MP_WEBHOOK_SECRET está configurado, se verifica el header
+    x-signature y se descartan reenvíos (x-request-id, ts) sin consultar a MP.
+    
+    IMPORTANTE: Siempre responder 200 OK para que MP no reintente
+    (salvo firmas inválidas, que responden 401).
     """
     # GET request = MP verificando que el webhook existe
     if request.method == 'GET':
         return JsonResponse({'status': 'webhook active', 'production': is_production_token()})
     
+    # Verificar firma y duplicados ANTES de parsear o consultar a MP
+    signature_header = request.headers.get('x-signature', '')
+    request_id = request.headers.get('x-request-id', '')
+    
+    try:
+        body = json.loads(request.body) if request.body else {}
+    except json.JSONDecodeError:
+        body = {}
+    if not isinstance(body, dict):
+        body = {}
+    
+    webhook_secret = tenant_webhook_secret()
+    if webhook_secret:
+        # MP firma con el data.id del query string (?data.id=xxx&type=payment);
+        # sin él la firma no cubre ningún pago
+        data_id = request.GET.get('data.id') or request.GET.get('id')
+        if not data_id:
+            logger.warning(f"[WEBHOOK] Notificación rechazada: missing_data_id (request-id={request_id or 'N/A'})")
+            return JsonResponse({'status': 'rejected', 'reason': 'missing_data_id'}, status=401)
+        is_valid, reason, ts = verify_mp_signature(
+            webhook_secret,
+            signature_header,
+            request_id,
+            data_id,
+            tolerance_seconds=MP_WEBHOOK_TOLERANCE_SECONDS,
+        )
+        if is_valid and not data_id_matches(data_id, notified_data_id(body)):
+            # Firma válida para otro pago: el body es el que se procesa
+            is_valid, reason = False, 'data_id_mismatch'
+        if not is_valid:
+            logger.warning(f"[WEBHOOK] Notificación rechazada: {reason} (request-id={request_id or 'N/A'})")
+            return JsonResponse({'status': 'rejected', 'reason': reason}, status=401)
+    else:
+        ts, _ = parse_signature_header(signature_header)
+    
+    if request_id and ts and _webhook_replay_cache.seen(request_id, ts):
+        logger.info(f"[WEBHOOK] Notificación duplicada descartada (request-id={request_id})")
+        return JsonResponse({'status': 'duplicate'})
+    
     try:
-        # Parsear body del webhook
-        try:
-            body = json.loads(request.body) if request.body else {}
-        except json.JSONDecodeError:
-            body = {}
-        
         # Log del webhook recibido
         notification_type = body.get('type', 'unknown')
         action = body.get('action', 'unknown')
+        notified_id = notified_data_id(body) or request.GET.get('data.id')
         
-        log_payment_event("WEBHOOK_RECEIVED", "N/A", {
+        log_payment_event("WEBHOOK_RECEIVED", str(notified_id or "N/A"), {
             "type": notification_type,
             "action": action,
             "body_keys": list(body.keys())
@@ -471,9 +815,8 @@ def webhook(request):
             logger.info(f"[WEBHOOK] Ignorando notificación tipo: {notification_type}")
             return JsonResponse({'status': 'ignored', 'reason': 'not a payment notification'})
         
-        # Obtener el ID del pago
-        data = body.get('data', {})
-        payment_id = data.get('id') or body.get('data.id')
+        # Obtener el ID del pago (con firma, el mismo que el firmado)
+        payment_id = notified_data_id(body)
         
         if not payment_id:
             logger.warning("[WEBHOOK] No payment_id en la notificación")
@@ -482,7 +825,8 @@ def webhook(request):
         payment_id = str(payment_id)
         
         # Verificar si ya procesamos este pago
-        if payment_id in _processed_payments:
+        # (las actualizaciones se consultan igual: pueden ser reembolsos)
+        if already_processed(payment_id) and action != 'payment.updated':
             logger.info(f"[WEBHOOK] Payment {payment_id} ya procesado, skipping")
             return JsonResponse({'status': 'already_processed'})
         
@@ -490,7 +834,8 @@ def webhook(request):
         
         # Consultar detalles del pago a MP
         try:
-            payment_response = sdk.payment().get(payment_id)
+            with span("mp.payment.get", kind=KIND_CLIENT, payment_id=payment_id):
+                payment_response = tenant_sdk().payment().get(payment_id)
             
             if payment_response.get("status") != 200:
                 logger.error(f"[WEBHOOK] Error obteniendo pago {payment_id}: {payment_response}")
@@ -498,73 +843,49 @@ def webhook(request):
             
             payment_data = payment_response.get("response", {})
             status = payment_data.get("status")
-            metadata = payment_data.get("metadata", {})
+            bind_trace(trace_id_for_payment(payment_data))
             
             log_payment_event("WEBHOOK_PAYMENT_STATUS", payment_id, {
                 "status": status,
+                "external_reference": payment_data.get("external_reference"),
                 "amount": payment_data.get("transaction_amount")
             })
             
+            with span("db.apply_payment_status", status=status):
+                apply_payment_status(payment_id, payment_data)
+            
         except Exception as e:
             logger.exception(f"[WEBHOOK] Error consultando MP para {payment_id}")
             return JsonResponse({'status': 'error', 'reason': str(e)}, status=200)
         
         # Solo procesamos pagos aprobados
+        # (los pendientes los sigue consultando el watcher, ver watcher.py)
         if status != 'approved':
             logger.info(f"[WEBHOOK] Payment {payment_id} status={status}, no action needed")
             return JsonResponse({'status': 'noted', 'payment_status': status})
         
-        # Obtener email del cliente
-        customer_email = metadata.get("customer_email", "")
+        if already_processed(payment_id):
+            logger.info(f"[WEBHOOK] Payment {payment_id} ya procesado, skipping")
+            return JsonResponse({'status': 'already_processed'})
+        
+        delivery = deliver_approved_payment(payment_id, payment_data, 'WEBHOOK')
         
-        if not customer_email:
-            logger.error(f"[WEBHOOK] No email en metadata para {payment_id}")
+        if delivery['reason'] == 'no_customer_email':
             return JsonResponse({
                 'status': 'error', 
                 'reason': 'no_customer_email',
                 'action': 'manual_intervention_required'
             }, status=200)
         
-        # Construir orden para envío de email
-        fake_order = SimpleNamespace(
-            id=payment_data.get("external_reference", payment_id),
-            first_name=metadata.get("customer_first_name", "Cliente"),
-            email=customer_email,
-            course_title=metadata.get("course_title", "Producto Digital"),
-            course_id=metadata.get("course_id", "tracker-habitos"),
-            price=metadata.get("price", payment_data.get("transaction_amount", 0)),
-            status=status
-        )
-        
-        # Enviar email
-        try:
-            logger.info(f"[WEBHOOK] Enviando email a {customer_email} para payment {payment_id}")
-            email_sent = send_product_email(fake_order)
-            
-            if email_sent:
-                _processed_payments.add(payment_id)
-                log_payment_event("WEBHOOK_EMAIL_SUCCESS", payment_id, {
-                    "to": customer_email,
-                    "product": fake_order.course_id
-                })
-                return JsonResponse({'status': 'processed', 'email_sent': True})
-            else:
-                log_payment_event("WEBHOOK_EMAIL_FAILED", payment_id, {
-                    "to": customer_email
-                })
-                return JsonResponse({'status': 'processed', 'email_sent': False})
-                
-        except Exception as e:
-            logger.exception(f"[WEBHOOK] Error enviando email para {payment_id}")
-            log_payment_event("WEBHOOK_EMAIL_EXCEPTION", payment_id, {
-                "error": str(e)
-            })
+        if delivery['reason'] == 'email_failed':
             return JsonResponse({
                 'status': 'error', 
                 'reason': 'email_failed',
-                'error': str(e)
+                'error': delivery['error']
             }, status=200)
         
+        return JsonResponse({'status': 'processed', 'email_sent': delivery['email_sent']})
+        
     except Exception as e:
         logger.exception("[CRITICAL] Error general en webhook")
         # SIEMPRE responder 200 para que MP no reintente
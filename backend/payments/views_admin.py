@@ -0,0 +1,303 @@
+"""
+Endpoints internos (administración) del sistema de pagos.
+==========================================================
+Requieren ADMIN_API_TOKEN (ver decorators.require_admin_token).
+
+- sales_dashboard: ingresos, órdenes y conversión desde los rollups
+- export_orders: historial de órdenes en CSV o XLSX (streaming)
+- bulk_preferences: links de pago masivos para campañas (streaming NDJSON)
+- export_events / payment_timeline: eventos de pago del event store
+- search_orders: búsqueda de órdenes por comprador / IDs (soporte)
+
+Alcance: estos endpoints son GLOBALES, no por tienda. Ignoran
+request.tenant a propósito: ADMIN_API_TOKEN es un único token para todo
+el despliegue, los rollups (SalesRollup) no tienen columna de tienda y
+el archivo y el event store tampoco la guardan. Las órdenes exportadas y
+buscadas incluyen las de todas las tiendas (en la base, Order.tenant
+indica de cuál es cada una).
+Si alguna vez hay un token de admin por tienda, el filtro va acá.
+==========================================================
+"""
+
+from __future__ import annotations
+
+import datetime
+import hashlib
+import json
+import logging
+import tempfile
+import time
+from typing import Optional
+
+from django.db import DatabaseError
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_http_methods
+
+from . import views
+from .archive import find_order, order_record
+from .bulk import BULK_DEFAULT_RATE, BULK_DEFAULT_WORKERS, clamp_rate, parse_bulk_rows, run_bulk
+from .decorators import require_admin_token
+from .deliveries import delivery_history
+from .event_store import get_event_store
+from .exports import (
+    event_headers,
+    iter_all_order_rows,
+    iter_csv,
+    iter_event_rows,
+    order_headers,
+    write_xlsx,
+)
+from .rollups import get_sales_summary, rollup_version
+from .search import SEARCH_MAX_LIMIT, search_orders as run_order_search
+
+logger = logging.getLogger(__name__)
+
+# Rango por defecto del dashboard cuando no se indica ?from=
+DEFAULT_DASHBOARD_DAYS = 30
+
+
+def _parse_date_range(request) -> tuple[datetime.date, datetime.date, Optional[str]]:
+    """
+    Lee ?from=YYYY-MM-DD&to=YYYY-MM-DD&course_id=xxx.
+
+    Raises:
+        ValueError: si alguna fecha es inválida o el rango está invertido
+    """
+    today = timezone.localdate()
+    date_to = datetime.date.fromisoformat(request.GET['to']) if request.GET.get('to') else today
+    if request.GET.get('from'):
+        date_from = datetime.date.fromisoformat(request.GET['from'])
+    else:
+        date_from = date_to - datetime.timedelta(days=DEFAULT_DASHBOARD_DAYS - 1)
+
+    if date_from > date_to:
+        raise ValueError("'from' es posterior a 'to'")
+
+    return date_from, date_to, request.GET.get('course_id') or None
+
+
+def _dashboard_version(request) -> Optional[tuple[str, Optional[datetime.datetime]]]:
+    """(etag, last_modified) del rango pedido, calculado una vez por request."""
+    if not hasattr(request, '_dashboard_version'):
+        try:
+            date_from, date_to, course_id = _parse_date_range(request)
+        except ValueError:
+            request._dashboard_version = None
+        else:
+            last_update, rows = rollup_version(date_from, date_to, course_id)
+            raw = f"{date_from}|{date_to}|{course_id}|{last_update}|{rows}"
+            request._dashboard_version = (hashlib.md5(raw.encode()).hexdigest(), last_update)
+    return request._dashboard_version
+
+
+def _dashboard_etag(request) -> Optional[str]:
+    version = _dashboard_version(request)
+    return version[0] if version else None
+
+
+def _dashboard_last_modified(request) -> Optional[datetime.datetime]:
+    version = _dashboard_version(request)
+    return version[1] if version else None
+
+
+@require_admin_token
+@require_http_methods(["GET"])
+@cache_control(private=True, max_age=60, must_revalidate=True)
+@condition(etag_func=_dashboard_etag, last_modified_func=_dashboard_last_modified)
+def sales_dashboard(request) -> JsonResponse:
+    """
+    Resumen de ventas por rango de fechas.
+    GET /api/payments/dashboard/sales/?from=2026-01-01&to=2026-01-31&course_id=tracker-habitos
+
+    Se calcula solo desde los rollups (no recorre órdenes) y soporta
+    GET condicional: si nada cambió responde 304 sin armar el JSON.
+    """
+    try:
+        date_from, date_to, course_id = _parse_date_range(request)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': f'Rango de fechas inválido: {e}'}, status=400)
+
+    summary = get_sales_summary(date_from, date_to, course_id)
+    return JsonResponse({'success': True, **summary})
+
+
+def _optional_date(value: Optional[str]) -> Optional[datetime.date]:
+    return datetime.date.fromisoformat(value) if value else None
+
+
+@require_admin_token
+@require_http_methods(["GET"])
+def export_orders(request):
+    """
+    Exporta el historial de órdenes.
+    GET /api/payments/export/orders/?format=csv|xlsx&from=YYYY-MM-DD&to=YYYY-MM-DD&course_id=xxx&status=approved
+
+    CSV se genera fila por fila mientras se envía; XLSX se escribe en modo
+    write-only a un archivo temporal y se envía por bloques.
+    """
+    export_format = request.GET.get('format', 'csv').lower()
+    if export_format not in ('csv', 'xlsx'):
+        return JsonResponse({'success': False, 'error': "Formato inválido (usar 'csv' o 'xlsx')"}, status=400)
+
+    try:
+        date_from = _optional_date(request.GET.get('from'))
+        date_to = _optional_date(request.GET.get('to'))
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': f'Fecha inválida: {e}'}, status=400)
+
+    rows = iter_all_order_rows(
+        date_from=date_from,
+        date_to=date_to,
+        course_id=request.GET.get('course_id') or None,
+        status=request.GET.get('status') or None,
+    )
+    logger.info(f"[EXPORT] Exportando órdenes ({export_format}) desde={date_from} hasta={date_to}")
+    return _export_response(export_format, 'ordenes', 'Órdenes', order_headers(), rows)
+
+
+@require_admin_token
+@require_http_methods(["GET"])
+def export_events(request):
+    """
+    Exporta los eventos de pago del event store.
+    GET /api/payments/export/events/?format=csv|xlsx&from=YYYY-MM-DD&to=YYYY-MM-DD
+    """
+    export_format = request.GET.get('format', 'csv').lower()
+    if export_format not in ('csv', 'xlsx'):
+        return JsonResponse({'success': False, 'error': "Formato inválido (usar 'csv' o 'xlsx')"}, status=400)
+
+    try:
+        date_from = _optional_date(request.GET.get('from'))
+        date_to = _optional_date(request.GET.get('to'))
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': f'Fecha inválida: {e}'}, status=400)
+
+    logger.info(f"[EXPORT] Exportando eventos ({export_format}) desde={date_from} hasta={date_to}")
+    return _export_response(export_format, 'eventos', 'Eventos', event_headers(), iter_event_rows(date_from, date_to))
+
+
+def _export_response(export_format: str, basename: str, sheet_title: str, headers, rows):
+    """CSV en streaming o XLSX write-only enviado por bloques."""
+    filename = f"{basename}-{timezone.localdate().isoformat()}.{export_format}"
+
+    if export_format == 'csv':
+        response = StreamingHttpResponse(
+            iter_csv(headers, rows),
+            content_type='text/csv; charset=utf-8',
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    target = tempfile.TemporaryFile()
+    write_xlsx(target, [(sheet_title, headers, rows)])
+    target.seek(0)
+    return FileResponse(
+        target,
+        as_attachment=True,
+        filename=filename,
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
+
+
+@require_admin_token
+@require_http_methods(["GET"])
+def payment_timeline(request):
+    """
+    Historia completa de un pago desde el event store, con la orden (de la
+    tabla o del archivo) y los intentos de entrega por email.
+    GET /api/payments/events/?payment_id=123  o  ?external_reference=456
+    """
+    key = request.GET.get('payment_id') or request.GET.get('external_reference')
+    if not key:
+        return JsonResponse({'success': False, 'error': 'Falta payment_id o external_reference'}, status=400)
+
+    started = time.perf_counter()
+    events = get_event_store().timeline(key)
+    order = find_order(key)
+    return JsonResponse({
+        'success': True,
+        'key': key,
+        'order': order_record(order) if order is not None else None,
+        'archived': order is not None and order._state.adding,
+        'count': len(events),
+        'events': events,
+        'deliveries': delivery_history(key),
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 2),
+    })
+
+
+@require_admin_token
+@require_http_methods(["GET"])
+def search_orders(request):
+    """
+    Busca órdenes por nombre, apellido, email, DNI/CUIT, payment_id,
+    preferencia o número de orden (prefijos, sin acentos).
+    GET /api/payments/orders/search/?q=juan+perez&status=approved&limit=50
+    """
+    query = (request.GET.get('q') or '').strip()
+    if not query:
+        return JsonResponse({'success': False, 'error': 'Falta el parámetro q'}, status=400)
+    try:
+        limit = int(request.GET.get('limit', 50))
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'limit inválido'}, status=400)
+
+    started = time.perf_counter()
+    try:
+        results = run_order_search(query, limit=min(limit, SEARCH_MAX_LIMIT), status=request.GET.get('status') or None)
+    except DatabaseError:
+        logger.exception(f"[SEARCH] Error buscando '{query}'")
+        return JsonResponse({'success': False, 'error': 'No se pudo buscar, probá en unos minutos'}, status=503)
+    return JsonResponse({
+        'success': True,
+        'query': query,
+        'count': len(results),
+        'results': results,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 2),
+    })
+
+
+@csrf_exempt
+@require_admin_token
+@require_http_methods(["POST"])
+def bulk_preferences(request):
+    """
+    Genera links de pago en lote.
+    POST /api/payments/bulk-preferences/?workers=8&rate=10&campaign=black-friday
+
+    Body: JSON ({"rows": [...]} o lista) o CSV (Content-Type: text/csv) con
+    first_name,last_name,document,email,course_id,title,price[,quantity]
+
+    Responde NDJSON: una línea por fila a medida que MP responde y una
+    línea final con el resumen.
+    """
+    try:
+        rows = parse_bulk_rows(request.body, request.content_type or '')
+        workers = int(request.GET.get('workers', BULK_DEFAULT_WORKERS))
+        rate = clamp_rate(float(request.GET.get('rate', BULK_DEFAULT_RATE)))
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    campaign = request.GET.get('campaign') or None
+    tenant = request.tenant
+    logger.info(f"[BULK] {len(rows)} filas, workers={workers}, rate={rate}/s, campaign={campaign}, tienda={tenant.id}")
+
+    def stream():
+        started = time.perf_counter()
+        ok = failed = 0
+        for result in run_bulk(rows, views.tenant_sdk(tenant), views.tenant_frontend_url(tenant),
+                               workers=workers, rate=rate, campaign=campaign, tenant=tenant):
+            if result['success']:
+                ok += 1
+            else:
+                failed += 1
+            yield json.dumps(result) + '\n'
+        elapsed = time.perf_counter() - started
+        logger.info(f"[BULK] Terminado: {ok} OK, {failed} con error en {elapsed:.1f}s")
+        yield json.dumps({'summary': True, 'total': ok + failed, 'ok': ok, 'failed': failed,
+                          'elapsed_seconds': round(elapsed, 2)}) + '\n'
+
+    return StreamingHttpResponse(stream(), content_type='application/x-ndjson')
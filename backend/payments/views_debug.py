@@ -2,19 +2,24 @@
 Endpoints de diagnóstico y debug para el sistema de pagos.
 ==========================================================
 Estos endpoints ayudan a verificar que todo esté configurado correctamente.
+Con varias tiendas (tenants.py) muestran la configuración de la tienda del
+request (header X-Tenant o ?tenant=).
 
 IMPORTANTE: En producción, considerar restringir acceso a estos endpoints.
 ==========================================================
 """
 
 from django.http import JsonResponse
-from django.conf import settings
 from django.core.mail import EmailMessage
 import os
 import logging
 from typing import Any
 
+from .checkout_options import checkout_options_status
+from .event_store import store_is_persistent
+from .replication import replication_status
 from .services import test_email_connection, list_available_products, validate_product_files
+from .tenants import current_tenant, mailer_for
 
 logger = logging.getLogger(__name__)
 
@@ -24,15 +29,18 @@ def health_check(request) -> JsonResponse:
     Verificación básica de que el backend está corriendo.
     GET /api/payments/health/
     """
-    mp_token = os.environ.get('MP_ACCESS_TOKEN', '')
-    is_production = mp_token.startswith('APP_USR-')
+    tenant = current_tenant()
+    is_production = tenant.is_production
+    replication = replication_status()
     
     return JsonResponse({
         "status": "ok",
+        "tenant": tenant.id,
         "message": "Backend running - Datos con Alex",
         "email_service": "Gmail SMTP",
         "production_mode": is_production,
-        "token_type": "production" if is_production else "sandbox/test"
+        "token_type": "production" if is_production else "sandbox/test",
+        "replication_lag_seconds": replication.get('lag_seconds'),
     })
 
 
@@ -43,15 +51,17 @@ def env_check(request) -> JsonResponse:
     
     Útil para diagnosticar problemas de configuración en Railway.
     """
-    mp_token = os.environ.get('MP_ACCESS_TOKEN', '')
-    email_user = os.environ.get('EMAIL_HOST_USER', '')
-    email_pass = os.environ.get('EMAIL_HOST_PASSWORD', '')
-    frontend_url = os.environ.get('FRONTEND_URL', 'Not Set')
+    tenant = current_tenant()
+    mp_token = tenant.mp_access_token
+    email_user = tenant.email_host_user
+    email_pass = tenant.email_host_password
+    frontend_url = tenant.frontend_url or 'Not Set'
     
     return JsonResponse({
         "environment": {
             "DEBUG": os.environ.get('DEBUG', 'Not Set'),
             "FRONTEND_URL": frontend_url,
+            "TENANT": tenant.id,
         },
         "mercado_pago": {
             "token_configured": bool(mp_token),
@@ -59,12 +69,12 @@ def env_check(request) -> JsonResponse:
             "is_production": mp_token.startswith('APP_USR-'),
         },
         "email_gmail": {
-            "host": os.environ.get('EMAIL_HOST', 'smtp.gmail.com'),
-            "port": os.environ.get('EMAIL_PORT', '587'),
+            "host": tenant.email_host,
+            "port": str(tenant.email_port),
             "user_configured": bool(email_user),
             "user_preview": email_user[:5] + "***" if len(email_user) > 5 else "Not Set",
             "password_configured": bool(email_pass),
-            "from_email": settings.DEFAULT_FROM_EMAIL,
+            "from_email": tenant.default_from_email,
         },
         "django": {
             "allowed_hosts": os.environ.get('ALLOWED_HOSTS', 'Not Set'),
@@ -106,9 +116,10 @@ def test_email(request) -> JsonResponse:
             "details": email_check
         }, status=500)
     
+    tenant = current_tenant()
     try:
         email = EmailMessage(
-            subject="🧪 Prueba de Email - Datos con Alex",
+            subject=f"🧪 Prueba de Email - {tenant.name}",
             body="""
                 <div style="font-family: sans-serif; padding: 20px; background: #1a1a1a; color: white; border-radius: 10px;">
                     <h2 style="color: #22c55e;">✅ Email de Prueba Exitoso</h2>
@@ -116,18 +127,18 @@ def test_email(request) -> JsonResponse:
                     <p style="color: #888; font-size: 12px;">Enviado desde el backend de Datos con Alex vía Gmail SMTP</p>
                 </div>
             """,
-            from_email=settings.DEFAULT_FROM_EMAIL,
+            from_email=tenant.default_from_email,
             to=[destinatario],
-            reply_to=[settings.EMAIL_HOST_USER] if settings.EMAIL_HOST_USER else None
+            reply_to=[tenant.email_host_user] if tenant.email_host_user else None
         )
         email.content_subtype = "html"
-        email.send(fail_silently=False)
+        mailer_for(tenant).send(email)
         
         return JsonResponse({
             "status": "ok",
             "message": f"✅ Email de prueba enviado a {destinatario}",
             "service": "Gmail SMTP",
-            "from": settings.DEFAULT_FROM_EMAIL
+            "from": tenant.default_from_email
         })
         
     except Exception as e:
@@ -146,10 +157,11 @@ def system_status(request) -> JsonResponse:
     
     Resumen de todos los checks para verificar que el sistema está listo.
     """
-    mp_token = os.environ.get('MP_ACCESS_TOKEN', '')
-    email_user = os.environ.get('EMAIL_HOST_USER', '')
-    email_pass = os.environ.get('EMAIL_HOST_PASSWORD', '')
-    frontend_url = os.environ.get('FRONTEND_URL', '')
+    tenant = current_tenant()
+    mp_token = tenant.mp_access_token
+    email_user = tenant.email_host_user
+    email_pass = tenant.email_host_password
+    frontend_url = tenant.frontend_url if not tenant.is_default else os.environ.get('FRONTEND_URL', '')
     
     # Verificar productos
     products = list_available_products()
@@ -167,13 +179,21 @@ def system_status(request) -> JsonResponse:
         "all_products_ready": all_products_ready,
         "debug_off": os.environ.get('DEBUG', 'True').lower() != 'true',
     }
+    replication = replication_status()
+    if replication['enabled']:
+        checks["replication_healthy"] = replication['healthy']
+    # Historial de pagos fuera del disco que se borra en cada deploy
+    checks["event_store_persistent"] = store_is_persistent()
     
     all_ok = all(checks.values())
     
     return JsonResponse({
+        "tenant": tenant.id,
         "ready_for_production": all_ok,
         "email_service": "Gmail SMTP",
         "checks": checks,
+        "replication": replication,
+        "checkout_options": checkout_options_status(),
         "products": products,
         "recommendation": "🚀 Sistema listo para producción" if all_ok else "⚠️ Revisar checks fallidos"
     })
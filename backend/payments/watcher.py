@@ -0,0 +1,305 @@
+"""
+Watcher de pagos pendientes - Datos con Alex
+=============================================
+Los pagos en efectivo (Rapipago, Pago Fácil) y transferencias quedan en
+``pending`` / ``in_process`` y se acreditan horas después. Antes solo se
+entregaban si llegaba el webhook; ahora cada orden con un pago no final
+se vuelve a consultar a MP con backoff adaptativo hasta que termine.
+
+- apply_payment_status agenda la orden (``next_check_at``) la primera vez
+  que ve el pago en un estado no final, y la saca de la agenda con un
+  estado final.
+- Backoff: segundos al principio (tarjetas en revisión se resuelven
+  rápido), después minutos y horas. Los medios en efectivo / transferencia
+  arrancan directamente en minutos.
+- Cada ronda toma hasta PAYMENT_WATCH_BATCH pagos vencidos y los consulta
+  en paralelo respetando PAYMENT_WATCH_RATE consultas por segundo.
+- Cuando un pago se aprueba se entrega en el momento (mismo flujo que el
+  webhook); los streams de estado abiertos se enteran por apply_payment_status.
+- Cada ronda "reclama" las órdenes con un UPDATE condicional, así varios
+  workers de gunicorn no consultan el mismo pago a la vez.
+- Se deja de consultar a los PAYMENT_WATCH_MAX_DAYS de creada la orden.
+- También toma las órdenes aprobadas sin entregar que quedaron agendadas
+  (entregas cortadas por un apagado, ver shutdown.py) y las vuelve a
+  entregar; si el envío falla siguen con el mismo backoff.
+- Durante el apagado no reclama órdenes nuevas y libera las reclamadas
+  que todavía no consultó.
+
+Corre como thread en cada worker (config/wsgi.py) o con
+``python manage.py watch_payments``.
+=============================================
+"""
+
+from __future__ import annotations
+
+import datetime
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+
+from django.db import DatabaseError, close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from .shutdown import coordinator
+from .tenants import get_tenant, using_tenant
+from .tracing import span, trace_id_for, trace_id_for_payment
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_WATCHER_ENABLED = os.getenv('PAYMENT_WATCHER_ENABLED', 'True').lower() == 'true'
+PAYMENT_WATCH_TICK_SECONDS = float(os.getenv('PAYMENT_WATCH_TICK_SECONDS', '5'))
+PAYMENT_WATCH_BATCH = int(os.getenv('PAYMENT_WATCH_BATCH', '50'))
+PAYMENT_WATCH_WORKERS = int(os.getenv('PAYMENT_WATCH_WORKERS', '4'))
+PAYMENT_WATCH_RATE = float(os.getenv('PAYMENT_WATCH_RATE', '5'))
+PAYMENT_WATCH_MAX_DAYS = int(os.getenv('PAYMENT_WATCH_MAX_DAYS', '7'))
+
+# Estados que todavía pueden cambiar
+WATCHED_STATUSES = ('pending', 'in_process', 'authorized')
+
+# Espera entre consultas (segundos) según cuántas se hicieron; la última se repite
+BACKOFF_SECONDS = (10, 20, 40, 60, 120, 300, 600, 1800, 3600, 7200, 14400)
+
+# Medios que tardan horas: se saltean los primeros escalones del backoff
+SLOW_PAYMENT_TYPES = {'ticket', 'atm', 'bank_transfer'}
+SLOW_PAYMENT_FIRST_STEP = 5  # arrancan en 5 minutos
+
+# Cuánto tiempo queda "reclamada" una orden mientras se consulta
+CLAIM_SECONDS = 60
+
+
+def next_delay(attempts: int, payment_type: Optional[str] = None) -> int:
+    """Segundos hasta la próxima consulta después de ``attempts`` consultas."""
+    step = attempts + (SLOW_PAYMENT_FIRST_STEP if payment_type in SLOW_PAYMENT_TYPES else 0)
+    return BACKOFF_SECONDS[min(step, len(BACKOFF_SECONDS) - 1)]
+
+
+def schedule_for(status: str, payment_data: dict[str, Any], attempts: int = 0) -> Optional[datetime.datetime]:
+    """``next_check_at`` para una orden en ``status`` (None si no hay que consultarla)."""
+    if status not in WATCHED_STATUSES:
+        return None
+    return timezone.now() + datetime.timedelta(seconds=next_delay(attempts, payment_data.get('payment_type_id')))
+
+
+def _claim_due(limit: int) -> list[Any]:
+    """Órdenes vencidas, reclamadas para esta ronda (ningún otro worker las toma)."""
+    from .models import Order
+
+    now = timezone.now()
+    # Pendientes, o aprobadas con la entrega reencolada
+    due = Q(status__in=WATCHED_STATUSES) | Q(status='approved', delivered_at__isnull=True)
+    candidates = list(
+        Order.objects.filter(due, next_check_at__lte=now, payment_id__isnull=False)
+        .order_by('next_check_at')
+        .only('id', 'payment_id', 'external_reference', 'status', 'next_check_at', 'check_attempts', 'created_at', 'tenant')[:limit]
+    )
+    claimed_until = now + datetime.timedelta(seconds=CLAIM_SECONDS)
+    claimed = []
+    for order in candidates:
+        if Order.objects.filter(pk=order.pk, next_check_at=order.next_check_at).update(next_check_at=claimed_until):
+            claimed.append(order)
+    return claimed
+
+
+def _reschedule(order, payment_data: dict[str, Any]) -> None:
+    """Sigue pendiente: próxima consulta con más espera (o se abandona por antigüedad)."""
+    from .models import Order
+
+    attempts = order.check_attempts + 1
+    expired = timezone.now() - order.created_at > datetime.timedelta(days=PAYMENT_WATCH_MAX_DAYS)
+    next_check_at = None if expired else timezone.now() + datetime.timedelta(
+        seconds=next_delay(attempts, payment_data.get('payment_type_id'))
+    )
+    Order.objects.filter(pk=order.pk).update(check_attempts=attempts, next_check_at=next_check_at)
+    if expired:
+        logger.warning(f"[WATCHER] Payment {order.payment_id} sigue {order.status} tras {attempts} consultas, se deja de consultar")
+
+
+def _release(order) -> bool:
+    """Devuelve una orden reclamada a la agenda sin contar la consulta (apagado)."""
+    from .models import Order
+
+    try:
+        return bool(Order.objects.filter(pk=order.pk).update(next_check_at=timezone.now()))
+    except DatabaseError:
+        logger.exception(f"[WATCHER] No se pudo liberar la orden {order.pk}")
+        return False
+
+
+# Consulta salteada por el apagado (la orden se libera, no es un error)
+_SKIPPED: dict[str, Any] = {}
+
+
+def _unschedule(order) -> None:
+    from .models import Order
+
+    Order.objects.filter(pk=order.pk).update(next_check_at=None, check_attempts=0)
+
+
+def _fetch(sdk, payment_id: str, limiter) -> Optional[dict[str, Any]]:
+    if coordinator.draining:
+        return _SKIPPED
+    limiter.acquire()
+    if coordinator.draining:
+        return _SKIPPED
+    try:
+        response = sdk.payment().get(payment_id)
+    except Exception:
+        logger.exception(f"[WATCHER] Error consultando payment {payment_id}")
+        return None
+    if response.get('status') != 200:
+        logger.warning(f"[WATCHER] MP respondió {response.get('status')} para payment {payment_id}")
+        return None
+    return response.get('response', {}) or {}
+
+
+def poll_due_payments(sdk=None, limit: int = PAYMENT_WATCH_BATCH, workers: int = PAYMENT_WATCH_WORKERS) -> dict[str, int]:
+    """
+    Una ronda: consulta en paralelo los pagos vencidos y aplica los cambios.
+    Los aprobados se entregan en el momento.
+
+    Returns:
+        Contadores de la ronda (checked, changed, delivered, errors).
+    """
+    from . import views
+    from .bulk import RateLimiter
+
+    stats = {'checked': 0, 'changed': 0, 'delivered': 0, 'errors': 0, 'released': 0}
+    if coordinator.draining:
+        return stats
+    try:
+        orders = _claim_due(limit)
+    except DatabaseError:
+        logger.exception("[WATCHER] Error leyendo pagos pendientes")
+        return stats
+    if not orders:
+        return stats
+
+    # Cada orden se consulta con la cuenta de MP de su tienda (tenants.py)
+    tenants = {order.pk: get_tenant(order.tenant) for order in orders}
+    sdks = {order.pk: sdk or views.tenant_sdk(tenants[order.pk]) for order in orders}
+
+    # Si el apagado no espera la ronda, las órdenes vuelven a la agenda
+    operations = {
+        order.pk: coordinator.start('watcher.check', order.payment_id, requeue=lambda order=order: _release(order))
+        for order in orders
+    }
+
+    limiter = RateLimiter(PAYMENT_WATCH_RATE)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(orders))), thread_name_prefix='mp-watch') as pool:
+            results = list(pool.map(lambda order: _fetch(sdks[order.pk], order.payment_id, limiter), orders))
+
+        for order, payment_data in zip(orders, results):
+            if payment_data is _SKIPPED:
+                if _release(order):
+                    stats['released'] += 1
+                coordinator.finish(operations.pop(order.pk))
+                continue
+            stats['checked'] += 1
+            if payment_data is None:
+                stats['errors'] += 1
+                _reschedule(order, {})
+            else:
+                with using_tenant(tenants[order.pk]), span(
+                    'watcher.check', trace_id=trace_id_for_payment(payment_data) or trace_id_for(order.external_reference),
+                    payment_id=order.payment_id, attempt=order.check_attempts + 1,
+                ):
+                    _apply_polled_status(views, order, payment_data, stats)
+            coordinator.finish(operations.pop(order.pk))
+    finally:
+        for operation in operations.values():
+            coordinator.finish(operation)
+
+    logger.info(f"[WATCHER] Ronda: {stats}")
+    return stats
+
+
+def _apply_polled_status(views, order, payment_data: dict[str, Any], stats: dict[str, int]) -> None:
+    """Aplica el estado consultado de una orden (y entrega si se aprobó)."""
+    from .orders import apply_payment_status
+
+    status = payment_data.get('status')
+    views.log_payment_event("WATCHER_PAYMENT_STATUS", order.payment_id, {
+        "status": status,
+        "previous_status": order.status,
+        "external_reference": payment_data.get("external_reference"),
+        "attempt": order.check_attempts + 1,
+    })
+
+    if status in WATCHED_STATUSES:
+        if apply_payment_status(order.payment_id, payment_data):
+            stats['changed'] += 1
+        _reschedule(order, payment_data)
+        return
+
+    # Estado final: apply_payment_status saca la orden de la agenda
+    if apply_payment_status(order.payment_id, payment_data):
+        stats['changed'] += 1
+    if status == 'approved':
+        delivery = views.deliver_approved_payment(order.payment_id, payment_data, 'WATCHER')
+        if delivery['email_sent']:
+            stats['delivered'] += 1
+        # Recién aprobado o entrega reencolada: si el envío falló sigue en la
+        # agenda con backoff (apply_payment_status ya la había sacado)
+        if not delivery['email_sent'] and delivery['reason'] in (None, 'email_failed'):
+            _reschedule(order, payment_data)
+        else:
+            _unschedule(order)
+
+
+class PaymentWatcher:
+    """Thread que ejecuta una ronda cada PAYMENT_WATCH_TICK_SECONDS."""
+
+    def __init__(self, tick_seconds: float = PAYMENT_WATCH_TICK_SECONDS):
+        self.tick_seconds = tick_seconds
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name='payment-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 5) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+
+    def run(self) -> None:
+        logger.info(f"[WATCHER] Iniciado (ronda cada {self.tick_seconds:g}s)")
+        while not self._stop.is_set() and not coordinator.draining:
+            try:
+                close_old_connections()
+                poll_due_payments()
+            except Exception:
+                logger.exception("[WATCHER] Error en la ronda")
+            self._stop.wait(self.tick_seconds)
+
+
+_watcher: Optional[PaymentWatcher] = None
+_watcher_lock = threading.Lock()
+
+
+def start_watcher() -> Optional[PaymentWatcher]:
+    """Arranca el watcher del proceso (si PAYMENT_WATCHER_ENABLED)."""
+    global _watcher
+    if not PAYMENT_WATCHER_ENABLED:
+        return None
+    with _watcher_lock:
+        if _watcher is None:
+            _watcher = PaymentWatcher()
+        _watcher.start()
+    return _watcher
+
+
+def stop_watcher(timeout: Optional[float] = 5) -> None:
+    """Detiene el watcher del proceso (``timeout=0``: sin esperar la ronda en curso)."""
+    with _watcher_lock:
+        watcher = _watcher
+    if watcher is not None:
+        watcher.stop(timeout=timeout)
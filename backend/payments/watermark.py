@@ -0,0 +1,312 @@
+"""
+Planillas personalizadas por comprador - Datos con Alex
+========================================================
+Estampa cada .xlsx entregado con el nombre del comprador y el número de
+orden (licencia de uso) en las propiedades del documento:
+
+- docProps/core.xml: descripción y palabras clave con la licencia
+- docProps/custom.xml: propiedades personalizadas LicensedTo / OrderId
+  (visibles en Archivo > Propiedades > Personalizado)
+
+Para no abrir y re-guardar el workbook en cada compra:
+1. Cada plantilla se descompone UNA vez (cache por ruta + mtime) en sus
+   miembros ZIP con los bytes ya comprimidos.
+2. Por compra solo se generan y comprimen los XML chicos que cambian;
+   el resto se copia byte a byte y se arma el ZIP a mano.
+
+La generación corre en el mismo thread que envía el email: por compra solo
+se comprimen dos XML de unos cientos de bytes (milisegundos), menos que lo
+que costaba mandar la plantilla a un pool de procesos y traer el .xlsx de
+vuelta. El resultado queda en el cache de adjuntos por (archivo, versión,
+comprador, orden) de services.py, así un reenvío no lo vuelve a generar.
+
+CONFIGURACIÓN:
+- WATERMARK_ENABLED: "False" para enviar los archivos originales
+========================================================
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+import struct
+import threading
+import zipfile
+import zlib
+from dataclasses import dataclass
+from xml.sax.saxutils import escape
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_ENABLED = os.getenv('WATERMARK_ENABLED', 'True').lower() == 'true'
+
+CORE_PROPS_PART = 'docProps/core.xml'
+CUSTOM_PROPS_PART = 'docProps/custom.xml'
+CONTENT_TYPES_PART = '[Content_Types].xml'
+ROOT_RELS_PART = '_rels/.rels'
+
+CUSTOM_PROPS_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.custom-properties+xml'
+CUSTOM_PROPS_REL_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/custom-properties'
+
+_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+_CENTRAL_HEADER = struct.Struct('<IBBBBHHHHIIIHHHHHII')
+_END_OF_CENTRAL_DIR = struct.Struct('<IHHHHIIH')
+
+# Bits de flags que se conservan (opciones de compresión y UTF-8); el bit 3
+# (data descriptor) se limpia porque escribimos CRC y tamaños en el header
+_FLAG_MASK = 0x0806
+
+
+@dataclass(frozen=True)
+class ZipMember:
+    """Miembro de un ZIP con sus datos ya comprimidos."""
+
+    filename: str
+    compress_type: int
+    flag_bits: int
+    date_time: tuple[int, int, int, int, int, int]
+    crc: int
+    file_size: int
+    compressed: bytes
+    external_attr: int = 0
+    create_system: int = 0
+    create_version: int = 20
+    extract_version: int = 20
+
+
+@dataclass(frozen=True)
+class WorkbookTemplate:
+    """Plantilla descompuesta: miembros fijos y el core.xml original."""
+
+    members: tuple[ZipMember, ...]
+    core_xml: str
+
+
+_template_cache: dict[str, tuple[int, int, WorkbookTemplate]] = {}
+_template_lock = threading.Lock()
+
+
+# =============================================================================
+# ZIP DE BAJO NIVEL
+# =============================================================================
+
+def _read_members(path: str) -> list[tuple[ZipMember, bytes]]:
+    """Lee cada miembro del ZIP como (datos comprimidos, contenido descomprimido)."""
+    members: list[tuple[ZipMember, bytes]] = []
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as raw:
+        for info in archive.infolist():
+            raw.seek(info.header_offset)
+            header = raw.read(_LOCAL_HEADER.size)
+            name_length, extra_length = struct.unpack('<HH', header[26:30])
+            raw.seek(name_length + extra_length, os.SEEK_CUR)
+            compressed = raw.read(info.compress_size)
+
+            member = ZipMember(
+                filename=info.filename,
+                compress_type=info.compress_type,
+                flag_bits=info.flag_bits & _FLAG_MASK,
+                date_time=info.date_time,
+                crc=info.CRC,
+                file_size=info.file_size,
+                compressed=compressed,
+                external_attr=info.external_attr,
+                create_system=info.create_system,
+                create_version=info.create_version,
+                extract_version=info.extract_version,
+            )
+            members.append((member, archive.read(info.filename)))
+    return members
+
+
+def _deflate_member(filename: str, content: bytes, date_time: tuple[int, ...]) -> ZipMember:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    compressed = compressor.compress(content) + compressor.flush()
+    return ZipMember(
+        filename=filename,
+        compress_type=8,
+        flag_bits=0,
+        date_time=tuple(date_time),
+        crc=zlib.crc32(content),
+        file_size=len(content),
+        compressed=compressed,
+    )
+
+
+def _dos_datetime(date_time: tuple[int, ...]) -> tuple[int, int]:
+    year, month, day, hour, minute, second = date_time
+    dos_date = (max(year, 1980) - 1980) << 9 | month << 5 | day
+    dos_time = hour << 11 | minute << 5 | second // 2
+    return dos_time, dos_date
+
+
+def build_zip(members: list[ZipMember]) -> bytes:
+    """
+    Arma un ZIP a partir de miembros ya comprimidos (sin recomprimir).
+    Las planillas son chicas: no se soporta Zip64.
+    """
+    chunks: list[bytes] = []
+    central: list[bytes] = []
+    offset = 0
+
+    for member in members:
+        name = member.filename.encode('utf-8')
+        dos_time, dos_date = _dos_datetime(member.date_time)
+        local_header = _LOCAL_HEADER.pack(
+            0x04034B50, member.extract_version, member.flag_bits, member.compress_type,
+            dos_time, dos_date, member.crc, len(member.compressed), member.file_size,
+            len(name), 0,
+        )
+        central.append(_CENTRAL_HEADER.pack(
+            0x02014B50, member.create_version, member.create_system, member.extract_version, 0,
+            member.flag_bits, member.compress_type, dos_time, dos_date, member.crc,
+            len(member.compressed), member.file_size, len(name), 0, 0, 0, 0,
+            member.external_attr, offset,
+        ) + name)
+        chunks.extend((local_header, name, member.compressed))
+        offset += len(local_header) + len(name) + len(member.compressed)
+
+    central_dir = b''.join(central)
+    end_record = _END_OF_CENTRAL_DIR.pack(
+        0x06054B50, 0, 0, len(members), len(members), len(central_dir), offset, 0,
+    )
+    return b''.join(chunks) + central_dir + end_record
+
+
+# =============================================================================
+# PLANTILLAS
+# =============================================================================
+
+def _with_custom_props_declared(part: str, content: bytes) -> bytes:
+    """Declara docProps/custom.xml en [Content_Types].xml y _rels/.rels."""
+    text = content.decode('utf-8')
+    if part == CONTENT_TYPES_PART and f'/{CUSTOM_PROPS_PART}' not in text:
+        override = f'<Override PartName="/{CUSTOM_PROPS_PART}" ContentType="{CUSTOM_PROPS_CONTENT_TYPE}"/>'
+        text = text.replace('</Types>', override + '</Types>')
+    elif part == ROOT_RELS_PART and CUSTOM_PROPS_REL_TYPE not in text:
+        relationship = (
+            f'<Relationship Id="rIdAlexcelLicense" Type="{CUSTOM_PROPS_REL_TYPE}" '
+            f'Target="{CUSTOM_PROPS_PART}"/>'
+        )
+        text = text.replace('</Relationships>', relationship + '</Relationships>')
+    return text.encode('utf-8')
+
+
+def decompose_template(path: str) -> WorkbookTemplate:
+    """
+    Descompone un .xlsx en miembros reutilizables.
+
+    Los miembros que no cambian por comprador quedan con sus bytes
+    comprimidos originales. [Content_Types].xml y _rels/.rels se ajustan
+    una sola vez para declarar las propiedades personalizadas.
+    """
+    fixed: list[ZipMember] = []
+    core_xml = ''
+
+    for member, content in _read_members(path):
+        if member.filename == CORE_PROPS_PART:
+            core_xml = content.decode('utf-8')
+        elif member.filename == CUSTOM_PROPS_PART:
+            continue  # se regenera por comprador
+        elif member.filename in (CONTENT_TYPES_PART, ROOT_RELS_PART):
+            patched = _with_custom_props_declared(member.filename, content)
+            fixed.append(_deflate_member(member.filename, patched, member.date_time))
+        else:
+            fixed.append(member)
+
+    if not core_xml:
+        raise ValueError(f"{path} no tiene {CORE_PROPS_PART}")
+
+    return WorkbookTemplate(members=tuple(fixed), core_xml=core_xml)
+
+
+def get_template(path: str) -> WorkbookTemplate:
+    """Plantilla cacheada; se vuelve a descomponer si el archivo cambió."""
+    stat = os.stat(path)
+    with _template_lock:
+        cached = _template_cache.get(path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+
+    template = decompose_template(path)
+    with _template_lock:
+        _template_cache[path] = (stat.st_mtime_ns, stat.st_size, template)
+    return template
+
+
+# =============================================================================
+# PERSONALIZACIÓN
+# =============================================================================
+
+def license_text(buyer_name: str, order_id: str) -> str:
+    return f"Licencia de uso personal: {buyer_name} - Orden #{order_id}"
+
+
+def _personalized_core_xml(core_xml: str, buyer_name: str, order_id: str) -> bytes:
+    # Reemplazar descripción/keywords previas (si la plantilla ya las tiene)
+    core_xml = re.sub(r'<dc:description>.*?</dc:description>|<dc:description/>', '', core_xml, flags=re.S)
+    core_xml = re.sub(r'<cp:keywords>.*?</cp:keywords>|<cp:keywords/>', '', core_xml, flags=re.S)
+    stamp = (
+        f'<dc:description>{escape(license_text(buyer_name, order_id))}</dc:description>'
+        f'<cp:keywords>{escape(f"alexcel-licencia;orden={order_id}")}</cp:keywords>'
+    )
+    return core_xml.replace('</cp:coreProperties>', stamp + '</cp:coreProperties>').encode('utf-8')
+
+
+def _custom_props_xml(buyer_name: str, order_id: str) -> bytes:
+    fmtid = '{D5CDD505-2E9C-101B-9397-08002B2CF9AE}'
+    properties = ''.join(
+        f'<property fmtid="{fmtid}" pid="{pid}" name="{name}"><vt:lpwstr>{escape(value)}</vt:lpwstr></property>'
+        for pid, (name, value) in enumerate((('LicensedTo', buyer_name), ('OrderId', order_id)), start=2)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Properties xmlns="http://schemas.openxmlformats.org/officeDocument/2006/custom-properties" '
+        'xmlns:vt="http://schemas.openxmlformats.org/officeDocument/2006/docPropsVTypes">'
+        f'{properties}</Properties>'
+    ).encode('utf-8')
+
+
+def personalize_workbook(path: str, buyer_name: str, order_id: str) -> bytes:
+    """
+    Genera el .xlsx de ``path`` estampado para un comprador.
+
+    Returns:
+        Bytes del .xlsx personalizado
+    """
+    template = get_template(path)
+    date_time = template.members[0].date_time if template.members else (1980, 1, 1, 0, 0, 0)
+    members = list(template.members)
+    members.append(_deflate_member(
+        CORE_PROPS_PART, _personalized_core_xml(template.core_xml, buyer_name, order_id), date_time,
+    ))
+    members.append(_deflate_member(
+        CUSTOM_PROPS_PART, _custom_props_xml(buyer_name, order_id), date_time,
+    ))
+    return build_zip(members)
+
+
+def render_personalized_files(
+    file_paths: list[str],
+    buyer_name: str,
+    order_id: str,
+) -> dict[str, bytes]:
+    """
+    Genera las versiones personalizadas de ``file_paths``.
+
+    Returns:
+        Dict ruta -> bytes personalizados. Los archivos que fallan (o que
+        no son .xlsx) no aparecen: el llamador envía el original.
+    """
+    if not WATERMARK_ENABLED:
+        return {}
+
+    results: dict[str, bytes] = {}
+    for path in file_paths:
+        if not path.endswith('.xlsx') or not os.path.exists(path):
+            continue
+        try:
+            results[path] = personalize_workbook(path, buyer_name, order_id)
+        except Exception:
+            logger.exception(f"[WATERMARK] Error personalizando {os.path.basename(path)}")
+    return results
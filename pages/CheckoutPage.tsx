@@ -1,4 +1,4 @@
-import React, { useState, useMemo } from 'react';
+import React, { useState, useMemo, useEffect } from 'react';
 import { AppView } from '../types';
 import { getPlanillaById, getOfertaById } from '../data/planillas';
 import { ShieldCheck, ChevronLeft, CheckCircle, CreditCard, User, Mail, Loader2, FileText } from 'lucide-react';
@@ -21,9 +21,48 @@ import { ShieldCheck, ChevronLeft, CheckCircle, CreditCard, User, Mail, Loader2,
 // En producción (Vercel), VITE_API_URL debería estar configurado
 // En desarrollo local, usa el backend de Railway o localhost
 // En producción forzamos la URL de Railway para evitar errores de configuración en Vercel
-const API_URL = import.meta.env.PROD
-  ? 'https://alexcel-backend-production.up.railway.app'
-  : (import.meta.env.VITE_API_URL || `http://${window.location.hostname}:8000`);
+// Con VITE_SAME_ORIGIN=true el build lo sirve Django: rutas relativas, sin CORS
+const API_URL = import.meta.env.VITE_SAME_ORIGIN === 'true'
+  ? ''
+  : import.meta.env.PROD
+    ? 'https://alexcel-backend-production.up.railway.app'
+    : (import.meta.env.VITE_API_URL || `http://${window.location.hostname}:8000`);
+
+// Medios de pago y cuotas (GET /api/payments/checkout-options/, cacheado en el backend)
+interface PaymentMethodOption {
+  id: string;
+  name: string;
+  payment_type_id: string;
+  thumbnail: string | null;
+}
+
+interface InstallmentPlan {
+  payment_method_id: string;
+  name: string;
+  thumbnail: string | null;
+  max_installments: number;
+  interest_free_installments: number;
+}
+
+interface PaymentOptions {
+  methods: PaymentMethodOption[];
+  installments: InstallmentPlan[] | null;
+  pending: boolean;
+}
+
+// Si el backend todavía está pidiendo los datos a MP, se reintenta unas veces
+const PAYMENT_OPTIONS_RETRIES = 3;
+const PAYMENT_OPTIONS_RETRY_MS = 2000;
+
+const PAYMENT_TYPE_LABELS: Record<string, string> = {
+  credit_card: 'Tarjetas de crédito',
+  debit_card: 'Tarjetas de débito',
+  prepaid_card: 'Tarjetas prepagas',
+  ticket: 'Efectivo',
+  atm: 'Cajero',
+  bank_transfer: 'Transferencia',
+  account_money: 'Dinero en cuenta MP',
+};
 
 interface CheckoutPageProps {
   setView: (view: AppView) => void;
@@ -41,6 +80,7 @@ const CheckoutPage: React.FC<CheckoutPageProps> = ({ setView, planillaId, oferta
   // UI state
   const [isLoading, setIsLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
+  const [paymentOptions, setPaymentOptions] = useState<PaymentOptions | null>(null);
 
   // Determinar qué producto se está comprando
   const productData = useMemo(() => {
@@ -87,6 +127,50 @@ const CheckoutPage: React.FC<CheckoutPageProps> = ({ setView, planillaId, oferta
     };
   }, [planillaId, ofertaId]);
 
+  // Medios de pago y cuotas para el total (sin esperar a Mercado Pago)
+  useEffect(() => {
+    let cancelled = false;
+    let timer: ReturnType<typeof setTimeout> | undefined;
+    setPaymentOptions(null);
+
+    const load = (attempt: number) => {
+      fetch(`${API_URL}/api/payments/checkout-options/?amount=${productData.finalPrice}`)
+        .then((response) => (response.ok ? response.json() : null))
+        .then((data) => {
+          if (cancelled || !data?.success) return;
+          setPaymentOptions(data);
+          if (data.pending && attempt < PAYMENT_OPTIONS_RETRIES) {
+            timer = setTimeout(() => load(attempt + 1), PAYMENT_OPTIONS_RETRY_MS);
+          }
+        })
+        .catch(() => {
+          // Sin opciones se muestra la lista genérica de medios de pago
+        });
+    };
+    load(0);
+
+    return () => {
+      cancelled = true;
+      if (timer) clearTimeout(timer);
+    };
+  }, [productData.finalPrice]);
+
+  const paymentTypes = useMemo(() => {
+    const types: Record<string, PaymentMethodOption[]> = {};
+    for (const method of paymentOptions?.methods ?? []) {
+      (types[method.payment_type_id] ??= []).push(method);
+    }
+    return Object.entries(types);
+  }, [paymentOptions]);
+
+  const bestInstallments = useMemo(() => {
+    const plans = paymentOptions?.installments ?? [];
+    return plans.reduce<InstallmentPlan | null>(
+      (best, plan) => (!best || plan.interest_free_installments > best.interest_free_installments ? plan : best),
+      null,
+    );
+  }, [paymentOptions]);
+
   // Validación del formulario
   const isFormValid = () => {
     return (
@@ -293,24 +377,64 @@ const CheckoutPage: React.FC<CheckoutPageProps> = ({ setView, planillaId, oferta
               </div>
             </div>
 
-            <div className="grid grid-cols-2 gap-3 text-xs text-gray-400">
-              <div className="flex items-center gap-2">
-                <CheckCircle size={14} className="text-green-500 shrink-0" />
-                <span>Tarjetas de crédito</span>
-              </div>
-              <div className="flex items-center gap-2">
-                <CheckCircle size={14} className="text-green-500 shrink-0" />
-                <span>Tarjetas de débito</span>
+            {bestInstallments && bestInstallments.interest_free_installments > 1 && (
+              <div className="px-4 py-3 rounded-xl bg-green-500/10 border border-green-500/20 text-sm text-green-400 font-semibold">
+                Hasta {bestInstallments.interest_free_installments} cuotas sin interés de $
+                {(productData.finalPrice / bestInstallments.interest_free_installments).toFixed(2)}
               </div>
-              <div className="flex items-center gap-2">
-                <CheckCircle size={14} className="text-green-500 shrink-0" />
-                <span>Pago Fácil / Rapipago</span>
+            )}
+
+            {paymentTypes.length > 0 ? (
+              <div className="space-y-3 text-xs text-gray-400">
+                {paymentTypes.map(([type, methods]) => (
+                  <div key={type} className="space-y-2">
+                    <div className="flex items-center gap-2">
+                      <CheckCircle size={14} className="text-green-500 shrink-0" />
+                      <span>{PAYMENT_TYPE_LABELS[type] ?? type}</span>
+                    </div>
+                    <div className="flex flex-wrap gap-2 pl-6">
+                      {methods.map((method) => {
+                        const plan = paymentOptions?.installments?.find((item) => item.payment_method_id === method.id);
+                        return (
+                          <div
+                            key={method.id}
+                            title={plan ? `${method.name}: hasta ${plan.max_installments} cuotas` : method.name}
+                            className="flex items-center gap-1.5 px-2 py-1 rounded-lg bg-white/5 border border-white/5"
+                          >
+                            {method.thumbnail && (
+                              <img src={method.thumbnail} alt="" loading="lazy" className="h-4 w-auto" />
+                            )}
+                            <span>{method.name}</span>
+                            {plan && plan.max_installments > 1 && (
+                              <span className="text-gray-500">· {plan.max_installments} cuotas</span>
+                            )}
+                          </div>
+                        );
+                      })}
+                    </div>
+                  </div>
+                ))}
               </div>
-              <div className="flex items-center gap-2">
-                <CheckCircle size={14} className="text-green-500 shrink-0" />
-                <span>Dinero en cuenta MP</span>
+            ) : (
+              <div className="grid grid-cols-2 gap-3 text-xs text-gray-400">
+                <div className="flex items-center gap-2">
+                  <CheckCircle size={14} className="text-green-500 shrink-0" />
+                  <span>Tarjetas de crédito</span>
+                </div>
+                <div className="flex items-center gap-2">
+                  <CheckCircle size={14} className="text-green-500 shrink-0" />
+                  <span>Tarjetas de débito</span>
+                </div>
+                <div className="flex items-center gap-2">
+                  <CheckCircle size={14} className="text-green-500 shrink-0" />
+                  <span>Pago Fácil / Rapipago</span>
+                </div>
+                <div className="flex items-center gap-2">
+                  <CheckCircle size={14} className="text-green-500 shrink-0" />
+                  <span>Dinero en cuenta MP</span>
+                </div>
               </div>
-            </div>
+            )}
           </div>
         </div>
 
@@ -1,12 +1,80 @@
-import React from 'react';
+import React, { useEffect, useState } from 'react';
 import { AppView } from '../types';
-import { Clock, Mail, ArrowRight } from 'lucide-react';
+import { Clock, Mail, ArrowRight, Loader2 } from 'lucide-react';
+
+// API URL dinámico según el entorno (VITE_SAME_ORIGIN=true: lo sirve Django, sin CORS)
+const API_URL = import.meta.env.VITE_SAME_ORIGIN === 'true' ? '' : (import.meta.env.VITE_API_URL ||
+    (import.meta.env.PROD
+        ? 'https://alexcel-backend-production.up.railway.app'
+        : 'http://localhost:8000'));
+
+// Espera antes de reabrir el stream si el servidor lo rechazó
+const STREAM_BUSY_RETRY_MS = 5000;
+
+// Estados de MP que significan que el pago no se va a acreditar
+const FAILED_STATUSES = ['rejected', 'cancelled', 'refunded', 'charged_back'];
 
 interface PaymentPendingPageProps {
     setView: (view: AppView) => void;
 }
 
 const PaymentPendingPage: React.FC<PaymentPendingPageProps> = ({ setView }) => {
+    const [watching, setWatching] = useState(false);
+
+    // Escuchar el estado del pago en vivo (una sola conexión, sin recargar)
+    useEffect(() => {
+        const urlParams = new URLSearchParams(window.location.search);
+        const externalReference = urlParams.get('external_reference');
+        const paymentId = urlParams.get('payment_id') || urlParams.get('collection_id');
+
+        let query = '';
+        if (externalReference && externalReference !== 'null') {
+            query = `external_reference=${encodeURIComponent(externalReference)}`;
+        } else if (paymentId && paymentId !== 'null') {
+            query = `payment_id=${encodeURIComponent(paymentId)}`;
+        }
+        if (!query || typeof EventSource === 'undefined') {
+            return;
+        }
+
+        // EventSource reconecta solo si el servidor corta el stream; si responde
+        // con error (503: el servidor tiene muchos streams abiertos) se cierra
+        // y se vuelve a abrir a mano un rato después
+        let source: EventSource | null = null;
+        let retryTimer: ReturnType<typeof setTimeout> | undefined;
+        let finished = false;
+
+        const connect = () => {
+            source = new EventSource(`${API_URL}/api/payments/status-stream/?${query}`);
+            source.addEventListener('status', (event) => {
+                const data = JSON.parse((event as MessageEvent).data);
+                if (data.status === 'approved') {
+                    // La página de éxito valida el pago y confirma el envío del email
+                    finished = true;
+                    source?.close();
+                    setView(AppView.PAYMENT_SUCCESS);
+                } else if (FAILED_STATUSES.includes(data.status)) {
+                    finished = true;
+                    source?.close();
+                    setView(AppView.PAYMENT_FAILED);
+                }
+            });
+            source.onerror = () => {
+                if (!finished && source?.readyState === EventSource.CLOSED) {
+                    retryTimer = setTimeout(connect, STREAM_BUSY_RETRY_MS);
+                }
+            };
+        };
+        connect();
+        setWatching(true);
+
+        return () => {
+            finished = true;
+            if (retryTimer) clearTimeout(retryTimer);
+            source?.close();
+        };
+    }, [setView]);
+
     return (
         <div className="animate-in zoom-in duration-500 max-w-2xl mx-auto py-12 text-center">
             {/* Pending Icon */}
@@ -20,6 +88,12 @@ const PaymentPendingPage: React.FC<PaymentPendingPageProps> = ({ setView }) => {
                 <p className="text-gray-400 text-lg">
                     Tu pago está siendo procesado. Esto puede tomar unos minutos.
                 </p>
+                {watching && (
+                    <p className="text-sm text-gray-500 mt-4 flex items-center justify-center gap-2">
+                        <Loader2 size={16} className="animate-spin" />
+                        Esperando la confirmación de Mercado Pago. Si se acredita mientras estás acá, te llevamos solo.
+                    </p>
+                )}
             </div>
 
             {/* Info Card */}
@@ -1,12 +1,12 @@
 import React, { useEffect, useState } from 'react';
 import { AppView } from '../types';
-import { CheckCircle, Download, Mail, ArrowRight, Sparkles, Loader2, AlertCircle } from 'lucide-react';
+import { CheckCircle, Download, Mail, ArrowRight, Sparkles, Loader2, AlertCircle, RefreshCw } from 'lucide-react';
 
-// API URL dinámico según el entorno
-const API_URL = import.meta.env.VITE_API_URL ||
+// API URL dinámico según el entorno (VITE_SAME_ORIGIN=true: lo sirve Django, sin CORS)
+const API_URL = import.meta.env.VITE_SAME_ORIGIN === 'true' ? '' : (import.meta.env.VITE_API_URL ||
     (import.meta.env.PROD
         ? 'https://alexcel-backend-production.up.railway.app'
-        : 'http://localhost:8000');
+        : 'http://localhost:8000'));
 
 interface PaymentSuccessPageProps {
     setView: (view: AppView) => void;
@@ -16,6 +16,32 @@ const PaymentSuccessPage: React.FC<PaymentSuccessPageProps> = ({ setView }) => {
     const [showConfetti, setShowConfetti] = useState(false);
     const [status, setStatus] = useState<'loading' | 'success' | 'error'>('loading');
     const [errorMessage, setErrorMessage] = useState('');
+    const [emailSent, setEmailSent] = useState(true);
+    const [resendEmail, setResendEmail] = useState('');
+    const [resendState, setResendState] = useState<'idle' | 'sending' | 'done' | 'error'>('idle');
+    const [resendMessage, setResendMessage] = useState('');
+
+    // Número de orden para el reenvío: external_reference de MP (o el ID de operación)
+    const urlParams = new URLSearchParams(window.location.search);
+    const orderReference = urlParams.get('external_reference') || urlParams.get('payment_id') || urlParams.get('collection_id') || '';
+
+    const handleResend = async (event: React.FormEvent) => {
+        event.preventDefault();
+        setResendState('sending');
+        try {
+            const response = await fetch(`${API_URL}/api/payments/resend/`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ email: resendEmail, reference: orderReference }),
+            });
+            const data = await response.json();
+            setResendState(data.success ? 'done' : 'error');
+            setResendMessage(data.message || data.error || 'No pudimos reenviar el email.');
+        } catch (error) {
+            setResendState('error');
+            setResendMessage('Error de conexión. Probá de nuevo en unos minutos.');
+        }
+    };
 
     useEffect(() => {
         const validatePayment = async () => {
@@ -35,9 +61,14 @@ const PaymentSuccessPage: React.FC<PaymentSuccessPageProps> = ({ setView }) => {
                 const data = await response.json();
 
                 if (data.success) {
+                    setEmailSent(data.email_sent !== false);
                     setStatus('success');
                     setShowConfetti(true);
                     setTimeout(() => setShowConfetti(false), 5000);
+                } else if (data.status === 'pending' || data.status === 'in_process') {
+                    // Pago sin acreditar: la página de pendiente escucha el estado en vivo
+                    // (status-stream) en lugar de volver a consultar /validate/
+                    setView(AppView.PAYMENT_PENDING);
                 } else {
                     // FALLBACK INTELIGENTE:
                     // Si el backend da error (ej. email) pero Mercado Pago dice "approved" en la URL,
@@ -68,7 +99,7 @@ const PaymentSuccessPage: React.FC<PaymentSuccessPageProps> = ({ setView }) => {
         };
 
         validatePayment();
-    }, []);
+    }, [setView]);
 
     if (status === 'loading') {
         return (
@@ -173,6 +204,45 @@ const PaymentSuccessPage: React.FC<PaymentSuccessPageProps> = ({ setView }) => {
                 </div>
             </div>
 
+            {/* Reenvío de archivos */}
+            {orderReference && (
+                <div className="glass rounded-2xl p-6 mb-8 text-left">
+                    <p className="font-bold mb-1">
+                        {emailSent ? '¿No te llegó el email?' : 'No pudimos enviarte el email'}
+                    </p>
+                    <p className="text-sm text-gray-400 mb-4">
+                        Ingresá el email que usaste en la compra y te reenviamos los archivos.
+                    </p>
+                    {resendState === 'done' ? (
+                        <p className="text-sm text-green-400">{resendMessage}</p>
+                    ) : (
+                        <form onSubmit={handleResend} className="flex flex-col sm:flex-row gap-3">
+                            <input
+                                type="email"
+                                required
+                                value={resendEmail}
+                                onChange={(e) => setResendEmail(e.target.value)}
+                                placeholder="tu@email.com"
+                                className="flex-1 px-4 py-3 bg-white/5 border border-white/10 rounded-xl focus:outline-none focus:border-green-500"
+                            />
+                            <button
+                                type="submit"
+                                disabled={resendState === 'sending'}
+                                className="px-6 py-3 bg-white/10 rounded-xl hover:bg-white/20 transition-all font-bold flex items-center justify-center gap-2 disabled:opacity-50"
+                            >
+                                {resendState === 'sending'
+                                    ? <Loader2 size={18} className="animate-spin" />
+                                    : <RefreshCw size={18} />}
+                                Reenviar
+                            </button>
+                        </form>
+                    )}
+                    {resendState === 'error' && (
+                        <p className="text-sm text-red-400 mt-3">{resendMessage}</p>
+                    )}
+                </div>
+            )}
+
             {/* Next Steps */}
             <div className="space-y-4">
                 <p className="text-gray-500 text-sm">¿Qué querés hacer ahora?</p>
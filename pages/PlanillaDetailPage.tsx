@@ -1,7 +1,25 @@
-import React from 'react';
+import React, { useEffect, useState } from 'react';
 import { AppView } from '../types';
 import { getPlanillaById } from '../data/planillas';
-import { ChevronLeft, Check, ShoppingCart, Play, Sparkles, TrendingUp, Download, Shield } from 'lucide-react';
+import { ChevronLeft, Check, ShoppingCart, Play, Sparkles, TrendingUp, Download, Shield, Table } from 'lucide-react';
+
+const API_URL = import.meta.env.VITE_SAME_ORIGIN === 'true' ? '' : (import.meta.env.VITE_API_URL ||
+    (import.meta.env.PROD
+        ? 'https://alexcel-backend-production.up.railway.app'
+        : 'http://localhost:8000'));
+
+interface PreviewSheet {
+    name: string;
+    rows: number;
+    columns: number;
+    headers: string[];
+    thumbnail_url: string;
+}
+
+interface PreviewFile {
+    file: string;
+    sheets: PreviewSheet[];
+}
 
 interface PlanillaDetailPageProps {
     setView: (view: AppView) => void;
@@ -15,6 +33,27 @@ const PlanillaDetailPage: React.FC<PlanillaDetailPageProps> = ({
     setCheckoutPlanillaId
 }) => {
     const planilla = planillaId ? getPlanillaById(planillaId) : null;
+    const [previewFiles, setPreviewFiles] = useState<PreviewFile[]>([]);
+    const [activeSheet, setActiveSheet] = useState(0);
+
+    // Vista previa precalculada en el backend (hojas, encabezados y miniaturas)
+    useEffect(() => {
+        if (!planilla) return;
+        let cancelled = false;
+        setPreviewFiles([]);
+        setActiveSheet(0);
+        fetch(`${API_URL}/api/payments/previews/?product_id=${encodeURIComponent(planilla.id)}`)
+            .then((response) => (response.ok ? response.json() : null))
+            .then((data) => {
+                if (!cancelled && data?.files) setPreviewFiles(data.files);
+            })
+            .catch(() => {
+                // Sin vista previa la página se muestra igual
+            });
+        return () => {
+            cancelled = true;
+        };
+    }, [planilla?.id]);
 
     if (!planilla) {
         return (
@@ -78,6 +117,8 @@ const PlanillaDetailPage: React.FC<PlanillaDetailPageProps> = ({
     };
 
     const discount = Math.round((1 - planilla.price / planilla.originalPrice) * 100);
+    const previewSheets = previewFiles.flatMap((file) => file.sheets);
+    const sheet = previewSheets[Math.min(activeSheet, previewSheets.length - 1)];
 
     return (
         <div className="animate-in fade-in duration-500">
@@ -106,6 +147,45 @@ const PlanillaDetailPage: React.FC<PlanillaDetailPageProps> = ({
                         </div>
                     </div>
 
+                    {/* Workbook Preview */}
+                    {sheet && (
+                        <div className="glass rounded-2xl p-6">
+                            <div className="flex items-center gap-3 mb-4">
+                                <Table size={20} className={colors.text} />
+                                <h3 className="font-bold font-display">Vista previa</h3>
+                                <span className="text-sm text-gray-500 ml-auto">
+                                    {sheet.rows} filas × {sheet.columns} columnas
+                                </span>
+                            </div>
+                            {previewSheets.length > 1 && (
+                                <div className="flex flex-wrap gap-2 mb-4">
+                                    {previewSheets.map((item, idx) => (
+                                        <button
+                                            key={item.thumbnail_url}
+                                            onClick={() => setActiveSheet(idx)}
+                                            className={`px-3 py-1 rounded-lg text-sm transition-colors ${item === sheet ? `${colors.bg} ${colors.text}` : 'text-gray-400 hover:text-white'}`}
+                                        >
+                                            {item.name}
+                                        </button>
+                                    ))}
+                                </div>
+                            )}
+                            <div className="rounded-xl overflow-hidden border border-white/5 bg-white">
+                                <img
+                                    src={`${API_URL}${sheet.thumbnail_url}`}
+                                    alt={`Hoja ${sheet.name} de ${planilla.title}`}
+                                    loading="lazy"
+                                    className="w-full h-auto"
+                                />
+                            </div>
+                            {sheet.headers.length > 0 && (
+                                <p className="text-sm text-gray-500 mt-3">
+                                    Columnas: {sheet.headers.filter(Boolean).join(' · ')}
+                                </p>
+                            )}
+                        </div>
+                    )}
+
                     {/* Video Placeholder */}
                     <div className={`glass-strong rounded-2xl p-6 ${colors.border}`}>
                         <div className="flex items-center gap-4 mb-4">
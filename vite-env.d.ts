@@ -2,6 +2,8 @@
 
 interface ImportMetaEnv {
     readonly VITE_API_URL: string
+    // "true" cuando Django sirve el build (SERVE_FRONTEND): API en el mismo origen
+    readonly VITE_SAME_ORIGIN?: string
 }
 
 interface ImportMeta {